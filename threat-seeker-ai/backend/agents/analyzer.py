@@ -3,6 +3,11 @@ import uuid
 from typing import Dict, List, Any, Optional, Literal
 from pydantic import BaseModel
 
+from knowledge.attack_store import get_attack_store
+from storage.state import PLANS, get_state_backend
+from utils.agent_registry import run_in_thread
+from utils.metrics import instrument_agent
+
 class Finding(BaseModel):
     id: str
     title: str
@@ -40,6 +45,7 @@ class AnalysisAgent:
         # In a real implementation, this would initialize a language model
         pass
     
+    @instrument_agent("analysis", "analyze_results")
     async def analyze_results(self, plan_id: str, raw_results: Dict[str, Any]) -> Dict[str, Any]:
         """
         Analyze hunt results to identify patterns, anomalies, and potential threats
@@ -136,23 +142,7 @@ class AnalysisAgent:
                         count=22
                     )
                 ],
-                attack_techniques=[
-                    {
-                        "id": "T1546.003",
-                        "name": "Windows Management Instrumentation Event Subscription",
-                        "description": "Adversaries may establish persistence by executing malicious content triggered by a Windows Management Instrumentation (WMI) event subscription."
-                    },
-                    {
-                        "id": "T1047",
-                        "name": "Windows Management Instrumentation",
-                        "description": "Adversaries may abuse Windows Management Instrumentation (WMI) to execute malicious commands and payloads."
-                    },
-                    {
-                        "id": "T1021",
-                        "name": "Remote Services",
-                        "description": "Adversaries may use valid accounts to log into a service specifically designed to accept remote connections."
-                    }
-                ],
+                attack_techniques=[],
                 timestamps={
                     "analyzed_at": datetime.now().isoformat(),
                     "execution_start": raw_results.get("execution_start", datetime.now().isoformat())
@@ -166,57 +156,27 @@ class AnalysisAgent:
                 ]
             )
             
+            # Describe the observed techniques from the local ATT&CK knowledge base
+            analysis_result.attack_techniques = get_attack_store().describe_techniques(
+                technique for finding in analysis_result.findings for technique in finding.techniques
+            )
+            
             return analysis_result.dict()
         except Exception as e:
             # Log the error
             print(f"Error analyzing results: {str(e)}")
             raise
     
-    def _prepare_results_for_analysis(self, raw_results: Dict[str, Any]) -> str:
-        """
-        Prepare raw results for analysis by summarizing and formatting them
-        """
-        summary = raw_results.get("summary", {})
-        query_results = raw_results.get("query_results", [])
-        
-        # Create a summary string
-        result_str = f"Summary: {summary.get('total_results', 0)} total results from {summary.get('total_queries', 0)} queries.\n\n"
-        
-        # Add details for each query result
-        for qr in query_results:
-            result_str += f"Query ID: {qr.get('query_id')}\n"
-            result_str += f"Data Source: {qr.get('data_source')}\n"
-            result_str += f"Status: {qr.get('status')}\n"
-            
-            if qr.get("status") == "success":
-                result_str += f"Result Count: {qr.get('result_count', 0)}\n"
-                
-                # Add sample of results (limiting to prevent token overflow)
-                results = qr.get("results", [])
-                sample_size = min(10, len(results))
-                
-                if sample_size > 0:
-                    result_str += "Sample Results:\n"
-                    for i in range(sample_size):
-                        result_str += f"  - {str(results[i])[:500]}...\n"
-                
-                if len(results) > sample_size:
-                    result_str += f"  (and {len(results) - sample_size} more results)\n"
-            else:
-                result_str += f"Error: {qr.get('error_message', 'Unknown error')}\n"
-            
-            result_str += "\n"
-        
-        return result_str
-    
     async def _get_hunt_plan(self, plan_id: str) -> Dict[str, Any]:
         """
         Get a hunt plan by ID
         
-        In a real app, this would retrieve the plan from a database.
-        For this example, we're returning a placeholder.
+        Plans created through the API are read from the shared state backend,
+        so any worker can analyze their results; unknown IDs get a placeholder.
         """
-        # In a real app, this would fetch from a database
+        stored = await run_in_thread(get_state_backend().get, PLANS, plan_id)
+        if stored is not None:
+            return stored
         return {
             "plan_id": plan_id,
             "hypothesis": "I suspect an attacker is using WMI for lateral movement, hiding persistence in WMI event consumer bindings."
@@ -1,5 +1,20 @@
 from datetime import datetime
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional, Tuple
+
+from config.settings import settings
+from knowledge.attack_store import get_attack_store
+from storage.result_store import get_result_store
+from utils.agent_registry import run_in_thread
+from utils.event_fields import to_epoch
+from utils.metrics import instrument_agent
+from utils.prompt_budget import PromptBuilder, count_tokens
+from utils.serialization import dumps
+
+# Context keys that filter the retrieved events rather than describe the question
+_FILTER_KEYS = ("host", "user", "start", "end", "plan_id")
+# Characters of each retrieved event put in the prompt
+_EVENT_CHARS = 1000
+
 
 class ClarificationAgent:
     """
@@ -11,17 +26,25 @@ class ClarificationAgent:
         # In a real implementation, this would initialize a language model
         pass
     
+    @instrument_agent("clarification", "get_clarification")
     async def get_clarification(self, result_id: str, question: str, context: Dict[str, Any]) -> Dict[str, Any]:
         """
         Provide clarification about hunt results based on analyst questions
         
-        For this example, we're using a hard-coded mock response.
+        The stored events that best match the question (narrowed by host, user,
+        start and end in the context) are retrieved from the result's index and
+        assembled into the prompt context within the clarifier's token budget.
+        For this example, the answer itself is a hard-coded mock response.
         """
         try:
             # Get the hunt result
             hunt_result = await self._get_hunt_result(result_id)
             
-            # In a real implementation, we would process the question and generate an answer
+            # Events supporting the answer, best first
+            retrieved = await self._retrieve_events(result_id, question, context)
+            prompt_context, supporting_events = self._prepare_context(hunt_result, context, question, retrieved)
+            
+            # In a real implementation, we would send the prompt context to the model
             # For this mock, we select a response based on keywords in the question
             answer = self._get_mock_answer(question)
             
@@ -32,6 +55,8 @@ class ClarificationAgent:
                 "result_id": result_id,
                 "answer": answer,
                 "confidence": confidence,
+                "supporting_events": supporting_events,
+                "context_tokens": count_tokens(prompt_context),
                 "timestamp": datetime.now().isoformat()
             }
         except Exception as e:
@@ -57,21 +82,75 @@ class ClarificationAgent:
         else:
             return "The analysis shows a clear attack chain involving initial access through WORKSTATION03, lateral movement via WMI to multiple servers, and persistence using WMI event subscriptions. The encoded PowerShell commands appear to be establishing additional access mechanisms. I recommend investigating the affected systems in isolation to prevent further lateral movement while you determine the full scope of compromise."
     
-    def _prepare_context(self, hunt_result: Dict[str, Any], user_context: Dict[str, Any]) -> str:
+    def _prepare_context(self, hunt_result: Dict[str, Any], user_context: Dict[str, Any], question: str,
+                         events: List[Dict[str, Any]]) -> Tuple[str, List[Dict[str, Any]]]:
         """
         Prepare context for clarification by combining hunt result with user-provided context
+        
+        Retrieved events are trimmed first, lowest ranked first, when the clarifier's
+        prompt budget is exceeded, then the analyst's context, then the findings.
+        Returns the context and the events that fit in it.
+        """
+        builder = PromptBuilder("clarifier", settings.PROMPT_BUDGET_CLARIFIER)
+        builder.add("context", f"Question: {question}\n\n", required=True)
+        
+        findings = [
+            f"  - {finding.get('title', '')}: {finding.get('description', '')}\n"
+            for finding in hunt_result.get("findings") or []
+        ]
+        builder.add_items("context", findings, priority=1, header="Findings:\n" if findings else "")
+        
+        extra = {k: v for k, v in (user_context or {}).items() if k not in _FILTER_KEYS}
+        if extra:
+            builder.add("context", f"\nAnalyst context: {dumps(extra).decode('utf-8')}\n", priority=2)
+        
+        items = [
+            f"  - [{item['query_id']} #{item['row']}] {dumps(item['event']).decode('utf-8')[:_EVENT_CHARS]}\n"
+            for item in events
+        ]
+        builder.add_items("context", items, priority=3, header="\nSupporting events:\n" if items else "")
+        section = builder.sections[-1]
+        
+        prompt_context = builder.build()["context"]
+        return prompt_context, events[:len(events) - section.dropped_items]
+    
+    async def _retrieve_events(self, result_id: str, question: str, context: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        Top events of a stored result for the question; none for results that are not stored
         """
-        # For the mock implementation, we don't actually use this
-        return "Context prepared but not used in mock implementation"
+        context = context or {}
+        bounds = {}
+        for key in ("start", "end"):
+            value = context.get(key)
+            bounds[key] = to_epoch(value)
+            if value not in (None, "") and bounds[key] is None:
+                raise ValueError(f"Invalid {key} time: {value}")
+        retrieved = await run_in_thread(
+            get_result_store().retrieve,
+            result_id, question, settings.RETRIEVAL_TOP_K,
+            context.get("host"), context.get("user"), bounds["start"], bounds["end"]
+        )
+        return retrieved["events"] if retrieved is not None else []
     
     async def _get_hunt_result(self, result_id: str) -> Dict[str, Any]:
         """
         Get a hunt result by ID
         
-        In a real app, this would retrieve the result from a database.
-        For this example, we're returning a placeholder.
+        Stored results are read from the result store (their summary and analysis
+        only, events stay on disk); unknown IDs get a placeholder.
         """
-        # In a real app, this would fetch from a database
+        stored = await run_in_thread(get_result_store().get, result_id)
+        if stored is not None:
+            analysis = stored.get("analysis") or {}
+            return {
+                "result_id": result_id,
+                "plan_id": stored.get("plan_id"),
+                "summary": analysis.get("summary", {}),
+                "findings": analysis.get("findings", []),
+                "attack_techniques": analysis.get("attack_techniques", []),
+                "query_results": stored["raw_results"].get("query_results", [])
+            }
+        
         return {
             "result_id": result_id,
             "findings": [
@@ -80,10 +159,5 @@ class ClarificationAgent:
                     "description": "WMI event consumer bindings found on critical servers"
                 }
             ],
-            "attack_techniques": [
-                {
-                    "id": "T1546.003",
-                    "name": "Windows Management Instrumentation Event Subscription"
-                }
-            ]
+            "attack_techniques": get_attack_store().describe_techniques(["T1546.003"])
         }
@@ -1,7 +1,8 @@
 from datetime import datetime
+import asyncio
 import uuid
 import logging
-from typing import Dict, List, Optional, Any
+from typing import AsyncIterator, Callable, Dict, List, Optional, Any, Tuple
 
 from langchain_core.prompts import PromptTemplate
 from langchain_core.output_parsers import StrOutputParser
@@ -9,7 +10,11 @@ from langchain_google_genai import ChatGoogleGenerativeAI
 from pydantic import BaseModel, Field
 
 from config.settings import settings
-from utils.retry_handler import async_retry_with_exponential_backoff
+from knowledge.attack_store import get_attack_store
+from utils.metrics import instrument_agent
+from utils.micro_batcher import MicroBatcher
+from utils.json_stream import JsonArrayStreamParser
+from utils.prompt_budget import PromptBuilder, StreamInterruptedError, stream_with_budget
 
 # Setup logger
 logger = logging.getLogger(__name__)
@@ -83,43 +88,84 @@ class CriticAgent:
         )
         
         self.chain = self.prompt_template | self.llm | StrOutputParser()
+        
+        self.batch_prompt_template = PromptTemplate(
+            template="""You are an expert "Red Team" security analyst tasked with critiquing several threat hunt plans 
+            before they are presented to the security team.
+
+            Each plan below is labelled with a PLAN ID. Review every plan independently.
+
+            {plans}
+            
+            Your task is to critically evaluate each query in each hunt plan and provide feedback on:
+            
+            1. EFFICIENCY: Is the query optimized for performance? Could it be rewritten to be less resource-intensive?
+            
+            2. ACCURACY: Does the query accurately reflect the hypothesis and the targeted MITRE techniques?
+            Are there any logical errors or misconceptions in how the query is formulated?
+            
+            3. GAPS: Are there any missing queries that should be included to fully investigate the hypothesis?
+            Are there important data sources or detection opportunities being overlooked?
+            
+            4. FALSE POSITIVES: Will the query likely generate too many false positives? How could it be refined?
+            
+            5. EVASION RESISTANCE: Could a sophisticated attacker easily evade detection by this query?
+            How could it be improved to catch evasive techniques?
+            
+            For each query, provide specific, actionable feedback. If a query looks good, acknowledge its strengths.
+            If improvements are needed, suggest specific changes to the query.
+
+            Always include specific technical recommendations and provide example modifications where appropriate.
+            
+            Format your response as a JSON object with one entry per PLAN ID, using the following structure:
+            {{
+                "plan_critiques": [
+                    {{
+                        "plan_id": "The PLAN ID exactly as given above",
+                        "query_critiques": [
+                            {{
+                                "query_id": "ID of the query",
+                                "critique": "Your detailed critique",
+                                "suggested_modifications": "Specific changes to improve the query",
+                                "critique_severity": "high/medium/low" // How urgent/important is this feedback
+                            }},
+                            // More query critiques...
+                        ],
+                        "overall_assessment": "Your overall assessment of the hunt plan",
+                        "missing_detection_opportunities": ["List of any detection opportunities that are being missed"],
+                        "additional_data_sources": ["Any additional data sources that should be considered"]
+                    }},
+                    // More plan critiques...
+                ]
+            }}
+            """,
+            input_variables=["plans"]
+        )
+        
+        self.batch_chain = self.batch_prompt_template | self.llm | StrOutputParser()
+        
+        # Critique requests arriving within a short window share a single LLM call
+        self.batcher = MicroBatcher(
+            self._critique_batch,
+            max_batch_size=settings.CRITIQUE_BATCH_MAX_SIZE,
+            max_wait_ms=settings.CRITIQUE_BATCH_MAX_WAIT_MS
+        )
     
-    async def critique_plan(self, plan: Dict[str, Any]) -> Dict[str, Any]:
+    @instrument_agent("critic", "critique_plan")
+    async def critique_plan(
+        self,
+        plan: Dict[str, Any],
+        on_query_critique: Optional[Callable[[Dict[str, Any]], None]] = None
+    ) -> Dict[str, Any]:
         """
         Critique a hunt plan and provide feedback on each query
+        
+        Concurrent calls are micro-batched into a single LLM request; each caller
+        receives only the critiques for its own plan. If on_query_critique is given,
+        it is called with each query critique as soon as the LLM has generated it.
         """
         try:
-            # Extract the hypothesis and queries from the plan
-            hypothesis = plan.get("hypothesis", "")
-            queries = plan.get("queries", [])
-            
-            # Format the queries for the prompt
-            queries_str = ""
-            for i, query in enumerate(queries):
-                queries_str += f"QUERY {i+1} (ID: {query.get('query_id', 'unknown')}):\n"
-                queries_str += f"Data Source: {query.get('data_source', 'unknown')}\n"
-                queries_str += f"Query String: {query.get('query_string', 'unknown')}\n"
-                queries_str += f"Explanation: {query.get('explanation', 'unknown')}\n"
-                queries_str += f"Targeted MITRE Techniques: {', '.join(query.get('technique_ids', []))}\n"
-                queries_str += f"Expected Volume: {query.get('expected_volume', 'unknown')}\n"
-                queries_str += f"Risk Level: {query.get('risk_level', 'unknown')}\n\n"
-            
-            # Run the critique chain with retry logic for handling rate limits
-            critique_result = await async_retry_with_exponential_backoff(
-                self.chain.ainvoke,
-                {
-                    "hypothesis": hypothesis,
-                    "queries": queries_str
-                },
-                max_retries=5,  # Maximum number of retries
-                # The initial_delay will be overridden by API's retry_delay if available
-                initial_delay=20,
-                max_delay=300  # Maximum delay of 5 minutes
-            )
-            
-            # Parse the critique result
-            import json
-            critique_data = json.loads(critique_result)
+            critique_data = await self.batcher.submit((plan, on_query_critique))
             
             # Add critique to each query in the original plan
             for query in plan["queries"]:
@@ -155,3 +201,123 @@ class CriticAgent:
             # Log the error
             logger.error(f"Error critiquing hunt plan: {str(e)}")
             raise
+    
+    async def _critique_batch(self, requests: List[Tuple[Dict[str, Any], Optional[Callable]]]) -> List[Dict[str, Any]]:
+        """
+        Critique a batch of plans with one LLM call and return the raw critique data for each
+        plan, or the exception that failed a plan retried alone
+        """
+        # A lone plan keeps the original single-plan prompt
+        if len(requests) == 1:
+            plan, on_query_critique = requests[0]
+            builder = PromptBuilder("critic", settings.PROMPT_BUDGET_CRITIC, self.prompt_template.template)
+            builder.add("hypothesis", plan.get("hypothesis", ""), required=True)
+            builder.add_items("queries", self._format_queries(plan.get("queries", [])), priority=1)
+            
+            parser = JsonArrayStreamParser(["query_critiques"])
+            async for critique in self._stream(builder, self.chain, parser):
+                if on_query_critique:
+                    on_query_critique(critique)
+            
+            # Fall back to the critiques that were complete if the document itself is unusable
+            critique_data, critiques = parser.finish()
+            if not isinstance(critique_data, dict):
+                critique_data = {"query_critiques": critiques}
+            return [critique_data]
+        
+        # Label plans with short batch-local IDs so query IDs like "q1" cannot collide across plans
+        batch_ids = [f"P{i+1}" for i in range(len(requests))]
+        builder = PromptBuilder("critic", settings.PROMPT_BUDGET_CRITIC, self.batch_prompt_template.template)
+        for batch_id, (plan, _) in zip(batch_ids, requests):
+            plan_header = f"=== PLAN ID: {batch_id} ===\n"
+            plan_header += f"Hypothesis: {plan.get('hypothesis', '')}\n\n"
+            plan_header += "QUERIES TO REVIEW:\n"
+            builder.add("plans", plan_header, required=True)
+            builder.add_items("plans", self._format_queries(plan.get("queries", [])), priority=1)
+        
+        # Split an oversized batch rather than trimming some callers' queries away
+        if builder.tokens > builder.budget:
+            middle = len(requests) // 2
+            logger.info(f"Critique batch of {len(requests)} plans exceeds the prompt budget, splitting")
+            halves = await asyncio.gather(
+                self._critique_batch(requests[:middle]),
+                self._critique_batch(requests[middle:])
+            )
+            return halves[0] + halves[1]
+        
+        # Route each plan critique back to the caller that submitted it as soon as it completes
+        listeners = dict(zip(batch_ids, (on_query_critique for _, on_query_critique in requests)))
+        by_batch_id = {}
+        parser = JsonArrayStreamParser(["plan_critiques"])
+        async for entry in self._stream(builder, self.batch_chain, parser):
+            if not isinstance(entry, dict):
+                continue
+            by_batch_id[entry.get("plan_id")] = entry
+            on_query_critique = listeners.get(entry.get("plan_id"))
+            if on_query_critique:
+                for critique in entry.get("query_critiques", []):
+                    on_query_critique(critique)
+        
+        # A plan the LLM skipped is critiqued again on its own; if that fails too, only its caller fails
+        missing = [i for i, batch_id in enumerate(batch_ids) if batch_id not in by_batch_id]
+        if missing:
+            logger.warning(
+                f"No critique returned for {', '.join(batch_ids[i] for i in missing)} in batch of "
+                f"{len(requests)} plans, retrying them alone"
+            )
+        retried = await asyncio.gather(
+            *(self._critique_batch([requests[i]]) for i in missing), return_exceptions=True
+        )
+        routed: List[Any] = [by_batch_id.get(batch_id) for batch_id in batch_ids]
+        for i, result in zip(missing, retried):
+            routed[i] = result if isinstance(result, BaseException) else result[0]
+        
+        return routed
+    
+    async def _stream(self, builder: PromptBuilder, chain: Any, parser: JsonArrayStreamParser) -> AsyncIterator[Any]:
+        """
+        Stream a critique chain within the prompt budget, yielding each complete array element
+        
+        Opening the stream is retried on rate limits; if it is cut off part-way, the
+        elements already received are kept and the parser holds the valid prefix.
+        """
+        stream = stream_with_budget(
+            builder,
+            chain.astream,
+            max_retries=5,  # Maximum number of retries
+            # The initial_delay will be overridden by API's retry_delay if available
+            initial_delay=20,
+            max_delay=300  # Maximum delay of 5 minutes
+        )
+        try:
+            async for chunk in stream:
+                for element in parser.feed(chunk):
+                    yield element
+        except StreamInterruptedError as e:
+            logger.warning(f"{str(e)}; keeping {len(parser.elements)} complete critiques")
+        finally:
+            await stream.aclose()
+        
+        if parser.skipped:
+            logger.warning(f"Skipped {parser.skipped} malformed critiques in LLM output")
+    
+    def _format_queries(self, queries: List[Dict[str, Any]]) -> List[str]:
+        """
+        Format each query of a plan as a separate prompt item
+        """
+        store = get_attack_store()
+        query_blocks = []
+        for i, query in enumerate(queries):
+            techniques = [
+                f"{technique['id']} ({technique['name']})"
+                for technique in store.describe_techniques(query.get('technique_ids', []))
+            ]
+            query_block = f"QUERY {i+1} (ID: {query.get('query_id', 'unknown')}):\n"
+            query_block += f"Data Source: {query.get('data_source', 'unknown')}\n"
+            query_block += f"Query String: {query.get('query_string', 'unknown')}\n"
+            query_block += f"Explanation: {query.get('explanation', 'unknown')}\n"
+            query_block += f"Targeted MITRE Techniques: {', '.join(techniques)}\n"
+            query_block += f"Expected Volume: {query.get('expected_volume', 'unknown')}\n"
+            query_block += f"Risk Level: {query.get('risk_level', 'unknown')}\n\n"
+            query_blocks.append(query_block)
+        return query_blocks
@@ -1,12 +1,52 @@
 from datetime import datetime
+import fnmatch
+import random
 import uuid
 import asyncio
+import logging
 from typing import Dict, List, Optional, Any
 
 from config.settings import settings
 from connectors.splunk import SplunkConnector
 from connectors.elastic import ElasticConnector
 from connectors.rest_api import RestApiConnector
+from connectors.file_replay import FileReplayConnector
+from knowledge.ioc_store import get_ioc_store
+from query_engine import QuerySyntaxError, TranslationError, detect_language, get_query_compiler, ir_hash
+from query_engine.ir import ECS_FIELDS, indexes, rename_fields
+from query_engine.parser import LANGUAGES
+from query_engine.pushdown import Rewrite, optimize_ir
+from storage.state import PLANS, get_state_backend
+from utils.agent_registry import run_in_thread
+from utils.metrics import instrument_agent
+from utils.progress import hunt_progress
+from utils.tracing import tracer
+
+# Setup logger
+logger = logging.getLogger(__name__)
+
+# Data source whose queries run on the backend holding their index (QUERY_ROUTES)
+AUTO_SOURCE = "auto"
+# Compile target of each backend the IR can be compiled for, and the languages it runs as written
+_BACKEND_TARGETS = {"splunk": "spl", "elastic": "dsl", "file": "local"}
+_NATIVE_LANGUAGES = {"splunk": ("spl",), "elastic": ("dsl", "lucene"), "file": LANGUAGES}
+
+class _PreparedQuery:
+    """
+    A query as it is sent to its backend, and as it was written when rewrites changed it
+    """
+    
+    __slots__ = ("data_source", "query_string", "plan", "ir_hash", "rewrites", "original_query", "original_plan")
+    
+    def __init__(self, data_source: str, query_string: str, plan: Any = None, ir_hash: Optional[str] = None,
+                 rewrites: Optional[List[Rewrite]] = None, original_query: Optional[str] = None, original_plan: Any = None):
+        self.data_source = data_source
+        self.query_string = query_string
+        self.plan = plan
+        self.ir_hash = ir_hash
+        self.rewrites = rewrites or []
+        self.original_query = original_query
+        self.original_plan = original_plan
 
 class HuntExecutionAgent:
     """
@@ -28,8 +68,110 @@ class HuntExecutionAgent:
                 username=settings.ELASTIC_USERNAME,
                 password=settings.ELASTIC_PASSWORD
             ),
-            "rest_api": RestApiConnector()
+            "rest_api": RestApiConnector(),
+            "file": FileReplayConnector(
+                data_dir=settings.REPLAY_DATA_DIR,
+                time_field=settings.REPLAY_TIME_FIELD
+            )
         }
+        self.routes = []
+        for route in settings.QUERY_ROUTES.split(","):
+            pattern, _, backend = route.partition("=")
+            if pattern.strip() and backend.strip():
+                self.routes.append((pattern.strip().lower(), backend.strip().lower()))
+        
+    def route(self, ir: Dict[str, Any]) -> str:
+        """
+        Backend for a query on the "auto" data source: the first route whose index
+        glob matches an index the query searches, else QUERY_DEFAULT_BACKEND
+        """
+        for index in indexes(ir):
+            for pattern, backend in self.routes:
+                if fnmatch.fnmatchcase(index.lower(), pattern):
+                    return backend
+        return settings.QUERY_DEFAULT_BACKEND.lower()
+    
+    def _compile(self, ir: Dict[str, Any], target: str, language: Optional[str]) -> Any:
+        # Local plans of Elasticsearch queries read the ECS fields of the events they were written for
+        if target == "local" and language in ("dsl", "lucene"):
+            ir = rename_fields(ir, ECS_FIELDS)
+        return get_query_compiler().compile(ir, target)
+    
+    def _prepare(self, data_source: str, query_string: str, ir: Optional[Dict[str, Any]]) -> "_PreparedQuery":
+        """
+        Backend, query string or local plan, and IR hash to execute a query with
+        
+        The IR is rewritten by the pushdown rules (query_engine.pushdown) and
+        compiled for the backend (compiled queries are cached by IR hash), so one
+        logical query can run wherever the data is. Query strings already in a
+        language of their backend that no rule improves run as written.
+        """
+        compiler = get_query_compiler()
+        try:
+            if ir is None:
+                ir, digest = compiler.ir(query_string)
+            else:
+                digest = ir_hash(ir)
+        except QuerySyntaxError:
+            if data_source == AUTO_SOURCE:
+                raise
+            # Connectors may support more than the engine parses
+            return _PreparedQuery(data_source, query_string)
+        if data_source == AUTO_SOURCE:
+            data_source = self.route(ir)
+        target = _BACKEND_TARGETS.get(data_source)
+        if target is None:
+            return _PreparedQuery(data_source, query_string, ir_hash=digest)
+        language = detect_language(query_string) if query_string.strip() else None
+        native = language in _NATIVE_LANGUAGES[data_source]
+        
+        rewritten, rewrites = ir, []
+        artifact = None
+        if settings.QUERY_PUSHDOWN_ENABLED:
+            disabled = [
+                rule for rule, enabled in (
+                    ("sourcetype_narrowing", settings.QUERY_PUSHDOWN_SOURCETYPE_NARROWING),
+                    ("path_names", settings.QUERY_PUSHDOWN_PATH_NAMES)
+                ) if not enabled
+            ]
+            rewritten, rewrites = optimize_ir(ir, target, settings.QUERY_COST_EVENTS, disabled)
+        if rewrites:
+            try:
+                artifact = self._compile(rewritten, target, language)
+            except TranslationError as e:
+                logger.warning(f"Not rewriting query for {data_source}: {str(e)}")
+                rewritten, rewrites = ir, []
+        if not rewrites:
+            if native:
+                return _PreparedQuery(data_source, query_string, ir_hash=digest)
+            artifact = self._compile(ir, target, language)
+        
+        if target != "local":
+            return _PreparedQuery(data_source, artifact, ir_hash=digest, rewrites=rewrites, original_query=query_string)
+        original_plan = None if native else self._compile(ir, target, language)
+        return _PreparedQuery(
+            data_source, query_string or compiler.compile(rewritten, "spl"), plan=artifact, ir_hash=digest,
+            rewrites=rewrites, original_query=query_string, original_plan=original_plan
+        )
+    
+    async def _scan_original(self, connector: Any, prepared: "_PreparedQuery", time_range: Dict[str, str]) -> Optional[Dict[str, int]]:
+        """
+        Scan statistics of a rewritten query run as written, to measure what the rewrites saved
+        """
+        stats: Dict[str, int] = {}
+        options = {"plan": prepared.original_plan} if prepared.original_plan is not None else {}
+        try:
+            await connector.execute_query(
+                query_string=prepared.original_query,
+                time_range=time_range,
+                max_results=settings.MAX_RESULTS_PER_QUERY,
+                stats=stats,
+                **options
+            )
+        except Exception as e:
+            logger.warning(f"Error measuring unrewritten query: {str(e)}")
+            return None
+        return stats
         
     async def execute_query(self, query_details: Dict[str, Any], modifications: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
         """
@@ -37,17 +179,24 @@ class HuntExecutionAgent:
         """
         data_source = query_details.get("data_source", "").lower()
         query_string = query_details.get("query_string", "")
+        ir = query_details.get("ir")
         
-        # Apply any modifications to the query string
+        # Apply any modifications to the query string (the planned IR no longer describes it)
         if modifications and query_details["query_id"] in modifications:
             query_string = modifications[query_details["query_id"]]
+            ir = None
         
         # Check if we have a connector for this data source
-        if data_source not in self.connectors:
+        if data_source not in self.connectors and data_source != AUTO_SOURCE:
             raise ValueError(f"Unsupported data source: {data_source}")
         
+        digest = None
         try:
-            # Execute the query using the appropriate connector
+            # Route, rewrite and translate the query, then execute it using the appropriate connector
+            prepared = self._prepare(data_source, query_string, ir)
+            data_source, digest = prepared.data_source, prepared.ir_hash
+            if data_source not in self.connectors:
+                raise ValueError(f"Unsupported data source: {data_source}")
             connector = self.connectors[data_source]
             
             # Get time range from query details or use default
@@ -56,51 +205,116 @@ class HuntExecutionAgent:
                 "end": "now"
             })
             
+            # Only the file data source reports what its scans read; a sample of its
+            # rewritten queries also runs as written to measure the bytes saved
+            measure = bool(prepared.rewrites) and data_source == "file" and random.random() < settings.QUERY_PUSHDOWN_MEASURE_RATE
+            options: Dict[str, Any] = {"plan": prepared.plan} if prepared.plan is not None else {}
+            scan_stats: Dict[str, int] = {}
+            if measure:
+                options["stats"] = scan_stats
+            
             # Execute the query
             start_time = datetime.now()
-            results = await connector.execute_query(
-                query_string=query_string,
-                time_range=time_range,
-                max_results=settings.MAX_RESULTS_PER_QUERY
-            )
+            hunt_progress.emit("query.started", query_id=query_details["query_id"], data_source=data_source)
+            with tracer.span("executor.query", query_id=query_details["query_id"], data_source=data_source) as span:
+                execution = connector.execute_query(
+                    query_string=prepared.query_string,
+                    time_range=time_range,
+                    max_results=settings.MAX_RESULTS_PER_QUERY,
+                    **options
+                )
+                if measure:
+                    results, original_stats = await asyncio.gather(execution, self._scan_original(connector, prepared, time_range))
+                else:
+                    results, original_stats = await execution, None
+                if span is not None:
+                    span.set_attribute("result_count", len(results))
+                    span.set_attribute("rewrites", len(prepared.rewrites))
             end_time = datetime.now()
             
             # Calculate execution time
             execution_time = (end_time - start_time).total_seconds()
             
-            return {
+            # Tag the events matching threat intel indicators
+            ioc_store = await run_in_thread(get_ioc_store)
+            ioc_summary = await run_in_thread(ioc_store.tag, results) if ioc_store.indicators else None
+            hunt_progress.emit(
+                "query.completed", query_id=query_details["query_id"], data_source=data_source,
+                row_count=len(results), execution_time=execution_time
+            )
+            
+            result = {
                 "query_id": query_details["query_id"],
                 "data_source": data_source,
+                "ir_hash": digest,
                 "results": results,
                 "result_count": len(results),
                 "execution_time": execution_time,
                 "executed_at": end_time.isoformat(),
                 "status": "success"
             }
+            if ioc_summary is not None:
+                result["ioc"] = ioc_summary
+            if prepared.rewrites:
+                result["optimization"] = self._optimization_report(prepared, scan_stats, original_stats)
+                logger.debug(
+                    f"Query {query_details['query_id']} rewritten by {len(prepared.rewrites)} rules: "
+                    f"estimated {result['optimization']['estimated_bytes_saved']} bytes saved, "
+                    f"actual {result['optimization']['actual_bytes_saved']}"
+                )
+            return result
         except Exception as e:
             # Log the error
             print(f"Error executing query {query_details['query_id']}: {str(e)}")
+            hunt_progress.emit("query.failed", query_id=query_details["query_id"], data_source=data_source, error=str(e))
             
             # Return error information
             return {
                 "query_id": query_details["query_id"],
                 "data_source": data_source,
+                "ir_hash": digest,
                 "status": "error",
                 "error_message": str(e),
                 "executed_at": datetime.now().isoformat()
             }
     
-    async def execute_queries(self, plan_id: str, query_ids: List[str], modifications: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    @staticmethod
+    def _optimization_report(prepared: "_PreparedQuery", scan_stats: Dict[str, int],
+                             original_stats: Optional[Dict[str, int]]) -> Dict[str, Any]:
+        """
+        Rewrites applied to a query, with the bytes they were estimated to save and,
+        when measured, the bytes the scan parsed less than the query as written
+        """
+        actual = None
+        if original_stats is not None and scan_stats:
+            actual = original_stats["bytes_parsed"] - scan_stats["bytes_parsed"]
+        return {
+            "original_query": prepared.original_query,
+            "rewrites": [rewrite.to_dict() for rewrite in prepared.rewrites],
+            "estimated_bytes_saved": sum(rewrite.estimated_bytes_saved for rewrite in prepared.rewrites),
+            "actual_bytes_saved": actual,
+            "scan": {"original": original_stats, "rewritten": scan_stats} if actual is not None else None
+        }
+    
+    @instrument_agent("execution", "execute_queries")
+    async def execute_queries(self, plan_id: str, query_ids: List[str], modifications: Optional[Dict[str, str]] = None,
+                              overrides: Optional[Dict[str, Dict[str, Any]]] = None) -> Dict[str, Any]:
         """
         Execute multiple approved queries from a hunt plan
+        
+        overrides replaces fields of planned queries by query ID, e.g. the time
+        range and search of a scheduled run (utils.hunt_scheduler)
         """
         try:
-            # Get the hunt plan (in a real app, this would come from a database)
-            # For this example, we're simulating it
+            # Get the hunt plan saved when it was created
             hunt_plan = await self._get_hunt_plan(plan_id)
             
             # Filter for only approved queries
-            approved_queries = [q for q in hunt_plan["queries"] if q["query_id"] in query_ids]
+            approved_queries = [
+                dict(q, **(overrides or {}).get(q["query_id"], {})) for q in hunt_plan["queries"] if q["query_id"] in query_ids
+            ]
+            for query in approved_queries:
+                hunt_progress.emit("query.queued", query_id=query["query_id"], data_source=query.get("data_source"))
             
             # Execute all approved queries concurrently
             tasks = [self.execute_query(query, modifications) for query in approved_queries]
@@ -131,10 +345,12 @@ class HuntExecutionAgent:
         """
         Get a hunt plan by ID
         
-        In a real app, this would retrieve the plan from a database.
-        For this example, we're returning a placeholder.
+        Plans created through the API are read from the shared state backend,
+        so any worker can execute them; unknown IDs get a placeholder.
         """
-        # In a real app, this would fetch from a database
+        stored = await run_in_thread(get_state_backend().get, PLANS, plan_id)
+        if stored is not None:
+            return stored
         return {
             "plan_id": plan_id,
             "queries": [
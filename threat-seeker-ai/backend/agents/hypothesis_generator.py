@@ -1,7 +1,6 @@
-import json
 import logging
 from datetime import datetime
-from typing import Dict, List, Any, Optional
+from typing import AsyncIterator, Dict, List, Any, Optional
 import uuid
 
 from langchain_core.prompts import PromptTemplate
@@ -10,8 +9,11 @@ from langchain_google_genai import ChatGoogleGenerativeAI
 from pydantic import BaseModel, Field
 
 from config.settings import settings
-from connectors.rest_api import RestApiConnector
-from utils.retry_handler import async_retry_with_exponential_backoff
+from knowledge.attack_store import get_attack_store, sync_attack_store
+from utils.agent_registry import run_in_thread
+from utils.metrics import instrument_agent
+from utils.json_stream import JsonArrayStreamParser
+from utils.prompt_budget import PromptBuilder, StreamInterruptedError, stream_with_budget
 
 # Setup logger
 logger = logging.getLogger(__name__)
@@ -23,8 +25,6 @@ class HypothesisGeneratorAgent:
     """
     
     def __init__(self):
-        self.rest_api_connector = RestApiConnector()
-        
         self.prompt_template = PromptTemplate(
             template="""You are an expert threat intelligence analyst responsible for generating actionable 
             threat hunting hypotheses for a security team. 
@@ -86,53 +86,25 @@ class HypothesisGeneratorAgent:
     
     async def _fetch_threat_intelligence(self) -> str:
         """
-        Fetch the latest threat intelligence data from external sources
+        Summarise the latest threat intelligence from the local MITRE ATT&CK knowledge base
         
-        In a real implementation, this would connect to actual threat intel feeds.
-        For this example, we're using the RestApiConnector to simulate it.
+        The knowledge base is synced from a STIX bundle, so no external request is made here.
         """
         try:
-            # Fetch MITRE ATT&CK data
-            mitre_techniques_query = json.dumps({
-                "url": "https://api.example.com/mitre/techniques",
-                "method": "GET",
-                "params": {
-                    "limit": 10,
-                    "sort": "updated_desc"
-                }
-            })
-            
-            mitre_groups_query = json.dumps({
-                "url": "https://api.example.com/mitre/groups",
-                "method": "GET",
-                "params": {
-                    "limit": 5,
-                    "sort": "activity_desc"
-                }
-            })
-            
-            # Execute the queries
-            techniques_results = await self.rest_api_connector.execute_query(
-                query_string=mitre_techniques_query,
-                time_range={"start": "-30d", "end": "now"},
-                max_results=10
-            )
-            
-            groups_results = await self.rest_api_connector.execute_query(
-                query_string=mitre_groups_query,
-                time_range={"start": "-30d", "end": "now"},
-                max_results=5
-            )
+            # Pick up any new ATT&CK release before summarising (parsing one blocks for seconds)
+            await run_in_thread(sync_attack_store)
+            store = get_attack_store()
             
             # Format the results as a string
             intel = "Latest MITRE ATT&CK Techniques:\n"
-            for technique in techniques_results:
+            for technique in store.recent_techniques(limit=10):
                 intel += f"- {technique.get('id')}: {technique.get('name')}\n"
                 intel += f"  Description: {technique.get('description', '')[:200]}...\n"
             
             intel += "\nActive Threat Actor Groups:\n"
-            for group in groups_results:
-                intel += f"- {group.get('id')}: {group.get('name')} ({', '.join(group.get('aliases', []))})\n"
+            for group in store.active_groups(limit=5):
+                aliases = [alias for alias in group.get('aliases', []) if alias != group.get('name')]
+                intel += f"- {group.get('id')}: {group.get('name')} ({', '.join(aliases)})\n"
                 intel += f"  Known for techniques: {', '.join(group.get('techniques', []))}\n"
             
             return intel
@@ -164,47 +136,81 @@ class HypothesisGeneratorAgent:
         - Several instances of unusual PowerShell execution
         """
     
-    async def generate_hypotheses(self, count: int = 5) -> List[Dict[str, Any]]:
+    @instrument_agent("hypothesis_generator", "generate_hypotheses")
+    async def generate_hypotheses(self, count: int = 5, threat_intel: Optional[str] = None) -> List[Dict[str, Any]]:
         """
         Generate actionable threat hunting hypotheses
+        
+        Callers that have already fetched the threat intelligence can pass it in
+        to avoid fetching it a second time.
         """
         try:
-            # Check if LLM chain is initialized
-            if self.chain is None:
-                # LLM is not available, raise exception to trigger fallback to mock data
-                raise ValueError("LLM chain not initialized. Using mock data.")
-                
-            # Fetch threat intelligence
-            threat_intel = await self._fetch_threat_intelligence()
-            
-            # Get environment context
-            environment_context = self._get_environment_context()
-            
-            # Run the chain with retry logic for handling rate limits
-            result = await async_retry_with_exponential_backoff(
-                self.chain.ainvoke,
-                {
-                    "threat_intel": threat_intel,
-                    "environment_context": environment_context
-                },
-                max_retries=5,  # Maximum number of retries
-                # The initial_delay will be overridden by API's retry_delay if available
-                initial_delay=20,
-                max_delay=300  # Maximum delay of 5 minutes
-            )
-            
-            # Parse the result
-            hypotheses = json.loads(result)
-            
-            # Limit to the requested count
-            limited_hypotheses = hypotheses[:count] if count < len(hypotheses) else hypotheses
-            
-            # Ensure each hypothesis has a generated timestamp
-            for hypothesis in limited_hypotheses:
-                hypothesis["generated_at"] = datetime.now().isoformat()
-            
-            return limited_hypotheses
+            hypotheses = [hypothesis async for hypothesis in self.stream_hypotheses(count, threat_intel)]
+            if not hypotheses:
+                raise ValueError("LLM returned no parseable hypotheses")
+            return hypotheses
         except Exception as e:
             logger.error(f"Error generating hypotheses: {str(e)}")
             # We'll let the main.py handle the fallback to mock data
             raise
+    
+    async def stream_hypotheses(self, count: int = 5, threat_intel: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Yield each hypothesis as soon as the LLM has finished generating it
+        
+        If the completion is cut off or malformed part-way, the hypotheses that were
+        already complete are kept and the stream ends early instead of failing.
+        """
+        # Check if LLM chain is initialized
+        if self.chain is None:
+            # LLM is not available, raise exception to trigger fallback to mock data
+            raise ValueError("LLM chain not initialized. Using mock data.")
+            
+        # Fetch threat intelligence
+        if threat_intel is None:
+            threat_intel = await self._fetch_threat_intelligence()
+        
+        # Get environment context
+        environment_context = self._get_environment_context()
+        
+        # Assemble the prompt within budget; environment context is trimmed before threat intel
+        builder = PromptBuilder(
+            "hypothesis_generator",
+            settings.PROMPT_BUDGET_HYPOTHESIS_GENERATOR,
+            self.prompt_template.template
+        )
+        builder.add("threat_intel", threat_intel, priority=1)
+        builder.add("environment_context", environment_context, priority=2)
+        
+        # Parse each element of the top-level JSON array as it completes
+        parser = JsonArrayStreamParser()
+        yielded = 0
+        
+        # Stream the chain with retry logic for handling rate limits
+        stream = stream_with_budget(
+            builder,
+            self.chain.astream,
+            max_retries=5,  # Maximum number of retries
+            # The initial_delay will be overridden by API's retry_delay if available
+            initial_delay=20,
+            max_delay=300  # Maximum delay of 5 minutes
+        )
+        try:
+            async for chunk in stream:
+                for hypothesis in parser.feed(chunk):
+                    if not isinstance(hypothesis, dict):
+                        continue
+                    # Ensure each hypothesis has a generated timestamp
+                    hypothesis["generated_at"] = datetime.now().isoformat()
+                    yield hypothesis
+                    yielded += 1
+                    # Limit to the requested count
+                    if yielded >= count:
+                        return
+        except StreamInterruptedError as e:
+            logger.warning(f"{str(e)}; keeping {yielded} complete hypotheses")
+        finally:
+            await stream.aclose()
+        
+        if parser.skipped:
+            logger.warning(f"Skipped {parser.skipped} malformed hypotheses in LLM output")
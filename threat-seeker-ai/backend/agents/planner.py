@@ -3,6 +3,10 @@ import uuid
 from typing import Dict, List, Optional, Any
 from pydantic import BaseModel
 
+from knowledge.attack_store import get_attack_store
+from query_engine import QuerySyntaxError, get_query_compiler
+from utils.metrics import instrument_agent
+
 class QueryDetails(BaseModel):
     query_id: str
     data_source: str
@@ -12,6 +16,8 @@ class QueryDetails(BaseModel):
     time_range: Dict[str, str]
     expected_volume: str
     risk_level: str
+    # Backend-neutral form of the query (query_engine.ir), when the engine can parse it
+    ir: Optional[Dict[str, Any]] = None
 
 class HuntPlan(BaseModel):
     plan_id: str
@@ -33,6 +39,7 @@ class HuntPlannerAgent:
         # In a real implementation, this would initialize a language model
         pass
     
+    @instrument_agent("planner", "create_plan")
     async def create_plan(self, hypothesis: str, analyst_id: str, context: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """
         Create a hunt plan from a natural language hypothesis
@@ -85,26 +92,23 @@ class HuntPlannerAgent:
             ],
             created_at=datetime.now(),
             analyst_id=analyst_id,
-            mitre_techniques=[
-                {
-                    "id": "T1546.003",
-                    "name": "Windows Management Instrumentation Event Subscription",
-                    "description": "Adversaries may establish persistence by executing malicious content triggered by a Windows Management Instrumentation (WMI) event subscription."
-                },
-                {
-                    "id": "T1047",
-                    "name": "Windows Management Instrumentation",
-                    "description": "Adversaries may abuse Windows Management Instrumentation (WMI) to execute malicious commands and payloads."
-                },
-                {
-                    "id": "T1021",
-                    "name": "Remote Services",
-                    "description": "Adversaries may use valid accounts to log into remote services such as VPN, RDP, or SSH."
-                }
-            ],
+            mitre_techniques=[],
             estimated_execution_time="2-5 minutes"
         )
         
+        # Describe the targeted techniques from the local ATT&CK knowledge base
+        hunt_plan.mitre_techniques = get_attack_store().describe_techniques(
+            technique_id for query in hunt_plan.queries for technique_id in query.technique_ids
+        )
+        
+        # Attach the IR of each query so the executor can run it on any backend
+        compiler = get_query_compiler()
+        for query in hunt_plan.queries:
+            try:
+                query.ir, _ = compiler.ir(query.query_string)
+            except QuerySyntaxError:
+                query.ir = None
+        
         # Convert the hunt_plan to a dictionary
         plan_dict = hunt_plan.model_dump()
         
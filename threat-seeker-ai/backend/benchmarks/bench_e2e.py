@@ -0,0 +1,369 @@
+"""
+End-to-end load and latency benchmark of the API.
+
+The FastAPI app runs in-process behind httpx's ASGI transport (no sockets), with
+fake Splunk, Elasticsearch and REST connectors and a fake LLM, each with its own
+latency and error distribution (see benchmarks/fakes.py). A seeded mix of
+hypothesis, execute, clarify and suggested-hypotheses requests is driven at a
+fixed concurrency, and throughput, p50/p95/p99 latency and memory are reported.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_e2e --requests 2000 --concurrency 32
+    python -m benchmarks.bench_e2e --save-baseline benchmarks/baselines/e2e.json
+    python -m benchmarks.bench_e2e --compare benchmarks/baselines/e2e.json
+
+--compare exits with status 1 when a latency percentile or the overall throughput
+is worse than the baseline by more than --tolerance.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import random
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Any, Dict, List, Tuple
+
+DEFAULT_MIX = "hypothesis=2,execute=3,clarify=3,suggested=2,suggested_stream=0"
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        weights[name.strip()] = float(weight or 1)
+    unknown = set(weights) - set(REQUESTS)
+    if unknown:
+        raise SystemExit(f"Unknown request types in --mix: {', '.join(sorted(unknown))}")
+    return {name: weight for name, weight in weights.items() if weight > 0}
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def rss_bytes() -> int:
+    """
+    Current resident set size, or the peak where /proc is not available
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return peak_rss_bytes()
+
+
+def peak_rss_bytes() -> int:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class Workload:
+    """
+    The state requests draw on: plans to execute and results to ask about
+    """
+
+    def __init__(self, rng: random.Random, include_events: bool):
+        self.rng = rng
+        self.include_events = include_events
+        self.plans: List[Dict[str, Any]] = []
+        self.result_ids: List[str] = []
+
+
+async def request_hypothesis(client: Any, workload: Workload) -> int:
+    response = await client.post("/api/hypothesis", json={
+        "hypothesis": "Attackers are using WMI event consumers for persistence and lateral movement",
+        "analyst_id": "benchmark"
+    })
+    if response.status_code == 200:
+        workload.plans.append(response.json())
+        # Keep the working set bounded on long runs
+        del workload.plans[:-50]
+    return response.status_code
+
+
+async def request_execute(client: Any, workload: Workload) -> int:
+    plan = workload.rng.choice(workload.plans)
+    response = await client.post(
+        f"/api/execute?include_events={'true' if workload.include_events else 'false'}",
+        json={"plan_id": plan["plan_id"], "query_ids": [q["query_id"] for q in plan["queries"]]},
+        headers={"Accept-Encoding": "gzip"}
+    )
+    if response.status_code == 200:
+        workload.result_ids.append(response.json()["result_id"])
+        del workload.result_ids[:-50]
+    return response.status_code
+
+
+async def request_clarify(client: Any, workload: Workload) -> int:
+    response = await client.post("/api/clarify", json={
+        "result_id": workload.rng.choice(workload.result_ids),
+        "question": "Why is the WMI activity on DC01 suspicious?",
+        "context": {}
+    })
+    return response.status_code
+
+
+async def request_suggested(client: Any, workload: Workload) -> int:
+    response = await client.get("/api/suggested-hypotheses?count=3")
+    return response.status_code
+
+
+async def request_suggested_stream(client: Any, workload: Workload) -> int:
+    async with client.stream("GET", "/api/suggested-hypotheses/stream?count=3") as response:
+        async for _ in response.aiter_lines():
+            pass
+        return response.status_code
+
+
+REQUESTS = {
+    "hypothesis": request_hypothesis,
+    "execute": request_execute,
+    "clarify": request_clarify,
+    "suggested": request_suggested,
+    "suggested_stream": request_suggested_stream,
+}
+
+
+async def install_fakes(main_module: Any, args: argparse.Namespace) -> None:
+    """
+    Replace connectors and LLM calls of the app's agents with the fakes
+    """
+    from benchmarks.fakes import FakeConnector, FakeLLM, hypotheses_completion, with_llm_latency
+
+    agents = main_module.agents
+    execution = await agents.get("execution")
+    latencies = {"splunk": args.splunk_latency, "elastic": args.elastic_latency, "rest_api": args.rest_latency}
+    for offset, (data_source, latency) in enumerate(latencies.items()):
+        execution.connectors[data_source] = FakeConnector(
+            data_source, latency, args.source_error_rate, args.rows_per_query, args.seed + offset
+        )
+
+    llm = FakeLLM(args.llm_first_token, args.llm_tokens_per_second, args.llm_error_rate, args.seed,
+                  completion=hypotheses_completion())
+    # Planning, analysis and clarification are not LLM-backed yet; give them an LLM call's latency
+    with_llm_latency(await agents.get("planner"), "create_plan", llm, 600)
+    with_llm_latency(await agents.get("analysis"), "analyze_results", llm, 800)
+    with_llm_latency(await agents.get("clarification"), "get_clarification", llm, 300)
+
+    generator = await agents.get("hypothesis_generator")
+    if generator is not None:
+        generator.chain = type("FakeChain", (), {"astream": staticmethod(llm.astream)})()
+        await main_module.hypothesis_pool.refresh()
+
+
+async def run_load(client: Any, workload: Workload, kinds: List[str], concurrency: int) -> List[Tuple[str, float, bool]]:
+    samples: List[Tuple[str, float, bool]] = []
+    queue = iter(kinds)
+
+    async def worker() -> None:
+        for kind in queue:
+            start = time.perf_counter()
+            try:
+                ok = (await REQUESTS[kind](client, workload)) < 400
+            except Exception:
+                ok = False
+            samples.append((kind, time.perf_counter() - start, ok))
+
+    await asyncio.gather(*(worker() for _ in range(max(1, min(concurrency, len(kinds))))))
+    return samples
+
+
+def summarize(samples: List[Tuple[str, float, bool]], wall_seconds: float) -> Dict[str, Dict[str, float]]:
+    summary = {}
+    groups: Dict[str, List[Tuple[float, bool]]] = {}
+    for kind, seconds, ok in samples:
+        groups.setdefault(kind, []).append((seconds, ok))
+        groups.setdefault("all", []).append((seconds, ok))
+    for kind, values in sorted(groups.items(), key=lambda item: item[0] == "all"):
+        latencies = sorted(seconds for seconds, _ in values)
+        summary[kind] = {
+            "requests": len(values),
+            "errors": sum(1 for _, ok in values if not ok),
+            "throughput_rps": len(values) / wall_seconds if wall_seconds else 0.0,
+            "p50_ms": percentile(latencies, 0.50) * 1000,
+            "p95_ms": percentile(latencies, 0.95) * 1000,
+            "p99_ms": percentile(latencies, 0.99) * 1000,
+            "max_ms": latencies[-1] * 1000
+        }
+    return summary
+
+
+def print_table(results: Dict[str, Dict[str, float]], memory: Dict[str, float]) -> None:
+    headers = ["request", "count", "errors", "req/s", "p50 ms", "p95 ms", "p99 ms", "max ms"]
+    rows = [
+        [kind, str(r["requests"]), str(r["errors"]), f"{r['throughput_rps']:.1f}", f"{r['p50_ms']:.1f}",
+         f"{r['p95_ms']:.1f}", f"{r['p99_ms']:.1f}", f"{r['max_ms']:.1f}"]
+        for kind, r in results.items()
+    ]
+    widths = [max(len(row[i]) for row in rows + [headers]) for i in range(len(headers))]
+    for row in [headers] + rows:
+        print("  ".join(cell.ljust(width) for cell, width in zip(row, widths)))
+    print("\nmemory: " + ", ".join(f"{name} {value:.1f} MB" for name, value in memory.items()))
+
+
+def compare(report: Dict[str, Any], baseline_path: str, tolerance: float, min_delta_ms: float) -> bool:
+    """
+    Print the change against a saved baseline; False if anything regressed beyond tolerance
+    """
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    if baseline.get("config") != report["config"]:
+        print("\nwarning: the baseline was recorded with a different configuration")
+
+    print(f"\ncompared with {baseline_path} ({baseline.get('recorded_at', 'unknown date')}):")
+    regressed = False
+    for kind, current in report["results"].items():
+        previous = baseline["results"].get(kind)
+        if previous is None:
+            continue
+        changes = []
+        # Throughput is compared for the whole mix only, per request type it just mirrors the mix
+        metrics = ("p50_ms", "p95_ms", "p99_ms") + (("throughput_rps",) if kind == "all" else ())
+        for metric in metrics:
+            before, after = previous[metric], current[metric]
+            if not before:
+                continue
+            change = (after - before) / before
+            if metric == "throughput_rps":
+                worse = change < -tolerance
+            else:
+                # Ignore jitter on requests that take a few milliseconds
+                worse = change > tolerance and after - before > min_delta_ms
+            regressed |= worse
+            changes.append(f"{metric} {change:+.1%}{' REGRESSION' if worse else ''}")
+        print(f"  {kind}: " + ", ".join(changes))
+    return not regressed
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    data_dir = tempfile.mkdtemp(prefix="threat-seeker-bench-")
+    # Keep the benchmark's stored results, index and traces out of the real data directory
+    os.environ.update({
+        "RESULT_STORE_PATH": os.path.join(data_dir, "results"),
+        "SEARCH_INDEX_PATH": os.path.join(data_dir, "search_index.jsonl"),
+        "TRACE_EXPORT_PATH": os.path.join(data_dir, "traces.jsonl"),
+        "STATE_BACKEND": args.state_backend,
+        "STATE_SQLITE_PATH": os.path.join(data_dir, "state.db"),
+        "RATE_LIMIT_PER_MINUTE": "0",
+        "AGENT_WARMUP_ON_STARTUP": "False",
+    })
+    import logging
+    logging.disable(logging.WARNING)
+    import httpx
+    import main as main_module
+    from utils.serialization import orjson, zstandard
+
+    if args.trace_memory:
+        tracemalloc.start()
+    rss_start = rss_bytes()
+
+    await install_fakes(main_module, args)
+    rng = random.Random(args.seed)
+    workload = Workload(rng, args.include_events)
+    transport = httpx.ASGITransport(app=main_module.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        # Seed plans and results for execute and clarify requests
+        for _ in range(4):
+            await request_hypothesis(client, workload)
+        for _ in range(2):
+            await request_execute(client, workload)
+        if not workload.plans or not workload.result_ids:
+            raise SystemExit("Could not create the plans and results the workload needs")
+
+        # Drawn from its own generator so the mix does not depend on request timing
+        mix = parse_mix(args.mix)
+        names, weights = list(mix), list(mix.values())
+        mix_rng = random.Random(args.seed)
+        await run_load(client, workload, mix_rng.choices(names, weights, k=args.warmup), args.concurrency)
+
+        kinds = mix_rng.choices(names, weights, k=args.requests)
+        start = time.perf_counter()
+        samples = await run_load(client, workload, kinds, args.concurrency)
+        wall_seconds = time.perf_counter() - start
+
+    memory = {
+        "rss start": rss_start / 1e6,
+        "rss end": rss_bytes() / 1e6,
+        "rss peak": peak_rss_bytes() / 1e6
+    }
+    if args.trace_memory:
+        memory["python heap peak"] = tracemalloc.get_traced_memory()[1] / 1e6
+        tracemalloc.stop()
+
+    return {
+        "recorded_at": datetime.now().isoformat(),
+        "config": {
+            key: getattr(args, key) for key in (
+                "requests", "concurrency", "seed", "mix", "include_events", "rows_per_query", "state_backend",
+                "splunk_latency", "elastic_latency", "rest_latency", "source_error_rate",
+                "llm_first_token", "llm_tokens_per_second", "llm_error_rate"
+            )
+        },
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "orjson": orjson is not None,
+            "zstandard": zstandard is not None
+        },
+        "wall_seconds": wall_seconds,
+        "results": summarize(samples, wall_seconds),
+        "memory_mb": memory
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=1000, help="measured requests")
+    parser.add_argument("--warmup", type=int, default=50, help="unmeasured requests before the run")
+    parser.add_argument("--concurrency", type=int, default=16, help="requests in flight")
+    parser.add_argument("--seed", type=int, default=7, help="seed for the request mix and the fakes")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"request weights (default {DEFAULT_MIX})")
+    parser.add_argument("--include-events", action="store_true", help="return raw events from /api/execute")
+    parser.add_argument("--rows-per-query", type=int, default=500, help="events returned by each fake query")
+    parser.add_argument("--state-backend", default="memory", choices=["memory", "sqlite"])
+    parser.add_argument("--splunk-latency", default="lognormal:120:0.5")
+    parser.add_argument("--elastic-latency", default="lognormal:60:0.4")
+    parser.add_argument("--rest-latency", default="uniform:20:80")
+    parser.add_argument("--source-error-rate", type=float, default=0.01)
+    parser.add_argument("--llm-first-token", default="lognormal:400:0.3", help="time to first token")
+    parser.add_argument("--llm-tokens-per-second", type=float, default=2000.0)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--trace-memory", action="store_true", help="also report the Python heap peak (slower)")
+    parser.add_argument("--save-baseline", metavar="PATH", help="write the report as a baseline")
+    parser.add_argument("--compare", metavar="PATH", help="compare with a saved baseline")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed relative regression (default 0.10)")
+    parser.add_argument("--min-delta-ms", type=float, default=5.0, help="latency increases below this are not regressions")
+    args = parser.parse_args()
+
+    # Connectors and agents print per query; keep the report readable
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        report = asyncio.run(run(args))
+    print(f"{args.requests} requests at concurrency {args.concurrency} in {report['wall_seconds']:.1f}s "
+          f"(seed {args.seed}, mix {args.mix})\n")
+    print_table(report["results"], report["memory_mb"])
+
+    if args.save_baseline:
+        directory = os.path.dirname(args.save_baseline)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(args.save_baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nbaseline saved to {args.save_baseline}")
+    if args.compare and not compare(report, args.compare, args.tolerance, args.min_delta_ms):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Benchmark clarification retrieval: building a stored result's BM25 event index
+and answering questions from it.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_retrieval --events 200000
+
+Events come from the seeded synthetic telemetry generator and are stored in a
+temporary result store. Saving times chunk writing, indexing times building the
+index from the chunks (done by the first question about a result), and each
+question times the index search plus reading its top events back from their
+chunks (ResultStore.retrieve), after a first question has loaded the index.
+"""
+import argparse
+import statistics
+import tempfile
+import time
+from typing import Any, Dict, List
+
+from connectors.telemetry import TelemetryGenerator
+from storage.chunk_store import ChunkStore
+from utils.event_fields import to_epoch
+from storage.result_store import ResultStore
+
+# Questions with the filters an analyst would add to them
+QUESTIONS: List[Dict[str, Any]] = [
+    {"question": "Why is the encoded powershell command suspicious?"},
+    {"question": "Which hosts ran certutil or mimikatz?"},
+    {"question": "What did svchost.exe spawn through wmiprvse?"},
+    {"question": "Remote interactive logons with logon type 10", "host": "DC01"},
+    {"question": "What else did this account do?", "user": "robert.moore"},
+    {"question": "failed logons 4625", "start": "2023-06-15T00:00:00Z", "end": "2023-06-15T06:00:00Z"},
+]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=200_000)
+    parser.add_argument("--queries", type=int, default=4, help="hunt queries the events are split across")
+    parser.add_argument("--top-k", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=20, help="runs of each question")
+    parser.add_argument("--seed", type=int, default=1337)
+    args = parser.parse_args()
+
+    generator = TelemetryGenerator(seed=args.seed, attack_rate=0.01)
+    events = list(generator.events(args.events))
+    share = -(-len(events) // args.queries)
+    hunt_result = {
+        "result_id": "bench",
+        "plan_id": "bench",
+        "raw_results": {"query_results": [
+            {"query_id": f"q{number}", "status": "success", "results": events[start:start + share],
+             "result_count": len(events[start:start + share])}
+            for number, start in enumerate(range(0, len(events), share))
+        ]},
+        "analysis": {},
+    }
+
+    with tempfile.TemporaryDirectory() as root:
+        store = ResultStore(ChunkStore(root), retrieval_max_events=args.events)
+        start = time.perf_counter()
+        store.save(hunt_result)
+        saved = time.perf_counter() - start
+        start = time.perf_counter()
+        stats = store.event_index("bench").stats()
+        seconds = time.perf_counter() - start
+        print(
+            f"{len(events)} events saved in {saved:.2f}s and indexed in {seconds:.2f}s "
+            f"({len(events) / seconds:,.0f} events/s), "
+            f"{stats['terms']:,} terms, ~{stats['index_bytes'] / 2 ** 20:.1f} MiB of postings\n"
+        )
+
+        # Loading the index from disk, as after a restart
+        store = ResultStore(ChunkStore(root), retrieval_max_events=args.events)
+        start = time.perf_counter()
+        store.event_index("bench")
+        print(f"index loaded in {(time.perf_counter() - start) * 1000:.0f} ms\n")
+
+        for case in QUESTIONS:
+            latencies = []
+            for _ in range(args.repeat):
+                retrieved = store.retrieve(
+                    "bench", case["question"], args.top_k, case.get("host"), case.get("user"),
+                    to_epoch(case.get("start")), to_epoch(case.get("end"))
+                )
+                latencies.append(retrieved["took_ms"])
+            filters = " ".join(f"{k}={v}" for k, v in case.items() if k != "question")
+            print(
+                f"{case['question'][:48]:48} {filters[:30]:30} matched {retrieved['total']:>8,}"
+                f"   p50 {statistics.median(latencies):7.2f} ms   max {max(latencies):7.2f} ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Benchmark hunt result encodings against FastAPI's default response path.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_serialization --events 50000 --queries 5
+
+The baseline validates the payload against the HuntResult response model, runs it
+through jsonable_encoder and renders it with JSONResponse, which is what FastAPI does
+when a route returns a dict. The other encodings are the ones served by /api/execute.
+"""
+import argparse
+import gzip
+import json
+import random
+import statistics
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Tuple
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from utils.serialization import compress, decode_columnar, dumps, encode_columnar, orjson, zstandard
+
+HOSTS = ["SERVER01", "SERVER02", "SERVER03", "DC01", "WORKSTATION01", "WORKSTATION02", "WORKSTATION03"]
+USERS = ["SYSTEM", "DOMAIN\\admin", "DOMAIN\\user", "DOMAIN\\svc_account"]
+PROCESSES = ["WmiPrvSE.exe", "powershell.exe", "cmd.exe", "wmic.exe", "svchost.exe", "rundll32.exe"]
+
+
+def make_payload(queries: int, events: int, seed: int = 7) -> Dict[str, Any]:
+    """
+    Build a hunt result shaped like /api/execute output, with events spread over queries
+    """
+    rng = random.Random(seed)
+    per_query = events // queries
+    query_results = []
+    for q in range(queries):
+        results = [
+            {
+                "host": rng.choice(HOSTS),
+                "process": rng.choice(PROCESSES),
+                "command_line": f"C:\\Windows\\System32\\{rng.choice(PROCESSES)} -k {rng.randint(0, 500)}",
+                "user": rng.choice(USERS),
+                "event_code": rng.choice([4624, 4625, 4688, 4698, 5140]),
+                "bytes_out": rng.randint(0, 10_000_000),
+                "timestamp": f"2023-06-15T{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:{rng.randint(0, 59):02d}Z"
+            }
+            for _ in range(per_query)
+        ]
+        query_results.append({
+            "query_id": f"q{q + 1}",
+            "data_source": "splunk" if q % 2 == 0 else "elastic",
+            "results": results,
+            "result_count": len(results),
+            "execution_time": 1.0,
+            "executed_at": datetime.now().isoformat(),
+            "status": "success"
+        })
+    result_id = str(uuid.uuid4())
+    plan_id = str(uuid.uuid4())
+    return {
+        "result_id": result_id,
+        "plan_id": plan_id,
+        "raw_results": {"result_id": result_id, "plan_id": plan_id, "query_results": query_results},
+        "analysis": {"summary": {"total_results": events}, "findings": []},
+        "created_at": datetime.now().isoformat()
+    }
+
+
+def fastapi_default(payload: Dict[str, Any]) -> bytes:
+    from main import HuntResult
+    model = HuntResult.model_validate(payload)
+    return JSONResponse(jsonable_encoder(model)).body
+
+
+def measure(func: Callable[[], bytes], repeat: int) -> Tuple[float, bytes]:
+    timings = []
+    body = b""
+    for _ in range(repeat):
+        start = time.perf_counter()
+        body = func()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings), body
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=20000, help="total events across all queries")
+    parser.add_argument("--queries", type=int, default=4, help="number of queries in the hunt")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per encoding (median is reported)")
+    args = parser.parse_args()
+
+    payload = make_payload(args.queries, args.events)
+    print(f"{args.events} events in {args.queries} queries, median of {args.repeat} runs")
+    print(f"orjson: {'yes' if orjson else 'no (stdlib json)'}, zstandard: {'yes' if zstandard else 'no'}\n")
+
+    encoders = [
+        ("fastapi default", lambda: fastapi_default(payload)),
+        ("fast json", lambda: dumps(payload)),
+        ("columnar", lambda: encode_columnar(payload)),
+    ]
+    codings = ["gzip"] + (["zstd"] if zstandard else [])
+
+    rows: List[List[str]] = []
+    baseline_seconds = None
+    for name, encode in encoders:
+        seconds, body = measure(encode, args.repeat)
+        baseline_seconds = baseline_seconds or seconds
+        row = [name, f"{seconds * 1000:.1f} ms", f"{baseline_seconds / seconds:.1f}x", f"{len(body) / 1e6:.2f} MB"]
+        for coding in codings:
+            compress_seconds, compressed = measure(lambda: compress(body, coding), args.repeat)
+            row.append(f"{len(compressed) / 1e6:.2f} MB / {compress_seconds * 1000:.0f} ms")
+        rows.append(row)
+
+    headers = ["encoding", "encode", "speedup", "size"] + codings
+    widths = [max(len(r[i]) for r in rows + [headers]) for i in range(len(headers))]
+    for row in [headers] + rows:
+        print("  ".join(cell.ljust(width) for cell, width in zip(row, widths)))
+
+    # Sanity check: the columnar format round-trips to the same events
+    decoded = decode_columnar(encode_columnar(payload))
+    original = json.loads(dumps(payload))
+    assert decoded["raw_results"]["query_results"][0]["results"] == original["raw_results"]["query_results"][0]["results"]
+    assert gzip.decompress(compress(dumps(payload), "gzip")) == dumps(payload)
+
+
+if __name__ == "__main__":
+    main()
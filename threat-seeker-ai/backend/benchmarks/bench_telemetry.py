@@ -0,0 +1,72 @@
+"""
+Benchmark the synthetic telemetry generator used by the simulated connectors.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_telemetry --events 2000000 --workers 4
+
+Each worker process generates every --workers-th batch of the same seeded stream,
+so the events are identical for any number of workers and throughput scales with
+cores. Per-shape throughput of a single process is reported first.
+"""
+import argparse
+import multiprocessing
+import time
+from collections import Counter
+from typing import Tuple
+
+from connectors.telemetry import TelemetryGenerator
+
+
+def _generate(args: Tuple[argparse.Namespace, str, int]) -> int:
+    options, shape, worker = args
+    generator = TelemetryGenerator(
+        hosts=options.hosts, users=options.users, seed=options.seed, attack_rate=options.attack_rate
+    )
+    events = 0
+    for batch in generator.stream(options.events, options.batch_size, shape, worker=worker, workers=options.workers):
+        events += len(batch)
+    return events
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=1_000_000, help="events per shape")
+    parser.add_argument("--batch-size", type=int, default=100_000, help="events per generated batch")
+    parser.add_argument("--workers", type=int, default=multiprocessing.cpu_count(), help="processes for the parallel run")
+    parser.add_argument("--hosts", type=int, default=200)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=1337)
+    parser.add_argument("--attack-rate", type=float, default=0.01)
+    args = parser.parse_args()
+
+    generator = TelemetryGenerator(
+        hosts=args.hosts, users=args.users, seed=args.seed, attack_rate=args.attack_rate, label_scenarios=True
+    )
+    print(f"{args.events} events per shape, {len(generator.hosts)} hosts, {len(generator.users)} users\n")
+
+    for shape in ("splunk", "elastic"):
+        start = time.perf_counter()
+        events = 0
+        for batch in generator.stream(args.events, args.batch_size, shape):
+            events += len(batch)
+        seconds = time.perf_counter() - start
+        print(f"{shape:8} 1 process   {events / seconds:>12,.0f} events/s")
+
+        start = time.perf_counter()
+        with multiprocessing.Pool(args.workers) as pool:
+            events = sum(pool.map(_generate, [(args, shape, w) for w in range(args.workers)]))
+        seconds = time.perf_counter() - start
+        print(f"{shape:8} {args.workers} processes {events / seconds:>12,.0f} events/s")
+
+    # What a batch contains
+    sample = generator.events(min(args.events, 100_000))
+    codes = Counter(event["EventCode"] for event in sample)
+    scenarios = Counter(event["scenario"] for event in sample if "scenario" in event)
+    print("\nevent codes: " + ", ".join(f"{code}={n}" for code, n in sorted(codes.items())))
+    print("scenario events: " + (", ".join(f"{name}={n}" for name, n in sorted(scenarios.items())) or "none"))
+    assert sample == generator.events(len(sample)), "generation is not reproducible"
+
+
+if __name__ == "__main__":
+    main()
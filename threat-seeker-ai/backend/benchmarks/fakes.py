@@ -0,0 +1,135 @@
+"""
+Fake data sources and a fake LLM with configurable latency and error distributions,
+used by the end-to-end benchmark in place of Splunk, Elasticsearch, REST APIs and Gemini.
+
+Latency distributions are given as strings:
+
+    fixed:MS              always MS milliseconds
+    uniform:LOW:HIGH      uniformly between LOW and HIGH milliseconds
+    lognormal:MEDIAN:SIGMA  log-normal around MEDIAN milliseconds (SIGMA ~0.5 gives a long tail)
+"""
+import asyncio
+import json
+import math
+import random
+from typing import Any, AsyncIterator, Callable, Dict, List
+
+from connectors.telemetry import TelemetryGenerator
+from utils.metrics import instrument_connector
+
+class FakeServiceError(Exception):
+    """
+    Injected failure of a fake data source or LLM
+    """
+
+
+class Latency:
+    """
+    A latency distribution parsed from a spec string, sampled in seconds
+    """
+
+    def __init__(self, spec: str):
+        self.spec = spec
+        kind, *params = spec.split(":")
+        values = [float(p) for p in params]
+        if kind == "fixed" and len(values) == 1:
+            self._sample = lambda rng: values[0]
+        elif kind == "uniform" and len(values) == 2:
+            self._sample = lambda rng: rng.uniform(values[0], values[1])
+        elif kind == "lognormal" and len(values) == 2:
+            mu = math.log(max(values[0], 1e-6))
+            self._sample = lambda rng: rng.lognormvariate(mu, values[1])
+        else:
+            raise ValueError(f"Invalid latency distribution: {spec}")
+
+    def sample(self, rng: random.Random) -> float:
+        return max(0.0, self._sample(rng)) / 1000
+
+
+class FakeConnector:
+    """
+    Stands in for a data source connector: waits for a sampled latency, fails at the
+    given rate and returns rows_per_query events of seeded synthetic telemetry
+    """
+
+    def __init__(self, data_source: str, latency: str, error_rate: float, rows_per_query: int, seed: int):
+        self.data_source = data_source
+        self.latency = Latency(latency)
+        self.error_rate = error_rate
+        self.rows_per_query = rows_per_query
+        self.rng = random.Random(seed)
+        self.telemetry = TelemetryGenerator(seed=seed)
+        self.execute_query = instrument_connector(data_source)(self._execute_query)
+
+    async def _execute_query(self, query_string: str, time_range: Dict[str, str], max_results: int = 1000) -> List[Dict[str, Any]]:
+        await asyncio.sleep(self.latency.sample(self.rng))
+        if self.rng.random() < self.error_rate:
+            raise FakeServiceError(f"{self.data_source} returned HTTP 503")
+        shape = "elastic" if self.data_source == "elastic" else "splunk"
+        return self.telemetry.for_query(query_string, time_range, min(self.rows_per_query, max_results), shape)
+
+
+class FakeLLM:
+    """
+    Stands in for the Gemini chain: time to first token, then a token rate, and
+    failures at the given rate. astream() replaces a chain's astream; simulate()
+    adds the same latency to agents that do not call an LLM yet.
+    """
+
+    def __init__(self, first_token: str, tokens_per_second: float, error_rate: float, seed: int,
+                 completion: Callable[[], str] = lambda: "[]"):
+        self.first_token = Latency(first_token)
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.completion = completion
+
+    async def astream(self, inputs: Any, *args: Any, **kwargs: Any) -> AsyncIterator[str]:
+        await asyncio.sleep(self.first_token.sample(self.rng))
+        if self.rng.random() < self.error_rate:
+            raise FakeServiceError("LLM returned HTTP 500")
+        text = self.completion()
+        # Roughly four characters per token, streamed in chunks of eight tokens
+        chunk_chars = 32
+        for start in range(0, len(text), chunk_chars):
+            await asyncio.sleep(8 / self.tokens_per_second)
+            yield text[start:start + chunk_chars]
+
+    async def simulate(self, completion_tokens: int) -> None:
+        await asyncio.sleep(self.first_token.sample(self.rng) + completion_tokens / self.tokens_per_second)
+        if self.rng.random() < self.error_rate:
+            raise FakeServiceError("LLM returned HTTP 500")
+
+
+def hypotheses_completion(count: int = 5) -> Callable[[], str]:
+    """
+    A JSON array of hypotheses shaped like the hypothesis generator's output
+    """
+    def completion() -> str:
+        return json.dumps([
+            {
+                "title": f"Benchmark hypothesis {i + 1}",
+                "description": "Look for WMI event consumers created outside change windows.",
+                "threat_actors": ["APT29"],
+                "techniques": ["T1546.003"],
+                "confidence": 0.8,
+                "justification": "Synthetic",
+                "data_sources": ["Windows Event Logs"],
+                "source": "Benchmark"
+            }
+            for i in range(count)
+        ])
+    return completion
+
+
+def with_llm_latency(agent: Any, method: str, llm: FakeLLM, completion_tokens: int) -> None:
+    """
+    Make an agent method wait for a simulated LLM call before running
+    """
+    original = getattr(agent, method)
+
+    async def wrapper(*args: Any, **kwargs: Any) -> Any:
+        await llm.simulate(completion_tokens)
+        return await original(*args, **kwargs)
+
+    setattr(agent, method, wrapper)
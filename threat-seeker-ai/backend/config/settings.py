@@ -26,12 +26,119 @@ class Settings(BaseSettings):
     ELASTIC_USERNAME: str = config("ELASTIC_USERNAME", default="")
     ELASTIC_PASSWORD: str = config("ELASTIC_PASSWORD", default="")
     
+    # File Replay Settings (the "file" data source replays exported logs from this directory)
+    REPLAY_DATA_DIR: str = config("REPLAY_DATA_DIR", default="data/replay")
+    REPLAY_TIME_FIELD: str = config("REPLAY_TIME_FIELD", default="timestamp")
+    
+    # Query Routing Settings (queries for the "auto" data source run on the backend holding their index)
+    QUERY_ROUTES: str = config("QUERY_ROUTES", default="")  # e.g. "windows=splunk,winlogbeat-*=elastic"
+    QUERY_DEFAULT_BACKEND: str = config("QUERY_DEFAULT_BACKEND", default="splunk")
+    QUERY_COMPILE_CACHE_SIZE: int = config("QUERY_COMPILE_CACHE_SIZE", default=1024, cast=int)
+    
+    # Query Pushdown Settings (rule-based rewrites of queries before they run)
+    QUERY_PUSHDOWN_ENABLED: bool = config("QUERY_PUSHDOWN_ENABLED", default=True, cast=bool)
+    QUERY_COST_EVENTS: int = config("QUERY_COST_EVENTS", default=1000000, cast=int)  # events a search is assumed to cover in estimates
+    QUERY_PUSHDOWN_MEASURE_RATE: float = config("QUERY_PUSHDOWN_MEASURE_RATE", default=0.02, cast=float)
+    QUERY_PUSHDOWN_SOURCETYPE_NARROWING: bool = config("QUERY_PUSHDOWN_SOURCETYPE_NARROWING", default=False, cast=bool)
+    QUERY_PUSHDOWN_PATH_NAMES: bool = config("QUERY_PUSHDOWN_PATH_NAMES", default=False, cast=bool)
+    
+    # Scheduled Hunt Settings (continuous hunts re-run each query from its last watermark)
+    SCHEDULE_POLL_SECONDS: int = config("SCHEDULE_POLL_SECONDS", default=15, cast=int)
+    SCHEDULE_MIN_INTERVAL_SECONDS: int = config("SCHEDULE_MIN_INTERVAL_SECONDS", default=60, cast=int)
+    SCHEDULE_LATENESS_SECONDS: int = config("SCHEDULE_LATENESS_SECONDS", default=300, cast=int)  # overlap for late-arriving events
+    
+    # Result Diff Settings (re-runs of a plan are diffed against its previous result)
+    ANALYZE_DELTA_ONLY: bool = config("ANALYZE_DELTA_ONLY", default=True, cast=bool)
+    DIFF_SAMPLE_LIMIT: int = config("DIFF_SAMPLE_LIMIT", default=20, cast=int)
+    DIFF_RUN_ROWS: int = config("DIFF_RUN_ROWS", default=200000, cast=int)  # fingerprints sorted in memory before spilling a run
+    
+    # Streaming Detection Settings (approved queries evaluated against live NDJSON event streams)
+    DETECTION_TAIL_PATHS: str = config("DETECTION_TAIL_PATHS", default="")  # comma-separated files to follow
+    DETECTION_TAIL_FROM_START: bool = config("DETECTION_TAIL_FROM_START", default=False, cast=bool)
+    DETECTION_SOCKET_HOST: str = config("DETECTION_SOCKET_HOST", default="127.0.0.1")
+    DETECTION_SOCKET_PORT: int = config("DETECTION_SOCKET_PORT", default=0, cast=int)  # 0 disables the TCP source
+    DETECTION_BATCH_SIZE: int = config("DETECTION_BATCH_SIZE", default=8192, cast=int)
+    DETECTION_ALERT_QUEUE_SIZE: int = config("DETECTION_ALERT_QUEUE_SIZE", default=10000, cast=int)
+    DETECTION_SCHEMA: str = config("DETECTION_SCHEMA", default="cim")  # "ecs" for events with Elastic Common Schema fields
+    DETECTION_SYNC_SECONDS: float = config("DETECTION_SYNC_SECONDS", default=5.0, cast=float)  # rules re-read from the state backend
+    DETECTION_LEASE_SECONDS: float = config("DETECTION_LEASE_SECONDS", default=30.0, cast=float)  # before another worker takes a stream over
+    
+    # IOC Matching Settings (indicators of each THREAT_INTEL_SOURCES feed tagged on hunt result events)
+    IOC_FEED_DIR: str = config("IOC_FEED_DIR", default="data/iocs")  # <source>.csv/.txt/.json or <source>/ per source
+    IOC_BLOOM_FALSE_POSITIVE_RATE: float = config("IOC_BLOOM_FALSE_POSITIVE_RATE", default=0.001, cast=float)
+    IOC_SUBSTRING_FIELDS: str = config("IOC_SUBSTRING_FIELDS", default="command_line,CommandLine,process_path,parent_process_path,url")
+    IOC_MIN_SUBSTRING_LENGTH: int = config("IOC_MIN_SUBSTRING_LENGTH", default=4, cast=int)
+    
     # Advanced Settings
     ENABLE_HYPOTHESIS_GENERATION: bool = config("ENABLE_HYPOTHESIS_GENERATION", default=True, cast=bool)
     MAX_QUERIES_PER_PLAN: int = config("MAX_QUERIES_PER_PLAN", default=10, cast=int)
     MAX_RESULTS_PER_QUERY: int = config("MAX_RESULTS_PER_QUERY", default=1000, cast=int)
     THREAT_INTEL_SOURCES: str = config("THREAT_INTEL_SOURCES", default="")
     
+    # Startup Settings
+    AGENT_WARMUP_ON_STARTUP: bool = config("AGENT_WARMUP_ON_STARTUP", default=True, cast=bool)
+    
+    # MITRE ATT&CK Knowledge Base Settings
+    MITRE_ATTACK_BUNDLE_PATH: str = config("MITRE_ATTACK_BUNDLE_PATH", default="data/enterprise-attack.json")
+    MITRE_ATTACK_SNAPSHOT_PATH: str = config("MITRE_ATTACK_SNAPSHOT_PATH", default="data/enterprise-attack.snapshot")
+    
+    # Suggested Hypothesis Pool Settings
+    HYPOTHESIS_POOL_SIZE: int = config("HYPOTHESIS_POOL_SIZE", default=5, cast=int)
+    HYPOTHESIS_REFRESH_INTERVAL_SECONDS: int = config("HYPOTHESIS_REFRESH_INTERVAL_SECONDS", default=900, cast=int)
+    HYPOTHESIS_INTEL_POLL_SECONDS: int = config("HYPOTHESIS_INTEL_POLL_SECONDS", default=300, cast=int)
+    
+    # Prompt Budget Settings (estimated tokens per LLM prompt, per agent)
+    PROMPT_BUDGET_CRITIC: int = config("PROMPT_BUDGET_CRITIC", default=6000, cast=int)
+    PROMPT_BUDGET_HYPOTHESIS_GENERATOR: int = config("PROMPT_BUDGET_HYPOTHESIS_GENERATOR", default=3000, cast=int)
+    PROMPT_BUDGET_CLARIFIER: int = config("PROMPT_BUDGET_CLARIFIER", default=4000, cast=int)
+    
+    # Tracing Settings
+    TRACING_ENABLED: bool = config("TRACING_ENABLED", default=True, cast=bool)
+    TRACE_EXPORT_PATH: str = config("TRACE_EXPORT_PATH", default="data/traces.jsonl")
+    TRACE_HISTORY_SIZE: int = config("TRACE_HISTORY_SIZE", default=200, cast=int)
+    TRACE_EXPORT_MAX_BYTES: int = config("TRACE_EXPORT_MAX_BYTES", default=50 * 2 ** 20, cast=int)  # before the file is rotated
+    TRACE_EXPORT_BACKUPS: int = config("TRACE_EXPORT_BACKUPS", default=3, cast=int)  # rotated files kept
+    
+    # Response Encoding Settings
+    RESPONSE_COMPRESSION_MIN_BYTES: int = config("RESPONSE_COMPRESSION_MIN_BYTES", default=1024, cast=int)
+    
+    # Result Store Settings
+    RESULT_STORE_PATH: str = config("RESULT_STORE_PATH", default="data/results")
+    RESULT_STORE_MAX_RESULTS: int = config("RESULT_STORE_MAX_RESULTS", default=50, cast=int)
+    RESULT_CHUNK_ROWS: int = config("RESULT_CHUNK_ROWS", default=2000, cast=int)
+    
+    # Search Index Settings
+    SEARCH_INDEX_PATH: str = config("SEARCH_INDEX_PATH", default="data/search_index.jsonl")
+    
+    # Event Retrieval Settings (per-result BM25 index used to answer clarification questions)
+    RETRIEVAL_MAX_EVENTS: int = config("RETRIEVAL_MAX_EVENTS", default=100000, cast=int)
+    RETRIEVAL_INDEX_CACHE_SIZE: int = config("RETRIEVAL_INDEX_CACHE_SIZE", default=4, cast=int)
+    RETRIEVAL_TOP_K: int = config("RETRIEVAL_TOP_K", default=20, cast=int)
+    
+    # Hunt Progress Settings (WebSocket lifecycle events per hunt)
+    PROGRESS_CLIENT_BUFFER: int = config("PROGRESS_CLIENT_BUFFER", default=256, cast=int)
+    PROGRESS_HISTORY_SIZE: int = config("PROGRESS_HISTORY_SIZE", default=200, cast=int)
+    PROGRESS_SYNC_SECONDS: float = config("PROGRESS_SYNC_SECONDS", default=0.5, cast=float)
+    
+    # Shared State Settings ("memory" for a single worker, "sqlite" to share state between workers)
+    STATE_BACKEND: str = config("STATE_BACKEND", default="memory")
+    STATE_SQLITE_PATH: str = config("STATE_SQLITE_PATH", default="data/state.db")
+    
+    # Rate Limit Settings (LLM-backed endpoints, per client; 0 disables the limit)
+    RATE_LIMIT_PER_MINUTE: int = config("RATE_LIMIT_PER_MINUTE", default=0, cast=int)
+    RATE_LIMIT_BURST: int = config("RATE_LIMIT_BURST", default=10, cast=int)
+    
+    # Critic Micro-Batching Settings
+    CRITIQUE_BATCH_MAX_SIZE: int = config("CRITIQUE_BATCH_MAX_SIZE", default=8, cast=int)
+    CRITIQUE_BATCH_MAX_WAIT_MS: int = config("CRITIQUE_BATCH_MAX_WAIT_MS", default=250, cast=int)
+    
+    # Synthetic Telemetry Settings (events returned by the simulated Splunk and Elasticsearch connectors)
+    SYNTHETIC_SEED: int = config("SYNTHETIC_SEED", default=1337, cast=int)
+    SYNTHETIC_HOSTS: int = config("SYNTHETIC_HOSTS", default=200, cast=int)
+    SYNTHETIC_USERS: int = config("SYNTHETIC_USERS", default=500, cast=int)
+    SYNTHETIC_ATTACK_RATE: float = config("SYNTHETIC_ATTACK_RATE", default=0.01, cast=float)
+    SYNTHETIC_EVENTS_PER_QUERY: int = config("SYNTHETIC_EVENTS_PER_QUERY", default=1000, cast=int)
+    
     model_config = {
         "env_file": ".env",
         "env_file_encoding": "utf-8",
@@ -1,6 +1,10 @@
 import asyncio
 from typing import Dict, List, Any, Optional
 
+from config.settings import settings
+from connectors.telemetry import get_telemetry_generator
+from utils.metrics import instrument_connector
+
 class ElasticConnector:
     """
     Connector for executing queries against Elasticsearch
@@ -35,6 +39,7 @@ class ElasticConnector:
             print(f"Error connecting to Elasticsearch: {str(e)}")
             return False
     
+    @instrument_connector("elastic")
     async def execute_query(self, query_string: str, time_range: Dict[str, str], max_results: int = 1000) -> List[Dict[str, Any]]:
         """
         Execute a query against Elasticsearch and return the results
@@ -54,164 +59,18 @@ class ElasticConnector:
             
             # Generate simulated results
             # In a real implementation, this would be the actual query results
-            results = self._generate_mock_results(query_string, max_results)
+            results = self._generate_mock_results(query_string, time_range, max_results)
             
             return results
         except Exception as e:
             print(f"Error executing Elasticsearch query: {str(e)}")
             raise
     
-    def _generate_mock_results(self, query_string: str, max_results: int) -> List[Dict[str, Any]]:
+    def _generate_mock_results(self, query_string: str, time_range: Dict[str, str], max_results: int) -> List[Dict[str, Any]]:
         """
-        Generate mock results for simulating Elasticsearch queries
+        Generate simulated Elasticsearch results from the seeded synthetic telemetry
         
         In a real implementation, this would be replaced with actual query results.
         """
-        # Simple keyword-based mock result generation
-        results = []
-        
-        if "winlogbeat" in query_string.lower() and "4688" in query_string:
-            # Mock Windows process creation events (Event ID 4688)
-            base_results = [
-                {
-                    "_index": "winlogbeat-*",
-                    "_id": "abc123",
-                    "_source": {
-                        "@timestamp": "2023-06-15T08:12:34.000Z",
-                        "host": {"name": "SERVER01"},
-                        "event": {"code": 4688, "provider": "Microsoft-Windows-Security-Auditing"},
-                        "winlog": {
-                            "event_id": 4688,
-                            "computer_name": "SERVER01.domain.local",
-                            "event_data": {
-                                "NewProcessName": "C:\\Windows\\System32\\wbem\\WmiPrvSE.exe",
-                                "ParentProcessName": "C:\\Windows\\System32\\services.exe",
-                                "SubjectUserName": "SYSTEM"
-                            }
-                        }
-                    }
-                },
-                {
-                    "_index": "winlogbeat-*",
-                    "_id": "def456",
-                    "_source": {
-                        "@timestamp": "2023-06-15T09:23:45.000Z",
-                        "host": {"name": "WORKSTATION02"},
-                        "event": {"code": 4688, "provider": "Microsoft-Windows-Security-Auditing"},
-                        "winlog": {
-                            "event_id": 4688,
-                            "computer_name": "WORKSTATION02.domain.local",
-                            "event_data": {
-                                "NewProcessName": "C:\\Windows\\System32\\cmd.exe",
-                                "ParentProcessName": "C:\\Windows\\explorer.exe",
-                                "SubjectUserName": "DOMAIN\\user1"
-                            }
-                        }
-                    }
-                },
-                {
-                    "_index": "winlogbeat-*",
-                    "_id": "ghi789",
-                    "_source": {
-                        "@timestamp": "2023-06-15T10:34:56.000Z",
-                        "host": {"name": "SERVER03"},
-                        "event": {"code": 4688, "provider": "Microsoft-Windows-Security-Auditing"},
-                        "winlog": {
-                            "event_id": 4688,
-                            "computer_name": "SERVER03.domain.local",
-                            "event_data": {
-                                "NewProcessName": "C:\\Windows\\System32\\WindowsPowerShell\\v1.0\\powershell.exe",
-                                "ParentProcessName": "C:\\Windows\\System32\\cmd.exe",
-                                "SubjectUserName": "DOMAIN\\admin"
-                            }
-                        }
-                    }
-                }
-            ]
-            
-            # Duplicate results to match max_results (with some variance)
-            while len(results) < min(max_results, 100):
-                for result in base_results:
-                    if len(results) < min(max_results, 100):
-                        import copy
-                        import random
-                        result_copy = copy.deepcopy(result)
-                        hours = random.randint(0, 23)
-                        minutes = random.randint(0, 59)
-                        seconds = random.randint(0, 59)
-                        result_copy["_source"]["@timestamp"] = f"2023-06-15T{hours:02d}:{minutes:02d}:{seconds:02d}.000Z"
-                        result_copy["_id"] = f"{result['_id']}_{len(results)}"
-                        results.append(result_copy)
-        
-        elif "filebeat" in query_string.lower() and "dns" in query_string.lower():
-            # Mock DNS query logs
-            base_results = [
-                {
-                    "_index": "filebeat-*",
-                    "_id": "dns1",
-                    "_source": {
-                        "@timestamp": "2023-06-15T11:22:33.000Z",
-                        "dns": {
-                            "question": {"name": "legitimate-domain.com"},
-                            "answers": [{"data": "192.168.1.100", "type": "A"}]
-                        },
-                        "source": {"ip": "10.0.0.5", "port": 53252},
-                        "destination": {"ip": "8.8.8.8", "port": 53}
-                    }
-                },
-                {
-                    "_index": "filebeat-*",
-                    "_id": "dns2",
-                    "_source": {
-                        "@timestamp": "2023-06-15T11:23:45.000Z",
-                        "dns": {
-                            "question": {"name": "suspicious-domain.ru"},
-                            "answers": [{"data": "203.0.113.100", "type": "A"}]
-                        },
-                        "source": {"ip": "10.0.0.7", "port": 49123},
-                        "destination": {"ip": "8.8.8.8", "port": 53}
-                    }
-                },
-                {
-                    "_index": "filebeat-*",
-                    "_id": "dns3",
-                    "_source": {
-                        "@timestamp": "2023-06-15T11:25:12.000Z",
-                        "dns": {
-                            "question": {"name": "malicious-c2-server.cn"},
-                            "answers": [{"data": "198.51.100.55", "type": "A"}]
-                        },
-                        "source": {"ip": "10.0.0.9", "port": 51234},
-                        "destination": {"ip": "8.8.8.8", "port": 53}
-                    }
-                }
-            ]
-            
-            # Duplicate results to match max_results (with some variance)
-            while len(results) < min(max_results, 100):
-                for result in base_results:
-                    if len(results) < min(max_results, 100):
-                        import copy
-                        import random
-                        result_copy = copy.deepcopy(result)
-                        hours = random.randint(0, 23)
-                        minutes = random.randint(0, 59)
-                        seconds = random.randint(0, 59)
-                        result_copy["_source"]["@timestamp"] = f"2023-06-15T{hours:02d}:{minutes:02d}:{seconds:02d}.000Z"
-                        result_copy["_id"] = f"{result['_id']}_{len(results)}"
-                        results.append(result_copy)
-        else:
-            # Generic results for any other query
-            for i in range(min(10, max_results)):
-                results.append({
-                    "_index": "generic-index",
-                    "_id": f"doc_{i}",
-                    "_source": {
-                        "@timestamp": f"2023-06-15T{i:02d}:00:00.000Z",
-                        "message": f"Event {i} matching query: {query_string}",
-                        "host": {"name": f"host_{i % 5}"},
-                        "event": {"dataset": "generic", "module": "system"}
-                    }
-                })
-        
-        return results
+        count = min(max_results, settings.SYNTHETIC_EVENTS_PER_QUERY)
+        return get_telemetry_generator().for_query(query_string, time_range, count, shape="elastic")
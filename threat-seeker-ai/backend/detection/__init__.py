@@ -0,0 +1,4 @@
+# Streaming detection package
+from .engine import AlertQueue, DetectionEngine, get_detection_engine
+from .rules import DetectionRule, compile_rule, plan_rules
+from .sources import FileTailSource, SocketSource
@@ -0,0 +1,478 @@
+import asyncio
+import logging
+import operator
+import threading
+import time
+import uuid
+from bisect import bisect_right
+from collections import deque
+from datetime import datetime
+from itertools import accumulate, compress, repeat
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from config.settings import settings
+from detection.rules import DetectionRule, TermCache, compile_rule
+from query_engine.expressions import And, Expr, Not, Or
+from query_engine.table import ColumnTable
+from storage.state import CACHE, DETECTION_RULES, StateBackend, get_state_backend
+from utils.agent_registry import run_in_thread
+from utils.metrics import metrics
+from utils.serialization import loads
+
+# Setup logger
+logger = logging.getLogger(__name__)
+
+stream_events = metrics.counter(
+    "threat_seeker_detection_events_total", "Events read from detection streams", ("source",)
+)
+detection_alerts = metrics.counter(
+    "threat_seeker_detection_alerts_total", "Stream events matched by a detection rule", ("rule_id",)
+)
+detection_alerts_dropped = metrics.counter(
+    "threat_seeker_detection_alerts_dropped_total", "Alerts dropped from the full alert queue"
+)
+
+
+class AlertQueue:
+    """
+    The most recent alerts, bounded: when it is full the oldest alert is dropped
+    and counted. Alerts carry increasing sequence numbers, so any number of
+    readers can each poll for the alerts after the last one they saw.
+    """
+
+    def __init__(self, max_size: int = 10000):
+        self._alerts: deque = deque(maxlen=max_size)
+        self._sequence = 0
+        self.dropped = 0
+        self._lock = threading.Lock()
+
+    def push(self, alerts: List[Dict[str, Any]]) -> None:
+        with self._lock:
+            overflow = len(self._alerts) + len(alerts) - self._alerts.maxlen
+            if overflow > 0:
+                self.dropped += overflow
+                detection_alerts_dropped.inc(overflow)
+            for alert in alerts:
+                self._sequence += 1
+                alert["sequence"] = self._sequence
+                self._alerts.append(alert)
+
+    def read(self, after: int = 0, limit: int = 100) -> Dict[str, Any]:
+        """
+        Up to limit alerts with a sequence number above after, oldest first
+        """
+        with self._lock:
+            first = self._sequence - len(self._alerts) + 1
+            skip = max(after + 1 - first, 0)
+            alerts = [self._alerts[i] for i in range(skip, min(skip + limit, len(self._alerts)))]
+            return {
+                "alerts": alerts,
+                # Past the last alert after a restart reset the sequence numbers, the reader starts over
+                "next": alerts[-1]["sequence"] if alerts else max(min(after, self._sequence), first - 1),
+                # Alerts after the reader's position that were dropped before it read them
+                "missed": max(first - after - 1, 0),
+                "dropped": self.dropped
+            }
+
+    def __len__(self) -> int:
+        return len(self._alerts)
+
+
+class DetectionEngine:
+    """
+    Evaluates detection rules against batches of raw NDJSON lines.
+
+    Before any line is parsed, each rule's needles (the literal strings every
+    matching event contains) are searched in the lower-cased batch at once, and
+    only lines that can match some rule are parsed. The parsed events form one
+    ColumnTable that every rule is evaluated over, so each field is extracted
+    once per batch, each term tests every distinct value once, and a term that
+    several rules share is evaluated once.
+
+    With a state backend, every API worker runs the rules registered there
+    through any worker, re-reading them at most every sync_interval seconds
+    before a batch, and each stream is consumed by one worker at a time: the
+    one holding its lease, which the others take over when it is not renewed
+    within lease_seconds.
+    """
+
+    LEASE_PREFIX = "detection:"
+
+    def __init__(self, alert_queue_size: int = 10000, schema: str = "cim", state: Optional[StateBackend] = None,
+                 sync_interval: float = 5.0, lease_seconds: float = 30.0):
+        self.schema = schema
+        self.state = state
+        self.sync_interval = sync_interval
+        self.lease_seconds = lease_seconds
+        self.alerts = AlertQueue(alert_queue_size)
+        self._terms = TermCache()
+        # Replaced, never changed in place, so batches read it without the lock
+        self._rules: Tuple[DetectionRule, ...] = ()
+        self._counters: Dict[str, Dict[str, Any]] = {}
+        self._sources: Dict[str, Dict[str, Any]] = {}
+        self._streams: Dict[str, Any] = {}
+        self._tasks: List[asyncio.Future] = []
+        self._lock = threading.Lock()
+        # Rule definitions as last read from the state backend, and when
+        self._stored: Dict[str, Dict[str, Any]] = {}
+        self._synced_at = float("-inf")
+        self._sync_lock = threading.Lock()
+        self._owner = str(uuid.uuid4())
+
+    def add_rules(self, definitions: List[Dict[str, Any]]) -> List[DetectionRule]:
+        """
+        Compile and start evaluating rules; none is added if any fails to compile (ValueError)
+        """
+        with self._lock:
+            rules = [compile_rule(definition, self._terms, self.schema) for definition in definitions]
+            replaced = {rule.rule_id for rule in rules}
+            self._rules = tuple(rule for rule in self._rules if rule.rule_id not in replaced) + tuple(rules)
+            for rule in rules:
+                self._counters.setdefault(rule.rule_id, {"events": 0, "candidates": 0, "matches": 0, "last_match_at": None})
+        return rules
+
+    def remove_rule(self, rule_id: str) -> bool:
+        with self._lock:
+            rules = tuple(rule for rule in self._rules if rule.rule_id != rule_id)
+            removed = len(rules) < len(self._rules)
+            self._rules = rules
+            self._counters.pop(rule_id, None)
+        return removed
+
+    def sync_rules(self) -> None:
+        """
+        Add, replace and remove rules to match those registered in the state
+        backend (blocking: call from a worker thread)
+        """
+        if self.state is None or not self._sync_lock.acquire(blocking=False):
+            return
+        try:
+            self._synced_at = time.monotonic()
+            stored = dict(self.state.items(DETECTION_RULES))
+            for rule_id, definition in stored.items():
+                if definition == self._stored.get(rule_id):
+                    continue
+                try:
+                    self.add_rules([definition])
+                except ValueError as e:
+                    logger.warning(f"Could not load detection rule {rule_id}: {str(e)}")
+            # Only rules deleted through another worker; rules added here since the read stay
+            for rule_id in set(self._stored) - set(stored):
+                self.remove_rule(rule_id)
+            self._stored = stored
+        finally:
+            self._sync_lock.release()
+
+    def rules(self) -> List[Dict[str, Any]]:
+        """
+        Every rule with its match counters
+        """
+        with self._lock:
+            return [dict(rule.to_dict(), **self._counters[rule.rule_id]) for rule in self._rules]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            sources = []
+            for name, counters in self._sources.items():
+                stream = self._streams.get(name)
+                entry = dict(stream.describe() if stream is not None else {"source": name}, **counters)
+                # Throughput of the evaluation itself, i.e. per core
+                entry["events_per_second"] = round(counters["events"] / counters["busy_seconds"]) if counters["busy_seconds"] else 0
+                sources.append(entry)
+            return {
+                "rules": len(self._rules),
+                "sources": sources,
+                "alerts_queued": len(self.alerts),
+                "alerts_dropped": self.alerts.dropped
+            }
+
+    def process(self, lines: List[bytes], source: str = "direct") -> int:
+        """
+        Evaluate every rule against a batch of raw event lines (blocking: call
+        from a worker thread); returns the number of alerts raised
+        """
+        started = time.perf_counter()
+        if time.monotonic() - self._synced_at >= self.sync_interval:
+            self.sync_rules()
+        rules = self._rules
+        candidates: Dict[str, List[int]] = {}
+        events: List[Dict[str, Any]] = []
+        alerts: List[Dict[str, Any]] = []
+        errors = 0
+        if rules:
+            candidates = self._prefilter(rules, lines)
+            parse = sorted(set().union(*candidates.values()))
+            positions, events, errors = _parse(lines, parse)
+            if events:
+                alerts = self._evaluate(rules, events, positions, candidates, source)
+        if alerts:
+            self.alerts.push(alerts)
+        stream_events.inc(len(lines), source=source)
+
+        with self._lock:
+            counters = self._sources.setdefault(
+                source, {"events": 0, "parsed": 0, "malformed": 0, "alerts": 0, "batches": 0, "busy_seconds": 0.0}
+            )
+            counters["events"] += len(lines)
+            counters["parsed"] += len(events)
+            counters["malformed"] += errors
+            counters["alerts"] += len(alerts)
+            counters["batches"] += 1
+            counters["busy_seconds"] += time.perf_counter() - started
+            for rule in rules:
+                rule_counters = self._counters.get(rule.rule_id)
+                if rule_counters is not None:
+                    rule_counters["events"] += len(lines)
+                    rule_counters["candidates"] += len(candidates.get(rule.rule_id, ()))
+        return len(alerts)
+
+    async def start(self, streams: Iterable[Any]) -> None:
+        """
+        Consume each stream (see detection.sources) in the background
+        """
+        for stream in streams:
+            self._streams[stream.name] = stream
+            self._tasks.append(asyncio.ensure_future(self._consume(stream)))
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except (asyncio.CancelledError, Exception):
+                pass
+        self._tasks = []
+
+    async def _consume(self, stream: Any) -> None:
+        """
+        Read the stream while holding its lease, renewing it every third of lease_seconds
+        """
+        lease = self.LEASE_PREFIX + stream.name
+        while True:
+            if not await run_in_thread(self._claim, lease):
+                await asyncio.sleep(self.lease_seconds / 3)
+                continue
+            reader = asyncio.ensure_future(self._read(stream))
+            try:
+                while True:
+                    done, _ = await asyncio.wait([reader], timeout=self.lease_seconds / 3)
+                    if done:
+                        return reader.result()
+                    if not await run_in_thread(self._claim, lease):
+                        logger.info(f"Detection stream {stream.name} taken over by another worker")
+                        break
+            finally:
+                reader.cancel()
+                try:
+                    await reader
+                except (asyncio.CancelledError, Exception):
+                    pass
+                if self.state is not None:
+                    await run_in_thread(self._release, lease)
+
+    async def _read(self, stream: Any) -> None:
+        while True:
+            try:
+                async for batch in stream.batches():
+                    await run_in_thread(self.process, batch, stream.name)
+                return
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Detection stream {stream.name} failed, restarting: {str(e)}")
+                await asyncio.sleep(1)
+
+    def _claim(self, lease: str) -> bool:
+        """
+        Take or renew a stream's lease; False while another worker holds it
+        """
+        if self.state is None:
+            return True
+        if self.state.set_if_absent(CACHE, lease, self._owner, self.lease_seconds):
+            return True
+        if self.state.get(CACHE, lease) != self._owner:
+            return False
+        self.state.set(CACHE, lease, self._owner, self.lease_seconds)
+        return True
+
+    def _release(self, lease: str) -> None:
+        if self.state.get(CACHE, lease) == self._owner:
+            self.state.delete(CACHE, lease)
+
+    def _prefilter(self, rules: Tuple[DetectionRule, ...], lines: List[bytes]) -> Dict[str, List[int]]:
+        """
+        Positions of the lines each rule can match: those containing all its needles
+        """
+        every = None
+        batch = None
+        candidates = {}
+        for rule in rules:
+            if not rule.needles:
+                if every is None:
+                    every = list(range(len(lines)))
+                candidates[rule.rule_id] = every
+                continue
+            if batch is None:
+                batch = _LoweredBatch(lines)
+            # The longest needle is usually the rarest; the others are only checked on its lines
+            needles = sorted(rule.needles, key=len, reverse=True)
+            positions = batch.containing(needles[0])
+            for needle in needles[1:]:
+                if not positions:
+                    break
+                lowered = batch.lines()
+                positions = [position for position in positions if needle in lowered[position]]
+            candidates[rule.rule_id] = positions
+        return candidates
+
+    def _evaluate(self, rules: Tuple[DetectionRule, ...], events: List[Dict[str, Any]], positions: List[int],
+                  candidates: Dict[str, List[int]], source: str) -> List[Dict[str, Any]]:
+        table = ColumnTable.from_rows(events)
+        memo: Dict[int, List[bool]] = {}
+        row_of = {position: row for row, position in enumerate(positions)}
+        detected_at = datetime.now().isoformat()
+        alerts = []
+        for rule in rules:
+            lines = candidates[rule.rule_id]
+            if not lines:
+                continue
+            mask = _mask(rule.predicate, table, memo)
+            rows = [row_of[line] for line in lines if line in row_of]
+            matched = [row for row in rows if mask[row]]
+            if not matched:
+                continue
+            for row in matched:
+                alerts.append({
+                    "rule_id": rule.rule_id,
+                    "plan_id": rule.plan_id,
+                    "query_id": rule.query_id,
+                    "title": rule.title,
+                    "source": source,
+                    "detected_at": detected_at,
+                    "event": events[row]
+                })
+            detection_alerts.inc(len(matched), rule_id=rule.rule_id)
+            with self._lock:
+                counters = self._counters.get(rule.rule_id)
+                if counters is not None:
+                    counters["matches"] += len(matched)
+                    counters["last_match_at"] = detected_at
+        return alerts
+
+
+class _LoweredBatch:
+    """
+    A batch of lines lower-cased once, with the lines containing each needle searched
+    """
+
+    __slots__ = ("blob", "count", "_lengths", "_lines", "_ends", "_found")
+
+    def __init__(self, lines: List[bytes]):
+        # Needles never contain a newline, so no match spans two lines
+        self.blob = b"\n".join(lines).lower()
+        self.count = len(lines)
+        self._lengths = map(len, lines)
+        self._lines: Optional[List[bytes]] = None
+        self._ends: Optional[List[int]] = None
+        self._found: Dict[bytes, List[int]] = {}
+
+    def lines(self) -> List[bytes]:
+        if self._lines is None:
+            self._lines = self.blob.split(b"\n")
+        return self._lines
+
+    def containing(self, needle: bytes) -> List[int]:
+        """
+        Positions of the lines containing needle, in order
+        """
+        found = self._found.get(needle)
+        if found is not None:
+            return found
+        if self._ends is None:
+            self._ends = list(accumulate(map((1).__add__, self._lengths)))
+        # Jump between occurrences over the whole batch, which is fastest for rare
+        # needles; a common needle is tested line by line instead
+        ends = self._ends
+        limit = self.count // 8
+        find = self.blob.find
+        found = []
+        position = find(needle)
+        while position != -1:
+            line = bisect_right(ends, position)
+            found.append(line)
+            if len(found) > limit:
+                found = list(compress(range(self.count), map(operator.contains, self.lines(), repeat(needle))))
+                break
+            position = find(needle, ends[line])
+        self._found[needle] = found
+        return found
+
+
+def _parse(lines: List[bytes], positions: List[int]) -> Tuple[List[int], List[Dict[str, Any]], int]:
+    """
+    Parse the lines at positions; returns the positions parsed into events, the events and the count of malformed lines
+    """
+    try:
+        events = [loads(lines[position]) for position in positions]
+        if all(isinstance(event, dict) for event in events):
+            return positions, events, 0
+    except ValueError:
+        pass
+    parsed_positions, events = [], []
+    for position in positions:
+        try:
+            event = loads(lines[position])
+        except ValueError:
+            continue
+        if isinstance(event, dict):
+            parsed_positions.append(position)
+            events.append(event)
+    return parsed_positions, events, len(positions) - len(events)
+
+
+def _mask(expr: Expr, table: ColumnTable, memo: Dict[int, List[bool]]) -> List[bool]:
+    """
+    expr evaluated over table, reusing the masks of terms already evaluated for the batch
+    """
+    key = id(expr)
+    mask = memo.get(key)
+    if mask is not None:
+        return mask
+    if isinstance(expr, And):
+        mask = _mask(expr.children[0], table, memo)
+        for child in expr.children[1:]:
+            if not any(mask):
+                break
+            mask = list(map(operator.and_, mask, _mask(child, table, memo)))
+    elif isinstance(expr, Or):
+        mask = _mask(expr.children[0], table, memo)
+        for child in expr.children[1:]:
+            if all(mask):
+                break
+            mask = list(map(operator.or_, mask, _mask(child, table, memo)))
+    elif isinstance(expr, Not):
+        mask = list(map(operator.not_, _mask(expr.child, table, memo)))
+    else:
+        mask = expr.evaluate(table)
+    memo[key] = mask
+    return mask
+
+
+_detection_engine: Optional[DetectionEngine] = None
+
+
+def get_detection_engine() -> DetectionEngine:
+    """
+    Return the shared detection engine
+    """
+    global _detection_engine
+    if _detection_engine is None:
+        _detection_engine = DetectionEngine(
+            alert_queue_size=settings.DETECTION_ALERT_QUEUE_SIZE,
+            schema=settings.DETECTION_SCHEMA,
+            state=get_state_backend(),
+            sync_interval=settings.DETECTION_SYNC_SECONDS,
+            lease_seconds=settings.DETECTION_LEASE_SECONDS
+        )
+    return _detection_engine
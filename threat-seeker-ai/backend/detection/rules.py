@@ -0,0 +1,125 @@
+import json
+import uuid
+from typing import Any, Dict, List, Optional
+
+from connectors.file_replay import _needles
+from query_engine import QuerySyntaxError, detect_language, get_query_compiler
+from query_engine.expressions import And, Expr, MatchAll, Not, Or, conjunction
+from query_engine.ir import ECS_FIELDS, expr_from_ir, rename_fields
+
+# Commands that leave which events match unchanged; a query with any other command
+# (stats, sort, head, dedup) describes a set of events, not a per-event condition
+_PER_EVENT_COMMANDS = ("filter", "table", "exclude", "rename")
+
+
+class DetectionRule:
+    """
+    An approved hunt query compiled into a predicate over single events. Leaf
+    terms are shared between the rules of an engine (see TermCache), so a term
+    that several rules test is evaluated once per batch.
+    """
+
+    __slots__ = ("rule_id", "plan_id", "query_id", "title", "query_string", "ir", "predicate", "needles")
+
+    def __init__(self, rule_id: str, plan_id: str, query_id: str, title: str, query_string: str,
+                 ir: Dict[str, Any], predicate: Expr):
+        self.rule_id = rule_id
+        self.plan_id = plan_id
+        self.query_id = query_id
+        self.title = title
+        self.query_string = query_string
+        self.ir = ir
+        self.predicate = predicate
+        self.needles = _needles(predicate)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Definition of the rule, from which compile_rule can rebuild it
+        """
+        return {
+            "rule_id": self.rule_id, "plan_id": self.plan_id, "query_id": self.query_id,
+            "title": self.title, "query_string": self.query_string, "ir": self.ir
+        }
+
+
+class TermCache:
+    """
+    Leaf terms of compiled rules by their IR, so identical terms are one object
+    """
+
+    def __init__(self):
+        self._terms: Dict[str, Expr] = {}
+
+    def build(self, node: Dict[str, Any]) -> Expr:
+        if "and" in node:
+            return And([self.build(child) for child in node["and"]])
+        if "or" in node:
+            return Or([self.build(child) for child in node["or"]])
+        if "not" in node:
+            return Not(self.build(node["not"]))
+        key = json.dumps(node, sort_keys=True)
+        term = self._terms.get(key)
+        if term is None:
+            term = self._terms[key] = expr_from_ir(node)
+        return term
+
+
+def compile_rule(definition: Dict[str, Any], terms: TermCache, schema: str = "cim") -> DetectionRule:
+    """
+    Rule for a definition holding plan_id, query_id, query_string and optionally
+    its ir and a title. schema "ecs" matches events with Elastic Common Schema
+    field names. Raises ValueError for queries without a per-event form.
+    """
+    query_string = definition.get("query_string") or ""
+    ir = definition.get("ir")
+    if ir is None:
+        try:
+            ir, _ = get_query_compiler().ir(query_string)
+        except QuerySyntaxError as e:
+            raise ValueError(f"Cannot compile query {definition['query_id']}: {str(e)}")
+    pipeline = ir["pipeline"]
+    renamed = False
+    for node in pipeline:
+        command = next(iter(node))
+        if command not in _PER_EVENT_COMMANDS or (command == "filter" and renamed):
+            raise ValueError(f"Query {definition['query_id']} uses {command}, which has no per-event form")
+        renamed = renamed or command == "rename"
+
+    matched = rename_fields(ir, ECS_FIELDS) if schema == "ecs" else ir
+    nodes = [matched["search"]] + [node["filter"] for node in matched["pipeline"] if "filter" in node]
+    predicate = conjunction([terms.build(node) for node in nodes]) or MatchAll()
+    return DetectionRule(
+        definition.get("rule_id") or str(uuid.uuid4()),
+        definition["plan_id"],
+        definition["query_id"],
+        definition.get("title") or definition["query_id"],
+        query_string,
+        ir,
+        predicate
+    )
+
+
+def plan_rules(plan: Dict[str, Any], query_ids: List[str], modifications: Optional[Dict[str, str]] = None) -> List[Dict[str, Any]]:
+    """
+    Rule definitions for approved queries of a hunt plan
+    """
+    definitions = []
+    for query in plan.get("queries") or []:
+        query_id = query["query_id"]
+        if query_id not in query_ids:
+            continue
+        modified = modifications is not None and query_id in modifications
+        query_string = modifications[query_id] if modified else query.get("query_string", "")
+        if detect_language(query_string) not in ("spl", "dsl", "lucene"):
+            raise ValueError(f"Query {query_id} is not in a language the detection engine runs")
+        definitions.append({
+            # Registering a query again replaces its rule
+            "rule_id": f"{plan['plan_id']}:{query_id}",
+            "plan_id": plan["plan_id"],
+            "query_id": query_id,
+            "title": query.get("description") or query_id,
+            "query_string": query_string,
+            "ir": None if modified else query.get("ir")
+        })
+    return definitions
+
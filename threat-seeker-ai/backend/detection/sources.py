@@ -0,0 +1,137 @@
+import asyncio
+import logging
+import os
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from utils.agent_registry import run_in_thread
+
+# Setup logger
+logger = logging.getLogger(__name__)
+
+# Bytes read from a followed file per call
+_READ_SIZE = 4 * 1024 * 1024
+
+
+class FileTailSource:
+    """
+    Follows a file of NDJSON events as it grows, like tail -F: lines are read in
+    batches, and the file is reopened from its start when it is rotated (a new
+    file at the path) or truncated. Stands in for a message bus topic.
+    """
+
+    def __init__(self, path: str, batch_size: int = 8192, poll_interval: float = 0.25, from_start: bool = False):
+        self.path = path
+        self.name = f"file:{path}"
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.from_start = from_start
+        self._file = None
+        self._inode: Optional[int] = None
+        self._position = 0
+        self._pending = b""
+        self._lines: List[bytes] = []
+        self.rotations = 0
+
+    async def batches(self) -> AsyncIterator[List[bytes]]:
+        try:
+            while True:
+                batch = await run_in_thread(self._read)
+                if batch:
+                    yield batch
+                else:
+                    await asyncio.sleep(self.poll_interval)
+        finally:
+            self._close()
+
+    def describe(self) -> Dict[str, Any]:
+        return {"source": self.name, "position": self._position, "rotations": self.rotations}
+
+    def _read(self) -> List[bytes]:
+        """
+        Up to batch_size complete lines written since the last call (blocking)
+        """
+        if not self._lines:
+            self._fill()
+        batch = self._lines[:self.batch_size]
+        del self._lines[:self.batch_size]
+        return batch
+
+    def _fill(self) -> None:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return
+        if self._file is not None and (stat.st_ino != self._inode or stat.st_size < self._position):
+            # Rotated or truncated: what is at the path now is new
+            self._close()
+            self.rotations += 1
+            self.from_start = True
+        if self._file is None:
+            self._file = open(self.path, "rb")
+            self._inode = os.fstat(self._file.fileno()).st_ino
+            self._position = 0 if self.from_start else self._file.seek(0, os.SEEK_END)
+            self._pending = b""
+        self._file.seek(self._position)
+        data = self._file.read(_READ_SIZE)
+        if not data:
+            return
+        self._position += len(data)
+        lines = (self._pending + data).split(b"\n")
+        # The last piece is a line still being written
+        self._pending = lines.pop()
+        self._lines = [line for line in lines if line.strip()]
+
+    def _close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class SocketSource:
+    """
+    Accepts NDJSON events over TCP, one event per line, from any number of
+    senders. Batches wait in a bounded queue; when it is full, reading from
+    the senders pauses, which pushes back on them through TCP.
+    """
+
+    def __init__(self, host: str, port: int, batch_size: int = 8192, queue_size: int = 16):
+        self.host = host
+        self.port = port
+        self.name = f"tcp:{host}:{port}"
+        self.batch_size = batch_size
+        self._queue: "asyncio.Queue[List[bytes]]" = asyncio.Queue(queue_size)
+        self.connections = 0
+
+    async def batches(self) -> AsyncIterator[List[bytes]]:
+        server = await asyncio.start_server(self._receive, self.host, self.port)
+        logger.info(f"Streaming detection listening on {self.name}")
+        try:
+            while True:
+                yield await self._queue.get()
+        finally:
+            server.close()
+            await server.wait_closed()
+
+    def describe(self) -> Dict[str, Any]:
+        return {"source": self.name, "connections": self.connections, "queued_batches": self._queue.qsize()}
+
+    async def _receive(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections += 1
+        pending = b""
+        try:
+            while True:
+                data = await reader.read(_READ_SIZE)
+                if not data:
+                    break
+                lines = (pending + data).split(b"\n")
+                pending = lines.pop()
+                lines = [line for line in lines if line.strip()]
+                for start in range(0, len(lines), self.batch_size):
+                    await self._queue.put(lines[start:start + self.batch_size])
+            if pending.strip():
+                await self._queue.put([pending])
+        except ConnectionError:
+            pass
+        finally:
+            self.connections -= 1
+            writer.close()
@@ -0,0 +1,3 @@
+# Knowledge package
+from .attack_store import AttackStore, get_attack_store, sync_attack_store
+from .ioc_store import IocStore, get_ioc_store, reload_ioc_store
@@ -0,0 +1,678 @@
+import json
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from config.settings import settings
+
+# Setup logger
+logger = logging.getLogger(__name__)
+
+# Snapshot layout: magic, header length, JSON header (indexes + record offsets), record blob
+SNAPSHOT_MAGIC = b"TSATTCK1"
+SNAPSHOT_VERSION = 1
+_HEADER_LEN = struct.Struct("<I")
+
+# STIX object types we keep, mapped to the record kind stored in the snapshot
+_KINDS = {
+    "attack-pattern": "technique",
+    "intrusion-set": "group",
+    "x-mitre-data-component": "data_component",
+    "x-mitre-data-source": "data_source",
+    "relationship": "relationship"
+}
+
+# Relationships must be applied after the objects they point at
+_APPLY_ORDER = {"data_source": 0, "data_component": 1, "technique": 2, "group": 2, "relationship": 3}
+
+
+class AttackStore:
+    """
+    Local, indexed MITRE ATT&CK knowledge base.
+
+    Techniques and groups are loaded from a STIX 2.x bundle and indexed by technique ID,
+    tactic, group alias and data source. Bundles are applied incrementally: only objects
+    whose "modified" timestamp is newer than the stored copy are re-parsed. The store can
+    be saved as a compact snapshot whose records are decoded lazily from a memory map,
+    so startup only pays for parsing the indexes.
+
+    Bundles are applied from worker threads while agents query the store, so every
+    read and update holds the store's lock (reads decode records into the cache too).
+    """
+
+    def __init__(self):
+        # stix_id -> [kind, modified, offset, length] for records held in the snapshot map
+        self._entries: Dict[str, List[Any]] = {}
+        # stix_id -> decoded record (new or updated since the snapshot, or decoded on access)
+        self._records: Dict[str, Dict[str, Any]] = {}
+
+        self._technique_ids: Dict[str, str] = {}
+        self._group_ids: Dict[str, str] = {}
+        self._by_tactic: Dict[str, Set[str]] = {}
+        self._by_data_source: Dict[str, Set[str]] = {}
+        self._group_aliases: Dict[str, str] = {}
+        self._group_techniques: Dict[str, Set[str]] = {}
+        self._component_sources: Dict[str, str] = {}
+        self._source_names: Dict[str, str] = {}
+        self._relationships: Dict[str, Dict[str, Any]] = {}
+
+        self._mmap: Optional[mmap.mmap] = None
+        self._file = None
+        self._data_offset = 0
+        self.bundle_mtime: float = 0.0
+        self._lock = threading.RLock()
+        # Held by a bundle sync from start to end, without blocking queries while the bundle is parsed
+        self._sync_lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # Loading and incremental updates
+    # ------------------------------------------------------------------
+
+    def load_bundle(self, path: str) -> Dict[str, int]:
+        """
+        Apply a STIX bundle file to the store, returning counts of what changed
+        """
+        with open(path, "r", encoding="utf-8") as f:
+            bundle = json.load(f)
+        with self._lock:
+            stats = self.apply_objects(bundle.get("objects", []))
+            self.bundle_mtime = os.path.getmtime(path)
+        logger.info(f"Applied ATT&CK bundle {path}: {stats}")
+        return stats
+
+    def apply_objects(self, objects: Iterable[Dict[str, Any]]) -> Dict[str, int]:
+        """
+        Incrementally apply STIX objects; unchanged objects are skipped without parsing
+        """
+        stats = {"added": 0, "updated": 0, "removed": 0, "unchanged": 0}
+
+        candidates = [obj for obj in objects if obj.get("type") in _KINDS and obj.get("id")]
+        candidates.sort(key=lambda obj: _APPLY_ORDER[_KINDS[obj["type"]]])
+
+        with self._lock:
+            for obj in candidates:
+                stix_id = obj["id"]
+                modified = obj.get("modified", "")
+                existing_modified = self._modified(stix_id)
+
+                if existing_modified is not None and existing_modified >= modified:
+                    stats["unchanged"] += 1
+                    continue
+
+                if existing_modified is not None:
+                    self._unindex(self._record(stix_id))
+                    self._entries.pop(stix_id, None)
+                    self._records.pop(stix_id, None)
+
+                if obj.get("revoked") or obj.get("x_mitre_deprecated"):
+                    if existing_modified is not None:
+                        stats["removed"] += 1
+                    continue
+
+                record = self._normalize(obj)
+                self._records[stix_id] = record
+                self._index(record)
+                stats["updated" if existing_modified is not None else "added"] += 1
+
+        return stats
+
+    def _modified(self, stix_id: str) -> Optional[str]:
+        if stix_id in self._records:
+            return self._records[stix_id]["modified"]
+        if stix_id in self._relationships:
+            return self._relationships[stix_id]["modified"]
+        if stix_id in self._entries:
+            return self._entries[stix_id][1]
+        return None
+
+    def _normalize(self, obj: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Reduce a STIX object to the compact record kept in the store
+        """
+        kind = _KINDS[obj["type"]]
+        record = {
+            "stix_id": obj["id"],
+            "kind": kind,
+            "modified": obj.get("modified", ""),
+            "name": obj.get("name", "")
+        }
+
+        if kind == "technique":
+            record.update({
+                "id": _external_id(obj),
+                "description": obj.get("description", ""),
+                "tactics": [
+                    phase["phase_name"] for phase in obj.get("kill_chain_phases", [])
+                    if phase.get("kill_chain_name") == "mitre-attack"
+                ],
+                "platforms": obj.get("x_mitre_platforms", []),
+                "data_sources": obj.get("x_mitre_data_sources", []),
+                "is_subtechnique": obj.get("x_mitre_is_subtechnique", False)
+            })
+        elif kind == "group":
+            record.update({
+                "id": _external_id(obj),
+                "description": obj.get("description", ""),
+                "aliases": obj.get("aliases", [])
+            })
+        elif kind == "data_component":
+            record["data_source_ref"] = obj.get("x_mitre_data_source_ref", "")
+        elif kind == "relationship":
+            record.update({
+                "relationship_type": obj.get("relationship_type", ""),
+                "source_ref": obj.get("source_ref", ""),
+                "target_ref": obj.get("target_ref", "")
+            })
+
+        return record
+
+    def _index(self, record: Dict[str, Any]) -> None:
+        kind = record["kind"]
+        stix_id = record["stix_id"]
+
+        if kind == "technique":
+            self._technique_ids[record["id"]] = stix_id
+            for tactic in record["tactics"]:
+                self._by_tactic.setdefault(tactic, set()).add(record["id"])
+            for data_source in record["data_sources"]:
+                self._add_data_source(data_source, record["id"])
+        elif kind == "group":
+            self._group_ids[record["id"]] = stix_id
+            for alias in [record["name"], record["id"]] + record["aliases"]:
+                self._group_aliases[alias.lower()] = stix_id
+        elif kind == "data_source":
+            self._source_names[stix_id] = record["name"]
+        elif kind == "data_component":
+            source_name = self._source_names.get(record["data_source_ref"], "")
+            self._component_sources[stix_id] = f"{source_name}: {record['name']}" if source_name else record["name"]
+        elif kind == "relationship":
+            self._relationships[stix_id] = record
+            self._index_relationship(record, add=True)
+
+    def _unindex(self, record: Dict[str, Any]) -> None:
+        kind = record["kind"]
+
+        if kind == "technique":
+            self._technique_ids.pop(record["id"], None)
+            for tactic in record["tactics"]:
+                self._by_tactic.get(tactic, set()).discard(record["id"])
+            for data_source in record["data_sources"]:
+                for key in _data_source_keys(data_source):
+                    self._by_data_source.get(key, set()).discard(record["id"])
+        elif kind == "group":
+            self._group_ids.pop(record["id"], None)
+            for alias in [record["name"], record["id"]] + record["aliases"]:
+                if self._group_aliases.get(alias.lower()) == record["stix_id"]:
+                    del self._group_aliases[alias.lower()]
+        elif kind == "data_source":
+            self._source_names.pop(record["stix_id"], None)
+        elif kind == "data_component":
+            self._component_sources.pop(record["stix_id"], None)
+        elif kind == "relationship":
+            self._relationships.pop(record["stix_id"], None)
+            self._index_relationship(record, add=False)
+
+    def _index_relationship(self, record: Dict[str, Any], add: bool) -> None:
+        relationship_type = record["relationship_type"]
+        source_ref = record["source_ref"]
+        target_ref = record["target_ref"]
+
+        if relationship_type == "uses" and source_ref.startswith("intrusion-set--") and target_ref.startswith("attack-pattern--"):
+            techniques = self._group_techniques.setdefault(source_ref, set())
+            if add:
+                techniques.add(target_ref)
+            else:
+                techniques.discard(target_ref)
+        elif relationship_type == "detects" and source_ref in self._component_sources:
+            technique = self._technique_for_stix(target_ref)
+            if technique is None:
+                return
+            data_source = self._component_sources[source_ref]
+            if add:
+                self._add_data_source(data_source, technique["id"])
+            else:
+                for key in _data_source_keys(data_source):
+                    self._by_data_source.get(key, set()).discard(technique["id"])
+
+    def _add_data_source(self, data_source: str, technique_id: str) -> None:
+        for key in _data_source_keys(data_source):
+            self._by_data_source.setdefault(key, set()).add(technique_id)
+
+    # ------------------------------------------------------------------
+    # Snapshot persistence
+    # ------------------------------------------------------------------
+
+    def save_snapshot(self, path: str) -> None:
+        """
+        Write the store as a snapshot and remap it, so records are again decoded lazily
+        """
+        with self._lock:
+            blob = bytearray()
+            entries = {}
+            for stix_id, (kind, modified, offset, length) in self._entries.items():
+                if stix_id in self._records:
+                    continue
+                entries[stix_id] = [kind, modified, len(blob), length]
+                blob += self._mmap[self._data_offset + offset:self._data_offset + offset + length]
+            for stix_id, record in self._records.items():
+                if record["kind"] == "relationship":
+                    continue
+                encoded = json.dumps(record, separators=(",", ":")).encode("utf-8")
+                entries[stix_id] = [record["kind"], record["modified"], len(blob), len(encoded)]
+                blob += encoded
+
+            header = json.dumps({
+                "version": SNAPSHOT_VERSION,
+                "bundle_mtime": self.bundle_mtime,
+                "entries": entries,
+                "technique_ids": self._technique_ids,
+                "group_ids": self._group_ids,
+                "by_tactic": {k: sorted(v) for k, v in self._by_tactic.items() if v},
+                "by_data_source": {k: sorted(v) for k, v in self._by_data_source.items() if v},
+                "group_aliases": self._group_aliases,
+                "group_techniques": {k: sorted(v) for k, v in self._group_techniques.items() if v},
+                "component_sources": self._component_sources,
+                "source_names": self._source_names,
+                "relationships": self._relationships
+            }, separators=(",", ":")).encode("utf-8")
+
+            directory = os.path.dirname(os.path.abspath(path))
+            os.makedirs(directory, exist_ok=True)
+            # A temporary file of its own, so that two workers saving at once never interleave writes
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(SNAPSHOT_MAGIC)
+                    f.write(_HEADER_LEN.pack(len(header)))
+                    f.write(header)
+                    f.write(blob)
+            except BaseException:
+                os.remove(tmp_path)
+                raise
+
+            # Every surviving record has been copied into the new file, so the old map can go
+            self._release_map()
+            os.replace(tmp_path, path)
+            self._open_snapshot(path)
+            logger.info(f"Saved ATT&CK snapshot to {path} ({len(entries)} records)")
+
+    @classmethod
+    def load_snapshot(cls, path: str) -> "AttackStore":
+        """
+        Open a snapshot written by save_snapshot
+        """
+        store = cls()
+        store._open_snapshot(path)
+        return store
+
+    def _open_snapshot(self, path: str) -> None:
+        self._file = open(path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self._mmap[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+            self._release_map()
+            raise ValueError(f"Not an ATT&CK snapshot: {path}")
+
+        header_start = len(SNAPSHOT_MAGIC) + _HEADER_LEN.size
+        (header_len,) = _HEADER_LEN.unpack_from(self._mmap, len(SNAPSHOT_MAGIC))
+        header = json.loads(self._mmap[header_start:header_start + header_len])
+        if header.get("version") != SNAPSHOT_VERSION:
+            self._release_map()
+            raise ValueError(f"Unsupported ATT&CK snapshot version: {header.get('version')}")
+
+        self._data_offset = header_start + header_len
+        self._entries = header["entries"]
+        self._records = {}
+        self.bundle_mtime = header["bundle_mtime"]
+        self._technique_ids = header["technique_ids"]
+        self._group_ids = header["group_ids"]
+        self._by_tactic = {k: set(v) for k, v in header["by_tactic"].items()}
+        self._by_data_source = {k: set(v) for k, v in header["by_data_source"].items()}
+        self._group_aliases = header["group_aliases"]
+        self._group_techniques = {k: set(v) for k, v in header["group_techniques"].items()}
+        self._component_sources = header["component_sources"]
+        self._source_names = header["source_names"]
+        self._relationships = header["relationships"]
+
+    def close(self) -> None:
+        """
+        Release the snapshot memory map, decoding any records still held only in the map
+        """
+        with self._lock:
+            for stix_id in list(self._entries):
+                self._record(stix_id)
+            self._release_map()
+
+    def _release_map(self) -> None:
+        self._entries = {}
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _record(self, stix_id: str) -> Dict[str, Any]:
+        """
+        Return a record, decoding it from the snapshot map on first access
+        """
+        if stix_id in self._records:
+            return self._records[stix_id]
+        if stix_id in self._relationships:
+            return self._relationships[stix_id]
+        _, _, offset, length = self._entries[stix_id]
+        start = self._data_offset + offset
+        record = json.loads(self._mmap[start:start + length])
+        self._records[stix_id] = record
+        return record
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+
+    def get_technique(self, technique_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up a technique by its ATT&CK ID (e.g. "T1047" or "T1546.003")
+        """
+        with self._lock:
+            stix_id = self._technique_ids.get(technique_id.upper())
+            return self._record(stix_id) if stix_id else None
+
+    def describe_techniques(self, technique_ids: Iterable[str]) -> List[Dict[str, str]]:
+        """
+        Return id/name/description entries for technique IDs, in order and without duplicates
+        """
+        with self._lock:
+            described = []
+            seen = set()
+            for technique_id in technique_ids:
+                if technique_id in seen:
+                    continue
+                seen.add(technique_id)
+                technique = self.get_technique(technique_id)
+                described.append({
+                    "id": technique_id,
+                    "name": technique["name"] if technique else technique_id,
+                    "description": _first_sentence(technique["description"]) if technique else ""
+                })
+            return described
+
+    def techniques_for_tactic(self, tactic: str) -> List[Dict[str, Any]]:
+        """
+        Return the techniques under a tactic (e.g. "persistence" or "lateral-movement")
+        """
+        with self._lock:
+            key = tactic.lower().replace(" ", "-")
+            return [self.get_technique(tid) for tid in sorted(self._by_tactic.get(key, ()))]
+
+    def techniques_for_data_source(self, data_source: str) -> List[Dict[str, Any]]:
+        """
+        Return techniques detectable from a data source ("Process" or "Process: Process Creation")
+        """
+        with self._lock:
+            key = data_source.lower().strip()
+            return [self.get_technique(tid) for tid in sorted(self._by_data_source.get(key, ()))]
+
+    def get_group(self, name_or_alias: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up a group by ATT&CK ID, name or any alias (e.g. "G0016", "APT29", "Cozy Bear")
+        """
+        with self._lock:
+            stix_id = self._group_aliases.get(name_or_alias.lower())
+            if not stix_id:
+                return None
+            group = dict(self._record(stix_id))
+            group["techniques"] = sorted(
+                technique["id"] for technique in
+                (self._technique_for_stix(ref) for ref in self._group_techniques.get(stix_id, ()))
+                if technique
+            )
+            return group
+
+    def groups_using(self, technique_id: str) -> List[str]:
+        """
+        Return the names of groups known to use a technique
+        """
+        with self._lock:
+            stix_id = self._technique_ids.get(technique_id.upper())
+            return sorted(
+                self._record(group_stix_id)["name"]
+                for group_stix_id, techniques in self._group_techniques.items()
+                if stix_id in techniques and group_stix_id in self._group_id_set()
+            )
+
+    def recent_techniques(self, limit: int = 10) -> List[Dict[str, Any]]:
+        """
+        Return the most recently modified techniques
+        """
+        with self._lock:
+            ranked = sorted(self._technique_ids.values(), key=self._modified, reverse=True)
+            return [self._record(stix_id) for stix_id in ranked[:limit]]
+
+    def active_groups(self, limit: int = 5) -> List[Dict[str, Any]]:
+        """
+        Return the groups with the most known techniques
+        """
+        with self._lock:
+            ranked = sorted(
+                self._group_ids,
+                key=lambda gid: len(self._group_techniques.get(self._group_ids[gid], ())),
+                reverse=True
+            )
+            return [self.get_group(gid) for gid in ranked[:limit]]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "techniques": len(self._technique_ids),
+                "groups": len(self._group_ids),
+                "tactics": len([t for t in self._by_tactic.values() if t]),
+                "data_sources": len([d for d in self._by_data_source.values() if d]),
+                "relationships": len(self._relationships)
+            }
+
+    def _technique_for_stix(self, stix_id: str) -> Optional[Dict[str, Any]]:
+        if stix_id not in self._records and stix_id not in self._entries:
+            return None
+        record = self._record(stix_id)
+        return record if record["kind"] == "technique" else None
+
+    def _group_id_set(self) -> Set[str]:
+        return set(self._group_ids.values())
+
+
+def _external_id(obj: Dict[str, Any]) -> str:
+    for reference in obj.get("external_references", []):
+        if reference.get("source_name") == "mitre-attack" and reference.get("external_id"):
+            return reference["external_id"]
+    return obj["id"]
+
+
+def _data_source_keys(data_source: str) -> List[str]:
+    """
+    Index "Process: Process Creation" under both the full name and the data source "process"
+    """
+    full = data_source.lower().strip()
+    keys = [full]
+    if ":" in full:
+        keys.append(full.split(":", 1)[0].strip())
+    return keys
+
+
+def _first_sentence(description: str) -> str:
+    end = description.find(". ")
+    return description[:end + 1] if end != -1 else description
+
+
+def _seed_objects() -> List[Dict[str, Any]]:
+    """
+    Minimal built-in ATT&CK subset used when no STIX bundle has been provided
+    """
+    techniques = [
+        ("T1546.003", "Windows Management Instrumentation Event Subscription", ["privilege-escalation", "persistence"],
+         "Adversaries may establish persistence and elevate privileges by executing malicious content triggered by a Windows Management Instrumentation (WMI) event subscription.",
+         ["WMI: WMI Creation", "Process: Process Creation", "Command: Command Execution"]),
+        ("T1047", "Windows Management Instrumentation", ["execution"],
+         "Adversaries may abuse Windows Management Instrumentation (WMI) to execute malicious commands and payloads.",
+         ["Process: Process Creation", "Command: Command Execution", "Network Traffic: Network Connection Creation"]),
+        ("T1021", "Remote Services", ["lateral-movement"],
+         "Adversaries may use valid accounts to log into a service specifically designed to accept remote connections.",
+         ["Logon Session: Logon Session Creation", "Network Traffic: Network Connection Creation"]),
+        ("T1021.002", "SMB/Windows Admin Shares", ["lateral-movement"],
+         "Adversaries may use valid accounts to interact with a remote network share using Server Message Block (SMB).",
+         ["Logon Session: Logon Session Creation", "Network Share: Network Share Access"]),
+        ("T1569.002", "Service Execution", ["execution"],
+         "Adversaries may abuse the Windows service control manager to execute malicious commands or payloads.",
+         ["Process: Process Creation", "Service: Service Creation"]),
+        ("T1003.006", "DCSync", ["credential-access"],
+         "Adversaries may attempt to access credentials and other sensitive information by abusing a Windows Domain Controller's application programming interface (API) to simulate the replication process from a remote domain controller using a technique called DCSync.",
+         ["Active Directory: Active Directory Object Access", "Network Traffic: Network Traffic Content"]),
+        ("T1190", "Exploit Public-Facing Application", ["initial-access"],
+         "Adversaries may attempt to exploit a weakness in an Internet-facing host or system to initially access a network.",
+         ["Application Log: Application Log Content", "Network Traffic: Network Traffic Content"]),
+        ("T1059.001", "PowerShell", ["execution"],
+         "Adversaries may abuse PowerShell commands and scripts for execution.",
+         ["Process: Process Creation", "Command: Command Execution", "Script: Script Execution"]),
+        ("T1570", "Lateral Tool Transfer", ["lateral-movement"],
+         "Adversaries may transfer tools or other files between systems in a compromised environment.",
+         ["File: File Creation", "Network Share: Network Share Access"]),
+        ("T1558.003", "Kerberoasting", ["credential-access"],
+         "Adversaries may abuse a valid Kerberos ticket-granting ticket (TGT) or sniff network traffic to obtain a ticket-granting service (TGS) ticket that may be vulnerable to Brute Force.",
+         ["Active Directory: Active Directory Credential Request"]),
+        ("T1557.001", "LLMNR/NBT-NS Poisoning and SMB Relay", ["credential-access", "collection"],
+         "By responding to LLMNR/NBT-NS network traffic, adversaries may spoof an authoritative source for name resolution to force communication with an adversary controlled system.",
+         ["Network Traffic: Network Traffic Content", "Windows Registry: Windows Registry Key Modification"]),
+        ("T1078", "Valid Accounts", ["defense-evasion", "persistence", "privilege-escalation", "initial-access"],
+         "Adversaries may obtain and abuse credentials of existing accounts as a means of gaining Initial Access, Persistence, Privilege Escalation, or Defense Evasion.",
+         ["Logon Session: Logon Session Creation", "User Account: User Account Authentication"]),
+        ("T1098", "Account Manipulation", ["persistence", "privilege-escalation"],
+         "Adversaries may manipulate accounts to maintain and/or elevate access to victim systems.",
+         ["User Account: User Account Modification", "Group: Group Modification"]),
+        ("T1204.002", "Malicious File", ["execution"],
+         "An adversary may rely upon a user opening a malicious file in order to gain execution.",
+         ["File: File Creation", "Process: Process Creation"])
+    ]
+    groups = [
+        ("G0016", "APT29", ["Cozy Bear", "The Dukes", "NOBELIUM"],
+         "APT29 is a threat group that has been attributed to the Russian government and has operated since at least 2008.",
+         ["T1047", "T1546.003", "T1078", "T1098", "T1059.001", "T1003.006"]),
+        ("G0050", "APT32", ["OceanLotus", "SeaLotus"],
+         "APT32 is a suspected Vietnam-based threat group that has been active since at least 2014.",
+         ["T1047", "T1059.001", "T1204.002", "T1021.002", "T1569.002"]),
+        ("G0046", "FIN7", ["Carbanak", "Carbon Spider"],
+         "FIN7 is a financially-motivated threat group that has been active since 2013.",
+         ["T1047", "T1059.001", "T1204.002", "T1078"]),
+        ("G0007", "APT28", ["Fancy Bear", "Sofacy", "STRONTIUM"],
+         "APT28 is a threat group that has been attributed to Russia's General Staff Main Intelligence Directorate (GRU).",
+         ["T1190", "T1078", "T1003.006", "T1570"])
+    ]
+
+    modified = "2023-10-01T00:00:00.000Z"
+    objects = []
+    for technique_id, name, tactics, description, data_sources in techniques:
+        objects.append({
+            "type": "attack-pattern",
+            "id": f"attack-pattern--seed-{technique_id}",
+            "modified": modified,
+            "name": name,
+            "description": description,
+            "kill_chain_phases": [{"kill_chain_name": "mitre-attack", "phase_name": t} for t in tactics],
+            "x_mitre_platforms": ["Windows"],
+            "x_mitre_data_sources": data_sources,
+            "x_mitre_is_subtechnique": "." in technique_id,
+            "external_references": [{"source_name": "mitre-attack", "external_id": technique_id}]
+        })
+    for group_id, name, aliases, description, used in groups:
+        objects.append({
+            "type": "intrusion-set",
+            "id": f"intrusion-set--seed-{group_id}",
+            "modified": modified,
+            "name": name,
+            "description": description,
+            "aliases": [name] + aliases,
+            "external_references": [{"source_name": "mitre-attack", "external_id": group_id}]
+        })
+        for technique_id in used:
+            objects.append({
+                "type": "relationship",
+                "id": f"relationship--seed-{group_id}-{technique_id}",
+                "modified": modified,
+                "relationship_type": "uses",
+                "source_ref": f"intrusion-set--seed-{group_id}",
+                "target_ref": f"attack-pattern--seed-{technique_id}"
+            })
+    return objects
+
+
+_attack_store: Optional[AttackStore] = None
+# Held while the shared store is loaded, so threads asking at once load it once
+_attack_store_lock = threading.Lock()
+
+
+def get_attack_store() -> AttackStore:
+    """
+    Return the shared ATT&CK store, loading it on first use
+
+    The snapshot is opened if present; the STIX bundle is applied incrementally when it is
+    newer than the snapshot, and the snapshot is rewritten. Without a bundle or snapshot the
+    store falls back to a small built-in subset.
+    """
+    global _attack_store
+    if _attack_store is not None:
+        return _attack_store
+
+    with _attack_store_lock:
+        if _attack_store is not None:
+            return _attack_store
+
+        bundle_path = settings.MITRE_ATTACK_BUNDLE_PATH
+        snapshot_path = settings.MITRE_ATTACK_SNAPSHOT_PATH
+
+        store = None
+        if snapshot_path and os.path.isfile(snapshot_path):
+            try:
+                store = AttackStore.load_snapshot(snapshot_path)
+            except Exception as e:
+                logger.error(f"Failed to open ATT&CK snapshot {snapshot_path}: {str(e)}")
+
+        if bundle_path and os.path.isfile(bundle_path):
+            store = store or AttackStore()
+            _sync_bundle(store, bundle_path, snapshot_path)
+
+        if store is None or not store.stats()["techniques"]:
+            logger.info("No ATT&CK bundle or snapshot found, using built-in ATT&CK subset")
+            store = AttackStore()
+            store.apply_objects(_seed_objects())
+
+        _attack_store = store
+        return _attack_store
+
+
+def sync_attack_store() -> Dict[str, int]:
+    """
+    Incrementally apply the STIX bundle to the shared store if it changed since the last sync
+    """
+    store = get_attack_store()
+    bundle_path = settings.MITRE_ATTACK_BUNDLE_PATH
+    if not bundle_path or not os.path.isfile(bundle_path):
+        return {}
+    return _sync_bundle(store, bundle_path, settings.MITRE_ATTACK_SNAPSHOT_PATH)
+
+
+def _sync_bundle(store: AttackStore, bundle_path: str, snapshot_path: str) -> Dict[str, int]:
+    # Agents keep querying the store meanwhile; a second sync waits for this one and finds nothing new
+    with store._sync_lock:
+        if os.path.getmtime(bundle_path) <= store.bundle_mtime:
+            return {}
+        try:
+            stats = store.load_bundle(bundle_path)
+            if snapshot_path:
+                store.save_snapshot(snapshot_path)
+            return stats
+        except Exception as e:
+            logger.error(f"Failed to apply ATT&CK bundle {bundle_path}: {str(e)}")
+            return {}
@@ -0,0 +1,178 @@
+import hashlib
+import math
+import sys
+from array import array
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Tuple
+
+try:
+    import ahocorasick
+except ImportError:  # Optional C automaton, the pure-Python one is used without it
+    ahocorasick = None
+
+_MASK32 = 0xFFFFFFFF
+
+
+def digest(value: str) -> int:
+    """
+    128-bit hash of a normalized indicator: the high 64 bits are its key in a
+    DigestSet, the low 64 bits seed the Bloom filter positions
+    """
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=16).digest(), "little")
+
+
+class BloomFilter:
+    """
+    Bit array sized for capacity items at the given false positive rate. Lookups
+    of values that were never added stop at the first clear bit, so most values
+    of an event cost one or two bit tests.
+    """
+
+    __slots__ = ("size", "hashes", "bits", "count")
+
+    def __init__(self, capacity: int, false_positive_rate: float = 0.001):
+        capacity = max(capacity, 1)
+        self.size = max(1024, int(-capacity * math.log(false_positive_rate) / math.log(2) ** 2))
+        # From the rate rather than the size, which the 1024-bit floor would inflate for small feeds
+        self.hashes = max(1, round(-math.log2(false_positive_rate)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def add(self, hashed: int) -> None:
+        self.update((hashed,))
+
+    def update(self, hashes: Iterable[int]) -> None:
+        bits, size, steps = self.bits, self.size, range(self.hashes)
+        for hashed in hashes:
+            # Double hashing: position i is h1 + i * h2
+            h1, h2 = hashed & _MASK32, (hashed >> 32) & _MASK32 | 1
+            for position in [(h1 + i * h2) % size for i in steps]:
+                bits[position >> 3] |= 1 << (position & 7)
+            self.count += 1
+
+    def __contains__(self, hashed: int) -> bool:
+        h1, h2 = hashed & _MASK32, (hashed >> 32) & _MASK32 | 1
+        bits, size = self.bits, self.size
+        for i in range(self.hashes):
+            position = (h1 + i * h2) % size
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.bits)
+
+    def false_positive_rate(self) -> float:
+        """
+        Expected false positive rate at the current fill
+        """
+        return (1 - math.exp(-self.hashes * self.count / self.size)) ** self.hashes
+
+
+class DigestSet:
+    """
+    Exact membership for the values the Bloom filter lets through: sorted 64-bit
+    keys with a parallel array of tags (what an indicator is and which feed it
+    came from), 10 bytes per indicator instead of a Python string in a set
+    """
+
+    __slots__ = ("keys", "tags")
+
+    def __init__(self, entries: Iterable[Tuple[int, int]]):
+        entries = sorted(entries)
+        self.keys = array("Q", (key for key, _ in entries))
+        self.tags = array("H", (tag for _, tag in entries))
+
+    def find(self, key: int) -> List[int]:
+        """
+        Tags of every indicator with this key (one per feed listing it)
+        """
+        keys = self.keys
+        position = bisect_left(keys, key)
+        found = []
+        while position < len(keys) and keys[position] == key:
+            found.append(self.tags[position])
+            position += 1
+        return found
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.keys) * self.keys.itemsize + len(self.tags) * self.tags.itemsize
+
+
+class SubstringMatcher:
+    """
+    Aho-Corasick automaton over lower-cased patterns: one pass over a text finds
+    every pattern it contains, however many patterns there are. Uses the C
+    automaton of pyahocorasick when it is installed.
+    """
+
+    def __init__(self, patterns: Dict[str, List[int]]):
+        self.patterns = len(patterns)
+        if ahocorasick is not None:
+            self._automaton = ahocorasick.Automaton()
+            for pattern, tags in patterns.items():
+                self._automaton.add_word(pattern, (pattern, tags))
+            if patterns:
+                self._automaton.make_automaton()
+            return
+        self._automaton = None
+        # State 0 is the root; out lists the (pattern, tags) ending at a state,
+        # including those of the states its failure links lead to
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[Tuple[str, List[int]]]] = [[]]
+        for pattern, tags in patterns.items():
+            state = 0
+            for char in pattern:
+                following = self._goto[state].get(char)
+                if following is None:
+                    following = self._goto[state][char] = len(self._goto)
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                state = following
+            self._out[state].append((pattern, tags))
+        queue = list(self._goto[0].values())
+        for state in queue:
+            for char, following in self._goto[state].items():
+                queue.append(following)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[following] = target if target != following else 0
+                self._out[following] = self._out[following] + self._out[self._fail[following]]
+
+    def search(self, text: str) -> List[Tuple[str, List[int]]]:
+        """
+        (pattern, tags) of every distinct pattern in the lower-cased text
+        """
+        if not self.patterns:
+            return []
+        if self._automaton is not None:
+            return list({pattern: tags for _, (pattern, tags) in self._automaton.iter(text)}.items())
+        goto, fail, out = self._goto, self._fail, self._out
+        found: Dict[str, List[int]] = {}
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if out[state]:
+                found.update(out[state])
+        return list(found.items())
+
+    @property
+    def nbytes(self) -> int:
+        if self._automaton is not None:
+            return self._automaton.get_stats()["total_size"] if self.patterns else 0
+        return (
+            sum(sys.getsizeof(transitions) for transitions in self._goto)
+            + sys.getsizeof(self._goto) + sys.getsizeof(self._fail) + sys.getsizeof(self._out)
+            + sum(sys.getsizeof(matches) for matches in self._out if matches)
+        )
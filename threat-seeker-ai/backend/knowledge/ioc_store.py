@@ -0,0 +1,423 @@
+import csv
+import glob
+import ipaddress
+import json
+import logging
+import os
+import re
+import threading
+from collections import Counter
+from datetime import datetime
+from itertools import repeat
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+from urllib.parse import urlsplit
+
+from config.settings import settings
+from knowledge.ioc_index import BloomFilter, DigestSet, SubstringMatcher, ahocorasick, digest
+from utils.metrics import metrics
+
+# Setup logger
+logger = logging.getLogger(__name__)
+
+# Indicator types: the first four are matched against whole field values, substrings anywhere in the substring fields
+EXACT_TYPES = ("hash", "ip", "domain", "url")
+SUBSTRING = "substring"
+
+# Field added to events that match an indicator
+MATCH_FIELD = "ioc_matches"
+
+# Type names used by common feeds (CSV exports, OTX, STIX observables)
+_TYPE_ALIASES = {
+    "md5": "hash", "sha1": "hash", "sha256": "hash", "filehash-md5": "hash", "filehash-sha1": "hash",
+    "filehash-sha256": "hash", "file": "hash", "ipv4": "ip", "ipv6": "ip", "ipv4-addr": "ip", "ipv6-addr": "ip",
+    "hostname": "domain", "fqdn": "domain", "domain-name": "domain", "uri": "url",
+    "command_line": SUBSTRING, "cmdline": SUBSTRING, "string": SUBSTRING,
+}
+_IPV4 = re.compile(r"(?:\d{1,3}\.){3}\d{1,3}")
+_HASH = re.compile(r"[0-9a-f]{32}|[0-9a-f]{40}|[0-9a-f]{64}")
+_DOMAIN = re.compile(r"(?:[a-z0-9_](?:[a-z0-9_-]*[a-z0-9])?\.)+[a-z][a-z0-9-]*[a-z0-9]")
+# Equality comparisons of STIX patterns: [ipv4-addr:value = '1.2.3.4'], [file:hashes.'SHA-256' = '...']
+_STIX_COMPARISON = re.compile(r"([a-z0-9-]+):([\w.'-]+)\s*=\s*'((?:[^'\\]|\\.)*)'")
+# Separators of key=value lists such as Sysmon's "MD5=...,SHA256=..." hashes field
+_TOKEN_SEPARATORS = re.compile(r"[=,;|]")
+
+ioc_matches = metrics.counter(
+    "threat_seeker_ioc_matches_total", "Event fields matching a threat intel indicator", ("type", "source")
+)
+
+
+def normalize(value: str) -> str:
+    """
+    Indicator as matched: lower-cased, trimmed and re-fanged (hxxp, [.])
+    """
+    value = value.strip().lower()
+    if "[" in value or value.startswith("hxxp"):
+        value = value.replace("[.]", ".").replace("[:]", ":").replace("hxxp", "http", 1)
+    return value
+
+
+def indicator_type(value: str, declared: Optional[str] = None) -> str:
+    """
+    Type of a normalized indicator: the declared feed type when known, else inferred from its shape
+    """
+    if declared:
+        declared = declared.strip().lower()
+        if declared in EXACT_TYPES or declared == SUBSTRING:
+            return declared
+        if declared in _TYPE_ALIASES:
+            return _TYPE_ALIASES[declared]
+    if _HASH.fullmatch(value):
+        return "hash"
+    if _IPV4.fullmatch(value):
+        return "ip"
+    if ":" in value and "/" not in value:
+        try:
+            ipaddress.ip_address(value)
+            return "ip"
+        except ValueError:
+            pass
+    if value.startswith(("http://", "https://")):
+        return "url"
+    if _DOMAIN.fullmatch(value):
+        return "domain"
+    return SUBSTRING
+
+
+def read_feed(path: str) -> Iterator[Tuple[str, Optional[str]]]:
+    """
+    (indicator, declared type) pairs of a feed file: a STIX 2 bundle (.json), a
+    CSV with a value (or indicator, ioc) column and an optional type column, or
+    plain text with one indicator per line and # comments
+    """
+    extension = os.path.splitext(path)[1].lower()
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        if extension == ".json":
+            for stix in json.load(f).get("objects", []):
+                if stix.get("type") != "indicator" or stix.get("revoked"):
+                    continue
+                for object_type, prop, value in _STIX_COMPARISON.findall(stix.get("pattern", "")):
+                    value = value.replace("\\'", "'").replace("\\\\", "\\")
+                    if object_type == "file":
+                        yield value, "hash"
+                    elif object_type == "process" and prop == "command_line":
+                        yield value, SUBSTRING
+                    else:
+                        yield value, object_type
+        elif extension == ".csv":
+            for row in csv.DictReader(f):
+                row = {(k or "").strip().lower(): v for k, v in row.items()}
+                value = row.get("value") or row.get("indicator") or row.get("ioc")
+                if value:
+                    yield value, row.get("type")
+        else:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    yield line, None
+
+
+def feed_paths(feed_dir: str, sources: Sequence[str]) -> Dict[str, List[str]]:
+    """
+    Feed files of each threat intel source: <feed_dir>/<source>.* and the files under <feed_dir>/<source>/
+    """
+    paths = {}
+    for source in sources:
+        found = sorted(glob.glob(os.path.join(feed_dir, f"{source}.*")) + glob.glob(os.path.join(feed_dir, source, "*")))
+        paths[source] = [path for path in found if os.path.isfile(path)]
+    return paths
+
+
+class _Index:
+    """
+    Immutable matching structures of one load, swapped in whole on reload
+    """
+
+    __slots__ = ("bloom", "digests", "substrings", "tags", "counts", "indicators")
+
+    def __init__(self, bloom: BloomFilter, digests: DigestSet, substrings: SubstringMatcher,
+                 tags: List[Tuple[str, str]], counts: Dict[str, Dict[str, int]]):
+        # Distinct indicator values; one listed by several feeds has an entry per feed in digests
+        self.indicators = bloom.count + substrings.patterns
+        self.bloom = bloom
+        self.digests = digests
+        self.substrings = substrings
+        self.tags = tags
+        self.counts = counts
+
+
+class IocStore:
+    """
+    Threat intel indicators matched against hunt result events.
+
+    Hashes, IPs, domains and URLs are matched against whole field values: a Bloom
+    filter screens out nearly every value of an event with a few bit tests, and
+    the values it lets through are confirmed in a sorted array of 64-bit hashes.
+    Domains also match their subdomains and URLs on their host. Substring
+    indicators (command-line fragments) are found in the substring fields by
+    one Aho-Corasick pass per value. Each distinct value is matched once per
+    batch of events.
+    """
+
+    def __init__(self, false_positive_rate: float = 0.001, substring_fields: Sequence[str] = (),
+                 min_substring_length: int = 4):
+        self.false_positive_rate = false_positive_rate
+        self.substring_fields = {field.lower() for field in substring_fields}
+        self.min_substring_length = min_substring_length
+        self._index: Optional[_Index] = None
+        self._lock = threading.Lock()
+        self._stats = Counter()
+        self.loaded_at: Optional[str] = None
+
+    def load(self, feeds: Dict[str, List[str]]) -> Dict[str, Any]:
+        """
+        Build the matching structures from feed files by source, replacing those of the previous load
+        """
+        exact: Dict[str, List[int]] = {}
+        substrings: Dict[str, List[int]] = {}
+        tags: List[Tuple[str, str]] = []
+        tag_ids: Dict[Tuple[str, str], int] = {}
+        counts: Dict[str, Dict[str, int]] = {}
+        skipped = 0
+        for source, paths in feeds.items():
+            for path in paths:
+                try:
+                    indicators = list(read_feed(path))
+                except (OSError, ValueError, csv.Error) as e:
+                    logger.warning(f"Could not read IOC feed {path}: {str(e)}")
+                    continue
+                for value, declared in indicators:
+                    value = normalize(value)
+                    kind = indicator_type(value, declared)
+                    if kind == SUBSTRING and len(value) < self.min_substring_length:
+                        skipped += 1
+                        continue
+                    tag = tag_ids.get((kind, source))
+                    if tag is None:
+                        tag = tag_ids[(kind, source)] = len(tags)
+                        tags.append((kind, source))
+                    listed = (substrings if kind == SUBSTRING else exact).setdefault(value, [])
+                    if tag not in listed:
+                        listed.append(tag)
+                        by_kind = counts.get(source)
+                        if by_kind is None:
+                            by_kind = counts[source] = Counter()
+                        by_kind[kind] += 1
+                logger.info(f"Loaded {len(indicators)} indicators of {source} from {path}")
+
+        bloom = BloomFilter(len(exact), self.false_positive_rate)
+        hashes = list(map(digest, exact))
+        bloom.update(hashes)
+        entries = [(hashed >> 64, tag) for hashed, value_tags in zip(hashes, exact.values()) for tag in value_tags]
+        index = _Index(bloom, DigestSet(entries), SubstringMatcher(substrings), tags,
+                       {source: dict(kinds) for source, kinds in counts.items()})
+        with self._lock:
+            self._index = index
+        self.loaded_at = datetime.now().isoformat()
+        return {"indicators": index.indicators, "skipped": skipped, "sources": index.counts}
+
+    @property
+    def indicators(self) -> int:
+        index = self._index
+        return index.indicators if index is not None else 0
+
+    def tag(self, events: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Add the indicators each event matches to its ioc_matches field (blocking:
+        call from a worker thread); returns the match counts of the batch
+        """
+        index = self._index
+        summary = {"events_scanned": len(events), "events_matched": 0, "match_rate": 0.0, "by_type": Counter(), "by_source": Counter()}
+        if index is None or not events:
+            return summary
+        stats = Counter()
+        matched: Dict[int, List[Dict[str, Any]]] = {}
+        cache: Dict[Tuple[str, bool], List[Tuple[str, int]]] = {}
+        self._scan(index, list(range(len(events))), events, "", matched, cache, stats)
+        for position, event in enumerate(events):
+            matches = matched.get(position)
+            if matches:
+                event[MATCH_FIELD] = matches
+                for match in matches:
+                    summary["by_type"][match["type"]] += 1
+                    summary["by_source"][match["source"]] += 1
+                    ioc_matches.inc(type=match["type"], source=match["source"])
+            elif MATCH_FIELD in event:
+                del event[MATCH_FIELD]
+        summary["events_matched"] = len(matched)
+        summary["match_rate"] = round(len(matched) / len(events), 6)
+        summary["by_type"] = dict(summary["by_type"])
+        summary["by_source"] = dict(summary["by_source"])
+        stats.update(events_scanned=len(events), events_matched=len(matched), distinct_values=len(cache))
+        with self._lock:
+            self._stats.update(stats)
+        return summary
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Indicators loaded, the memory of each matching structure, and match rates since startup
+        """
+        index = self._index
+        with self._lock:
+            counters = dict(self._stats)
+        scanned = counters.get("events_scanned", 0)
+        lookups = counters.get("bloom_lookups", 0)
+        report: Dict[str, Any] = {"indicators": self.indicators, "loaded_at": self.loaded_at, "counters": counters}
+        report["match_rate"] = round(counters.get("events_matched", 0) / scanned, 6) if scanned else 0.0
+        report["bloom_pass_rate"] = round(counters.get("bloom_passed", 0) / lookups, 6) if lookups else 0.0
+        if index is None:
+            return report
+        memory = {
+            "bloom_filter": index.bloom.nbytes,
+            "digests": index.digests.nbytes,
+            "substring_automaton": index.substrings.nbytes
+        }
+        report.update(
+            sources=index.counts,
+            memory_bytes=dict(memory, total=sum(memory.values())),
+            bytes_per_indicator=round(sum(memory.values()) / self.indicators, 1) if self.indicators else 0.0,
+            bloom_filter={
+                "bits": index.bloom.size, "hashes": index.bloom.hashes,
+                "expected_false_positive_rate": index.bloom.false_positive_rate()
+            },
+            substring_engine="pyahocorasick" if ahocorasick is not None else "python"
+        )
+        return report
+
+    def _scan(self, index: _Index, positions: List[int], objects: List[Dict[str, Any]], prefix: str,
+              matched: Dict[int, List[Dict[str, Any]]], cache: Dict[Tuple[str, bool], List[Tuple[str, int]]],
+              stats: Counter) -> None:
+        """
+        Match the fields of objects (events, or objects nested in the events at
+        positions) column by column: each distinct value of a field is matched
+        once, and only fields with a match or nested values are read row by row
+        """
+        for key in set().union(*objects):
+            if key == MATCH_FIELD and not prefix:
+                continue
+            field = prefix + key
+            substring = key.lower() in self.substring_fields
+            values = list(map(dict.get, objects, repeat(key)))
+            try:
+                distinct = set(values)
+                nested = False
+            except TypeError:
+                # Lists and objects: their strings are matched, and objects scanned as the next level
+                distinct = {value for value in values if isinstance(value, str)}
+                nested = True
+            hits = {}
+            for value in distinct:
+                if isinstance(value, str) and value:
+                    found = self._match(index, value, substring, cache, stats)
+                    if found:
+                        hits[value] = found
+            child_positions: List[int] = []
+            children: List[Dict[str, Any]] = []
+            if hits or nested:
+                for position, value in zip(positions, values):
+                    if isinstance(value, str):
+                        if value in hits:
+                            self._record(index, matched, position, field, hits[value])
+                    elif isinstance(value, dict):
+                        child_positions.append(position)
+                        children.append(value)
+                    elif isinstance(value, list):
+                        for item in value:
+                            if isinstance(item, str) and item:
+                                found = self._match(index, item, substring, cache, stats)
+                                if found:
+                                    self._record(index, matched, position, field, found)
+                            elif isinstance(item, dict):
+                                child_positions.append(position)
+                                children.append(item)
+            if children:
+                self._scan(index, child_positions, children, field + ".", matched, cache, stats)
+
+    def _match(self, index: _Index, value: str, substring: bool, cache: Dict[Tuple[str, bool], List[Tuple[str, int]]],
+               stats: Counter) -> List[Tuple[str, int]]:
+        """
+        (indicator, tag) pairs a field value matches, from the cache after its first occurrence in the batch
+        """
+        found = cache.get((value, substring))
+        if found is not None:
+            return found
+        lowered = value.lower()
+        found = []
+        for candidate in _candidates(lowered):
+            stats["bloom_lookups"] += 1
+            hashed = digest(candidate)
+            if hashed not in index.bloom:
+                continue
+            stats["bloom_passed"] += 1
+            tags = index.digests.find(hashed >> 64)
+            if not tags:
+                stats["bloom_false_positives"] += 1
+            found.extend((candidate, tag) for tag in tags)
+        if substring:
+            stats["substring_values"] += 1
+            found.extend((pattern, tag) for pattern, tags in index.substrings.search(lowered) for tag in tags)
+        cache[(value, substring)] = found
+        return found
+
+    @staticmethod
+    def _record(index: _Index, matched: Dict[int, List[Dict[str, Any]]], position: int, field: str,
+                found: List[Tuple[str, int]]) -> None:
+        matches = matched.setdefault(position, [])
+        for indicator, tag in found:
+            kind, source = index.tags[tag]
+            matches.append({"field": field, "indicator": indicator, "type": kind, "source": source})
+
+
+def _candidates(value: str) -> List[str]:
+    """
+    Strings of a lower-cased field value that can equal an exact indicator: the
+    value, the parent domains of a domain, the host of a URL, and the tokens of
+    key=value lists
+    """
+    if len(value) > 2048 or " " in value:
+        return []
+    candidates = [value]
+    if value.startswith(("http://", "https://")):
+        host = urlsplit(value).hostname
+        if host:
+            candidates.append(host)
+            value = host
+    if "=" in value or "," in value or ";" in value or "|" in value:
+        candidates.extend(token for token in _TOKEN_SEPARATORS.split(value) if len(token) >= 7)
+    elif "." in value and "/" not in value and ":" not in value:
+        labels = value.split(".")
+        # Parent domains down to the registered name (a.b.evil.com -> b.evil.com, evil.com)
+        candidates.extend(".".join(labels[i:]) for i in range(1, len(labels) - 1))
+    return candidates
+
+
+_ioc_store: Optional[IocStore] = None
+
+
+def _load_feeds(store: IocStore) -> Dict[str, Any]:
+    sources = [source.strip() for source in settings.THREAT_INTEL_SOURCES.split(",") if source.strip()]
+    return store.load(feed_paths(settings.IOC_FEED_DIR, sources))
+
+
+def reload_ioc_store() -> Dict[str, Any]:
+    """
+    Load the feeds of THREAT_INTEL_SOURCES from IOC_FEED_DIR again (blocking)
+    """
+    if _ioc_store is None:
+        return get_ioc_store().stats()
+    return _load_feeds(_ioc_store)
+
+
+def get_ioc_store() -> IocStore:
+    """
+    Return the shared IOC store, loading the feeds of THREAT_INTEL_SOURCES on first use
+    """
+    global _ioc_store
+    if _ioc_store is None:
+        store = IocStore(
+            false_positive_rate=settings.IOC_BLOOM_FALSE_POSITIVE_RATE,
+            substring_fields=[field.strip() for field in settings.IOC_SUBSTRING_FIELDS.split(",") if field.strip()],
+            min_substring_length=settings.IOC_MIN_SUBSTRING_LENGTH
+        )
+        _load_feeds(store)
+        _ioc_store = store
+    return _ioc_store
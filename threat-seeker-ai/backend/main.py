@@ -1,11 +1,18 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, WebSocket, WebSocketDisconnect, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from fastapi.routing import APIRoute
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
+from contextlib import nullcontext
 from datetime import datetime, timedelta
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Callable
 from pydantic import BaseModel
+import asyncio
+import json
+import math
 import uuid
 import logging
+import time
 import traceback
 
 # Configure logging
@@ -16,51 +23,98 @@ logging.basicConfig(
 )
 logger = logging.getLogger("threat-seeker-api")
 
+# Agents are imported and built lazily so the API accepts traffic before
+# the LLM client libraries have finished loading
+from utils.agent_registry import AgentRegistry, run_in_thread
+
+agents = AgentRegistry()
+
 # Import settings first to ensure environment variables are loaded
-from config.settings import settings
-
-# Import agent classes with exception handling
-try:
-    from agents.planner import HuntPlannerAgent
-except ImportError as e:
-    logger.error(f"Failed to import HuntPlannerAgent: {e}")
-    HuntPlannerAgent = None
-
-try:
-    from agents.executor import HuntExecutionAgent
-except ImportError as e:
-    logger.error(f"Failed to import HuntExecutionAgent: {e}")
-    HuntExecutionAgent = None
-
-try:
-    from agents.analyzer import AnalysisAgent
-except ImportError as e:
-    logger.error(f"Failed to import AnalysisAgent: {e}")
-    AnalysisAgent = None
-
-try:
-    from agents.clarifier import ClarificationAgent
-except ImportError as e:
-    logger.error(f"Failed to import ClarificationAgent: {e}")
-    ClarificationAgent = None
-
-try:
-    from agents.critic import CriticAgent
-except ImportError as e:
-    logger.error(f"Failed to import CriticAgent: {e}")
-    CriticAgent = None
+with agents.timed("config.settings", "import"):
+    from config.settings import settings
+with agents.timed("utils", "import"):
+    from detection import FileTailSource, SocketSource, get_detection_engine, plan_rules
+    from knowledge.attack_store import get_attack_store
+    from knowledge.ioc_store import get_ioc_store, reload_ioc_store
+    from utils.hunt_scheduler import HuntScheduler, merge_analysis
+    from utils.hypothesis_pool import HypothesisPool
+    from utils.prompt_budget import prompt_usage
+    from utils.metrics import metrics, http_request_duration, http_requests_in_flight, http_request_errors
+    from utils.tracing import tracer
+    from utils.progress import hunt_progress, is_terminal
+    from storage.pagination import InvalidQueryError
+    from storage.result_diff import delta_results
+    from storage.result_store import get_result_store, strip_events
+    from storage.search_index import get_search_index, index_plan, index_result
+    from storage.state import DETECTION_RULES, JOBS, JOB_TTL_SECONDS, PLANS, PLAN_TTL_SECONDS, get_state_backend
+    from utils.event_fields import to_epoch
+    from utils.serialization import (
+        COLUMNAR_MEDIA_TYPE, JSON_MEDIA_TYPE, encode_payload, negotiate_encoding, wants_columnar
+    )
+
+tracer.configure(
+    enabled=settings.TRACING_ENABLED,
+    export_path=settings.TRACE_EXPORT_PATH,
+    history_size=settings.TRACE_HISTORY_SIZE,
+    export_max_bytes=settings.TRACE_EXPORT_MAX_BYTES,
+    export_backups=settings.TRACE_EXPORT_BACKUPS
+)
+
+# Health probes and metric scrapes, polled every few seconds: measured, but not traced
+UNTRACED_ROUTES = {"/", "/api/health", "/api/health/ready", "/api/health/startup", "/metrics"}
+
+class InstrumentedRoute(APIRoute):
+    """
+    Route that records latency, in-flight requests and error responses per route template,
+    and opens the trace that every agent, connector and LLM span of the request joins
+    """
     
-try:
-    from agents.hypothesis_generator import HypothesisGeneratorAgent
-except ImportError as e:
-    logger.error(f"Failed to import HypothesisGeneratorAgent: {e}")
-    HypothesisGeneratorAgent = None
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+        route = self.path
+        traced = route not in UNTRACED_ROUTES
+        
+        async def instrumented_handler(request):
+            method = request.method
+            http_requests_in_flight.inc(method=method, route=route)
+            start = time.perf_counter()
+            status_code = 500
+            with (tracer.span(f"{method} {route}", "server", **{"http.method": method, "http.route": route})
+                  if traced else nullcontext()) as span:
+                try:
+                    response = await handler(request)
+                    status_code = response.status_code
+                    return response
+                except HTTPException as e:
+                    status_code = e.status_code
+                    raise
+                finally:
+                    if span is not None:
+                        span.set_attribute("http.status_code", status_code)
+                        if status_code >= 500:
+                            span.status = "error"
+                    http_request_duration.observe(time.perf_counter() - start, method=method, route=route, status=status_code)
+                    if status_code >= 400:
+                        http_request_errors.inc(method=method, route=route, status=status_code)
+                    http_requests_in_flight.dec(method=method, route=route)
+        
+        return instrumented_handler
+
+agents.register("planner", "agents.planner", "HuntPlannerAgent")
+agents.register("execution", "agents.executor", "HuntExecutionAgent")
+agents.register("analysis", "agents.analyzer", "AnalysisAgent")
+agents.register("clarification", "agents.clarifier", "ClarificationAgent")
+agents.register("critic", "agents.critic", "CriticAgent")
+agents.register("hypothesis_generator", "agents.hypothesis_generator", "HypothesisGeneratorAgent")
+# Agents the API routes cannot serve without (suggested hypotheses fall back to mock ones)
+REQUIRED_AGENTS = ["planner", "execution", "analysis", "clarification"]
 
 app = FastAPI(
     title="Threat-Seeker AI API",
     description="Backend API for the Threat-Seeker AI threat hunting co-pilot",
     version="1.0.0"
 )
+app.router.route_class = InstrumentedRoute
 
 # Configure CORS
 app.add_middleware(
@@ -83,12 +137,24 @@ class HuntPlan(BaseModel):
     queries: List[Dict[str, Any]]
     created_at: datetime
     analyst_id: str
+    similar_hunts: List[Dict[str, Any]] = []
 
 class QueryApprovalRequest(BaseModel):
     plan_id: str
     query_ids: List[str]
     modifications: Optional[Dict[str, str]] = None
 
+class ScheduleRequest(BaseModel):
+    plan_id: str
+    query_ids: List[str]
+    interval_seconds: int
+    modifications: Optional[Dict[str, str]] = None
+
+class DetectionRuleRequest(BaseModel):
+    plan_id: str
+    query_ids: List[str]
+    modifications: Optional[Dict[str, str]] = None
+
 class HuntResult(BaseModel):
     result_id: str
     plan_id: str
@@ -105,36 +171,43 @@ class ClarificationResponse(BaseModel):
     result_id: str
     answer: str
     confidence: float
+    supporting_events: List[Dict[str, Any]] = []
+    context_tokens: int = 0
 
-# Agent instances with safe initialization
-try:
-    planner_agent = HuntPlannerAgent() if HuntPlannerAgent else None
-    execution_agent = HuntExecutionAgent() if HuntExecutionAgent else None
-    analysis_agent = AnalysisAgent() if AnalysisAgent else None
-    clarification_agent = ClarificationAgent() if ClarificationAgent else None
-    critic_agent = CriticAgent() if CriticAgent else None
-    hypothesis_generator_agent = HypothesisGeneratorAgent() if HypothesisGeneratorAgent else None
-    
-    logger.info("Agent initialization complete")
-except Exception as e:
-    logger.error(f"Error initializing agents: {e}")
-    logger.error(traceback.format_exc())
-    
-    # Set any failed agents to None
-    if 'planner_agent' not in locals(): planner_agent = None
-    if 'execution_agent' not in locals(): execution_agent = None
-    if 'analysis_agent' not in locals(): analysis_agent = None
-    if 'clarification_agent' not in locals(): clarification_agent = None
-    if 'critic_agent' not in locals(): critic_agent = None
-    if 'hypothesis_generator_agent' not in locals(): hypothesis_generator_agent = None
+async def enforce_rate_limit(request: Request):
+    """
+    Per-client token bucket for the LLM-backed endpoints, shared by all workers
+    through the state backend
+    """
+    if settings.RATE_LIMIT_PER_MINUTE <= 0:
+        return
+    client = request.client.host if request.client else "unknown"
+    allowed, retry_after = await run_in_thread(
+        get_state_backend().take_token,
+        f"llm:{client}", settings.RATE_LIMIT_PER_MINUTE / 60, settings.RATE_LIMIT_BURST
+    )
+    if not allowed:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Rate limit exceeded, please retry later",
+            headers={"Retry-After": str(math.ceil(retry_after))}
+        )
+
+async def update_job(plan_id: str, **fields: Any) -> None:
+    """
+    Record the status of a hunt's execution where every worker can read it
+    """
+    fields.update(plan_id=plan_id, updated_at=datetime.now().isoformat())
+    await run_in_thread(get_state_backend().update, JOBS, plan_id, fields, JOB_TTL_SECONDS)
 
 # Routes
-@app.post("/api/hypothesis", response_model=HuntPlan)
+@app.post("/api/hypothesis", response_model=HuntPlan, dependencies=[Depends(enforce_rate_limit)])
 async def create_hunt_plan(hypothesis_req: HypothesisRequest):
     """
     Generate a hunt plan from a natural language hypothesis
     """
     # Check if agent was initialized
+    planner_agent = await agents.get("planner")
     if planner_agent is None:
         logger.error("Hunt planner agent not initialized")
         raise HTTPException(
@@ -151,6 +224,16 @@ async def create_hunt_plan(hypothesis_req: HypothesisRequest):
             context=hypothesis_req.context
         )
         
+        tracer.tag_hunt(hunt_plan["plan_id"])
+        
+        # Point the analyst at earlier hunts for the same thing before indexing this one
+        search_index = await run_in_thread(get_search_index)
+        # Searching reads other workers' log entries first
+        similar = await run_in_thread(search_index.search, hypothesis_req.hypothesis, {"type": "plan"}, 3, False)
+        hunt_plan["similar_hunts"] = similar["results"]
+        await run_in_thread(index_plan, search_index, hunt_plan)
+        # Any worker may receive the execution request for this plan
+        await run_in_thread(get_state_backend().set, PLANS, hunt_plan["plan_id"], hunt_plan, PLAN_TTL_SECONDS)
         logger.info(f"Successfully created hunt plan with ID: {hunt_plan['plan_id']}")
         return hunt_plan
     except Exception as e:
@@ -163,12 +246,62 @@ async def create_hunt_plan(hypothesis_req: HypothesisRequest):
             detail=f"Failed to create hunt plan: {str(e)}"
         )
 
-@app.post("/api/execute", response_model=HuntResult)
-async def execute_hunt_plan(approval: QueryApprovalRequest):
+async def hunt_result_response(request: Request, payload: Dict[str, Any], allow_columnar: bool = True) -> Response:
+    """
+    Serialize a (potentially very large) hunt result with the fast encoder, in the
+    columnar format when the client asks for it, compressed with the best coding
+    the client accepts. Encoding runs in a worker thread to keep the event loop free.
+    """
+    columnar = allow_columnar and wants_columnar(request.headers.get("accept"))
+    encoding = negotiate_encoding(request.headers.get("accept-encoding"))
+    with tracer.span("response.serialize", format="columnar" if columnar else "json") as span:
+        body, applied_encoding = await run_in_thread(
+            encode_payload, payload, columnar, encoding, settings.RESPONSE_COMPRESSION_MIN_BYTES
+        )
+        if span is not None:
+            span.set_attribute("bytes", len(body))
+            span.set_attribute("content_encoding", applied_encoding or "identity")
+    
+    headers = {"Vary": "Accept, Accept-Encoding"}
+    if applied_encoding:
+        headers["Content-Encoding"] = applied_encoding
+    return Response(
+        content=body,
+        media_type=COLUMNAR_MEDIA_TYPE if columnar else JSON_MEDIA_TYPE,
+        headers=headers
+    )
+
+def delta_since_previous(plan_id: str, raw_results: Dict[str, Any]):
+    """
+    Raw results to analyze: the rows each query added or changed since the plan's
+    previous stored result, that result, and a summary of the diff (blocking)
+    """
+    store = get_result_store()
+    previous_id = store.previous_result(plan_id)
+    if previous_id is None:
+        return raw_results, None, None
+    compared = store.diff(
+        previous_id, {"result_id": raw_results["result_id"], "raw_results": raw_results},
+        limit=settings.DIFF_SAMPLE_LIMIT, run_rows=settings.DIFF_RUN_ROWS
+    )
+    if compared is None:
+        return raw_results, None, None
+    report, diffs = compared
+    diff = {"base_result_id": previous_id, "summary": report["summary"], "entities": report["entities"]}
+    return delta_results(raw_results, diffs), store.get(previous_id), diff
+
+@app.post("/api/execute", response_model=HuntResult, dependencies=[Depends(enforce_rate_limit)])
+async def execute_hunt_plan(approval: QueryApprovalRequest, request: Request, include_events: bool = True):
     """
     Execute approved queries from a hunt plan
+    
+    Send "Accept: application/vnd.threat-seeker.columnar" to receive the results in
+    the binary columnar format; gzip and zstd are negotiated via Accept-Encoding.
+    With include_events=false the raw events are left out and read page by page
+    from /api/results/{result_id}/queries/{query_id}/events instead.
     """
     # Check if agents were initialized
+    execution_agent = await agents.get("execution")
     if execution_agent is None:
         logger.error("Hunt execution agent not initialized")
         raise HTTPException(
@@ -176,6 +309,7 @@ async def execute_hunt_plan(approval: QueryApprovalRequest):
             detail="Hunt execution service is currently unavailable"
         )
     
+    analysis_agent = await agents.get("analysis")
     if analysis_agent is None:
         logger.error("Analysis agent not initialized")
         raise HTTPException(
@@ -183,40 +317,384 @@ async def execute_hunt_plan(approval: QueryApprovalRequest):
             detail="Analysis service is currently unavailable"
         )
     
+    with hunt_progress.bind(approval.plan_id) as execution_id:
+        try:
+            logger.info(f"Executing hunt plan queries for plan ID: {approval.plan_id}")
+            tracer.tag_hunt(approval.plan_id)
+            hunt_progress.emit("hunt.started", query_ids=approval.query_ids)
+            await update_job(
+                approval.plan_id, status="running", stage="executing", execution_id=execution_id,
+                query_ids=approval.query_ids, started_at=datetime.now().isoformat(), result_id=None, error=None
+            )
+            # Execute approved queries
+            raw_results = await execution_agent.execute_queries(
+                plan_id=approval.plan_id,
+                query_ids=approval.query_ids,
+                modifications=approval.modifications
+            )
+            
+            # A re-run of a plan only analyzes what changed since its previous result
+            analyzed_results, previous, diff = raw_results, None, None
+            if settings.ANALYZE_DELTA_ONLY:
+                analyzed_results, previous, diff = await run_in_thread(delta_since_previous, approval.plan_id, raw_results)
+            
+            logger.info(f"Analyzing results for plan ID: {approval.plan_id}")
+            await update_job(approval.plan_id, stage="analyzing")
+            hunt_progress.emit("analysis.started", total_results=analyzed_results["summary"]["total_results"])
+            if previous is not None and not analyzed_results["summary"]["total_results"]:
+                analysis = previous.get("analysis") or {}
+            else:
+                # Analyze results
+                analysis = await analysis_agent.analyze_results(
+                    plan_id=approval.plan_id,
+                    raw_results=analyzed_results
+                )
+                if previous is not None:
+                    analysis = merge_analysis(previous.get("analysis"), analysis)
+            
+            for finding in analysis.get("findings") or []:
+                hunt_progress.emit("finding", finding=finding)
+            hunt_progress.emit("analysis.completed", findings=len(analysis.get("findings") or []))
+            logger.info(f"Successfully completed hunt execution and analysis for plan ID: {approval.plan_id}")
+            hunt_result = {
+                "result_id": raw_results["result_id"],
+                "plan_id": approval.plan_id,
+                "raw_results": raw_results,
+                "analysis": analysis,
+                "created_at": datetime.now().isoformat()
+            }
+            if diff is not None:
+                hunt_result["diff"] = diff
+            await run_in_thread(get_result_store().save, hunt_result)
+            await run_in_thread(index_result, get_search_index(), hunt_result)
+            await update_job(approval.plan_id, status="completed", stage="done", result_id=hunt_result["result_id"])
+            hunt_progress.emit("hunt.completed", result_id=hunt_result["result_id"])
+            if not include_events:
+                hunt_result = strip_events(hunt_result)
+            return await hunt_result_response(request, hunt_result)
+        except Exception as e:
+            error_details = traceback.format_exc()
+            logger.error(f"Failed to execute hunt plan: {str(e)}")
+            logger.debug(f"Error details: {error_details}")
+            await update_job(approval.plan_id, status="failed", error=str(e))
+            hunt_progress.emit("hunt.failed", error=str(e))
+            
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Failed to execute hunt plan: {str(e)}"
+            )
+
+@app.post("/api/schedules")
+async def create_hunt_schedule(req: ScheduleRequest):
+    """
+    Register approved queries of a hunt plan as a continuous hunt, re-run every interval_seconds
+    
+    Each run searches only the events since the previous one; new events are added
+    to the schedule's stored result and only they are analyzed.
+    """
+    plan = await run_in_thread(get_state_backend().get, PLANS, req.plan_id)
+    if plan is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Hunt plan {req.plan_id} not found"
+        )
     try:
-        logger.info(f"Executing hunt plan queries for plan ID: {approval.plan_id}")
-        # Execute approved queries
-        raw_results = await execution_agent.execute_queries(
-            plan_id=approval.plan_id,
-            query_ids=approval.query_ids,
-            modifications=approval.modifications
+        return await hunt_scheduler.create(plan, req.query_ids, req.interval_seconds, req.modifications)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+@app.get("/api/schedules")
+async def list_hunt_schedules():
+    """
+    Registered continuous hunts with their watermarks and recent runs
+    """
+    return {"schedules": await hunt_scheduler.list_schedules()}
+
+@app.get("/api/schedules/{schedule_id}")
+async def get_hunt_schedule(schedule_id: str):
+    """
+    A continuous hunt with its per-query watermarks and recent runs
+    """
+    schedule = await hunt_scheduler.get(schedule_id)
+    if schedule is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Hunt schedule {schedule_id} not found"
         )
-        
-        logger.info(f"Analyzing results for plan ID: {approval.plan_id}")
-        # Analyze results
-        hunt_results = await analysis_agent.analyze_results(
-            plan_id=approval.plan_id,
-            raw_results=raw_results
+    return schedule
+
+@app.post("/api/schedules/{schedule_id}/run")
+async def run_hunt_schedule(schedule_id: str):
+    """
+    Run a continuous hunt now instead of waiting for its next run
+    """
+    if await hunt_scheduler.get(schedule_id) is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Hunt schedule {schedule_id} not found"
         )
-        
-        logger.info(f"Successfully completed hunt execution and analysis for plan ID: {approval.plan_id}")
-        return hunt_results
-    except Exception as e:
-        error_details = traceback.format_exc()
-        logger.error(f"Failed to execute hunt plan: {str(e)}")
-        logger.debug(f"Error details: {error_details}")
-        
+    schedule = await hunt_scheduler.run(schedule_id)
+    if schedule is None:
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Failed to execute hunt plan: {str(e)}"
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Hunt schedule {schedule_id} is already running"
+        )
+    return schedule
+
+@app.delete("/api/schedules/{schedule_id}")
+async def delete_hunt_schedule(schedule_id: str):
+    """
+    Stop a continuous hunt; its stored result is kept
+    """
+    if not await hunt_scheduler.delete(schedule_id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Hunt schedule {schedule_id} not found"
+        )
+    return {"schedule_id": schedule_id, "deleted": True}
+
+@app.post("/api/detections/rules")
+async def create_detection_rules(req: DetectionRuleRequest):
+    """
+    Register approved queries of a hunt plan as detection rules, evaluated against
+    every event of the live streams from now on
+    
+    Only queries that test single events can run this way; a query that
+    aggregates, sorts or deduplicates events is rejected.
+    """
+    plan = await run_in_thread(get_state_backend().get, PLANS, req.plan_id)
+    if plan is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Hunt plan {req.plan_id} not found"
+        )
+    try:
+        rules = get_detection_engine().add_rules(plan_rules(plan, req.query_ids, req.modifications))
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    state = get_state_backend()
+    for rule in rules:
+        await run_in_thread(state.set, DETECTION_RULES, rule.rule_id, rule.to_dict())
+    return {"rules": [rule.to_dict() for rule in rules]}
+
+@app.get("/api/detections/rules")
+async def list_detection_rules():
+    """
+    Detection rules with their per-rule event, candidate and match counters (of this worker)
+    """
+    engine = get_detection_engine()
+    await run_in_thread(engine.sync_rules)
+    return {"rules": engine.rules()}
+
+@app.delete("/api/detections/rules/{rule_id}")
+async def delete_detection_rule(rule_id: str):
+    """
+    Stop evaluating a detection rule
+    """
+    state = get_state_backend()
+    # The other workers drop the rule at their next sync
+    registered = await run_in_thread(state.get, DETECTION_RULES, rule_id)
+    if not get_detection_engine().remove_rule(rule_id) and registered is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Detection rule {rule_id} not found"
+        )
+    await run_in_thread(state.delete, DETECTION_RULES, rule_id)
+    return {"rule_id": rule_id, "deleted": True}
+
+@app.get("/api/detections/alerts")
+async def read_detection_alerts(after: int = Query(0, ge=0), limit: int = Query(100, ge=1, le=1000)):
+    """
+    Alerts raised after sequence number after, oldest first; pass back next to poll
+    for newer alerts. missed counts alerts dropped from the bounded queue unread.
+    """
+    return get_detection_engine().alerts.read(after, limit)
+
+@app.get("/api/detections/stats")
+async def detection_stats():
+    """
+    Events read, parsed and matched per stream, with the evaluation throughput
+    """
+    return get_detection_engine().stats()
+
+@app.post("/api/detections/events")
+async def submit_detection_events(request: Request):
+    """
+    Evaluate the detection rules against NDJSON events in the request body
+    """
+    body = await request.body()
+    lines = [line for line in body.split(b"\n") if line.strip()]
+    alerts = await run_in_thread(get_detection_engine().process, lines, "http")
+    return {"events": len(lines), "alerts": alerts}
+
+@app.get("/api/iocs/stats")
+async def ioc_stats():
+    """
+    Threat intel indicators loaded per source and type, the memory of the
+    matching structures, and the share of events that matched since startup
+    """
+    store = await run_in_thread(get_ioc_store)
+    return store.stats()
+
+@app.post("/api/iocs/reload")
+async def reload_iocs():
+    """
+    Load the indicator feeds of THREAT_INTEL_SOURCES again, e.g. after an export was updated
+    """
+    return await run_in_thread(reload_ioc_store)
+
+@app.get("/api/search")
+async def search_hunts(
+    q: str = "",
+    type: Optional[str] = None,
+    technique: Optional[str] = None,
+    host: Optional[str] = None,
+    user: Optional[str] = None,
+    data_source: Optional[str] = None,
+    severity: Optional[str] = None,
+    limit: int = 20
+):
+    """
+    Full-text search over hunt plans (hypotheses, queries), results (hosts, users) and findings
+    
+    Results are ranked with BM25; the last term matches as a prefix (as does any
+    term ending in *). The other parameters filter by facet, and facet counts are
+    returned for the matching documents.
+    """
+    search_index = await run_in_thread(get_search_index)
+    filters = {
+        "type": type, "technique": technique, "host": host, "user": user,
+        "data_source": data_source, "severity": severity
+    }
+    return await run_in_thread(search_index.search, q, filters, max(1, min(limit, 100)))
+
+@app.get("/api/results")
+async def list_hunt_results(limit: int = 20):
+    """
+    Most recent stored hunt results, for hunt history
+    """
+    return {"results": await run_in_thread(get_result_store().list_results, limit)}
+
+@app.get("/api/results/{result_id}")
+async def get_hunt_result(result_id: str):
+    """
+    A stored hunt result with its analysis and per-query counts, without the raw events
+    """
+    hunt_result = await run_in_thread(get_result_store().get, result_id)
+    if hunt_result is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Hunt result {result_id} not found"
+        )
+    return hunt_result
+
+@app.get("/api/results/{result_id}/diff")
+async def diff_hunt_results(result_id: str, base: Optional[str] = None, limit: Optional[int] = None):
+    """
+    What changed between two results: rows added, removed and changed per query
+    (with samples), and hosts, users, processes, command lines and IPs that
+    appeared or disappeared. base defaults to the previous result of the same plan.
+    """
+    store = get_result_store()
+    hunt_result = await run_in_thread(store.get, result_id)
+    if hunt_result is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Hunt result {result_id} not found"
         )
+    if base is None:
+        base = await run_in_thread(store.previous_result, hunt_result.get("plan_id"), result_id)
+        if base is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"No earlier result of plan {hunt_result.get('plan_id')} to compare with"
+            )
+    sample_limit = max(0, min(limit if limit is not None else settings.DIFF_SAMPLE_LIMIT, 1000))
+    compared = await run_in_thread(store.diff, base, result_id, sample_limit, settings.DIFF_RUN_ROWS)
+    if compared is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Hunt result {base} not found"
+        )
+    return compared[0]
 
-@app.post("/api/clarify", response_model=ClarificationResponse)
+@app.get("/api/results/{result_id}/search")
+async def search_hunt_result_events(
+    result_id: str,
+    q: str = "",
+    host: Optional[str] = None,
+    user: Optional[str] = None,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    limit: Optional[int] = None
+):
+    """
+    A stored result's events ranked by BM25 relevance to q, as retrieved to
+    support clarification answers
+    
+    - host/user: events with this host or user (e.g. DC01, or CORP\\jsmith or jsmith)
+    - start/end: ISO 8601 or epoch time bounds
+    """
+    bounds = {}
+    for name, value in (("start", start), ("end", end)):
+        bounds[name] = to_epoch(value)
+        if value and bounds[name] is None:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid {name} time: {value}")
+    retrieved = await run_in_thread(
+        get_result_store().retrieve,
+        result_id, q, max(1, min(limit if limit is not None else settings.RETRIEVAL_TOP_K, 200)),
+        host, user, bounds["start"], bounds["end"]
+    )
+    if retrieved is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Hunt result {result_id} not found"
+        )
+    return retrieved
+
+@app.get("/api/results/{result_id}/queries/{query_id}/events")
+async def get_hunt_result_events(
+    request: Request,
+    result_id: str,
+    query_id: str,
+    cursor: Optional[str] = None,
+    limit: int = 100,
+    sort: Optional[str] = None,
+    order: str = "asc",
+    filter: Optional[List[str]] = Query(None),
+    fields: Optional[str] = None
+):
+    """
+    One page of a query's raw events
+    
+    - sort/order: sort by an event field, ascending or descending
+    - filter: repeatable, e.g. filter=host:DC01 (equals), filter=user~admin (contains),
+      filter=event_code>=4624 (also !=, >, <, <=); filters are combined with AND
+    - fields: comma-separated projection, e.g. fields=timestamp,host,user
+    - cursor: next_cursor from the previous page
+    """
+    try:
+        # Sorting a large result set is CPU-bound, keep it off the event loop
+        page = await run_in_thread(lambda: get_result_store().page(
+            result_id, query_id,
+            limit=limit, cursor=cursor, sort=sort, order=order, filters=filter, fields=fields
+        ))
+    except InvalidQueryError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if page is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Query {query_id} of hunt result {result_id} not found"
+        )
+    return await hunt_result_response(request, page, allow_columnar=False)
+
+@app.post("/api/clarify", response_model=ClarificationResponse, dependencies=[Depends(enforce_rate_limit)])
 async def request_clarification(req: ClarificationRequest):
     """
     Request clarification about hunt results
     """
     # Check if agent was initialized
+    clarification_agent = await agents.get("clarification")
     if clarification_agent is None:
         logger.error("Clarification agent not initialized")
         raise HTTPException(
@@ -226,6 +704,7 @@ async def request_clarification(req: ClarificationRequest):
     
     try:
         logger.info(f"Requesting clarification for result ID: {req.result_id}, question: {req.question[:50]}...")
+        tracer.tag_hunt(req.context.get("plan_id", ""))
         response = await clarification_agent.get_clarification(
             result_id=req.result_id,
             question=req.question,
@@ -233,6 +712,8 @@ async def request_clarification(req: ClarificationRequest):
         )
         logger.info(f"Successfully generated clarification response")
         return response
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     except Exception as e:
         error_details = traceback.format_exc()
         logger.error(f"Failed to get clarification: {str(e)}")
@@ -246,11 +727,113 @@ async def request_clarification(req: ClarificationRequest):
 @app.get("/api/health")
 async def api_health_check():
     """
-    API health check endpoint
+    API health check endpoint (liveness: the process is up and serving requests)
     """
     logger.info("API health check endpoint called")
     return {"status": "healthy", "timestamp": datetime.now().isoformat()}
 
+@app.get("/api/health/ready")
+async def api_readiness_check():
+    """
+    Readiness check: 503 while an agent the routes need is loading or failed to
+    load (without warm-up, agents are built on first use and count as available)
+    """
+    readiness = agents.readiness(REQUIRED_AGENTS, lazy=not settings.AGENT_WARMUP_ON_STARTUP)
+    readiness["timestamp"] = datetime.now().isoformat()
+    if not readiness["ready"]:
+        return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content=readiness)
+    return readiness
+
+@app.get("/api/health/startup")
+async def api_startup_report():
+    """
+    How long each import and agent build took during startup
+    """
+    return agents.startup_report()
+
+@app.get("/api/prompt-usage")
+async def get_prompt_usage():
+    """
+    Prompt size, completion size and latency of LLM calls, per agent
+    """
+    return prompt_usage.summary()
+
+@app.get("/api/hunts/{plan_id}/status")
+async def get_hunt_status(plan_id: str):
+    """
+    Execution status of a hunt (running, completed or failed, and the current stage),
+    whichever worker is running it
+    """
+    job = await run_in_thread(get_state_backend().get, JOBS, plan_id)
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"No execution recorded for hunt plan {plan_id}"
+        )
+    return job
+
+@app.websocket("/api/hunts/{plan_id}/progress")
+async def hunt_progress_channel(websocket: WebSocket, plan_id: str, execution_id: Optional[str] = None):
+    """
+    Live lifecycle events of a hunt execution: hunt.started, query.queued/started/completed/failed
+    (with row counts), retry, analysis.started, finding, analysis.completed and
+    hunt.completed or hunt.failed, after which the channel is closed.
+    
+    Follows the execution_id given (reported by /api/hunts/{plan_id}/status), or else
+    the plan's latest execution, or its next one if it has not run yet. Events
+    already published for the execution are replayed first. A client that falls
+    behind loses the oldest buffered events and receives an events_dropped message
+    with their count instead.
+    """
+    await websocket.accept()
+    subscription, history = await hunt_progress.subscribe(plan_id, execution_id)
+    
+    async def send_events():
+        batch = history
+        while True:
+            for message in batch:
+                await websocket.send_text(message)
+                if is_terminal(message):
+                    return
+            batch = await subscription.get()
+    
+    async def wait_for_disconnect():
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+    
+    sender = asyncio.ensure_future(send_events())
+    receiver = asyncio.ensure_future(wait_for_disconnect())
+    try:
+        done, _ = await asyncio.wait({sender, receiver}, return_when=asyncio.FIRST_COMPLETED)
+        if sender in done and sender.exception() is None:
+            await websocket.close()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        sender.cancel()
+        receiver.cancel()
+        hunt_progress.unsubscribe(plan_id, subscription)
+
+@app.get("/api/hunts/{plan_id}/trace")
+async def get_hunt_trace(plan_id: str):
+    """
+    Waterfall of every span recorded for a hunt: planning, query execution, analysis and clarification
+    """
+    waterfall = tracer.waterfall(plan_id)
+    if waterfall is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"No trace recorded for hunt plan {plan_id}"
+        )
+    return waterfall
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """
+    Latency histograms, in-flight gauges and error counters in the Prometheus text format
+    """
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/")
 @app.head("/")
 async def root_health_check():
@@ -261,44 +844,45 @@ async def root_health_check():
     return {"status": "ok", "message": "Threat Seeker API is running"}
 
 @app.get("/api/suggested-hypotheses")
-async def get_suggested_hypotheses(count: Optional[int] = 3):
+async def get_suggested_hypotheses(count: int = Query(3, ge=1, le=settings.HYPOTHESIS_POOL_SIZE)):
     """
     Get AI-generated threat hunting hypotheses
+    
+    Hypotheses are served from the background-refreshed pool, so count is at most
+    HYPOTHESIS_POOL_SIZE (use /api/suggested-hypotheses/stream for more); the
+    response includes the pool's freshness so clients can tell how current it is.
     """
     logger.info(f"Received request for {count} suggested hypotheses")
     
-    # Check if agent was initialized
-    if hypothesis_generator_agent is None:
-        logger.warning("Hypothesis generator agent not initialized, using mock data")
-        mock_hypotheses = get_mock_hypotheses()
-        limited_hypotheses = mock_hypotheses[:count] if count < len(mock_hypotheses) else mock_hypotheses
-        return {"hypotheses": limited_hypotheses}
+    hypotheses, freshness = await hypothesis_pool.get(count)
+    return {"hypotheses": hypotheses, "freshness": freshness}
+
+@app.get("/api/suggested-hypotheses/stream")
+async def stream_suggested_hypotheses(count: Optional[int] = 3):
+    """
+    Stream freshly generated hypotheses as newline-delimited JSON, one per line,
+    as soon as the LLM has produced each of them
+    """
+    logger.info(f"Received request to stream {count} suggested hypotheses")
     
-    try:
-        # Check if Gemini API key is set
-        if settings.GEMINI_API_KEY and settings.GEMINI_API_KEY != "your-api-key-here":
-            logger.info("Using LLM to generate hypotheses")
-            # Generate hypotheses using the agent
-            hypotheses = await hypothesis_generator_agent.generate_hypotheses(count=count)
-            logger.info(f"Successfully generated {len(hypotheses)} hypotheses using LLM")
-            return {"hypotheses": hypotheses}
-        else:
-            logger.info("No valid Gemini API key found, using mock hypotheses")
-            # Return static mock hypotheses for demo purposes
-            mock_hypotheses = get_mock_hypotheses()
-            # Limit to requested count
-            limited_hypotheses = mock_hypotheses[:count] if count < len(mock_hypotheses) else mock_hypotheses
-            return {"hypotheses": limited_hypotheses}
-    except Exception as e:
-        error_details = traceback.format_exc()
-        logger.error(f"Error generating hypotheses: {str(e)}")
-        logger.debug(f"Error details: {error_details}")
+    async def hypothesis_lines():
+        streamed = 0
+        hypothesis_generator_agent = await agents.get("hypothesis_generator")
+        if hypothesis_generator_agent is not None and hypothesis_generator_agent.chain is not None:
+            try:
+                async for hypothesis in hypothesis_generator_agent.stream_hypotheses(count=count):
+                    streamed += 1
+                    yield json.dumps(hypothesis) + "\n"
+            except Exception as e:
+                logger.error(f"Error streaming hypotheses: {str(e)}")
         
-        # Fallback to mock data on error
-        logger.info("Falling back to mock hypotheses data")
-        mock_hypotheses = get_mock_hypotheses()
-        limited_hypotheses = mock_hypotheses[:count] if count < len(mock_hypotheses) else mock_hypotheses
-        return {"hypotheses": limited_hypotheses}
+        # Top up from the pool if the LLM is unavailable or stopped early
+        if streamed < count:
+            hypotheses, _ = await hypothesis_pool.get(count)
+            for hypothesis in hypotheses[streamed:]:
+                yield json.dumps(hypothesis) + "\n"
+    
+    return StreamingResponse(hypothesis_lines(), media_type="application/x-ndjson")
 
 def get_mock_hypotheses() -> List[Dict[str, Any]]:
     """
@@ -367,6 +951,135 @@ def get_mock_hypotheses() -> List[Dict[str, Any]]:
         }
     ]
 
+async def _generate_pool_hypotheses(count: int, threat_intel: Optional[str]) -> List[Dict[str, Any]]:
+    hypothesis_generator_agent = await agents.get("hypothesis_generator")
+    if hypothesis_generator_agent is None:
+        raise ValueError("Hypothesis generator agent not initialized")
+    return await hypothesis_generator_agent.generate_hypotheses(count=count, threat_intel=threat_intel)
+
+async def _fetch_pool_threat_intel() -> str:
+    hypothesis_generator_agent = await agents.get("hypothesis_generator")
+    if hypothesis_generator_agent is None:
+        raise ValueError("Hypothesis generator agent not initialized")
+    return await hypothesis_generator_agent._fetch_threat_intelligence()
+
+# Background-refreshed pool of suggested hypotheses
+hypothesis_pool = HypothesisPool(
+    generate=_generate_pool_hypotheses,
+    fetch_intel=_fetch_pool_threat_intel,
+    fallback=get_mock_hypotheses,
+    pool_size=settings.HYPOTHESIS_POOL_SIZE,
+    refresh_interval=settings.HYPOTHESIS_REFRESH_INTERVAL_SECONDS,
+    intel_poll_interval=settings.HYPOTHESIS_INTEL_POLL_SECONDS,
+    state=get_state_backend()
+)
+
+async def _execute_scheduled_queries(plan_id: str, query_ids: List[str], overrides: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    execution_agent = await agents.get("execution")
+    if execution_agent is None:
+        raise ValueError("Hunt execution agent not initialized")
+    return await execution_agent.execute_queries(plan_id=plan_id, query_ids=query_ids, overrides=overrides)
+
+async def _analyze_scheduled_results(plan_id: str, raw_results: Dict[str, Any]) -> Dict[str, Any]:
+    analysis_agent = await agents.get("analysis")
+    if analysis_agent is None:
+        raise ValueError("Analysis agent not initialized")
+    return await analysis_agent.analyze_results(plan_id=plan_id, raw_results=raw_results)
+
+# Continuous hunts, re-run incrementally from their watermarks
+hunt_scheduler = HuntScheduler(
+    execute=_execute_scheduled_queries,
+    analyze=_analyze_scheduled_results,
+    state=get_state_backend(),
+    poll_interval=settings.SCHEDULE_POLL_SECONDS,
+    lateness_seconds=settings.SCHEDULE_LATENESS_SECONDS,
+    min_interval=settings.SCHEDULE_MIN_INTERVAL_SECONDS
+)
+
+def detection_streams() -> List[Any]:
+    """
+    The configured event streams for streaming detection
+    """
+    streams: List[Any] = [
+        FileTailSource(path.strip(), settings.DETECTION_BATCH_SIZE, from_start=settings.DETECTION_TAIL_FROM_START)
+        for path in settings.DETECTION_TAIL_PATHS.split(",") if path.strip()
+    ]
+    if settings.DETECTION_SOCKET_PORT:
+        streams.append(SocketSource(settings.DETECTION_SOCKET_HOST, settings.DETECTION_SOCKET_PORT, settings.DETECTION_BATCH_SIZE))
+    return streams
+
+async def start_detection():
+    """
+    Restore the registered detection rules and start consuming the event streams
+    (each by the worker that takes its lease)
+    """
+    engine = get_detection_engine()
+    await run_in_thread(engine.sync_rules)
+    await engine.start(detection_streams())
+
+async def start_hypothesis_pool():
+    """
+    Start refreshing the hypothesis pool when an LLM is available
+    """
+    if not settings.ENABLE_HYPOTHESIS_GENERATION:
+        logger.info("Hypothesis generation disabled, serving mock hypotheses")
+        return
+    hypothesis_generator_agent = await agents.get("hypothesis_generator")
+    if hypothesis_generator_agent is None or hypothesis_generator_agent.chain is None:
+        logger.info("No LLM available for hypothesis generation, serving mock hypotheses")
+    else:
+        await hypothesis_pool.start()
+
+async def warm_up():
+    """
+    Load the ATT&CK knowledge base and threat intel indicators and build every
+    agent in the background
+    """
+    with agents.timed("attack_store", "load"):
+        await run_in_thread(get_attack_store)
+    with agents.timed("search_index", "load"):
+        await run_in_thread(get_search_index)
+    with agents.timed("ioc_store", "load"):
+        await run_in_thread(get_ioc_store)
+    await agents.warm_up()
+
+def _log_startup_failure(name: str) -> Callable[[asyncio.Future], None]:
+    def log_failure(task: asyncio.Future) -> None:
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Startup task {name} failed: {task.exception()}", exc_info=task.exception())
+    return log_failure
+
+@app.on_event("startup")
+async def start_background_services():
+    """
+    Start scheduled hunts, streaming detection and the hypothesis pool, and the
+    warm-up if enabled, each on its own so that one failing does not keep the
+    others from starting, and without delaying the moment the server accepts traffic
+    """
+    startup = {
+        "hunt_scheduler": hunt_scheduler.start(),
+        "detection": start_detection(),
+        "hypothesis_pool": start_hypothesis_pool()
+    }
+    if settings.AGENT_WARMUP_ON_STARTUP:
+        startup["warm_up"] = warm_up()
+    app.state.startup_tasks = {}
+    for name, coroutine in startup.items():
+        task = asyncio.ensure_future(coroutine)
+        task.add_done_callback(_log_startup_failure(name))
+        app.state.startup_tasks[name] = task
+
+@app.on_event("shutdown")
+async def stop_hypothesis_pool():
+    """
+    Stop the hypothesis pool refresher, the hunt scheduler and the detection
+    streams, and write the traces still queued for export
+    """
+    await hypothesis_pool.stop()
+    await hunt_scheduler.stop()
+    await get_detection_engine().stop()
+    await run_in_thread(tracer.close)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
@@ -0,0 +1,7 @@
+# Embedded query engine package
+from .compiler import QueryCompiler, TranslationError, get_query_compiler
+from .expressions import QuerySyntaxError
+from .ir import ir_hash, plan_from_ir, to_ir
+from .parser import detect_language, parse_query
+from .plan import LogicalPlan, run_query
+from .table import ColumnTable, RowSource
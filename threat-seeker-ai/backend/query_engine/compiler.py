@@ -0,0 +1,376 @@
+import json
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from config.settings import settings
+
+from .expressions import METADATA_FIELDS, to_number
+from .ir import ECS_FIELDS, ir_hash, plan_from_ir, rename_fields, to_ir
+from .parser import parse_query
+
+TARGETS = ("spl", "dsl", "local")
+
+# Values SPL takes without quotes
+_SPL_BARE = re.compile(r"^[\w.:@/*-]+$")
+_SPL_RESERVED = ("AND", "OR", "NOT", "IN")
+_LUCENE_SPECIAL = re.compile(r'([+\-=&|><!(){}\[\]^"~?:\\/ ])')
+_DSL_METRICS = {"dc": "cardinality", "sum": "sum", "avg": "avg", "min": "min", "max": "max", "count": "value_count"}
+
+
+class TranslationError(ValueError):
+    """Raised when a query cannot be expressed in a target language."""
+
+
+# SPL
+
+def _spl_value(value: Any) -> str:
+    text = str(value).lower() if isinstance(value, bool) else str(value)
+    if _SPL_BARE.match(text) and text.upper() not in _SPL_RESERVED:
+        return text
+    return '"' + text.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def _spl_expr(node: Dict[str, Any], parent: Optional[str] = None, where: bool = False) -> str:
+    if "all" in node:
+        return "*"
+    if "cmp" in node:
+        field, op, value = node["cmp"]
+        return f"{field}{op}{_spl_value(value)}"
+    if "in" in node:
+        field, values = node["in"]
+        return f"{field} IN ({', '.join(_spl_value(v) for v in values)})"
+    if "contains" in node:
+        field, text = node["contains"]
+        return f"{field}={_spl_value('*' + text + '*')}"
+    if "exists" in node:
+        return f"{node['exists']}=*"
+    if "keyword" in node:
+        return _spl_value(node["keyword"])
+    if "not" in node:
+        return "NOT " + _spl_expr(node["not"], "not", where)
+    kind = "and" if "and" in node else "or"
+    # where clauses need an explicit AND
+    joiner = " OR " if kind == "or" else " AND " if where else " "
+    text = joiner.join(_spl_expr(child, kind, where) for child in node[kind])
+    # Parenthesized wherever the other operator surrounds it, so Splunk's precedence does not matter
+    return f"({text})" if parent is not None and parent != kind else text
+
+
+def _spl_where(node: Dict[str, Any]) -> bool:
+    """
+    Whether a filter is a where clause: numeric comparisons only
+    """
+    if "cmp" in node:
+        return to_number(node["cmp"][2]) is not None and not node.get("lenient")
+    if "not" in node:
+        return _spl_where(node["not"])
+    if "and" in node or "or" in node:
+        return all(_spl_where(child) for child in node.get("and", node.get("or")))
+    return False
+
+
+def _spl_fields(fields: List[str]) -> str:
+    return ", ".join(fields)
+
+
+def compile_spl(ir: Dict[str, Any]) -> str:
+    """
+    SPL for an IR. Case-sensitive terms become Splunk's case-insensitive ones.
+    """
+    segments = [_spl_expr(ir["search"])]
+    for position, node in enumerate(ir["pipeline"]):
+        if "filter" in node:
+            if _spl_where(node["filter"]):
+                segments.append("where " + _spl_expr(node["filter"], where=True))
+            else:
+                segments.append("search " + _spl_expr(node["filter"]))
+        elif "stats" in node:
+            aggregations = []
+            for function, field, alias in node["stats"]["aggs"]:
+                name = function if field is None else f"{function}({field})"
+                aggregations.append(name if alias == name else f"{name} as {alias}")
+            by = node["stats"]["by"]
+            segments.append("stats " + ", ".join(aggregations) + (f" by {_spl_fields(by)}" if by else ""))
+        elif "sort" in node:
+            keys = ", ".join(("-" if descending else "") + field for field, descending in node["sort"]["keys"])
+            limit = node["sort"].get("limit")
+            segments.append(f"sort {limit} {keys}" if limit is not None else f"sort {keys}")
+        elif "head" in node:
+            segments.append(f"head {node['head']}")
+        elif "table" in node:
+            # fields runs where the events are; table only formats the final results
+            command = "table " if position == len(ir["pipeline"]) - 1 else "fields "
+            segments.append(command + _spl_fields(node["table"]))
+        elif "exclude" in node:
+            segments.append("fields - " + _spl_fields(node["exclude"]))
+        elif "rename" in node:
+            segments.append("rename " + ", ".join(f"{old} as {new}" for old, new in node["rename"].items()))
+        elif "dedup" in node:
+            segments.append("dedup " + _spl_fields(node["dedup"]))
+        else:
+            raise TranslationError(f"No SPL for {node!r}")
+    return " | ".join(segments)
+
+
+# Elasticsearch DSL
+
+def _dsl_scalar(value: Any) -> Any:
+    if isinstance(value, str):
+        number = to_number(value)
+        if number is not None and re.fullmatch(r"-?\d+(\.\d+)?", value):
+            return int(number) if float(number).is_integer() and "." not in value else number
+    return value
+
+
+def _dsl_equals(field: str, value: Any, case_sensitive: bool) -> Dict[str, Any]:
+    value = _dsl_scalar(value)
+    if isinstance(value, str) and "*" in value:
+        return {"wildcard": {field: {"value": value, "case_insensitive": not case_sensitive}}}
+    if not isinstance(value, str) or case_sensitive:
+        return {"term": {field: value}}
+    return {"term": {field: {"value": value, "case_insensitive": True}}}
+
+
+def _dsl_bool(required: List[Dict[str, Any]]) -> Dict[str, Any]:
+    positive = [q for q in required if not (set(q) == {"bool"} and set(q["bool"]) == {"must_not"})]
+    negative = [n for q in required if q not in positive for n in q["bool"]["must_not"]]
+    body: Dict[str, Any] = {}
+    if positive:
+        body["filter"] = positive
+    if negative:
+        body["must_not"] = negative
+    return {"bool": body}
+
+
+def _dsl_query(node: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Query clause for an IR expression; None for terms that always match, such
+    as Splunk index and sourcetype terms, which the index pattern stands for
+    """
+    if "all" in node:
+        return None
+    if "cmp" in node:
+        field, op, value = node["cmp"]
+        if node.get("lenient") and field in METADATA_FIELDS and field != "_index":
+            return None
+        if op == "=":
+            return _dsl_equals(field, value, node.get("cs", False))
+        if op == "!=":
+            return {"bool": {"filter": [{"exists": {"field": field}}], "must_not": [_dsl_equals(field, value, node.get("cs", False))]}}
+        bound = {"<": "lt", "<=": "lte", ">": "gt", ">=": "gte"}[op]
+        return {"range": {field: {bound: _dsl_scalar(value)}}}
+    if "in" in node:
+        field, values = node["in"]
+        values = [_dsl_scalar(v) for v in values]
+        if node.get("cs") or not any(isinstance(v, str) for v in values):
+            return {"terms": {field: values}}
+        return {"bool": {"should": [_dsl_equals(field, v, False) for v in values], "minimum_should_match": 1}}
+    if "contains" in node:
+        return {"match_phrase": {node["contains"][0]: node["contains"][1]}}
+    if "exists" in node:
+        return {"exists": {"field": node["exists"]}}
+    if "keyword" in node:
+        text = node["keyword"]
+        if "*" in text:
+            query = _LUCENE_SPECIAL.sub(r"\\\1", text)
+        else:
+            query = '"' + text.replace("\\", "\\\\").replace('"', '\\"') + '"'
+        return {"query_string": {"query": query}}
+    if "not" in node:
+        child = _dsl_query(node["not"])
+        if child is None:
+            raise TranslationError("Negated index or sourcetype terms have no Elasticsearch equivalent")
+        return {"bool": {"must_not": [child]}}
+    if "and" in node:
+        children = [q for q in (_dsl_query(child) for child in node["and"]) if q is not None]
+        if not children:
+            return None
+        return children[0] if len(children) == 1 else _dsl_bool(children)
+    children = [_dsl_query(child) for child in node["or"]]
+    if any(child is None for child in children):
+        return None
+    return {"bool": {"should": children, "minimum_should_match": 1}}
+
+
+def _dsl_aggregations(stats: Dict[str, Any], rest: List[Dict[str, Any]]) -> Dict[str, Any]:
+    by = stats["by"]
+    count_alias = None
+    metrics: Dict[str, Any] = {}
+    for function, field, alias in stats["aggs"]:
+        if function == "count" and field is None:
+            count_alias = alias
+        elif function in _DSL_METRICS:
+            metrics[alias] = {_DSL_METRICS[function]: {"field": field}}
+        else:
+            raise TranslationError(f"{function}() has no Elasticsearch aggregation")
+    if not by:
+        if rest:
+            raise TranslationError("Commands after an ungrouped stats have no Elasticsearch equivalent")
+        return metrics or {"count": {"value_count": {"field": "_index"}}}
+
+    size = None
+    min_doc_count = 1
+    order: Dict[str, str] = {}
+    for node in rest:
+        if "filter" in node and count_alias is not None and "cmp" in node["filter"] \
+                and node["filter"]["cmp"][0] == count_alias and node["filter"]["cmp"][1] in (">", ">=") \
+                and to_number(node["filter"]["cmp"][2]) is not None and size is None:
+            # where count > 5 is a minimum bucket size
+            threshold = to_number(node["filter"]["cmp"][2])
+            min_doc_count = int(threshold) + 1 if node["filter"]["cmp"][1] == ">" else int(-(-threshold // 1))
+        elif "sort" in node and not order and size is None:
+            for field, descending in node["sort"]["keys"]:
+                key = "_count" if field == count_alias else "_key" if field == by[0] and len(by) == 1 else field
+                if key not in ("_count", "_key") and key not in metrics:
+                    raise TranslationError(f"Buckets cannot be ordered by {field}")
+                order[key] = "desc" if descending else "asc"
+            if node["sort"].get("limit") is not None:
+                size = node["sort"]["limit"]
+        elif "head" in node:
+            size = node["head"] if size is None else min(size, node["head"])
+        else:
+            raise TranslationError(f"No Elasticsearch equivalent of {next(iter(node))} after stats")
+    if len(by) > 1 and (size is not None or order):
+        raise TranslationError("Sorting or limiting nested buckets has no exact Elasticsearch equivalent")
+
+    aggregations: Dict[str, Any] = metrics
+    for position, field in reversed(list(enumerate(by))):
+        terms: Dict[str, Any] = {"field": field, "size": size if size is not None and position == 0 else 10000}
+        if min_doc_count > 1:
+            terms["min_doc_count"] = min_doc_count
+        if order and position == 0:
+            terms["order"] = order
+        level: Dict[str, Any] = {"terms": terms}
+        if aggregations:
+            level["aggs"] = aggregations
+        aggregations = {f"by_{field}": level}
+    return aggregations
+
+
+def compile_dsl(ir: Dict[str, Any]) -> str:
+    """
+    Elasticsearch search request (JSON) for an IR, with fields mapped to ECS
+    """
+    ir = rename_fields(ir, ECS_FIELDS)
+    query = _dsl_query(ir["search"])
+    body: Dict[str, Any] = {"query": query or {"match_all": {}}}
+    pipeline = list(ir["pipeline"])
+    for position, node in enumerate(pipeline):
+        if "stats" in node:
+            if position:
+                raise TranslationError("Commands before stats have no Elasticsearch equivalent")
+            body["size"] = 0
+            body["aggs"] = _dsl_aggregations(node["stats"], pipeline[position + 1:])
+            return json.dumps(body)
+
+    sort: List[Dict[str, Any]] = []
+    for node in pipeline:
+        if "sort" in node:
+            if sort or "size" in body or "collapse" in body:
+                raise TranslationError("Only one sort before head has an Elasticsearch equivalent")
+            sort = [{field: {"order": "desc" if descending else "asc"}} for field, descending in node["sort"]["keys"]]
+            body["sort"] = sort
+            if node["sort"].get("limit") is not None:
+                body["size"] = node["sort"]["limit"]
+        elif "head" in node:
+            body["size"] = min(body.get("size", node["head"]), node["head"])
+        elif "table" in node:
+            body["_source"] = node["table"]
+        elif "exclude" in node:
+            body["_source"] = {"excludes": node["exclude"]}
+        elif "dedup" in node and len(node["dedup"]) == 1 and "size" not in body:
+            body["collapse"] = {"field": node["dedup"][0]}
+        else:
+            raise TranslationError(f"No Elasticsearch equivalent of {next(iter(node))}")
+    return json.dumps(body)
+
+
+def compile_local(ir: Dict[str, Any]) -> Any:
+    """
+    Optimized plan of the embedded query engine for an IR
+    """
+    return plan_from_ir(ir).optimize()
+
+
+COMPILERS: Dict[str, Callable[[Dict[str, Any]], Any]] = {"spl": compile_spl, "dsl": compile_dsl, "local": compile_local}
+
+
+class QueryCompiler:
+    """
+    Translates hunt queries through the IR. Each query string is parsed once and
+    each IR is compiled once per target; both are kept in LRU caches, compiled
+    artifacts by IR hash, so the same logic written for different backends
+    shares them.
+    """
+
+    def __init__(self, cache_size: int = 1024):
+        self.cache_size = cache_size
+        self._irs: "OrderedDict[Tuple[str, str], Tuple[Dict[str, Any], str]]" = OrderedDict()
+        self._artifacts: "OrderedDict[Tuple[str, str], Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def ir(self, query_string: str, language: Optional[str] = None) -> Tuple[Dict[str, Any], str]:
+        """
+        IR of a query string and its hash
+        """
+        key = (language or "", query_string)
+        with self._lock:
+            cached = self._irs.get(key)
+            if cached is not None:
+                self._irs.move_to_end(key)
+                return cached
+        ir = to_ir(parse_query(query_string, language))
+        entry = (ir, ir_hash(ir))
+        self._store(self._irs, key, entry)
+        return entry
+
+    def compile(self, ir: Dict[str, Any], target: str, digest: Optional[str] = None) -> Any:
+        """
+        ir compiled for target: SPL text, an Elasticsearch request body (JSON text)
+        or a LogicalPlan for the local engine. Compiled plans are shared; do not modify them.
+        """
+        if target not in COMPILERS:
+            raise ValueError(f"Unknown compile target {target}; expected one of {', '.join(TARGETS)}")
+        key = (digest or ir_hash(ir), target)
+        with self._lock:
+            artifact = self._artifacts.get(key)
+            if artifact is not None:
+                self._artifacts.move_to_end(key)
+                self.hits += 1
+                return artifact
+            self.misses += 1
+        artifact = COMPILERS[target](ir)
+        self._store(self._artifacts, key, artifact)
+        return artifact
+
+    def translate(self, query_string: str, target: str, language: Optional[str] = None) -> Any:
+        ir, digest = self.ir(query_string, language)
+        return self.compile(ir, target, digest)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"parsed": len(self._irs), "compiled": len(self._artifacts), "hits": self.hits, "misses": self.misses}
+
+    def _store(self, cache: "OrderedDict[Tuple[str, str], Any]", key: Tuple[str, str], value: Any) -> None:
+        with self._lock:
+            cache[key] = value
+            cache.move_to_end(key)
+            while len(cache) > self.cache_size:
+                cache.popitem(last=False)
+
+
+_compiler: Optional[QueryCompiler] = None
+
+
+def get_query_compiler() -> QueryCompiler:
+    """
+    Return the shared query compiler
+    """
+    global _compiler
+    if _compiler is None:
+        _compiler = QueryCompiler(cache_size=settings.QUERY_COMPILE_CACHE_SIZE)
+    return _compiler
@@ -0,0 +1,387 @@
+import re
+from typing import Any, Dict, List, Tuple
+
+from utils.serialization import loads
+
+from .expressions import (
+    METADATA_FIELDS, Compare, Contains, Exists, Expr, In, Keyword, MatchAll, Not, QuerySyntaxError, conjunction,
+    disjunction
+)
+from .plan import Aggregate, Aggregation, Dedup, Exclude, Filter, Limit, LogicalPlan, Operator, Project, Sort
+
+_FIELD = re.compile(r"((?:[\w.@*-]|\\.)+):")
+_GROUP_OPERATOR = re.compile(r"\s+(OR|AND|\|\||&&)\s+")
+_RANGE = re.compile(r"^\s*(\S+)\s+TO\s+(\S+)\s*$")
+_METRICS = {"cardinality": "dc", "avg": "avg", "sum": "sum", "min": "min", "max": "max", "value_count": "count"}
+# Top-level keys of a search request body, as opposed to a bare query clause
+_REQUEST_KEYS = {"query", "size", "from", "sort", "_source", "aggs", "aggregations", "collapse"}
+# Buckets per terms aggregation when the request does not say
+DEFAULT_BUCKETS = 10
+
+
+class _LuceneParser:
+    """
+    Lucene query strings (Kibana, query_string queries): field:value terms with
+    wildcards, quoted phrases, field:(a OR b) groups, ranges ([a TO b], >=x),
+    AND/OR/NOT (also &&, ||, !, - and +), parentheses and bare keywords. Terms
+    without an operator between them must all match.
+    """
+
+    def __init__(self, text: str):
+        self.text = text
+        self.position = 0
+
+    def parse(self) -> Expr:
+        self._skip()
+        if self.position >= len(self.text):
+            return MatchAll()
+        expr = self._or()
+        self._skip()
+        if self.position < len(self.text):
+            raise QuerySyntaxError(f"Unexpected {self.text[self.position:]!r}")
+        return expr
+
+    def _skip(self) -> None:
+        while self.position < len(self.text) and self.text[self.position].isspace():
+            self.position += 1
+
+    def _at(self, word: str) -> bool:
+        self._skip()
+        end = self.position + len(word)
+        if not self.text.startswith(word, self.position):
+            return False
+        return end >= len(self.text) or self.text[end].isspace() or self.text[end] == "("
+
+    def _consume(self, *words: str) -> bool:
+        for word in words:
+            if self._at(word):
+                self.position += len(word)
+                return True
+        return False
+
+    def _or(self) -> Expr:
+        terms = [self._and()]
+        while self._consume("OR", "||"):
+            terms.append(self._and())
+        return disjunction(terms)
+
+    def _and(self) -> Expr:
+        terms = [self._unary()]
+        while True:
+            self._skip()
+            if self.position >= len(self.text) or self.text[self.position] == ")" or self._at("OR") or self._at("||"):
+                break
+            self._consume("AND", "&&")
+            terms.append(self._unary())
+        return conjunction(terms) or MatchAll()
+
+    def _unary(self) -> Expr:
+        if self._consume("NOT"):
+            return Not(self._unary())
+        if self.position >= len(self.text):
+            raise QuerySyntaxError("Query ends unexpectedly")
+        char = self.text[self.position]
+        if char in "-!":
+            self.position += 1
+            return Not(self._unary())
+        if char == "+":
+            self.position += 1
+            return self._unary()
+        if char == "(":
+            self.position += 1
+            expr = self._or()
+            self._skip()
+            if self.position >= len(self.text) or self.text[self.position] != ")":
+                raise QuerySyntaxError("Unclosed parenthesis")
+            self.position += 1
+            return expr
+        match = _FIELD.match(self.text, self.position)
+        if match:
+            self.position = match.end()
+            self._skip()
+            return self._field_value(re.sub(r"\\(.)", r"\1", match.group(1)))
+        value, quoted = self._value()
+        if value == "*" and not quoted:
+            return MatchAll()
+        return Keyword(value)
+
+    def _value(self) -> Tuple[str, bool]:
+        text = self.text
+        if self.position < len(text) and text[self.position] == '"':
+            end = self.position + 1
+            while end < len(text) and text[end] != '"':
+                end += 2 if text[end] == "\\" else 1
+            if end >= len(text):
+                raise QuerySyntaxError("Unclosed quote")
+            value = re.sub(r'\\(["\\])', r"\1", text[self.position + 1:end])
+            self.position = end + 1
+            return value, True
+        start = self.position
+        while self.position < len(text) and not text[self.position].isspace() and text[self.position] != ")":
+            self.position += 2 if text[self.position] == "\\" else 1
+        if self.position == start:
+            raise QuerySyntaxError(f"Expected a value at {text[start:]!r}")
+        return re.sub(r"\\(.)", r"\1", text[start:self.position]), False
+
+    def _closing(self, opening: str, closing: str) -> int:
+        depth = 0
+        quoted = False
+        position = self.position
+        while position < len(self.text):
+            char = self.text[position]
+            if char == "\\":
+                position += 2
+                continue
+            if char == '"':
+                quoted = not quoted
+            elif not quoted and char == opening:
+                depth += 1
+            elif not quoted and char in closing:
+                depth -= 1
+                if depth == 0:
+                    return position
+            position += 1
+        raise QuerySyntaxError(f"Unclosed {opening}")
+
+    def _field_value(self, field: str) -> Expr:
+        text = self.text
+        if self.position >= len(text):
+            raise QuerySyntaxError(f"Expected a value for {field}")
+        char = text[self.position]
+        if char == "(":
+            end = self._closing("(", ")")
+            inner = text[self.position + 1:end]
+            self.position = end + 1
+            return self._group(field, inner)
+        if char in "[{":
+            end = self._closing(char, "]}")
+            bounds = _RANGE.match(text[self.position + 1:end])
+            if bounds is None:
+                raise QuerySyntaxError(f"Cannot parse range {text[self.position:end + 1]!r}")
+            terms: List[Expr] = []
+            low, high = (value.strip('"') for value in bounds.groups())
+            if low != "*":
+                terms.append(Compare(field, ">=" if char == "[" else ">", low))
+            if high != "*":
+                terms.append(Compare(field, "<=" if text[end] == "]" else "<", high))
+            self.position = end + 1
+            return conjunction(terms) or Exists(field)
+        for op in (">=", "<=", ">", "<"):
+            if text.startswith(op, self.position):
+                self.position += len(op)
+                value, _ = self._value()
+                return Compare(field, op, value)
+        value, quoted = self._value()
+        return _term(field, value, quoted)
+
+    def _group(self, field: str, inner: str) -> Expr:
+        parts = _GROUP_OPERATOR.split(inner.strip())
+        values = parts[0::2]
+        conjunctive = any(op in ("AND", "&&") for op in parts[1::2])
+        terms = []
+        for value in values:
+            value = value.strip()
+            if value.startswith("(") and value.endswith(")"):
+                value = value[1:-1].strip()
+            quoted = len(value) > 1 and value.startswith('"') and value.endswith('"')
+            if quoted:
+                value = value[1:-1]
+            if not quoted and " " in value and "*" not in value:
+                # Unquoted words each match (Lucene's default OR)
+                terms.append(disjunction([_term(field, word, False) for word in value.split()]))
+            else:
+                terms.append(_term(field, value, quoted))
+        return (conjunction(terms) or MatchAll()) if conjunctive else disjunction(terms)
+
+
+def _term(field: str, value: str, quoted: bool) -> Expr:
+    if value == "*" and not quoted:
+        return Exists(field)
+    if quoted and " " in value:
+        return Contains(field, value)
+    return Compare(field, "=", value, lenient=field in METADATA_FIELDS)
+
+
+def parse_lucene(query: str) -> Expr:
+    return _LuceneParser(query).parse()
+
+
+def _field_and_options(body: Any, kind: str) -> Tuple[str, Any, Dict[str, Any]]:
+    items = [(field, value) for field, value in (body or {}).items() if field not in ("boost", "_name")]
+    if len(items) != 1:
+        raise QuerySyntaxError(f"{kind} needs exactly one field")
+    field, value = items[0]
+    if isinstance(value, dict):
+        return field, value.get("value", value.get("query")), value
+    return field, value, {}
+
+
+def _clause(query: Any) -> Expr:
+    if not isinstance(query, dict) or len(query) != 1:
+        raise QuerySyntaxError(f"Expected a single query clause, got {query!r}")
+    (kind, body), = query.items()
+
+    if kind == "match_all":
+        return MatchAll()
+    if kind == "bool":
+        required = [_clause(q) for key in ("must", "filter") for q in _as_list(body.get(key))]
+        should = [_clause(q) for q in _as_list(body.get("should"))]
+        # With must or filter clauses, should clauses only score unless minimum_should_match says otherwise
+        if should and (not required or int(body.get("minimum_should_match", 0) or 0) > 0):
+            required.append(disjunction(should))
+        required.extend(Not(_clause(q)) for q in _as_list(body.get("must_not")))
+        return conjunction(required) or MatchAll()
+    if kind == "constant_score":
+        return _clause(body.get("filter", {"match_all": {}}))
+    if kind in ("query_string", "simple_query_string"):
+        return parse_lucene(str(body.get("query", "")))
+    if kind == "exists":
+        return Exists(body["field"])
+    if kind == "terms":
+        items = [(field, values) for field, values in body.items() if field not in ("boost", "_name")]
+        if len(items) != 1 or not isinstance(items[0][1], list):
+            raise QuerySyntaxError("terms needs exactly one field and a list of values")
+        return In(items[0][0], items[0][1], case_sensitive=True)
+
+    field, value, options = _field_and_options(body, kind)
+    if kind == "term":
+        return Compare(field, "=", value, case_sensitive=not options.get("case_insensitive", False))
+    if kind == "wildcard":
+        return Compare(field, "=", value, case_sensitive=not options.get("case_insensitive", False))
+    if kind == "prefix":
+        return Compare(field, "=", f"{value}*", case_sensitive=not options.get("case_insensitive", False))
+    if kind == "match_phrase":
+        return Contains(field, str(value))
+    if kind == "match":
+        words = [Contains(field, word) for word in str(value).split()] or [MatchAll()]
+        if str(options.get("operator", "or")).lower() == "and":
+            return conjunction(words) or MatchAll()
+        return disjunction(words)
+    if kind == "range":
+        terms = []
+        for key, op in (("gte", ">="), ("gt", ">"), ("lte", "<="), ("lt", "<")):
+            bound = options.get(key)
+            # Relative date math is the query's time range, applied by the connector
+            if bound is None or (isinstance(bound, str) and bound.startswith("now")):
+                continue
+            terms.append(Compare(field, op, bound))
+        return conjunction(terms) or MatchAll()
+    raise QuerySyntaxError(f"Unsupported query clause: {kind}")
+
+
+def _as_list(value: Any) -> List[Any]:
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def _sort_keys(sort: Any) -> List[Tuple[str, bool]]:
+    keys = []
+    for entry in _as_list(sort):
+        if isinstance(entry, str):
+            field, order = entry, "asc"
+        elif isinstance(entry, dict) and len(entry) == 1:
+            (field, order), = entry.items()
+            if isinstance(order, dict):
+                order = order.get("order", "asc")
+        else:
+            raise QuerySyntaxError(f"Cannot parse sort {entry!r}")
+        if field != "_score":
+            keys.append((field, str(order).lower() == "desc"))
+    return keys
+
+
+def _aggregations(aggs: Dict[str, Any]) -> List[Operator]:
+    """
+    Nested terms aggregations become one grouping by all their fields, sorted by
+    doc_count (or the outermost order) and filtered by min_doc_count; metric
+    aggregations at any level are computed per group
+    """
+    group_by: List[str] = []
+    metrics: List[Aggregation] = []
+    buckets = 1
+    min_doc_count = 1
+    order: List[Tuple[str, bool]] = []
+    level = aggs
+    while level:
+        terms = None
+        for name, spec in level.items():
+            if "terms" in spec:
+                if terms is not None:
+                    raise QuerySyntaxError("Only one terms aggregation per level is supported")
+                terms = spec
+                continue
+            kind = next((k for k in spec if k in _METRICS), None)
+            if kind is None:
+                raise QuerySyntaxError(f"Unsupported aggregation {name}: {', '.join(spec)}")
+            metrics.append(Aggregation(_METRICS[kind], spec[kind]["field"], name))
+        if terms is None:
+            break
+        options = terms["terms"]
+        group_by.append(options["field"])
+        buckets *= int(options.get("size", DEFAULT_BUCKETS))
+        min_doc_count = max(min_doc_count, int(options.get("min_doc_count", 1)))
+        if not order and isinstance(options.get("order"), dict):
+            for key, direction in options["order"].items():
+                field = {"_count": "doc_count", "_key": options["field"], "_term": options["field"]}.get(key, key)
+                order.append((field, str(direction).lower() == "desc"))
+        level = terms.get("aggs") or terms.get("aggregations") or {}
+
+    operators: List[Operator] = [Aggregate(group_by, [Aggregation("count", alias="doc_count")] + metrics)]
+    if min_doc_count > 1:
+        operators.append(Filter(Compare("doc_count", ">=", min_doc_count)))
+    if group_by:
+        operators += [Sort(order or [("doc_count", True)]), Limit(buckets)]
+    return operators
+
+
+def parse_dsl(query: str) -> LogicalPlan:
+    """
+    Plan for an Elasticsearch search request (or a bare query clause) in JSON:
+    bool, term(s), match, match_phrase, range, wildcard, prefix, exists,
+    query_string and match_all queries, size, sort, collapse, _source and
+    terms/metric aggregations
+    """
+    try:
+        body = loads(query)
+    except ValueError as e:
+        raise QuerySyntaxError(f"Invalid JSON query: {str(e)}")
+    if not isinstance(body, dict):
+        raise QuerySyntaxError("Expected a JSON object")
+    if not set(body) & _REQUEST_KEYS:
+        body = {"query": body}
+    if body.get("from"):
+        raise QuerySyntaxError("from is not supported; page through results instead")
+
+    operators: List[Operator] = []
+    predicate = _clause(body["query"]) if "query" in body else MatchAll()
+    if not isinstance(predicate, MatchAll):
+        operators.append(Filter(predicate))
+
+    aggs = body.get("aggs") or body.get("aggregations")
+    if aggs:
+        operators.extend(_aggregations(aggs))
+        return LogicalPlan(operators, "dsl", query)
+
+    keys = _sort_keys(body.get("sort"))
+    if keys:
+        operators.append(Sort(keys))
+    # Collapsing keeps the first hit of each value in sort order
+    collapse = body.get("collapse")
+    if isinstance(collapse, dict) and collapse.get("field"):
+        operators.append(Dedup([collapse["field"]]))
+    if body.get("size") is not None:
+        operators.append(Limit(int(body["size"])))
+    source = body.get("_source")
+    if isinstance(source, dict):
+        if source.get("excludes"):
+            operators.append(Exclude(list(source["excludes"])))
+        source = source.get("includes")
+    if isinstance(source, list) and source:
+        operators.append(Project(source))
+    return LogicalPlan(operators, "dsl", query)
+
+
+def parse_lucene_query(query: str) -> LogicalPlan:
+    predicate = parse_lucene(query)
+    return LogicalPlan([] if isinstance(predicate, MatchAll) else [Filter(predicate)], "lucene", query)
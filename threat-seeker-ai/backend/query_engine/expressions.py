@@ -0,0 +1,295 @@
+import fnmatch
+import json
+import operator
+import re
+from typing import Any, List, Optional, Set
+
+from .table import ColumnTable
+
+# Fields describing where events are stored rather than what they contain; data
+# without them (replayed files, in-memory events) matches any value
+METADATA_FIELDS = ("index", "source", "sourcetype", "_index")
+
+
+class QuerySyntaxError(ValueError):
+    """Raised for queries the engine cannot parse or does not support."""
+
+
+def to_number(value: Any) -> Optional[float]:
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return value
+    if isinstance(value, str):
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return None
+
+
+class Expr:
+    """
+    A boolean expression over event fields, evaluated over a whole ColumnTable
+    into one flag per row
+    """
+
+    __slots__ = ()
+
+    def evaluate(self, table: ColumnTable) -> List[bool]:
+        raise NotImplementedError
+
+    def fields(self) -> Set[str]:
+        return set()
+
+    def conjuncts(self) -> List["Expr"]:
+        return [self]
+
+
+class MatchAll(Expr):
+    __slots__ = ()
+
+    def evaluate(self, table: ColumnTable) -> List[bool]:
+        return [True] * table.length
+
+    def __repr__(self) -> str:
+        return "*"
+
+
+class Compare(Expr):
+    """
+    field <op> value. Equality is case-insensitive unless case_sensitive, and * in
+    value is a wildcard; ordering compares numerically when both sides are
+    numbers, else as strings. Multi-valued fields match when any value does.
+    """
+
+    __slots__ = ("field", "op", "value", "case_sensitive", "lenient", "_number", "_pattern", "_text")
+
+    OPS = ("=", "!=", "<", "<=", ">", ">=")
+
+    def __init__(self, field: str, op: str, value: Any, case_sensitive: bool = False, lenient: bool = False):
+        if op not in self.OPS:
+            raise ValueError(f"Unknown comparison operator {op}")
+        self.field = field
+        self.op = op
+        self.value = value
+        self.case_sensitive = case_sensitive
+        # A missing field matches: used for index/source/sourcetype
+        self.lenient = lenient
+        self._number = to_number(value)
+        text = value if isinstance(value, str) else str(value).lower() if isinstance(value, bool) else str(value)
+        self._text = text if case_sensitive else text.lower()
+        self._pattern = None
+        if isinstance(value, str) and "*" in value and op in ("=", "!="):
+            flags = 0 if case_sensitive else re.IGNORECASE
+            self._pattern = re.compile(fnmatch.translate(value), flags)
+
+    def _test(self, value: Any) -> bool:
+        if isinstance(value, list):
+            return any(self._test(item) for item in value)
+        if value is None:
+            return self.lenient
+        op = self.op
+        if op in ("=", "!="):
+            if self._pattern is not None:
+                hit = self._pattern.match(str(value)) is not None
+            elif self._number is not None and to_number(value) is not None:
+                hit = to_number(value) == self._number
+            else:
+                text = str(value).lower() if isinstance(value, bool) else str(value)
+                hit = (text if self.case_sensitive else text.lower()) == self._text
+            return hit if op == "=" else not hit
+        number = to_number(value)
+        if self._number is not None and number is not None:
+            left, right = number, self._number
+        else:
+            left, right = str(value), str(self.value)
+        if op == "<":
+            return left < right
+        if op == "<=":
+            return left <= right
+        if op == ">":
+            return left > right
+        return left >= right
+
+    def evaluate(self, table: ColumnTable) -> List[bool]:
+        return table.column(self.field).mask(self._test)
+
+    def fields(self) -> Set[str]:
+        return {self.field}
+
+    def literal(self) -> Optional[str]:
+        """
+        Text every raw event matching this term contains, for prefiltering lines
+        """
+        if self.op != "=" or self.lenient or self._pattern is not None or not isinstance(self.value, str):
+            return None
+        if self._number is not None and not re.fullmatch(r"-?\d+", self.value):
+            return None
+        return self._text
+
+    def __repr__(self) -> str:
+        return f'{self.field}{self.op}"{self.value}"'
+
+
+class In(Expr):
+    __slots__ = ("field", "terms")
+
+    def __init__(self, field: str, values: List[Any], case_sensitive: bool = False):
+        self.field = field
+        self.terms = [Compare(field, "=", value, case_sensitive) for value in values]
+
+    def evaluate(self, table: ColumnTable) -> List[bool]:
+        tests = [term._test for term in self.terms]
+        return table.column(self.field).mask(lambda value: any(test(value) for test in tests))
+
+    def fields(self) -> Set[str]:
+        return {self.field}
+
+    def __repr__(self) -> str:
+        return f"{self.field} IN ({', '.join(repr(t.value) for t in self.terms)})"
+
+
+class Contains(Expr):
+    """
+    field contains text, case-insensitively (match_phrase and analyzed text fields)
+    """
+
+    __slots__ = ("field", "text")
+
+    def __init__(self, field: str, text: str):
+        self.field = field
+        self.text = text.lower()
+
+    def _test(self, value: Any) -> bool:
+        if isinstance(value, list):
+            return any(self._test(item) for item in value)
+        return value is not None and self.text in str(value).lower()
+
+    def evaluate(self, table: ColumnTable) -> List[bool]:
+        return table.column(self.field).mask(self._test)
+
+    def fields(self) -> Set[str]:
+        return {self.field}
+
+    def __repr__(self) -> str:
+        return f'{self.field}~"{self.text}"'
+
+
+class Exists(Expr):
+    __slots__ = ("field",)
+
+    def __init__(self, field: str):
+        self.field = field
+
+    def evaluate(self, table: ColumnTable) -> List[bool]:
+        return table.column(self.field).mask(lambda value: value is not None)
+
+    def fields(self) -> Set[str]:
+        return {self.field}
+
+    def __repr__(self) -> str:
+        return f"{self.field}=*"
+
+
+class Keyword(Expr):
+    """
+    text anywhere in the raw event, case-insensitively; * is a wildcard
+    """
+
+    __slots__ = ("text", "_needle", "_pattern")
+
+    def __init__(self, text: str):
+        self.text = text.lower()
+        # Raw events are JSON text, where backslashes and quotes are escaped
+        self._needle = json.dumps(self.text.strip("*"), ensure_ascii=False)[1:-1]
+        self._pattern = re.compile(fnmatch.translate(self._needle)[:-2]) if "*" in self._needle else None
+
+    def evaluate(self, table: ColumnTable) -> List[bool]:
+        raw = table.raw_text()
+        if self._pattern is not None:
+            search = self._pattern.search
+            return [search(text) is not None for text in raw]
+        needle = self._needle
+        return [needle in text for text in raw]
+
+    def literal(self) -> Optional[str]:
+        return None if self._pattern is not None else self.text.strip("*") or None
+
+    def __repr__(self) -> str:
+        return f'"{self.text}"'
+
+
+class Not(Expr):
+    __slots__ = ("child",)
+
+    def __init__(self, child: Expr):
+        self.child = child
+
+    def evaluate(self, table: ColumnTable) -> List[bool]:
+        return list(map(operator.not_, self.child.evaluate(table)))
+
+    def fields(self) -> Set[str]:
+        return self.child.fields()
+
+    def __repr__(self) -> str:
+        return f"NOT {self.child!r}"
+
+
+class And(Expr):
+    __slots__ = ("children",)
+
+    def __init__(self, children: List[Expr]):
+        self.children = children
+
+    def evaluate(self, table: ColumnTable) -> List[bool]:
+        mask = self.children[0].evaluate(table)
+        for child in self.children[1:]:
+            if not any(mask):
+                break
+            mask = list(map(operator.and_, mask, child.evaluate(table)))
+        return mask
+
+    def fields(self) -> Set[str]:
+        return set().union(*(child.fields() for child in self.children))
+
+    def conjuncts(self) -> List[Expr]:
+        return [term for child in self.children for term in child.conjuncts()]
+
+    def __repr__(self) -> str:
+        return "(" + " AND ".join(map(repr, self.children)) + ")"
+
+
+class Or(Expr):
+    __slots__ = ("children",)
+
+    def __init__(self, children: List[Expr]):
+        self.children = children
+
+    def evaluate(self, table: ColumnTable) -> List[bool]:
+        mask = self.children[0].evaluate(table)
+        for child in self.children[1:]:
+            if all(mask):
+                break
+            mask = list(map(operator.or_, mask, child.evaluate(table)))
+        return mask
+
+    def fields(self) -> Set[str]:
+        return set().union(*(child.fields() for child in self.children))
+
+    def __repr__(self) -> str:
+        return "(" + " OR ".join(map(repr, self.children)) + ")"
+
+
+def conjunction(terms: List[Expr]) -> Optional[Expr]:
+    """
+    The AND of terms, flattened; None for no terms
+    """
+    flat = [term for child in terms for term in child.conjuncts() if not isinstance(term, MatchAll)]
+    if not flat:
+        return None
+    return flat[0] if len(flat) == 1 else And(flat)
+
+
+def disjunction(terms: List[Expr]) -> Expr:
+    return terms[0] if len(terms) == 1 else Or(terms)
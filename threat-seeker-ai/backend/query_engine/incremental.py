@@ -0,0 +1,190 @@
+"""
+Incremental evaluation of hunt queries over batches of new events.
+
+A query whose pipeline up to its first stats only filters, renames and projects
+events can be kept up to date without re-reading what it already saw: the
+search alone runs over the new events, the streaming commands are applied to
+them locally, and stats keeps partial aggregates per group (count, sum, min,
+max, the distinct values for dc and values, sum and count for avg) that are
+merged with those of later batches. The commands after stats run over the
+merged groups.
+"""
+import json
+from typing import Any, Dict, List, Optional
+
+from storage.pagination import sort_key
+
+from .expressions import to_number
+from .ir import IR_VERSION, plan_from_ir
+from .plan import _LIST_LIMIT, run_query
+
+# Commands that keep each event independent of the others
+_STREAMING = ("filter", "rename", "table", "exclude")
+
+# Partial state per group: [group values, one state per aggregation]
+Partials = Dict[str, List[Any]]
+
+
+def _value_key(value: Any) -> str:
+    return json.dumps(value, sort_keys=True, default=str)
+
+
+class IncrementalQuery:
+    """
+    A query split for incremental evaluation: the search to run over new events,
+    the streaming commands applied to its events, and the first stats with the
+    commands after it, if any
+    """
+
+    __slots__ = ("search", "streaming", "stats", "after")
+
+    def __init__(self, search: Dict[str, Any], streaming: List[Dict[str, Any]],
+                 stats: Optional[Dict[str, Any]] = None, after: Optional[List[Dict[str, Any]]] = None):
+        self.search = search
+        self.streaming = streaming
+        self.stats = stats
+        self.after = after or []
+
+    def search_ir(self) -> Dict[str, Any]:
+        """
+        IR of the search alone, run over each batch of new events
+        """
+        return {"version": IR_VERSION, "search": self.search, "pipeline": []}
+
+    def apply(self, events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        New events after the streaming commands: the rows to append for queries without stats
+        """
+        if not self.streaming:
+            return list(events)
+        return run_query(plan_from_ir({"version": IR_VERSION, "search": {"all": True}, "pipeline": self.streaming}), events)
+
+    def partials(self, events: List[Dict[str, Any]]) -> Partials:
+        """
+        Partial aggregates of the stats over a batch of new events
+        """
+        group_by = self.stats["by"]
+        aggs = self.stats["aggs"]
+        groups: Partials = {}
+        for row in self.apply(events):
+            values = [row.get(field) for field in group_by]
+            if any(value is None for value in values):
+                # As in Aggregate, events missing a group-by field are dropped
+                continue
+            key = _value_key(values)
+            group = groups.get(key)
+            if group is None:
+                group = groups[key] = [values, [_empty(function) for function, _, _ in aggs]]
+            for position, (function, field, _) in enumerate(aggs):
+                group[1][position] = _add(function, group[1][position], row, field)
+        return groups
+
+    def merge(self, state: Partials, delta: Partials) -> List[str]:
+        """
+        Merge the partial aggregates of a batch into state, in place; returns the keys of the groups changed
+        """
+        functions = [function for function, _, _ in self.stats["aggs"]]
+        for key, (values, partial) in delta.items():
+            current = state.get(key)
+            if current is None:
+                state[key] = [values, partial]
+            else:
+                current[1] = [_combine(function, a, b) for function, a, b in zip(functions, current[1], partial)]
+        return list(delta)
+
+    def rows(self, state: Partials) -> List[Dict[str, Any]]:
+        """
+        Result rows of the query over every batch merged into state
+        """
+        group_by = self.stats["by"]
+        aggs = self.stats["aggs"]
+        groups = sorted(state.values(), key=lambda group: [sort_key(value) for value in group[0]])
+        if not group_by and not groups:
+            # stats over no events still reports a count of 0
+            rows = [{alias: 0 if function in ("count", "dc") else None for function, _, alias in aggs}]
+        else:
+            rows = []
+            for values, partial in groups:
+                row = dict(zip(group_by, values))
+                for (function, _, alias), value in zip(aggs, partial):
+                    row[alias] = _final(function, value)
+                rows.append(row)
+        if not self.after:
+            return rows
+        return run_query(plan_from_ir({"version": IR_VERSION, "search": {"all": True}, "pipeline": self.after}), rows)
+
+
+def split_incremental(ir: Dict[str, Any]) -> Optional[IncrementalQuery]:
+    """
+    The incremental form of a query, or None when a command ahead of its first
+    stats (sort, head, dedup) depends on events that came before
+    """
+    pipeline = list(ir["pipeline"])
+    for position, node in enumerate(pipeline):
+        if "stats" in node:
+            return IncrementalQuery(ir["search"], pipeline[:position], node["stats"], pipeline[position + 1:])
+        if next(iter(node)) not in _STREAMING:
+            return None
+    return IncrementalQuery(ir["search"], pipeline)
+
+
+def _empty(function: str) -> Any:
+    if function == "count":
+        return 0
+    if function in ("dc", "values"):
+        # Distinct values by their JSON encoding
+        return {}
+    if function == "list":
+        return []
+    if function == "avg":
+        return [0, 0]
+    return None
+
+
+def _add(function: str, state: Any, row: Dict[str, Any], field: Optional[str]) -> Any:
+    if field is None:
+        return state + 1
+    value = row.get(field)
+    if value is None:
+        return state
+    if function == "count":
+        return state + 1
+    if function in ("dc", "values"):
+        state[_value_key(value)] = value
+        return state
+    if function == "list":
+        if len(state) < _LIST_LIMIT:
+            state.append(value)
+        return state
+    number = to_number(value)
+    if number is None:
+        return state
+    if function == "avg":
+        return [state[0] + number, state[1] + 1]
+    return _combine(function, state, number)
+
+
+def _combine(function: str, a: Any, b: Any) -> Any:
+    if function == "count":
+        return a + b
+    if function in ("dc", "values"):
+        return dict(a, **b)
+    if function == "list":
+        return (a + b)[:_LIST_LIMIT]
+    if function == "avg":
+        return [a[0] + b[0], a[1] + b[1]]
+    if a is None or b is None:
+        return b if a is None else a
+    if function == "sum":
+        return a + b
+    return min(a, b) if function == "min" else max(a, b)
+
+
+def _final(function: str, state: Any) -> Any:
+    if function == "dc":
+        return len(state)
+    if function == "values":
+        return sorted(state.values(), key=sort_key)
+    if function == "avg":
+        return state[0] / state[1] if state[1] else None
+    return state
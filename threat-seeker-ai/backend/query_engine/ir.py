@@ -0,0 +1,254 @@
+"""
+Backend-neutral intermediate representation (IR) of hunt queries.
+
+The IR of a query is plain JSON: the search predicate and the pipeline of
+commands after it, with field names in the Splunk/CIM style (host, user,
+EventCode, command_line). Queries written for Elasticsearch have their ECS
+field names mapped on the way in, so the same hunt logic has the same IR, and
+the same hash, whichever backend it was written for:
+
+    {"version": 1,
+     "search": {"and": [{"cmp": ["EventCode", "=", "4688"]}, {"cmp": ["process", "=", "wmiprvse.exe"]}]},
+     "pipeline": [{"stats": {"by": ["host"], "aggs": [["count", null, "count"]]}}, {"sort": {"keys": [["count", true]]}}]}
+"""
+import hashlib
+import json
+from typing import Any, Dict, List, Optional
+
+from .expressions import (
+    And, Compare, Contains, Exists, Expr, In, Keyword, MatchAll, Not, Or, QuerySyntaxError, conjunction
+)
+from .plan import Aggregate, Aggregation, Dedup, Exclude, Filter, Limit, LogicalPlan, Operator, Project, Rename, Scan, Sort
+
+IR_VERSION = 1
+
+# CIM-style field names of the IR and their Elastic Common Schema equivalents
+ECS_FIELDS = {
+    "timestamp": "@timestamp",
+    "host": "host.name",
+    "user": "user.name",
+    "EventCode": "event.code",
+    "action": "event.action",
+    "status": "event.outcome",
+    "process": "process.name",
+    "process_path": "process.executable",
+    "command_line": "process.command_line",
+    "process_id": "process.pid",
+    "parent_process": "process.parent.name",
+    "parent_process_path": "process.parent.executable",
+    "parent_process_id": "process.parent.pid",
+    "src_ip": "source.ip",
+    "src_host": "source.domain",
+    "dest_ip": "destination.ip",
+    "dest_port": "destination.port",
+    "logon_type": "winlog.logon.type",
+    "auth_type": "winlog.event_data.AuthenticationPackageName",
+    "namespace": "winlog.event_data.Namespace",
+    "operation": "winlog.event_data.Operation",
+    "query_name": "dns.question.name",
+}
+CIM_FIELDS = {ecs: cim for cim, ecs in ECS_FIELDS.items()}
+CIM_FIELDS.update({"winlog.event_id": "EventCode", "winlog.event_data.CommandLine": "command_line"})
+# Windows event log field names used in Splunk queries
+ECS_FIELDS.update({"Computer": "host.name", "User": "user.name", "CommandLine": "process.command_line"})
+
+
+def _expr_to_ir(expr: Expr) -> Dict[str, Any]:
+    if isinstance(expr, MatchAll):
+        return {"all": True}
+    if isinstance(expr, Compare):
+        node: Dict[str, Any] = {"cmp": [expr.field, expr.op, expr.value]}
+        if expr.case_sensitive:
+            node["cs"] = True
+        if expr.lenient:
+            node["lenient"] = True
+        return node
+    if isinstance(expr, In):
+        node = {"in": [expr.field, [term.value for term in expr.terms]]}
+        if expr.terms and expr.terms[0].case_sensitive:
+            node["cs"] = True
+        return node
+    if isinstance(expr, Contains):
+        return {"contains": [expr.field, expr.text]}
+    if isinstance(expr, Exists):
+        return {"exists": expr.field}
+    if isinstance(expr, Keyword):
+        return {"keyword": expr.text}
+    if isinstance(expr, Not):
+        return {"not": _expr_to_ir(expr.child)}
+    if isinstance(expr, And):
+        return {"and": [_expr_to_ir(child) for child in expr.children]}
+    if isinstance(expr, Or):
+        return {"or": [_expr_to_ir(child) for child in expr.children]}
+    raise QuerySyntaxError(f"No IR for {type(expr).__name__}")
+
+
+def expr_from_ir(node: Dict[str, Any]) -> Expr:
+    if "all" in node:
+        return MatchAll()
+    if "cmp" in node:
+        field, op, value = node["cmp"]
+        return Compare(field, op, value, node.get("cs", False), node.get("lenient", False))
+    if "in" in node:
+        field, values = node["in"]
+        return In(field, values, node.get("cs", False))
+    if "contains" in node:
+        return Contains(*node["contains"])
+    if "exists" in node:
+        return Exists(node["exists"])
+    if "keyword" in node:
+        return Keyword(node["keyword"])
+    if "not" in node:
+        return Not(expr_from_ir(node["not"]))
+    if "and" in node:
+        return And([expr_from_ir(child) for child in node["and"]])
+    if "or" in node:
+        return Or([expr_from_ir(child) for child in node["or"]])
+    raise QuerySyntaxError(f"Unknown IR expression {node!r}")
+
+
+def _operator_to_ir(op: Operator) -> Dict[str, Any]:
+    if isinstance(op, Filter):
+        return {"filter": _expr_to_ir(op.predicate)}
+    if isinstance(op, Aggregate):
+        return {"stats": {"by": op.group_by, "aggs": [[a.function, a.field, a.alias] for a in op.aggregations]}}
+    if isinstance(op, Sort):
+        node: Dict[str, Any] = {"keys": [[field, descending] for field, descending in op.keys]}
+        if op.limit is not None:
+            node["limit"] = op.limit
+        return {"sort": node}
+    if isinstance(op, Limit):
+        return {"head": op.count}
+    if isinstance(op, Project):
+        return {"table": op.fields}
+    if isinstance(op, Exclude):
+        return {"exclude": op.fields}
+    if isinstance(op, Rename):
+        return {"rename": op.mapping}
+    if isinstance(op, Dedup):
+        return {"dedup": op.fields}
+    raise QuerySyntaxError(f"No IR for {type(op).__name__}")
+
+
+def _operator_from_ir(node: Dict[str, Any]) -> Operator:
+    if "filter" in node:
+        return Filter(expr_from_ir(node["filter"]))
+    if "stats" in node:
+        stats = node["stats"]
+        return Aggregate(list(stats["by"]), [Aggregation(function, field, alias) for function, field, alias in stats["aggs"]])
+    if "sort" in node:
+        return Sort([(field, descending) for field, descending in node["sort"]["keys"]], node["sort"].get("limit"))
+    if "head" in node:
+        return Limit(node["head"])
+    if "table" in node:
+        return Project(list(node["table"]))
+    if "exclude" in node:
+        return Exclude(list(node["exclude"]))
+    if "rename" in node:
+        return Rename(dict(node["rename"]))
+    if "dedup" in node:
+        return Dedup(list(node["dedup"]))
+    raise QuerySyntaxError(f"Unknown IR command {node!r}")
+
+
+def to_ir(plan: LogicalPlan) -> Dict[str, Any]:
+    """
+    IR of a parsed (not optimized) plan, with ECS field names of Elasticsearch
+    queries mapped to their CIM names
+    """
+    operators = list(plan.operators[1:])
+    terms = [plan.scan.predicate] if plan.scan.predicate is not None else []
+    while operators and isinstance(operators[0], Filter):
+        terms.append(operators.pop(0).predicate)
+    search = conjunction(terms)
+    ir = {
+        "version": IR_VERSION,
+        "search": _expr_to_ir(search) if search is not None else {"all": True},
+        "pipeline": [_operator_to_ir(op) for op in operators]
+    }
+    if plan.language in ("dsl", "lucene"):
+        ir = rename_fields(ir, CIM_FIELDS)
+    return ir
+
+
+def plan_from_ir(ir: Dict[str, Any]) -> LogicalPlan:
+    if ir.get("version") != IR_VERSION:
+        raise QuerySyntaxError(f"Unsupported IR version {ir.get('version')}")
+    search = expr_from_ir(ir["search"])
+    operators: List[Operator] = [Scan()]
+    if not isinstance(search, MatchAll):
+        operators.append(Filter(search))
+    operators.extend(_operator_from_ir(node) for node in ir["pipeline"])
+    return LogicalPlan(operators, "ir", "")
+
+
+def ir_hash(ir: Dict[str, Any]) -> str:
+    return hashlib.sha256(json.dumps(ir, sort_keys=True, separators=(",", ":"), default=str).encode("utf-8")).hexdigest()
+
+
+def rename_fields(ir: Dict[str, Any], mapping: Dict[str, str]) -> Dict[str, Any]:
+    """
+    A copy of ir with field names translated through mapping. Default stats
+    aliases such as dc(user) follow their field.
+    """
+    # Fields created by stats and rename keep their names
+    created: set = set()
+
+    def field(name: Optional[str]) -> Optional[str]:
+        if name is None or name in created:
+            return name
+        return mapping.get(name, name)
+
+    def expr(node: Dict[str, Any]) -> Dict[str, Any]:
+        node = dict(node)
+        if "cmp" in node:
+            node["cmp"] = [field(node["cmp"][0])] + list(node["cmp"][1:])
+        elif "in" in node:
+            node["in"] = [field(node["in"][0]), node["in"][1]]
+        elif "contains" in node:
+            node["contains"] = [field(node["contains"][0]), node["contains"][1]]
+        elif "exists" in node:
+            node["exists"] = field(node["exists"])
+        elif "not" in node:
+            node["not"] = expr(node["not"])
+        elif "and" in node or "or" in node:
+            key = "and" if "and" in node else "or"
+            node[key] = [expr(child) for child in node[key]]
+        return node
+
+    pipeline = []
+    for node in ir["pipeline"]:
+        if "filter" in node:
+            pipeline.append({"filter": expr(node["filter"])})
+        elif "stats" in node:
+            aggs = []
+            for function, source, alias in node["stats"]["aggs"]:
+                default = function if source is None else f"{function}({source})"
+                renamed = field(source)
+                aggs.append([function, renamed, (function if renamed is None else f"{function}({renamed})") if alias == default else alias])
+            by = [field(f) for f in node["stats"]["by"]]
+            pipeline.append({"stats": {"by": by, "aggs": aggs}})
+            created.clear()
+            created.update(by, (alias for _, _, alias in aggs))
+        elif "sort" in node:
+            pipeline.append({"sort": dict(node["sort"], keys=[[field(f), d] for f, d in node["sort"]["keys"]])})
+        elif "rename" in node:
+            pipeline.append({"rename": {field(old): new for old, new in node["rename"].items()}})
+            created |= set(node["rename"].values())
+        else:
+            key = next(iter(node))
+            value = node[key]
+            pipeline.append({key: [field(f) for f in value] if isinstance(value, list) else value})
+    return {"version": ir["version"], "search": expr(ir["search"]), "pipeline": pipeline}
+
+
+def indexes(ir: Dict[str, Any]) -> List[str]:
+    """
+    Values of index and _index terms the search requires
+    """
+    search = ir["search"]
+    terms = search["and"] if "and" in search else [search]
+    return [
+        str(term["cmp"][2]) for term in terms
+        if "cmp" in term and term["cmp"][0] in ("index", "_index") and term["cmp"][1] == "="
+    ]
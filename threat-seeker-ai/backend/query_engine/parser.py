@@ -0,0 +1,40 @@
+import re
+from typing import Optional
+
+from .dsl import parse_dsl, parse_lucene_query
+from .expressions import QuerySyntaxError
+from .plan import LogicalPlan
+from .spl import parse_spl
+
+LANGUAGES = ("spl", "dsl", "lucene")
+
+_SPL_TERM = re.compile(r"(?:^|[\s(])[\w.@-]+\s*(?:!=|=|<|>)")
+_LUCENE_TERM = re.compile(r"(?:^|[\s(!+-])[\w.@*-]+:\s*[^\s)]")
+
+
+def detect_language(query: str) -> str:
+    """
+    dsl for JSON, lucene for field:value queries without SPL comparisons or
+    pipes, spl otherwise
+    """
+    text = query.strip()
+    if text.startswith("{"):
+        return "dsl"
+    if "|" not in text and not _SPL_TERM.search(text) and _LUCENE_TERM.search(text):
+        return "lucene"
+    return "spl"
+
+
+def parse_query(query: str, language: Optional[str] = None) -> LogicalPlan:
+    """
+    Logical plan of an SPL, Elasticsearch DSL or Lucene query, detected from its
+    text unless language is given
+    """
+    language = language or detect_language(query)
+    if language == "spl":
+        return parse_spl(query)
+    if language == "dsl":
+        return parse_dsl(query)
+    if language == "lucene":
+        return parse_lucene_query(query)
+    raise QuerySyntaxError(f"Unknown query language {language}; expected one of {', '.join(LANGUAGES)}")
@@ -0,0 +1,429 @@
+from collections import Counter
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from storage.pagination import sort_key
+
+from .expressions import Expr, conjunction, to_number
+from .table import ColumnTable, RowSource
+
+AGGREGATIONS = ("count", "dc", "sum", "avg", "min", "max", "values", "list")
+# As in Splunk, list() keeps the first 100 values of each group
+_LIST_LIMIT = 100
+
+
+class Aggregation:
+    __slots__ = ("function", "field", "alias")
+
+    def __init__(self, function: str, field: Optional[str] = None, alias: Optional[str] = None):
+        if function not in AGGREGATIONS:
+            raise ValueError(f"Unsupported aggregation {function}")
+        if field is None and function != "count":
+            raise ValueError(f"{function} needs a field")
+        self.function = function
+        self.field = field
+        self.alias = alias or (function if field is None else f"{function}({field})")
+
+    def compute(self, table: ColumnTable, groups: List[List[int]]) -> List[Any]:
+        if self.field is None:
+            return [len(rows) for rows in groups]
+        column = table.column(self.field)
+        codes = column.codes
+        values = column.values
+        present = [value is not None for value in values]
+        function = self.function
+        if function == "count":
+            return [sum(present[codes[i]] for i in rows) for rows in groups]
+        if function == "dc":
+            return [len({codes[i] for i in rows if present[codes[i]]}) for rows in groups]
+        if function == "values":
+            return [sorted((values[c] for c in {codes[i] for i in rows} if present[c]), key=sort_key) for rows in groups]
+        if function == "list":
+            return [[values[codes[i]] for i in rows if present[codes[i]]][:_LIST_LIMIT] for rows in groups]
+        numbers = [to_number(value) for value in values]
+        results: List[Any] = []
+        for rows in groups:
+            found = [numbers[codes[i]] for i in rows if numbers[codes[i]] is not None]
+            if not found:
+                results.append(None)
+            elif function == "sum":
+                results.append(sum(found))
+            elif function == "avg":
+                results.append(sum(found) / len(found))
+            elif function == "min":
+                results.append(min(found))
+            else:
+                results.append(max(found))
+        return results
+
+    def __repr__(self) -> str:
+        name = self.function if self.field is None else f"{self.function}({self.field})"
+        return name if self.alias == name else f"{name} as {self.alias}"
+
+
+class Operator:
+    """
+    One step of a LogicalPlan, transforming a ColumnTable. reshapes is True when
+    the output rows are no longer the scanned events.
+    """
+
+    __slots__ = ()
+    reshapes = False
+    # Row order and count are unchanged, so a limit may move ahead of it
+    preserves_rows = False
+
+    def apply(self, table: ColumnTable) -> ColumnTable:
+        raise NotImplementedError
+
+    def inputs(self) -> Optional[Set[str]]:
+        """
+        Fields read from the input; None for all of them
+        """
+        return set()
+
+
+class Scan(Operator):
+    """
+    Reads events from the source. The optimizer pushes filters (predicate), the
+    fields later operators need (columns) and row limits into it.
+    """
+
+    __slots__ = ("predicate", "columns", "limit")
+
+    def __init__(self, predicate: Optional[Expr] = None, columns: Optional[List[str]] = None, limit: Optional[int] = None):
+        self.predicate = predicate
+        self.columns = columns
+        self.limit = limit
+
+    def __repr__(self) -> str:
+        parts = [f"where {self.predicate!r}" if self.predicate is not None else "all events"]
+        if self.columns is not None:
+            parts.append(f"columns {', '.join(self.columns)}")
+        if self.limit is not None:
+            parts.append(f"limit {self.limit}")
+        return "Scan " + ", ".join(parts)
+
+
+class Filter(Operator):
+    __slots__ = ("predicate",)
+
+    def __init__(self, predicate: Expr):
+        self.predicate = predicate
+
+    def apply(self, table: ColumnTable) -> ColumnTable:
+        return table.filter(self.predicate.evaluate(table))
+
+    def inputs(self) -> Optional[Set[str]]:
+        return self.predicate.fields()
+
+    def __repr__(self) -> str:
+        return f"Filter {self.predicate!r}"
+
+
+class Aggregate(Operator):
+    """
+    Hash aggregation over the dictionary codes of the group-by fields. Events
+    missing a group-by field are dropped, and groups come out in order of their
+    values, as in Splunk stats and Elasticsearch terms aggregations.
+    """
+
+    __slots__ = ("group_by", "aggregations")
+    reshapes = True
+
+    def __init__(self, group_by: List[str], aggregations: List[Aggregation]):
+        self.group_by = group_by
+        self.aggregations = aggregations or [Aggregation("count")]
+
+    def apply(self, table: ColumnTable) -> ColumnTable:
+        columns = [table.column(field) for field in self.group_by]
+        if columns:
+            keys = list(zip(*(column.codes for column in columns)))
+        else:
+            keys = [()] * table.length
+
+        if all(a.field is None for a in self.aggregations):
+            # count only: no need to collect the rows of each group
+            counts = Counter(keys)
+            group_keys = list(counts)
+            sizes = [counts[key] for key in group_keys]
+            outputs = [sizes for _ in self.aggregations]
+        else:
+            members: Dict[Tuple[int, ...], List[int]] = {}
+            for row, key in enumerate(keys):
+                rows = members.get(key)
+                if rows is None:
+                    members[key] = [row]
+                else:
+                    rows.append(row)
+            group_keys = list(members)
+            groups = [members[key] for key in group_keys]
+            outputs = [aggregation.compute(table, groups) for aggregation in self.aggregations]
+
+        if not columns and not group_keys:
+            # stats over no events still reports a count of 0
+            group_keys = [()]
+            outputs = [[0 if a.function in ("count", "dc") else None] for a in self.aggregations]
+
+        # Drop groups with a missing group-by value and order the rest by value
+        missing = [{code for code, value in enumerate(column.values) if value is None} for column in columns]
+        order = [
+            position for position, key in enumerate(group_keys)
+            if not any(code in absent for code, absent in zip(key, missing))
+        ]
+        order.sort(key=lambda position: [
+            sort_key(column.values[code]) for column, code in zip(columns, group_keys[position])
+        ])
+
+        data: Dict[str, List[Any]] = {}
+        for index, (field, column) in enumerate(zip(self.group_by, columns)):
+            data[field] = [column.values[group_keys[position][index]] for position in order]
+        for aggregation, values in zip(self.aggregations, outputs):
+            data[aggregation.alias] = [values[position] for position in order]
+        return ColumnTable.from_columns(data, len(order))
+
+    def inputs(self) -> Optional[Set[str]]:
+        return set(self.group_by) | {a.field for a in self.aggregations if a.field is not None}
+
+    def __repr__(self) -> str:
+        by = f" by {', '.join(self.group_by)}" if self.group_by else ""
+        return f"Aggregate {', '.join(map(repr, self.aggregations))}{by}"
+
+
+class Sort(Operator):
+    """
+    Multi-key sort; keys are (field, descending). With a limit only the first rows are kept.
+    """
+
+    __slots__ = ("keys", "limit")
+
+    def __init__(self, keys: List[Tuple[str, bool]], limit: Optional[int] = None):
+        self.keys = keys
+        self.limit = limit
+
+    def apply(self, table: ColumnTable) -> ColumnTable:
+        indices = list(range(table.length))
+        # Stable sorts from the last key to the first give the lexicographic order
+        for field, descending in reversed(self.keys):
+            column = table.column(field)
+            ranked = sorted(range(len(column.values)), key=lambda code: sort_key(column.values[code]))
+            ranks = [0] * len(ranked)
+            for rank, code in enumerate(ranked):
+                ranks[code] = rank
+            if descending:
+                # Missing values stay last, as in Splunk
+                keys = [(value is None, -rank) for value, rank in zip(column.values, ranks)]
+            else:
+                keys = ranks
+            row_keys = list(map(keys.__getitem__, column.codes))
+            indices.sort(key=row_keys.__getitem__)
+        if self.limit is not None:
+            indices = indices[:self.limit]
+        return table.take(indices)
+
+    def inputs(self) -> Optional[Set[str]]:
+        return {field for field, _ in self.keys}
+
+    def __repr__(self) -> str:
+        keys = ", ".join(("-" if descending else "") + field for field, descending in self.keys)
+        return f"Sort {keys}" + (f" limit {self.limit}" if self.limit is not None else "")
+
+
+class Limit(Operator):
+    __slots__ = ("count",)
+    preserves_rows = True
+
+    def __init__(self, count: int):
+        self.count = count
+
+    def apply(self, table: ColumnTable) -> ColumnTable:
+        return table.head(self.count)
+
+    def __repr__(self) -> str:
+        return f"Limit {self.count}"
+
+
+class Project(Operator):
+    __slots__ = ("fields",)
+    reshapes = True
+    preserves_rows = True
+
+    def __init__(self, fields: List[str]):
+        self.fields = fields
+
+    def apply(self, table: ColumnTable) -> ColumnTable:
+        return table.project(self.fields)
+
+    def inputs(self) -> Optional[Set[str]]:
+        return set(self.fields)
+
+    def __repr__(self) -> str:
+        return f"Project {', '.join(self.fields)}"
+
+
+class Exclude(Operator):
+    __slots__ = ("fields",)
+    reshapes = True
+    preserves_rows = True
+
+    def __init__(self, fields: List[str]):
+        self.fields = fields
+
+    def apply(self, table: ColumnTable) -> ColumnTable:
+        if table.rows is not None:
+            dropped = set(self.fields)
+            return ColumnTable.from_rows([{k: v for k, v in row.items() if k not in dropped} for row in table.rows])
+        return ColumnTable({n: c for n, c in table.columns.items() if n not in self.fields}, table.length)
+
+    def inputs(self) -> Optional[Set[str]]:
+        return None
+
+    def __repr__(self) -> str:
+        return f"Exclude {', '.join(self.fields)}"
+
+
+class Rename(Operator):
+    __slots__ = ("mapping",)
+    reshapes = True
+    preserves_rows = True
+
+    def __init__(self, mapping: Dict[str, str]):
+        self.mapping = mapping
+
+    def apply(self, table: ColumnTable) -> ColumnTable:
+        mapping = self.mapping
+        if table.rows is not None:
+            return ColumnTable.from_rows([{mapping.get(k, k): v for k, v in row.items()} for row in table.rows])
+        return ColumnTable({mapping.get(n, n): c for n, c in table.columns.items()}, table.length)
+
+    def inputs(self) -> Optional[Set[str]]:
+        return None
+
+    def __repr__(self) -> str:
+        return "Rename " + ", ".join(f"{old} as {new}" for old, new in self.mapping.items())
+
+
+class Dedup(Operator):
+    __slots__ = ("fields",)
+
+    def __init__(self, fields: List[str]):
+        self.fields = fields
+
+    def apply(self, table: ColumnTable) -> ColumnTable:
+        columns = [table.column(field) for field in self.fields]
+        # As in Splunk, events missing one of the fields are dropped
+        missing = [{code for code, value in enumerate(column.values) if value is None} for column in columns]
+        seen = set()
+        keep = []
+        for row, key in enumerate(zip(*(column.codes for column in columns))):
+            if key in seen or any(code in absent for code, absent in zip(key, missing)):
+                continue
+            seen.add(key)
+            keep.append(row)
+        return table.take(keep)
+
+    def inputs(self) -> Optional[Set[str]]:
+        return set(self.fields)
+
+    def __repr__(self) -> str:
+        return f"Dedup {', '.join(self.fields)}"
+
+
+class LogicalPlan:
+    """
+    A query as a Scan followed by a pipeline of operators, parsed from SPL or
+    Elasticsearch queries (see query_engine.parse_query)
+    """
+
+    def __init__(self, operators: List[Operator], language: str = "spl", text: str = ""):
+        if not operators or not isinstance(operators[0], Scan):
+            operators = [Scan()] + list(operators)
+        self.operators = operators
+        self.language = language
+        self.text = text
+
+    @property
+    def scan(self) -> Scan:
+        return self.operators[0]
+
+    def explain(self) -> str:
+        return "\n".join(("  " * depth) + repr(op) for depth, op in enumerate(self.operators))
+
+    def optimize(self) -> "LogicalPlan":
+        """
+        A copy with filters, projections and limits pushed into the scan:
+
+        - filters right after the scan become its predicate
+        - filters on group-by fields move ahead of the aggregation, then into the scan
+        - when the pipeline ends in an aggregation or projection, the scan only
+          provides the fields it reads
+        - a limit behind operators that keep rows as they are stops the scan early
+        """
+        scan = Scan(self.scan.predicate, self.scan.columns, self.scan.limit)
+        operators: List[Operator] = list(self.operators[1:])
+
+        moved = True
+        while moved:
+            moved = False
+            for position in range(len(operators) - 1):
+                first, second = operators[position], operators[position + 1]
+                if isinstance(first, Aggregate) and isinstance(second, Filter) \
+                        and second.predicate.fields() <= set(first.group_by):
+                    operators[position], operators[position + 1] = second, first
+                    moved = True
+            while operators and isinstance(operators[0], Filter):
+                scan.predicate = conjunction([t for t in (scan.predicate, operators.pop(0).predicate) if t is not None])
+                moved = True
+
+        needed: Set[str] = set()
+        for op in operators:
+            inputs = op.inputs()
+            if inputs is None:
+                break
+            needed |= inputs
+            if isinstance(op, (Aggregate, Project)):
+                scan.columns = sorted(needed)
+                break
+
+        for position, op in enumerate(operators):
+            if isinstance(op, Limit):
+                scan.limit = op.count if scan.limit is None else min(scan.limit, op.count)
+            if not op.preserves_rows:
+                if isinstance(op, Sort) and position + 1 < len(operators) and isinstance(operators[position + 1], Limit):
+                    limit = operators[position + 1].count
+                    operators[position] = Sort(op.keys, limit if op.limit is None else min(op.limit, limit))
+                break
+
+        return LogicalPlan([scan] + operators, self.language, self.text)
+
+    def streaming(self) -> bool:
+        """
+        Whether the output rows are the first matching events, so the scan may
+        stop after the number of results wanted
+        """
+        return all(op.preserves_rows for op in self.operators[1:])
+
+    def execute(self, source: Any, max_results: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Run the plan over source, any object with scan(columns, predicate, limit)
+        returning a ColumnTable
+        """
+        scan = self.scan
+        limit = scan.limit
+        if max_results is not None and self.streaming():
+            limit = max_results if limit is None else min(limit, max_results)
+        table = source.scan(scan.columns, scan.predicate, limit)
+        reshaped = False
+        for op in self.operators[1:]:
+            table = op.apply(table)
+            reshaped = reshaped or op.reshapes
+        if not reshaped and table.rows is not None:
+            rows = table.rows
+        else:
+            rows = table.to_rows()
+        return rows if max_results is None else rows[:max_results]
+
+
+def run_query(plan: LogicalPlan, events: List[Dict[str, Any]], max_results: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Run a plan over events already in memory
+    """
+    return plan.optimize().execute(RowSource(events), max_results)
@@ -0,0 +1,451 @@
+"""
+Rule-based rewrites of query IRs before they are sent to a backend.
+
+Each rule returns an IR that the backend can run more cheaply, and the bytes it
+is estimated to save under a simple cost model. The IR is equivalent, except for
+the rules relying on how the data is named (sourcetype_narrowing, path_names),
+which only hold on data following that convention and are enabled by callers
+that know it does. In the cost model, index-time fields
+(index, source, sourcetype) decide which events are read, terms with a leading
+literal are looked up in the index instead of tested on every event read, and
+every command after the search handles its input rows at the width of the
+fields they carry. Selectivities are fixed guesses in the style of System R.
+"""
+import re
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from .expressions import METADATA_FIELDS, to_number
+from .ir import expr_from_ir
+
+# Cost model: serialized size of a whole event and of one field value
+EVENT_BYTES = 640
+FIELD_BYTES = 32
+_EQUALS = 0.1
+_RANGE = 1 / 3
+_NOT_EQUALS = 0.9
+_EXISTS = 0.9
+# Rows left by stats (per row in) and dedup
+_GROUPS = 0.1
+
+# Windows event log channel of event codes, for narrowing searches to their sourcetype
+EVENT_CHANNELS: Dict[int, str] = {
+    **{code: "Security" for code in (
+        4624, 4625, 4634, 4647, 4648, 4656, 4663, 4672, 4688, 4689, 4697, 4698, 4699, 4702, 4720, 4722, 4724,
+        4728, 4732, 4738, 4740, 4756, 4768, 4769, 4771, 4776, 5140, 5145
+    )},
+    **{code: "Microsoft-Windows-WMI-Activity/Operational" for code in (5857, 5858, 5859, 5860, 5861)},
+    **{code: "Microsoft-Windows-Sysmon/Operational" for code in (1, 3, 5, 7, 8, 10, 11, 12, 13, 15, 17, 18, 19, 20, 21, 22, 23, 25)},
+}
+# Fields that may hold the file name at the end of a path field: the CIM name field, and the
+# name field of the ECS-style events of this project (in CIM, process is the whole command line)
+_PATH_NAMES = {
+    "process_path": ("process_name", "process"),
+    "parent_process_path": ("parent_process_name", "parent_process"),
+}
+_PATH_SUFFIX = re.compile(r"^\*[\\/]([^\\/*?]+)$")
+_LEADING_WILDCARD = re.compile(r"^\*([^*?]{3,})\*?$")
+
+
+class Rewrite:
+    """
+    One rule applied to a query
+    """
+
+    __slots__ = ("rule", "detail", "estimated_bytes_saved")
+
+    def __init__(self, rule: str, detail: str, estimated_bytes_saved: int = 0):
+        self.rule = rule
+        self.detail = detail
+        self.estimated_bytes_saved = estimated_bytes_saved
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"rule": self.rule, "detail": self.detail, "estimated_bytes_saved": self.estimated_bytes_saved}
+
+
+# IR helpers
+
+def _conjuncts(node: Dict[str, Any]) -> List[Dict[str, Any]]:
+    if "all" in node:
+        return []
+    if "and" in node:
+        return [term for child in node["and"] for term in _conjuncts(child)]
+    return [node]
+
+
+def _conjoin(terms: List[Dict[str, Any]]) -> Dict[str, Any]:
+    if not terms:
+        return {"all": True}
+    return terms[0] if len(terms) == 1 else {"and": terms}
+
+
+def _expr_fields(node: Dict[str, Any]) -> Optional[Set[str]]:
+    """
+    Fields an expression reads, None when it reads the whole event (keywords)
+    """
+    if "keyword" in node:
+        return None
+    if "all" in node:
+        return set()
+    for key in ("cmp", "in", "contains"):
+        if key in node:
+            return {node[key][0]}
+    if "exists" in node:
+        return {node["exists"]}
+    children = [node["not"]] if "not" in node else node.get("and", node.get("or", []))
+    fields: Set[str] = set()
+    for child in children:
+        child_fields = _expr_fields(child)
+        if child_fields is None:
+            return None
+        fields |= child_fields
+    return fields
+
+
+def _describe(node: Dict[str, Any]) -> str:
+    return repr(expr_from_ir(node))
+
+
+# Cost model
+
+def _selectivity(node: Dict[str, Any]) -> float:
+    if "all" in node:
+        return 1.0
+    if "cmp" in node:
+        op = node["cmp"][1]
+        if op == "=":
+            return _EQUALS
+        return _NOT_EQUALS if op == "!=" else _RANGE
+    if "in" in node:
+        return min(1.0, _EQUALS * len(node["in"][1]))
+    if "exists" in node:
+        return _EXISTS
+    if "not" in node:
+        return 1.0 - _selectivity(node["not"])
+    if "and" in node:
+        product = 1.0
+        for child in node["and"]:
+            product *= _selectivity(child)
+        return product
+    if "or" in node:
+        return min(1.0, sum(_selectivity(child) for child in node["or"]))
+    return _EQUALS
+
+
+def _index_time(node: Dict[str, Any]) -> bool:
+    if "or" in node:
+        return all(_index_time(child) for child in node["or"])
+    return "cmp" in node and node["cmp"][0] in METADATA_FIELDS and node["cmp"][1] == "="
+
+
+def _indexed(node: Dict[str, Any]) -> bool:
+    """
+    Whether a term can be looked up in the index: it has a literal that does not start with a wildcard
+    """
+    if "or" in node:
+        return all(_indexed(child) for child in node["or"])
+    if "cmp" in node:
+        return node["cmp"][1] == "=" and not str(node["cmp"][2]).startswith("*")
+    if "keyword" in node:
+        return not node["keyword"].startswith("*")
+    return "in" in node
+
+
+def estimate_bytes(ir: Dict[str, Any], events: int) -> int:
+    """
+    Estimated bytes a backend handles for ir over events: the events it reads,
+    then each command's input
+    """
+    terms = _conjuncts(ir["search"])
+    scanned = float(events)
+    for term in terms:
+        if _index_time(term):
+            scanned *= _selectivity(term)
+    read = scanned
+    for term in terms:
+        if _indexed(term) and not _index_time(term):
+            read *= _selectivity(term)
+    cost = read * EVENT_BYTES
+    rows = float(events)
+    for term in terms:
+        # Narrowing terms only skip events the other terms would reject
+        if not (_index_time(term) and _is_narrowing(term)):
+            rows *= _selectivity(term)
+    rows = min(rows, read)
+    width: Optional[int] = None
+    for node in ir["pipeline"]:
+        if "table" in node:
+            # Applied as events are read
+            width = len(node["table"])
+            continue
+        cost += rows * (EVENT_BYTES if width is None else width * FIELD_BYTES)
+        if "filter" in node:
+            rows *= _selectivity(node["filter"])
+        elif "stats" in node:
+            rows = max(1.0, rows * _GROUPS) if node["stats"]["by"] else 1.0
+            width = len(node["stats"]["by"]) + len(node["stats"]["aggs"])
+        elif "dedup" in node:
+            rows = max(1.0, rows * _GROUPS)
+        elif "head" in node:
+            rows = min(rows, node["head"])
+        elif "sort" in node and node["sort"].get("limit") is not None:
+            rows = min(rows, node["sort"]["limit"])
+    return int(cost)
+
+
+# Rules
+
+def _moves_past(previous: Dict[str, Any], fields: Optional[Set[str]]) -> bool:
+    """
+    Whether a filter reading fields gives the same rows before previous as after it
+    """
+    if fields is None:
+        return False
+    if "filter" in previous:
+        return True
+    if "sort" in previous:
+        return previous["sort"].get("limit") is None
+    if "stats" in previous:
+        by = previous["stats"]["by"]
+        aliases = {alias for _, _, alias in previous["stats"]["aggs"]}
+        return bool(by) and fields <= set(by) and not fields & aliases
+    if "table" in previous:
+        return fields <= set(previous["table"])
+    if "exclude" in previous:
+        return not fields & set(previous["exclude"])
+    if "dedup" in previous:
+        return fields <= set(previous["dedup"])
+    if "rename" in previous:
+        return not fields & (set(previous["rename"]) | set(previous["rename"].values()))
+    return False
+
+
+def push_filters(ir: Dict[str, Any], target: str) -> Tuple[Dict[str, Any], List[str]]:
+    """
+    Moves filters ahead of the commands that do not change which rows they keep,
+    into the search when nothing stops them (filters on group-by fields move
+    ahead of stats)
+    """
+    search = _conjuncts(ir["search"])
+    pipeline = list(ir["pipeline"])
+    details = []
+    index = 0
+    while index < len(pipeline):
+        node = pipeline[index]
+        if "filter" not in node:
+            index += 1
+            continue
+        fields = _expr_fields(node["filter"])
+        position = index
+        while position > 0 and _moves_past(pipeline[position - 1], fields):
+            position -= 1
+        if position == 0:
+            del pipeline[index]
+            search.extend(_conjuncts(node["filter"]))
+            details.append(f"{_describe(node['filter'])} moved into the search")
+            continue
+        passed = [next(iter(previous)) for previous in pipeline[position:index] if "filter" not in previous]
+        if passed:
+            del pipeline[index]
+            pipeline.insert(position, node)
+            details.append(f"{_describe(node['filter'])} moved ahead of {', '.join(passed)}")
+        index += 1
+    if not details:
+        return ir, []
+    return {"version": ir["version"], "search": _conjoin(search), "pipeline": pipeline}, details
+
+
+def aggregate_early(ir: Dict[str, Any], target: str) -> Tuple[Dict[str, Any], List[str]]:
+    """
+    Drops sorts and tables that stats makes irrelevant, so events stream
+    straight from the search into the aggregation, which backends run where the
+    data is (Splunk indexers, Elasticsearch shards) instead of after gathering them
+    """
+    pipeline = list(ir["pipeline"])
+    details = []
+    for index in range(len(pipeline) - 1, 0, -1):
+        if index >= len(pipeline) or "stats" not in pipeline[index]:
+            continue
+        stats = pipeline[index]["stats"]
+        inputs = set(stats["by"]) | {field for _, field, _ in stats["aggs"] if field is not None}
+        ordered = any(function == "list" for function, _, _ in stats["aggs"])
+        while index > 0:
+            previous = pipeline[index - 1]
+            if "sort" in previous and previous["sort"].get("limit") is None and not ordered:
+                details.append("sort before stats dropped")
+            elif "table" in previous and inputs <= set(previous["table"]):
+                details.append("table before stats dropped")
+            else:
+                break
+            del pipeline[index - 1]
+            index -= 1
+    if not details:
+        return ir, []
+    return {"version": ir["version"], "search": ir["search"], "pipeline": pipeline}, details
+
+
+def project(ir: Dict[str, Any], target: str) -> Tuple[Dict[str, Any], List[str]]:
+    """
+    Keeps only the fields the commands up to the first stats read, as soon as
+    events are read. Only for SPL: the local engine already prunes columns and
+    Elasticsearch aggregations read doc values.
+    """
+    if target != "spl":
+        return ir, []
+    needed: List[str] = []
+    for node in ir["pipeline"]:
+        if "stats" in node:
+            fields = list(node["stats"]["by"]) + [field for _, field, _ in node["stats"]["aggs"] if field is not None]
+        elif "filter" in node:
+            expr_fields = _expr_fields(node["filter"])
+            if expr_fields is None:
+                return ir, []
+            fields = sorted(expr_fields)
+        elif "sort" in node:
+            fields = [field for field, _ in node["sort"]["keys"]]
+        elif "dedup" in node:
+            fields = list(node["dedup"])
+        else:
+            return ir, []
+        needed.extend(field for field in fields if field not in needed)
+        if "stats" in node:
+            pipeline = [{"table": needed}] + list(ir["pipeline"])
+            return {"version": ir["version"], "search": ir["search"], "pipeline": pipeline}, [f"fields {', '.join(needed)} kept"]
+    return ir, []
+
+
+def _event_codes(term: Dict[str, Any]) -> Optional[List[Any]]:
+    if "cmp" in term and term["cmp"][0] == "EventCode" and term["cmp"][1] == "=":
+        return [term["cmp"][2]]
+    if "in" in term and term["in"][0] == "EventCode":
+        return list(term["in"][1])
+    if "or" in term:
+        codes = [_event_codes(child) for child in term["or"]]
+        return None if any(c is None for c in codes) else [code for c in codes for code in c]
+    return None
+
+
+def _is_narrowing(term: Dict[str, Any]) -> bool:
+    children = term["or"] if "or" in term else [term]
+    return all("cmp" in child and child.get("lenient") and child["cmp"][0] in ("source", "sourcetype") for child in children)
+
+
+def narrow_sourcetype(ir: Dict[str, Any], target: str) -> Tuple[Dict[str, Any], List[str]]:
+    """
+    Adds the Windows event log channel of the event codes a search requires
+    when it names no source or sourcetype, so only that channel's events are
+    read. The channel is matched as a sourcetype (WinEventLog:Security, as
+    before Splunk_TA_windows 6) or as a source (sourcetype WinEventLog, source
+    WinEventLog:Security, since), and leniently: events without these fields
+    still match. Events of the channel ingested under other names are missed,
+    so the rule is off unless enabled (QUERY_PUSHDOWN_SOURCETYPE_NARROWING).
+    Only for SPL: Elasticsearch has no per-event sourcetype, and lenient terms
+    cannot skip lines in the local engine.
+    """
+    if target != "spl":
+        return ir, []
+    terms = _conjuncts(ir["search"])
+    if any(field in ("source", "sourcetype") for term in terms for field in (_expr_fields(term) or ())):
+        return ir, []
+    channels = set()
+    for term in terms:
+        codes = _event_codes(term)
+        if codes is None:
+            continue
+        for code in codes:
+            number = to_number(code)
+            channel = EVENT_CHANNELS.get(int(number)) if number is not None and number == int(number) else None
+            if channel is None:
+                return ir, []
+            channels.add(channel)
+    if len(channels) != 1:
+        return ir, []
+    channel = channels.pop()
+    narrowing = {"or": [
+        {"cmp": [field, "=", f"{prefix}WinEventLog:{channel}"], "lenient": True}
+        for field in ("sourcetype", "source") for prefix in ("", "Xml")
+    ]}
+    search = _conjoin([narrowing] + terms)
+    return {"version": ir["version"], "search": search, "pipeline": ir["pipeline"]}, [f"source or sourcetype (Xml)WinEventLog:{channel} added"]
+
+
+def add_path_names(ir: Dict[str, Any], target: str) -> Tuple[Dict[str, Any], List[str]]:
+    """
+    Helps path=*\\name, whose leading wildcard no index can look up, with an
+    exact match on the file name in the CIM name field or this project's name
+    field, which the index can look up; the path term is kept to test the whole
+    path. Events with the path but neither name field are missed, so the rule
+    is off unless enabled (QUERY_PUSHDOWN_PATH_NAMES).
+    """
+    details = []
+    terms = []
+    for term in _conjuncts(ir["search"]):
+        terms.append(term)
+        if "cmp" not in term or term["cmp"][1] != "=" or not isinstance(term["cmp"][2], str):
+            continue
+        field, _, value = term["cmp"]
+        suffix = _PATH_SUFFIX.match(value)
+        if field in _PATH_NAMES and suffix:
+            name = {"or": [dict(term, cmp=[name_field, "=", suffix.group(1)]) for name_field in _PATH_NAMES[field]]}
+            terms.insert(-1, name)
+            details.append(f"{_describe(name)} added for {_describe(term)}")
+    if not details:
+        return ir, []
+    return {"version": ir["version"], "search": _conjoin(terms), "pipeline": ir["pipeline"]}, details
+
+
+def replace_leading_wildcards(ir: Dict[str, Any], target: str) -> Tuple[Dict[str, Any], List[str]]:
+    """
+    Helps field=*text*, whose leading wildcard no index can look up, with a
+    text keyword, so raw lines without it are skipped before they are parsed.
+    Only for the local engine, and not for index/source/sourcetype, which
+    events need not carry.
+    """
+    if target != "local":
+        return ir, []
+    details = []
+    keywords = []
+    terms = _conjuncts(ir["search"])
+    for term in terms:
+        if "cmp" not in term or term["cmp"][1] != "=" or term.get("cs") or term.get("lenient"):
+            continue
+        field, _, value = term["cmp"]
+        if field in METADATA_FIELDS or not isinstance(value, str):
+            continue
+        match = _LEADING_WILDCARD.match(value)
+        if match and match.group(1).isascii() and {"keyword": match.group(1)} not in keywords:
+            keywords.append({"keyword": match.group(1)})
+            details.append(f'keyword "{match.group(1)}" added for {_describe(term)}')
+    if not details:
+        return ir, []
+    return {"version": ir["version"], "search": _conjoin(terms + keywords), "pipeline": ir["pipeline"]}, details
+
+
+RULES: Tuple[Tuple[str, Callable[[Dict[str, Any], str], Tuple[Dict[str, Any], List[str]]]], ...] = (
+    ("filter_pushdown", push_filters),
+    ("early_aggregation", aggregate_early),
+    ("projection", project),
+    ("sourcetype_narrowing", narrow_sourcetype),
+    ("path_names", add_path_names),
+    ("leading_wildcard", replace_leading_wildcards),
+)
+
+
+def optimize_ir(ir: Dict[str, Any], target: str, events: int,
+                disabled: Iterable[str] = ()) -> Tuple[Dict[str, Any], List[Rewrite]]:
+    """
+    ir rewritten by every rule (but the disabled ones, by name) for a backend
+    compile target (spl, dsl or local), with the rules that applied and the
+    bytes each is estimated to save when the search covers events
+    """
+    rewrites = []
+    cost = estimate_bytes(ir, events)
+    for name, rule in RULES:
+        if name in disabled:
+            continue
+        rewritten, details = rule(ir, target)
+        if not details:
+            continue
+        rewritten_cost = estimate_bytes(rewritten, events)
+        rewrites.append(Rewrite(name, "; ".join(details), max(0, cost - rewritten_cost)))
+        ir, cost = rewritten, rewritten_cost
+    return ir, rewrites
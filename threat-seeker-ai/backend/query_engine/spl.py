@@ -0,0 +1,295 @@
+import re
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .expressions import (
+    METADATA_FIELDS, Compare, Exists, Expr, In, Keyword, MatchAll, Not, QuerySyntaxError, conjunction, disjunction
+)
+from .plan import Aggregate, Aggregation, Dedup, Exclude, Filter, Limit, LogicalPlan, Operator, Project, Rename, Sort
+
+_TOKEN = re.compile(
+    r'\s*(?:(?P<paren>[()])|(?P<comma>,)|(?P<op>==|!=|>=|<=|=|<|>)'
+    r'|"(?P<quoted>(?:[^"\\]|\\.)*)"|(?P<word>(?:[^\s()=!<>,"]|!(?!=))+))'
+)
+# function, function(field), either with "as alias"; then a comma, spaces or the end
+_AGGREGATION = re.compile(
+    r'(\w+)(?:\s*\(\s*([^)]*?)\s*\))?(?:\s+as\s+(?:"([^"]+)"|([\w.@-]+)))?(?:\s*,\s*|\s+|$)', re.IGNORECASE
+)
+_FUNCTIONS = {
+    "count": "count", "c": "count", "dc": "dc", "distinct_count": "dc", "sum": "sum", "avg": "avg", "mean": "avg",
+    "min": "min", "max": "max", "values": "values", "list": "list"
+}
+# head without a count, as in Splunk
+DEFAULT_HEAD = 10
+
+Token = Tuple[str, str]
+
+
+def _tokenize(text: str) -> List[Token]:
+    tokens: List[Token] = []
+    text = text.rstrip()
+    position = 0
+    while position < len(text):
+        match = _TOKEN.match(text, position)
+        if match is None:
+            raise QuerySyntaxError(f"Cannot parse {text[position:]!r}")
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind == "quoted":
+            # Inside quotes only \" and \\ are escapes; other backslashes are literal (C:\Windows)
+            value = re.sub(r'\\(["\\])', r"\1", value)
+        tokens.append((kind, value))
+        position = match.end()
+    return tokens
+
+
+class _ExpressionParser:
+    """
+    Search expressions: terms joined by AND (or just spaces), OR and NOT, with
+    parentheses. A term is field=value (also != < <= > >=), field IN (values) or
+    a keyword. In where clauses every term must be a comparison.
+    """
+
+    def __init__(self, text: str, where: bool = False):
+        self.tokens = _tokenize(text)
+        self.position = 0
+        self.where = where
+
+    def parse(self) -> Optional[Expr]:
+        if not self.tokens:
+            return None
+        expr = self._expression()
+        if self.position < len(self.tokens):
+            raise QuerySyntaxError(f"Unexpected {self.tokens[self.position][1]!r}")
+        return expr
+
+    def _peek(self) -> Optional[Token]:
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def _next(self) -> Optional[Token]:
+        token = self._peek()
+        self.position += 1
+        return token
+
+    def _expect(self, expected: Token) -> None:
+        token = self._next()
+        if token != expected:
+            raise QuerySyntaxError(f"Expected {expected[1]!r}, found {token[1] if token else 'end of query'!r}")
+
+    @staticmethod
+    def _is_word(token: Optional[Token], word: str) -> bool:
+        return token is not None and token[0] == "word" and token[1].upper() == word
+
+    def _expression(self) -> Expr:
+        # As in Splunk, OR binds tighter than AND in searches ("a b OR c" is a AND (b OR c)),
+        # and AND tighter than OR in where clauses
+        if self.where:
+            return self._or(lambda: self._and(self._unary))
+        return self._and(lambda: self._or(self._unary))
+
+    def _or(self, operand: Callable[[], Expr]) -> Expr:
+        terms = [operand()]
+        while self._is_word(self._peek(), "OR"):
+            self.position += 1
+            terms.append(operand())
+        return disjunction(terms)
+
+    def _and(self, operand: Callable[[], Expr]) -> Expr:
+        terms = [operand()]
+        while True:
+            token = self._peek()
+            if token is None or token == ("paren", ")") or self._is_word(token, "OR"):
+                break
+            if self._is_word(token, "AND"):
+                self.position += 1
+            terms.append(operand())
+        return conjunction(terms) or MatchAll()
+
+    def _unary(self) -> Expr:
+        token = self._next()
+        if token is None:
+            raise QuerySyntaxError("Query ends unexpectedly")
+        if self._is_word(token, "NOT"):
+            return Not(self._unary())
+        if token == ("paren", "("):
+            expr = self._expression()
+            self._expect(("paren", ")"))
+            return expr
+        if token[0] not in ("word", "quoted"):
+            raise QuerySyntaxError(f"Unexpected {token[1]!r}")
+
+        following = self._peek()
+        if token[0] == "word" and following is not None and following[0] == "op":
+            self.position += 1
+            value = self._next()
+            if value is None or value[0] not in ("word", "quoted"):
+                raise QuerySyntaxError(f"Expected a value after {token[1]}{following[1]}")
+            return self._compare(token[1], "=" if following[1] == "==" else following[1], value)
+        if token[0] == "word" and self._is_word(following, "IN"):
+            self.position += 1
+            self._expect(("paren", "("))
+            values = []
+            while True:
+                item = self._next()
+                if item is None:
+                    raise QuerySyntaxError("Unclosed IN list")
+                if item == ("paren", ")"):
+                    break
+                if item[0] in ("word", "quoted"):
+                    values.append(item[1])
+            return In(token[1], values)
+        if token == ("word", "*"):
+            return MatchAll()
+        if self.where:
+            raise QuerySyntaxError(f"Expected a comparison in where, found {token[1]!r}")
+        return Keyword(token[1])
+
+    def _compare(self, field: str, op: str, value: Token) -> Expr:
+        if value[1] == "*" and op in ("=", "!="):
+            return Exists(field) if op == "=" else Not(Exists(field))
+        return Compare(field, op, value[1], lenient=field in METADATA_FIELDS and not self.where)
+
+
+def _split_pipeline(query: str) -> List[str]:
+    segments = [""]
+    quoted = False
+    escaped = False
+    for char in query:
+        if char == "|" and not quoted:
+            segments.append("")
+            continue
+        if char == '"' and not escaped:
+            quoted = not quoted
+        escaped = char == "\\" and not escaped
+        segments[-1] += char
+    return segments
+
+
+def _field_list(text: str) -> List[str]:
+    return [field.strip('"') for field in re.split(r"[\s,]+", text.strip()) if field]
+
+
+def _search(args: str) -> List[Operator]:
+    predicate = _ExpressionParser(args).parse()
+    return [] if predicate is None or isinstance(predicate, MatchAll) else [Filter(predicate)]
+
+
+def _where(args: str) -> List[Operator]:
+    predicate = _ExpressionParser(args, where=True).parse()
+    if predicate is None:
+        raise QuerySyntaxError("where needs an expression")
+    return [Filter(predicate)]
+
+
+def _stats(args: str) -> List[Operator]:
+    parts = re.split(r"\s+by\s+", " " + args, maxsplit=1, flags=re.IGNORECASE)
+    text = parts[0].strip()
+    aggregations = []
+    position = 0
+    while position < len(text):
+        match = _AGGREGATION.match(text, position)
+        if match is None or match.end() == position:
+            raise QuerySyntaxError(f"Cannot parse stats function {text[position:]!r}")
+        function = _FUNCTIONS.get(match.group(1).lower())
+        if function is None:
+            raise QuerySyntaxError(f"Unsupported stats function {match.group(1)}")
+        aggregation = Aggregation(function, match.group(2) or None, match.group(3) or match.group(4))
+        if any(other.alias == aggregation.alias for other in aggregations):
+            # Such as "count c", where c is another count rather than a name for the first
+            raise QuerySyntaxError(f"Duplicate stats output {aggregation.alias}, name one with 'as'")
+        aggregations.append(aggregation)
+        position = match.end()
+    return [Aggregate(_field_list(parts[1]) if len(parts) > 1 else [], aggregations)]
+
+
+def _sort(args: str) -> List[Operator]:
+    keys = []
+    limit = None
+    for token in _field_list(args):
+        if token.isdigit():
+            limit = int(token)
+        elif token.lower().startswith("limit="):
+            limit = int(token[6:])
+        else:
+            descending = token.startswith("-")
+            field = token.lstrip("+-")
+            wrapped = re.fullmatch(r"(?:auto|str|ip|num)\((.+)\)", field)
+            keys.append((wrapped.group(1) if wrapped else field, descending))
+    if not keys:
+        raise QuerySyntaxError("sort needs a field")
+    return [Sort(keys, limit or None)]
+
+
+def _head(args: str) -> List[Operator]:
+    text = args.strip()
+    if text.lower().startswith("limit="):
+        text = text[6:]
+    if text and not text.isdigit():
+        raise QuerySyntaxError(f"Unsupported head argument {args!r}")
+    return [Limit(int(text) if text else DEFAULT_HEAD)]
+
+
+def _table(args: str) -> List[Operator]:
+    return [Project(_field_list(args))]
+
+
+def _fields(args: str) -> List[Operator]:
+    text = args.strip()
+    if text.startswith("-"):
+        return [Exclude(_field_list(text[1:]))]
+    return [Project(_field_list(text.lstrip("+")))]
+
+
+def _rename(args: str) -> List[Operator]:
+    pairs = re.findall(r'("[^"]+"|[\w.@-]+)\s+as\s+("[^"]+"|[\w.@-]+)', args, re.IGNORECASE)
+    if not pairs:
+        raise QuerySyntaxError("rename needs field AS name")
+    return [Rename({old.strip('"'): new.strip('"') for old, new in pairs})]
+
+
+def _dedup(args: str) -> List[Operator]:
+    fields = _field_list(args)
+    if not fields or any("=" in field or field.isdigit() for field in fields):
+        raise QuerySyntaxError(f"Unsupported dedup arguments {args!r}")
+    return [Dedup(fields)]
+
+
+def _top(args: str) -> List[Operator]:
+    limit = DEFAULT_HEAD
+    fields = []
+    for token in _field_list(args):
+        if token.lower().startswith("limit="):
+            limit = int(token[6:])
+        elif token.lower() == "by" or "=" in token:
+            raise QuerySyntaxError(f"Unsupported top arguments {args!r}")
+        else:
+            fields.append(token)
+    return [Aggregate(fields, [Aggregation("count")]), Sort([("count", True)]), Limit(limit)]
+
+
+_COMMANDS: Dict[str, Callable[[str], List[Operator]]] = {
+    "search": _search, "where": _where, "stats": _stats, "sort": _sort, "head": _head, "table": _table,
+    "fields": _fields, "rename": _rename, "dedup": _dedup, "top": _top
+}
+
+
+def parse_spl(query: str) -> LogicalPlan:
+    """
+    Plan for an SPL query: a search followed by search, where, stats, sort, head,
+    table, fields, rename, dedup and top commands
+    """
+    segments = _split_pipeline(query)
+    first = segments[0].strip()
+    if not first and len(segments) > 1:
+        raise QuerySyntaxError("Queries starting with a generating command are not supported")
+    if first.lower().startswith("search "):
+        first = first[7:]
+    operators = _search(first)
+    for segment in segments[1:]:
+        match = re.match(r"\s*(\w+)\s*(.*)", segment, re.DOTALL)
+        if match is None:
+            raise QuerySyntaxError(f"Empty command in {query!r}")
+        command = _COMMANDS.get(match.group(1).lower())
+        if command is None:
+            raise QuerySyntaxError(f"Unsupported SPL command: {match.group(1)}")
+        operators.extend(command(match.group(2).strip()))
+    return LogicalPlan(operators, "spl", query)
@@ -0,0 +1,187 @@
+from itertools import compress, repeat
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from utils.serialization import dumps
+
+
+def lookup(row: Dict[str, Any], path: str) -> Any:
+    """
+    A field by name, or by dotted path into nested objects ("host.name"), also
+    looked up in the _source of Elasticsearch hits
+    """
+    if path in row:
+        return row[path]
+    value: Any = row
+    for part in path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            source = row.get("_source")
+            return lookup(source, path) if isinstance(source, dict) else None
+        value = value[part]
+    return value
+
+
+def _extract(rows: List[Dict[str, Any]], name: str) -> List[Any]:
+    if "." not in name and not (rows and "_source" in rows[0]):
+        # Flat rows: dict.get over every row without a Python-level loop
+        return list(map(dict.get, rows, repeat(name)))
+    return [lookup(row, name) for row in rows]
+
+
+class Column:
+    """
+    A dictionary-encoded column: each distinct value once, and one code per row.
+
+    Predicates are evaluated once per distinct value and mapped onto the codes,
+    and grouping, sorting and deduplication work on the integer codes.
+    """
+
+    __slots__ = ("values", "codes")
+
+    def __init__(self, values: List[Any], codes: List[int]):
+        self.values = values
+        self.codes = codes
+
+    @classmethod
+    def encode(cls, data: Iterable[Any]) -> "Column":
+        index: Dict[Any, int] = {}
+        data = list(data)
+        try:
+            codes = [index.setdefault(value, len(index)) for value in data]
+            return cls(list(index), codes)
+        except TypeError:
+            pass
+        # Lists and objects are not hashable; key them by their JSON text
+        index = {}
+        values: List[Any] = []
+        codes = []
+        for value in data:
+            key = value if isinstance(value, (str, int, float, bool, type(None))) else dumps(value)
+            code = index.get(key)
+            if code is None:
+                code = index[key] = len(values)
+                values.append(value)
+            codes.append(code)
+        return cls(values, codes)
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def decode(self) -> List[Any]:
+        return list(map(self.values.__getitem__, self.codes))
+
+    def take(self, indices: Iterable[int]) -> "Column":
+        return Column(self.values, list(map(self.codes.__getitem__, indices)))
+
+    def mask(self, test: Callable[[Any], bool]) -> List[bool]:
+        """
+        test applied to every row, evaluated once per distinct value
+        """
+        table = [test(value) for value in self.values]
+        return list(map(table.__getitem__, self.codes))
+
+
+class ColumnTable:
+    """
+    A batch of rows stored column by column.
+
+    Tables scanned from events keep the original rows: columns are built on
+    first use, so a query only pays for the fields it touches, and a query
+    that does not reshape events returns them unchanged. raw holds each row's
+    lower-cased text for keyword search when the source has it.
+    """
+
+    __slots__ = ("length", "columns", "rows", "raw")
+
+    def __init__(self, columns: Dict[str, Column], length: int, rows: Optional[List[Dict[str, Any]]] = None,
+                 raw: Optional[List[str]] = None):
+        self.columns = columns
+        self.length = length
+        self.rows = rows
+        self.raw = raw
+
+    @classmethod
+    def from_rows(cls, rows: List[Dict[str, Any]], fields: Optional[Iterable[str]] = None,
+                  raw: Optional[List[str]] = None) -> "ColumnTable":
+        table = cls({}, len(rows), rows, raw)
+        for field in fields or ():
+            table.column(field)
+        return table
+
+    @classmethod
+    def from_columns(cls, data: Dict[str, List[Any]], length: int) -> "ColumnTable":
+        return cls({name: Column.encode(values) for name, values in data.items()}, length)
+
+    @classmethod
+    def concat(cls, tables: List["ColumnTable"]) -> "ColumnTable":
+        if len(tables) == 1:
+            return tables[0]
+        length = sum(t.length for t in tables)
+        if all(t.rows is not None for t in tables):
+            raw = None
+            if all(t.raw is not None for t in tables):
+                raw = [text for t in tables for text in t.raw]
+            return cls({}, length, [row for t in tables for row in t.rows], raw)
+        names = list(dict.fromkeys(name for t in tables for name in t.columns))
+        return cls.from_columns({name: [v for t in tables for v in t.column(name).decode()] for name in names}, length)
+
+    def column(self, name: str) -> Column:
+        column = self.columns.get(name)
+        if column is None:
+            if self.rows is not None:
+                column = Column.encode(_extract(self.rows, name))
+            else:
+                column = Column([None], [0] * self.length)
+            self.columns[name] = column
+        return column
+
+    def raw_text(self) -> List[str]:
+        if self.raw is None:
+            rows = self.rows if self.rows is not None else self.to_rows()
+            self.raw = [dumps(row).decode("utf-8").lower() for row in rows]
+        return self.raw
+
+    def take(self, indices: List[int]) -> "ColumnTable":
+        return ColumnTable(
+            {name: column.take(indices) for name, column in self.columns.items()},
+            len(indices),
+            list(map(self.rows.__getitem__, indices)) if self.rows is not None else None,
+            list(map(self.raw.__getitem__, indices)) if self.raw is not None else None
+        )
+
+    def filter(self, mask: List[bool]) -> "ColumnTable":
+        if all(mask):
+            return self
+        return self.take(list(compress(range(self.length), mask)))
+
+    def head(self, count: int) -> "ColumnTable":
+        if count >= self.length:
+            return self
+        return self.take(list(range(count)))
+
+    def project(self, fields: List[str]) -> "ColumnTable":
+        return ColumnTable({field: self.column(field) for field in fields}, self.length)
+
+    def to_rows(self, fields: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        if fields is None:
+            if self.rows is not None:
+                return self.rows
+            fields = list(self.columns)
+        values = [self.column(field).decode() for field in fields]
+        return [dict(zip(fields, row)) for row in zip(*values)] if fields else [{} for _ in range(self.length)]
+
+
+class RowSource:
+    """
+    Scan source over events already in memory
+    """
+
+    def __init__(self, rows: List[Dict[str, Any]]):
+        self.rows = rows
+
+    def scan(self, columns: Optional[List[str]], predicate: Any, limit: Optional[int]) -> ColumnTable:
+        table = ColumnTable.from_rows(self.rows)
+        if predicate is not None:
+            table = table.filter(predicate.evaluate(table))
+        if limit is not None:
+            table = table.head(limit)
+        return table
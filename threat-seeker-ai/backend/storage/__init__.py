@@ -0,0 +1,7 @@
+# Storage package
+from .chunk_store import ChunkStore, ChunkedEvents
+from .event_index import EventIndex
+from .pagination import EventPaginator, InvalidQueryError
+from .result_store import ResultStore, get_result_store
+from .search_index import SearchIndex, get_search_index
+from .state import MemoryStateBackend, SQLiteStateBackend, StateBackend, get_state_backend
@@ -0,0 +1,333 @@
+import json
+import logging
+import mmap
+import os
+import shutil
+import zlib
+from bisect import bisect_right
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from utils.serialization import dumps, loads, zstandard
+
+# Setup logger
+logger = logging.getLogger(__name__)
+
+META_FILE = "meta.json"
+CHUNKS_SUFFIX = ".chunks"
+INDEX_SUFFIX = ".idx"
+
+
+def _compress(data: bytes) -> Tuple[bytes, str]:
+    if zstandard is not None:
+        return zstandard.ZstdCompressor(level=3).compress(data), "zstd"
+    return zlib.compress(data, 6), "zlib"
+
+
+def _decompress(data: Any, codec: str) -> bytes:
+    if codec == "zstd":
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+
+def _time_bounds(events: Sequence[Dict[str, Any]], time_field: str) -> Tuple[Any, Any]:
+    values = [event.get(time_field) for event in events]
+    if not values or any(value is None for value in values):
+        return None, None
+    if len({isinstance(value, str) for value in values}) > 1:
+        # Mixed strings and numbers cannot be ordered, the chunk is never pruned
+        return None, None
+    return min(values), max(values)
+
+
+def _safe_name(query_id: str) -> str:
+    return "".join(c if c.isalnum() or c in "-_" else "_" for c in query_id)
+
+
+class ChunkedEvents(Sequence):
+    """
+    Read-only view of one query's events, backed by a memory-mapped chunk file.
+
+    Only the chunks that are actually read are decompressed, and only the last few
+    are kept decoded, so paging through or sorting a large stored result costs page
+    cache and I/O rather than worker heap.
+    """
+
+    def __init__(self, path: str, index: List[Dict[str, Any]], cache_chunks: int = 4, version: str = ""):
+        self.index = index
+        # Changes whenever the query's events are appended to or replaced
+        self.version = version
+        self._first_rows = [entry["first_row"] for entry in index]
+        self._length = index[-1]["first_row"] + index[-1]["rows"] if index else 0
+        self._cache: "OrderedDict[int, List[Dict[str, Any]]]" = OrderedDict()
+        self._cache_chunks = cache_chunks
+        self._file = None
+        self._mmap = None
+        if self._length:
+            self._file = open(path, "rb")
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __getitem__(self, row: int) -> Dict[str, Any]:
+        if row < 0:
+            row += self._length
+        if not 0 <= row < self._length:
+            raise IndexError(row)
+        chunk = bisect_right(self._first_rows, row) - 1
+        return self._chunk(chunk)[row - self._first_rows[chunk]]
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for _, event in self.scan(0):
+            yield event
+
+    def scan(self, start_row: int = 0, time_min: Any = None, time_max: Any = None) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        """
+        Yield (row, event) from start_row onwards, skipping chunks whose time range
+        lies entirely outside [time_min, time_max]
+        """
+        if start_row >= self._length:
+            return
+        first_chunk = max(0, bisect_right(self._first_rows, start_row) - 1)
+        for chunk in range(first_chunk, len(self.index)):
+            entry = self.index[chunk]
+            if not self._overlaps(entry, time_min, time_max):
+                continue
+            events = self._chunk(chunk)
+            offset = max(0, start_row - entry["first_row"])
+            for i in range(offset, len(events)):
+                yield entry["first_row"] + i, events[i]
+
+    def close(self) -> None:
+        if self._mmap is not None:
+            self._mmap.close()
+            self._file.close()
+            self._mmap = None
+            self._file = None
+        self._cache.clear()
+
+    def __enter__(self) -> "ChunkedEvents":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+    @staticmethod
+    def _overlaps(entry: Dict[str, Any], time_min: Any, time_max: Any) -> bool:
+        low, high = entry.get("min_time"), entry.get("max_time")
+        if low is None or high is None:
+            return True
+        try:
+            if time_min is not None and high < time_min:
+                return False
+            if time_max is not None and low > time_max:
+                return False
+        except TypeError:
+            # Bounds of a different type than the stored times: never prune
+            return True
+        return True
+
+    def _chunk(self, chunk: int) -> List[Dict[str, Any]]:
+        events = self._cache.get(chunk)
+        if events is not None:
+            self._cache.move_to_end(chunk)
+            return events
+        entry = self.index[chunk]
+        raw = memoryview(self._mmap)[entry["offset"]:entry["offset"] + entry["length"]]
+        try:
+            events = loads(_decompress(raw, entry["codec"]))
+        finally:
+            raw.release()
+        self._cache[chunk] = events
+        while len(self._cache) > self._cache_chunks:
+            self._cache.popitem(last=False)
+        return events
+
+
+class ChunkStore:
+    """
+    On-disk storage for hunt results.
+
+    Each result is a directory holding meta.json (the result without its events)
+    and, per query, an append-only file of compressed chunks of chunk_rows events
+    plus an index file with one JSON line per chunk: byte offset and length, first
+    row, row count, codec and the chunk's min/max time, which lets time-filtered
+    reads skip chunks without decompressing them. Other files derived from the
+    result, such as its retrieval index, are kept alongside.
+    """
+
+    def __init__(self, root: str, chunk_rows: int = 2000, time_field: str = "timestamp"):
+        self.root = root
+        self.chunk_rows = chunk_rows
+        self.time_field = time_field
+        os.makedirs(root, exist_ok=True)
+
+    def write_result(self, hunt_result: Dict[str, Any], meta: Dict[str, Any]) -> None:
+        """
+        Write a complete hunt result; it becomes visible atomically once fully written
+        """
+        result_id = hunt_result["result_id"]
+        final_dir = self._result_dir(result_id)
+        tmp_dir = os.path.join(self.root, f".tmp-{result_id}")
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+
+        for query_result in (hunt_result.get("raw_results") or {}).get("query_results") or []:
+            self._append(tmp_dir, query_result.get("query_id", ""), query_result.get("results") or [])
+        with open(os.path.join(tmp_dir, META_FILE), "wb") as f:
+            f.write(dumps(meta))
+
+        shutil.rmtree(final_dir, ignore_errors=True)
+        os.replace(tmp_dir, final_dir)
+
+    def append_events(self, result_id: str, query_id: str, events: List[Dict[str, Any]]) -> None:
+        """
+        Append events to a stored query as new chunks
+        """
+        self._append(self._result_dir(result_id), query_id, events)
+
+    def replace_events(self, result_id: str, query_id: str, events: List[Dict[str, Any]]) -> None:
+        """
+        Replace a stored query's events, e.g. the groups of an aggregation updated by a scheduled run
+        """
+        result_dir = self._result_dir(result_id)
+        base = os.path.join(result_dir, _safe_name(query_id))
+        tmp_dir = os.path.join(result_dir, ".tmp")
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        self._append(tmp_dir, query_id, events)
+        tmp_base = os.path.join(tmp_dir, _safe_name(query_id))
+        # Without an index the query briefly reads as missing, never as new chunks with old offsets
+        if os.path.exists(base + INDEX_SUFFIX):
+            os.remove(base + INDEX_SUFFIX)
+        os.replace(tmp_base + CHUNKS_SUFFIX, base + CHUNKS_SUFFIX)
+        os.replace(tmp_base + INDEX_SUFFIX, base + INDEX_SUFFIX)
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def write_meta(self, result_id: str, meta: Dict[str, Any]) -> None:
+        """
+        Atomically rewrite the meta.json of a stored result
+        """
+        path = os.path.join(self._result_dir(result_id), META_FILE)
+        with open(path + ".tmp", "wb") as f:
+            f.write(dumps(meta))
+        os.replace(path + ".tmp", path)
+
+    def read_meta(self, result_id: str) -> Optional[Dict[str, Any]]:
+        path = os.path.join(self._result_dir(result_id), META_FILE)
+        try:
+            with open(path, "rb") as f:
+                return loads(f.read())
+        except FileNotFoundError:
+            return None
+
+    def write_file(self, result_id: str, name: str, data: bytes) -> bool:
+        """
+        Atomically write a file kept with a stored result (e.g. its retrieval
+        index); False when the result no longer exists
+        """
+        result_dir = self._result_dir(result_id)
+        if not os.path.isdir(result_dir):
+            return False
+        path = os.path.join(result_dir, name)
+        with open(path + ".tmp", "wb") as f:
+            f.write(data)
+        os.replace(path + ".tmp", path)
+        return True
+
+    def read_file(self, result_id: str, name: str) -> Optional[bytes]:
+        try:
+            with open(os.path.join(self._result_dir(result_id), name), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def open_events(self, result_id: str, query_id: str) -> Optional[ChunkedEvents]:
+        """
+        Open a stored query's events; the caller closes the returned view
+        """
+        base = os.path.join(self._result_dir(result_id), _safe_name(query_id))
+        read = self._read_versioned_index(base + INDEX_SUFFIX)
+        if read is None:
+            return None
+        index, version = read
+        return ChunkedEvents(base + CHUNKS_SUFFIX, index, version=version)
+
+    def chunk_index(self, result_id: str, query_id: str) -> Optional[List[Dict[str, Any]]]:
+        base = os.path.join(self._result_dir(result_id), _safe_name(query_id))
+        return self._read_index(base + INDEX_SUFFIX)
+
+    def result_ids(self) -> List[str]:
+        """
+        Stored result IDs, most recently written first
+        """
+        entries = []
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if name.startswith(".") or not os.path.isfile(os.path.join(path, META_FILE)):
+                continue
+            entries.append((os.path.getmtime(os.path.join(path, META_FILE)), name))
+        return [name for _, name in sorted(entries, reverse=True)]
+
+    def delete(self, result_id: str) -> None:
+        shutil.rmtree(self._result_dir(result_id), ignore_errors=True)
+
+    def _result_dir(self, result_id: str) -> str:
+        return os.path.join(self.root, _safe_name(result_id))
+
+    def _append(self, result_dir: str, query_id: str, events: List[Dict[str, Any]]) -> None:
+        base = os.path.join(result_dir, _safe_name(query_id))
+        index = self._read_index(base + INDEX_SUFFIX) or []
+        first_row = index[-1]["first_row"] + index[-1]["rows"] if index else 0
+
+        with open(base + CHUNKS_SUFFIX, "ab") as chunks, open(base + INDEX_SUFFIX, "a", encoding="utf-8") as idx:
+            offset = chunks.tell()
+            for start in range(0, len(events), self.chunk_rows):
+                batch = events[start:start + self.chunk_rows]
+                data, codec = _compress(dumps(batch))
+                chunks.write(data)
+                min_time, max_time = _time_bounds(batch, self.time_field)
+                entry = {
+                    "offset": offset,
+                    "length": len(data),
+                    "first_row": first_row,
+                    "rows": len(batch),
+                    "codec": codec,
+                    "min_time": min_time,
+                    "max_time": max_time
+                }
+                # The chunk is written before its index line, so a crash never indexes a partial chunk
+                chunks.flush()
+                idx.write(json.dumps(entry) + "\n")
+                offset += len(data)
+                first_row += len(batch)
+
+    @staticmethod
+    def _read_index(path: str) -> Optional[List[Dict[str, Any]]]:
+        read = ChunkStore._read_versioned_index(path)
+        return read[0] if read is not None else None
+
+    @staticmethod
+    def _read_versioned_index(path: str) -> Optional[Tuple[List[Dict[str, Any]], str]]:
+        """
+        A chunk index and its version: appending grows the index file and
+        replacing swaps in a new one, so its inode, size and modification time
+        identify what was read, on every worker sharing the directory
+        """
+        try:
+            with open(path, "rb") as f:
+                stat = os.fstat(f.fileno())
+                # Only the lines the version covers, even if a run appends meanwhile
+                lines = f.read(stat.st_size).decode("utf-8").splitlines()
+        except FileNotFoundError:
+            return None
+        version = f"{stat.st_ino:x}.{stat.st_size:x}.{stat.st_mtime_ns:x}"
+        index = []
+        for line in lines:
+            try:
+                index.append(json.loads(line))
+            except json.JSONDecodeError:
+                logger.warning(f"Ignoring truncated chunk index line in {path}")
+                break
+        return index, version
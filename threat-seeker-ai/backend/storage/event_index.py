@@ -0,0 +1,412 @@
+import heapq
+import json
+import math
+import struct
+import threading
+import zlib
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from storage.search_index import tokenize
+from utils.event_fields import HOST_FIELDS, USER_FIELDS, event_time, field_values, normalize_event
+from utils.serialization import dumps, loads
+
+INDEX_MAGIC = b"TSBM25v1"
+_HEADER_LENGTH = struct.Struct("<I")
+
+# Term frequency multipliers of the normalized fields; the raw event text repeats the other fields
+FIELD_BOOSTS = {"host": 2.0, "user": 2.0, "process": 2.0, "command_line": 1.5, "_raw": 0.5}
+# Term frequency multiplier of the words of field names, so that "logon type" finds logon_type=10
+NAME_BOOST = 0.5
+# Question words that carry no evidence
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "did", "do", "does", "for", "from", "has", "have", "how",
+    "in", "is", "it", "of", "on", "or", "should", "that", "the", "this", "to", "was", "were", "what", "when",
+    "where", "which", "who", "why", "with", "we", "i", "you", "there", "these", "those", "any"
+}
+
+# BM25 parameters
+_K1 = 1.2
+_B = 0.75
+
+# Share of events above which a term only reorders the events found by rarer terms
+_COMMON_SHARE = 0.125
+
+# Events per compressed block of the stored copies
+_BLOCK_EVENTS = 32
+
+# Distinct field values whose tokens are remembered while indexing a batch
+_MEMO_SIZE = 50000
+
+
+def _entity_terms(name: str, values: Iterable[str]) -> Set[str]:
+    """
+    Filter terms of host or user values: the whole value, and a host's short name
+    or a user's name without its domain
+    """
+    terms = set()
+    for value in values:
+        value = value.lower()
+        terms.add(f"{name}:{value}")
+        if name == "host" and "." in value and not value.replace(".", "").isdigit():
+            terms.add(f"host:{value.split('.', 1)[0]}")
+        elif name == "user":
+            terms.add(f"user:{value.rsplit(chr(92), 1)[-1].split('@', 1)[0]}")
+    return terms
+
+
+class EventIndex:
+    """
+    BM25 index over the events of one stored hunt result, used to pick the events
+    that support an answer about the result without reading all of them.
+
+    Events are documents identified by their query and row in the chunk store.
+    Each keeps its length and time in flat arrays, and each term a posting list
+    of document numbers and boosted term frequencies. Host and user values are
+    also indexed as host:<name> and user:<name> terms, which tokens never look
+    like, so filters are posting list lookups. Only the first max_events events
+    are indexed; later rows are still counted so appends keep their row numbers.
+
+    The index also keeps a copy of its events, compressed in blocks of a few
+    dozen, so the best events are returned by decoding a few small blocks
+    instead of the result's large chunks.
+    """
+
+    def __init__(self, max_events: int = 100000):
+        self.max_events = max_events
+        self.queries: List[str] = []
+        # Rows stored per query, indexed or not
+        self.rows: Dict[str, int] = {}
+        self._doc_query = array("H")
+        self._doc_row = array("I")
+        self._doc_length = array("f")
+        self._doc_time = array("d")
+        self._postings: Dict[str, Tuple[array, array]] = {}
+        self._total_length = 0.0
+        # Compressed blocks of _BLOCK_EVENTS encoded events, and the encoded events of the last, partial block
+        self._blocks: List[bytes] = []
+        self._pending: List[bytes] = []
+        # Per-document BM25 length normalization, recomputed after documents change
+        self._norms: Optional[List[float]] = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._doc_row)
+
+    def add(self, query_id: str, events: List[Dict[str, Any]]) -> None:
+        """
+        Index events appended to a query (rows continue from its previous events)
+        """
+        with self._lock:
+            self._add(query_id, events)
+
+    def replace(self, query_id: str, events: List[Dict[str, Any]]) -> None:
+        """
+        Index the new events of a query whose stored events were replaced
+        """
+        with self._lock:
+            if query_id in self.queries:
+                self._remove_query(self.queries.index(query_id))
+            self.rows[query_id] = 0
+            self._add(query_id, events)
+
+    def search(self, question: str, limit: int = 20, host: Optional[str] = None, user: Optional[str] = None,
+               start: Optional[float] = None, end: Optional[float] = None) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        The limit best events for a question (with their query_id, row and score),
+        and how many events were ranked. host and user must equal one of an
+        event's host or user values (or their short names), start and end bound
+        its time in epoch seconds. A question without indexed terms returns the
+        latest events that pass the filters, or none without filters.
+        """
+        with self._lock:
+            allowed: Optional[Set[int]] = None
+            for name, value in (("host", host), ("user", user)):
+                if value:
+                    docs = set(self._postings.get(f"{name}:{value.strip().lower()}", ((), ()))[0])
+                    allowed = docs if allowed is None else allowed & docs
+            timed = start is not None or end is not None
+            low = -math.inf if start is None else start
+            high = math.inf if end is None else end
+            # Events without a time never pass a time filter (NaN compares false)
+            times = self._doc_time
+
+            postings = self._postings
+            # Rarest terms first: they carry the most weight and add the fewest events
+            terms = sorted(
+                dict.fromkeys(filter(None, (self._term(token) for token in tokenize(question)))),
+                key=lambda term: len(postings[term][0])
+            )
+            norms = self._norms
+            if norms is None:
+                average = (self._total_length / len(self._doc_length) if self._doc_length else 0.0) or 1.0
+                norms = self._norms = [_K1 * (1 - _B + _B * length / average) for length in self._doc_length]
+
+            doc_count = len(self._doc_row)
+            # Terms in every event (such as the words of field names they all have) rank nothing
+            # next to terms that are not
+            terms = [term for term in terms if len(postings[term][0]) < doc_count] or terms
+            idfs = [
+                math.log(1 + (doc_count - len(postings[term][0]) + 0.5) / (len(postings[term][0]) + 0.5))
+                for term in terms
+            ]
+            # Most that the remaining terms can add to an event's score (tf / (tf + norm) < 1)
+            remaining = [sum(idfs[i:]) * (_K1 + 1) for i in range(len(terms))]
+            scores: Dict[int, float] = {}
+            for term, idf, bound in zip(terms, idfs, remaining):
+                docs, frequencies = postings[term]
+                if len(scores) >= limit and (
+                    len(docs) > doc_count * _COMMON_SHARE or heapq.nlargest(limit, scores.values())[-1] > bound
+                ):
+                    # No event outside the candidates can reach the top any more, or the term is too
+                    # common to be worth adding events for: only rescore the candidates
+                    if len(scores) * 8 < len(docs):
+                        for doc in scores:
+                            position = bisect_left(docs, doc)
+                            if position < len(docs) and docs[position] == doc:
+                                tf = frequencies[position]
+                                scores[doc] += idf * tf * (_K1 + 1) / (tf + norms[doc])
+                    else:
+                        for doc, tf in zip(docs, frequencies):
+                            if doc in scores:
+                                scores[doc] += idf * tf * (_K1 + 1) / (tf + norms[doc])
+                    continue
+                get = scores.get
+                for doc, tf in zip(docs, frequencies):
+                    if (allowed is not None and doc not in allowed) or (timed and not low <= times[doc] <= high):
+                        continue
+                    scores[doc] = get(doc, 0.0) + idf * tf * (_K1 + 1) / (tf + norms[doc])
+
+            if not terms:
+                if allowed is None and not timed:
+                    return [], 0
+                # Nothing in the question is in the events: the latest events that pass the filters
+                candidates = allowed if allowed is not None else range(doc_count)
+                if timed:
+                    candidates = [doc for doc in candidates if low <= times[doc] <= high]
+                candidates = list(candidates)
+                best = heapq.nlargest(
+                    limit, candidates, key=lambda doc: (-math.inf if math.isnan(times[doc]) else times[doc], -doc)
+                )
+                return self._hits([(doc, 0.0) for doc in best]), len(candidates)
+
+            best = heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], -item[0]))
+            return self._hits(best), len(scores)
+
+    def _hits(self, ranked: List[Tuple[int, float]]) -> List[Dict[str, Any]]:
+        blocks: Dict[int, List[bytes]] = {}
+        hits = []
+        for doc, score in ranked:
+            block = doc // _BLOCK_EVENTS
+            if block < len(self._blocks):
+                if block not in blocks:
+                    blocks[block] = zlib.decompress(self._blocks[block]).split(b"\n")
+                encoded = blocks[block][doc % _BLOCK_EVENTS]
+            else:
+                encoded = self._pending[doc % _BLOCK_EVENTS]
+            hits.append({
+                "query_id": self.queries[self._doc_query[doc]],
+                "row": self._doc_row[doc],
+                "score": round(score, 4),
+                "event": loads(encoded)
+            })
+        return hits
+
+    def _term(self, token: str) -> Optional[str]:
+        """
+        The indexed term a question token stands for, its singular if only that is indexed
+        """
+        if token in STOPWORDS:
+            return None
+        if token in self._postings:
+            return token
+        if len(token) > 3 and token.endswith("s") and token[:-1] in self._postings:
+            return token[:-1]
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            postings = sum(len(docs) for docs, _ in self._postings.values())
+            return {
+                "indexed_events": len(self._doc_row),
+                "stored_events": sum(self.rows.values()),
+                "terms": len(self._postings),
+                "postings": postings,
+                "index_bytes": len(self._doc_row) * 18 + postings * 8,
+                "stored_bytes": sum(map(len, self._blocks)) + sum(map(len, self._pending))
+            }
+
+    def to_bytes(self) -> bytes:
+        """
+        Serialized index: a JSON header with the queries and the term dictionary,
+        followed by the document arrays, the concatenated posting lists and the
+        blocks of stored events (the partial block last)
+        """
+        with self._lock:
+            terms = list(self._postings.items())
+            header = json.dumps({
+                "queries": self.queries,
+                "rows": self.rows,
+                "max_events": self.max_events,
+                "documents": len(self._doc_row),
+                "total_length": self._total_length,
+                "blocks": len(self._blocks) + 1,
+                "terms": [[term, len(docs)] for term, (docs, _) in terms]
+            }, ensure_ascii=False).encode("utf-8")
+            docs = array("I")
+            frequencies = array("f")
+            for _, (term_docs, term_frequencies) in terms:
+                docs.extend(term_docs)
+                frequencies.extend(term_frequencies)
+            blocks = self._blocks + [zlib.compress(b"\n".join(self._pending))]
+            block_lengths = array("I", map(len, blocks))
+            parts = [INDEX_MAGIC, _HEADER_LENGTH.pack(len(header)), header]
+            parts.extend(
+                values.tobytes()
+                for values in (self._doc_query, self._doc_row, self._doc_length, self._doc_time, docs, frequencies, block_lengths)
+            )
+            parts.extend(blocks)
+            return b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "EventIndex":
+        if data[:len(INDEX_MAGIC)] != INDEX_MAGIC:
+            raise ValueError("Not an event index")
+        position = len(INDEX_MAGIC) + _HEADER_LENGTH.size
+        (header_length,) = _HEADER_LENGTH.unpack_from(data, len(INDEX_MAGIC))
+        header = json.loads(data[position:position + header_length])
+        position += header_length
+        view = memoryview(data)
+
+        def read(typecode: str, count: int) -> array:
+            nonlocal position
+            values = array(typecode)
+            size = count * values.itemsize
+            values.frombytes(view[position:position + size])
+            position += size
+            return values
+
+        index = cls(header["max_events"])
+        index.queries = header["queries"]
+        index.rows = header["rows"]
+        index._total_length = header["total_length"]
+        documents = header["documents"]
+        index._doc_query = read("H", documents)
+        index._doc_row = read("I", documents)
+        index._doc_length = read("f", documents)
+        index._doc_time = read("d", documents)
+        total = sum(count for _, count in header["terms"])
+        docs, frequencies = read("I", total), read("f", total)
+        offset = 0
+        for term, count in header["terms"]:
+            index._postings[term] = (docs[offset:offset + count], frequencies[offset:offset + count])
+            offset += count
+        for length in read("I", header["blocks"]):
+            index._blocks.append(bytes(view[position:position + length]))
+            position += length
+        pending = zlib.decompress(index._blocks.pop())
+        index._pending = pending.split(b"\n") if documents % _BLOCK_EVENTS else []
+        return index
+
+    def _add(self, query_id: str, events: List[Dict[str, Any]]) -> None:
+        if query_id not in self.queries:
+            self.queries.append(query_id)
+            self.rows.setdefault(query_id, 0)
+        query = self.queries.index(query_id)
+        first_row = self.rows[query_id]
+        self.rows[query_id] = first_row + len(events)
+        room = max(0, self.max_events - len(self._doc_row))
+        if not room or not events:
+            return
+
+        postings = self._postings
+        # Tokens of each distinct value (host names, processes, event codes repeat across events)
+        memo: Dict[str, List[str]] = {}
+        entity_memo: Dict[Tuple[str, str], Set[str]] = {}
+        for offset, event in enumerate(events[:room]):
+            doc = len(self._doc_row)
+            fields = normalize_event(event)
+            plain: List[str] = []
+            boosted: List[Tuple[List[str], float]] = []
+            for name, values in fields.items():
+                name_tokens = memo.get(name)
+                if name_tokens is None:
+                    name_tokens = memo[name] = tokenize(name.replace("_", " "))
+                boosted.append((name_tokens, NAME_BOOST))
+                boost = FIELD_BOOSTS.get(name)
+                for value in values:
+                    tokens = memo.get(value)
+                    if tokens is None:
+                        tokens = tokenize(value)
+                        if len(memo) < _MEMO_SIZE:
+                            memo[value] = tokens
+                    if boost is None:
+                        plain.extend(tokens)
+                    else:
+                        boosted.append((tokens, boost))
+            # Counting the unboosted tokens in one call is most of the work per event
+            weights: Dict[str, float] = Counter(plain)
+            for tokens, boost in boosted:
+                for token in tokens:
+                    weights[token] += boost
+            length = sum(weights.values())
+            for name, names in (("host", HOST_FIELDS), ("user", USER_FIELDS)):
+                for value in field_values(fields, names):
+                    terms = entity_memo.get((name, value))
+                    if terms is None:
+                        terms = entity_memo[(name, value)] = _entity_terms(name, (value,))
+                    for term in terms:
+                        weights[term] = 1.0
+            for term, weight in weights.items():
+                entry = postings.get(term)
+                if entry is None:
+                    entry = postings[term] = (array("I"), array("f"))
+                entry[0].append(doc)
+                entry[1].append(weight)
+
+            time = event_time(event)
+            self._pending.append(dumps(event))
+            if len(self._pending) == _BLOCK_EVENTS:
+                self._blocks.append(zlib.compress(b"\n".join(self._pending)))
+                self._pending = []
+            self._doc_query.append(query)
+            self._doc_row.append(first_row + offset)
+            self._doc_length.append(length)
+            self._doc_time.append(math.nan if time is None else time)
+            self._total_length += length
+        self._norms = None
+
+    def _remove_query(self, query: int) -> None:
+        """
+        Drop the documents of a query and renumber the others
+        """
+        renumbered = array("i")
+        kept = 0
+        for doc_query in self._doc_query:
+            if doc_query == query:
+                renumbered.append(-1)
+            else:
+                renumbered.append(kept)
+                kept += 1
+        keep = [number >= 0 for number in renumbered]
+        stored = [line for block in self._blocks for line in zlib.decompress(block).split(b"\n")] + self._pending
+        stored = [encoded for encoded, kept_doc in zip(stored, keep) if kept_doc]
+        split = len(stored) - len(stored) % _BLOCK_EVENTS
+        self._blocks = [
+            zlib.compress(b"\n".join(stored[start:start + _BLOCK_EVENTS])) for start in range(0, split, _BLOCK_EVENTS)
+        ]
+        self._pending = stored[split:]
+        self._total_length -= sum(length for length, kept_doc in zip(self._doc_length, keep) if not kept_doc)
+        for name in ("_doc_query", "_doc_row", "_doc_length", "_doc_time"):
+            values = getattr(self, name)
+            setattr(self, name, array(values.typecode, (value for value, kept_doc in zip(values, keep) if kept_doc)))
+        for term in list(self._postings):
+            docs, frequencies = self._postings[term]
+            pairs = [(renumbered[doc], tf) for doc, tf in zip(docs, frequencies) if keep[doc]]
+            if pairs:
+                self._postings[term] = (array("I", (doc for doc, _ in pairs)), array("f", (tf for _, tf in pairs)))
+            else:
+                del self._postings[term]
+        self._norms = None
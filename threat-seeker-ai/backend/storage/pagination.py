@@ -0,0 +1,217 @@
+import base64
+import hashlib
+import json
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# field:value (equals), field!=value, field~value (case-insensitive contains), and comparisons
+FILTER_PATTERN = re.compile(r"^([\w.@-]+?)(>=|<=|!=|>|<|~|:)(.*)$")
+
+MAX_PAGE_SIZE = 1000
+
+
+class InvalidQueryError(ValueError):
+    """Raised for malformed filters, sort fields or cursors."""
+
+
+Filter = Tuple[str, str, str]
+
+
+def parse_filters(filters: Optional[Sequence[str]]) -> List[Filter]:
+    """
+    Parse filter expressions such as "host:DC01", "user~admin" or "event_code>=4624"
+    """
+    parsed = []
+    for expression in filters or []:
+        match = FILTER_PATTERN.match(expression)
+        if not match:
+            raise InvalidQueryError(f"Invalid filter expression: {expression}")
+        parsed.append((match.group(1), match.group(2), match.group(3)))
+    return parsed
+
+
+def parse_fields(fields: Optional[str]) -> Optional[List[str]]:
+    if not fields:
+        return None
+    return [field.strip() for field in fields.split(",") if field.strip()]
+
+
+def _coerce(value: Any, operand: str) -> Tuple[Any, Any]:
+    # Compare numerically when the event value is a number, as strings otherwise
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        try:
+            return value, float(operand)
+        except ValueError:
+            pass
+    return str(value), operand
+
+
+def matches(event: Dict[str, Any], filters: List[Filter]) -> bool:
+    for field, op, operand in filters:
+        value = event.get(field)
+        if op == "~":
+            if value is None or operand.lower() not in str(value).lower():
+                return False
+            continue
+        if value is None:
+            if op != "!=":
+                return False
+            continue
+        left, right = _coerce(value, operand)
+        if op == ":" and left != right:
+            return False
+        if op == "!=" and left == right:
+            return False
+        if op == ">" and not left > right:
+            return False
+        if op == "<" and not left < right:
+            return False
+        if op == ">=" and not left >= right:
+            return False
+        if op == "<=" and not left <= right:
+            return False
+    return True
+
+
+def sort_key(value: Any) -> Tuple[int, Any]:
+    """
+    Total order over mixed event values: numbers, then strings, then other values, then missing
+    """
+    if value is None:
+        return (3, "")
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return (0, value)
+    if isinstance(value, str):
+        return (1, value)
+    return (2, json.dumps(value, sort_keys=True, default=str))
+
+
+def project(event: Dict[str, Any], fields: Optional[List[str]]) -> Dict[str, Any]:
+    if fields is None:
+        return event
+    return {field: event[field] for field in fields if field in event}
+
+
+def _fingerprint(*parts: Any) -> str:
+    return hashlib.sha1(json.dumps(parts, default=str).encode("utf-8")).hexdigest()[:12]
+
+
+def encode_cursor(position: int, fingerprint: str) -> str:
+    raw = json.dumps({"p": position, "q": fingerprint}, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, fingerprint: str) -> int:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        data = json.loads(raw)
+        position = int(data["p"])
+    except (ValueError, KeyError, TypeError):
+        raise InvalidQueryError("Invalid cursor")
+    if data.get("q") != fingerprint:
+        raise InvalidQueryError("Cursor does not match the sort and filter of this request, or the events changed since")
+    return position
+
+
+class EventPaginator:
+    """
+    Cursor pagination over the stored events of one query.
+
+    A cursor is a position: the next row to scan for unsorted requests, or the
+    next index into the sorted ordering, which is computed once per (result,
+    query, version, sort, filter) and kept in a small LRU cache so following
+    pages do not sort again. The cache key includes the version of the stored
+    events, which scheduled runs change, and the cursor carries a fingerprint
+    of the key, sort and filters so it cannot be replayed against a different
+    ordering or against events that changed since.
+    """
+
+    def __init__(self, cache_size: int = 32):
+        self.cache_size = cache_size
+        self._orderings: "OrderedDict[Tuple[Any, ...], List[int]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def page(
+        self,
+        cache_key: Tuple[Any, ...],
+        load_events: Callable[[], Sequence[Dict[str, Any]]],
+        limit: int = 100,
+        cursor: Optional[str] = None,
+        sort: Optional[str] = None,
+        order: str = "asc",
+        filters: Optional[Sequence[str]] = None,
+        fields: Optional[str] = None,
+        scan: Optional[Callable[[int], Iterable[Tuple[int, Dict[str, Any]]]]] = None
+    ) -> Dict[str, Any]:
+        """
+        Return one page of events with the cursor of the next page
+
+        load_events returns every event of the query; scan, when given, yields
+        (row, event) pairs from a row onwards so unsorted pages can stop reading
+        as soon as they are full.
+        """
+        if order not in ("asc", "desc"):
+            raise InvalidQueryError("order must be 'asc' or 'desc'")
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        parsed_filters = parse_filters(filters)
+        projection = parse_fields(fields)
+        fingerprint = _fingerprint(cache_key, sort, order, parsed_filters)
+        position = decode_cursor(cursor, fingerprint) if cursor else 0
+
+        if sort:
+            events = load_events()
+            ordering = self._ordering(cache_key + (sort, order, tuple(parsed_filters)), events, sort, order, parsed_filters)
+            rows = ordering[position:position + limit]
+            next_position = position + len(rows)
+            # Read in storage order so chunked storage decodes each chunk at most once
+            fetched = {row: events[row] for row in sorted(rows)}
+            return {
+                "events": [project(fetched[row], projection) for row in rows],
+                "next_cursor": encode_cursor(next_position, fingerprint) if next_position < len(ordering) else None,
+                "total_matching": len(ordering)
+            }
+
+        if scan is None:
+            events = load_events()
+            scan = lambda start: ((row, events[row]) for row in range(start, len(events)))
+        page_events = []
+        next_position = None
+        for row, event in scan(position):
+            if not matches(event, parsed_filters):
+                continue
+            if len(page_events) == limit:
+                next_position = row
+                break
+            page_events.append(project(event, projection))
+        return {
+            "events": page_events,
+            "next_cursor": encode_cursor(next_position, fingerprint) if next_position is not None else None,
+            "total_matching": None
+        }
+
+    def _ordering(self, key: Tuple[Any, ...], events: Sequence[Dict[str, Any]], sort: str,
+                  order: str, filters: List[Filter]) -> List[int]:
+        with self._lock:
+            ordering = self._orderings.get(key)
+            if ordering is not None:
+                self._orderings.move_to_end(key)
+                return ordering
+
+        rows = [row for row, event in enumerate(events) if matches(event, filters)]
+        # Row number breaks ties so the ordering is deterministic across recomputation
+        rows.sort(key=lambda row: (sort_key(events[row].get(sort)), row), reverse=order == "desc")
+        with self._lock:
+            self._orderings[key] = rows
+            while len(self._orderings) > self.cache_size:
+                self._orderings.popitem(last=False)
+        return rows
+
+    def discard(self, prefix: Tuple[Any, ...]) -> None:
+        """
+        Drop the cached orderings whose cache key starts with prefix, e.g. (result_id,)
+        """
+        with self._lock:
+            for key in [key for key in self._orderings if key[:len(prefix)] == prefix]:
+                del self._orderings[key]
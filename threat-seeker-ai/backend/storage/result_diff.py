@@ -0,0 +1,333 @@
+import hashlib
+import heapq
+import itertools
+import json
+import struct
+import tempfile
+from array import array
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from utils.event_fields import ENTITY_FIELDS, select_fields
+from utils.serialization import orjson
+
+# Fields that identify an event regardless of its content (Splunk, Elasticsearch, Windows event logs)
+ID_FIELDS = ("_id", "_cd", "record_id", "EventRecordID", "winlog.record_id")
+# Fields that change between two retrievals of the same event
+VOLATILE_FIELDS = ("_serial", "_indextime", "_si", "_bkt", "_score")
+# Fields added to events after retrieval (threat intel tags), compared as content but not part of their identity
+ENRICHMENT_FIELDS = ("ioc_matches",)
+
+_RECORD = struct.Struct("<QQQ")
+# Records read back from a spilled run at a time
+_READ_RECORDS = 4096
+# Row numbers of entity records carry the index of their query in the high bits
+_ROW_BITS = 40
+
+
+def _digest(value: Any) -> int:
+    if orjson is not None:
+        encoded = orjson.dumps(value, default=str, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS)
+    else:
+        encoded = json.dumps(value, sort_keys=True, separators=(",", ":"), default=str).encode("utf-8")
+    return int.from_bytes(hashlib.blake2b(encoded, digest_size=8).digest(), "little")
+
+
+def fingerprint(event: Dict[str, Any]) -> Tuple[int, int]:
+    """
+    64-bit identity and content hashes of an event. The identity is its ID field
+    when it has one, else its non-numeric fields, so an aggregate row whose
+    counts moved keeps its identity and is reported as changed.
+    """
+    content = {k: v for k, v in event.items() if k not in VOLATILE_FIELDS}
+    for field in ID_FIELDS:
+        if content.get(field) is not None:
+            return _digest([field, content[field]]), _digest(content)
+    identity = {
+        k: v for k, v in content.items()
+        if (not isinstance(v, (int, float)) or isinstance(v, bool)) and k not in ENRICHMENT_FIELDS
+    }
+    return _digest(identity), _digest(content)
+
+
+def entity_values(event: Dict[str, Any], entity: str) -> List[str]:
+    """
+    Values of an entity (a key of ENTITY_FIELDS) in an event, flat or nested,
+    Splunk row or Elasticsearch hit
+    """
+    return select_fields(event, (entity,)).get(entity, [])
+
+
+class SortedRuns:
+    """
+    External sort of (key, value, row) triples of 64-bit integers: triples are
+    sorted in memory in runs of run_rows, spilled to temporary files, and read
+    back through a k-way merge, so diffing millions of rows holds at most one
+    run in memory.
+    """
+
+    def __init__(self, run_rows: int = 200000):
+        self.run_rows = run_rows
+        self._buffer: List[Tuple[int, int, int]] = []
+        self._runs: List[Any] = []
+
+    def add(self, key: int, value: int, row: int) -> None:
+        self._buffer.append((key, value, row))
+        if len(self._buffer) >= self.run_rows:
+            self._spill()
+
+    def __iter__(self) -> Iterator[Tuple[int, int, int]]:
+        self._buffer.sort()
+        return heapq.merge(*(self._read(run) for run in self._runs), iter(self._buffer))
+
+    def close(self) -> None:
+        for run in self._runs:
+            run.close()
+        self._runs = []
+        self._buffer = []
+
+    def __enter__(self) -> "SortedRuns":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+    def _spill(self) -> None:
+        self._buffer.sort()
+        run = tempfile.TemporaryFile()
+        for start in range(0, len(self._buffer), _READ_RECORDS):
+            run.write(b"".join(_RECORD.pack(*record) for record in self._buffer[start:start + _READ_RECORDS]))
+        self._runs.append(run)
+        self._buffer = []
+
+    @staticmethod
+    def _read(run: Any) -> Iterator[Tuple[int, int, int]]:
+        run.seek(0)
+        while True:
+            data = run.read(_RECORD.size * _READ_RECORDS)
+            if not data:
+                return
+            yield from _RECORD.iter_unpack(data)
+
+
+def _groups(records: Iterable[Tuple[int, int, int]]) -> Iterator[Tuple[int, List[Tuple[int, int, int]]]]:
+    for key, group in itertools.groupby(records, key=lambda record: record[0]):
+        yield key, list(group)
+
+
+def _merge_join(base: Iterable[Tuple[int, int, int]], target: Iterable[Tuple[int, int, int]]) -> Iterator[
+        Tuple[List[Tuple[int, int, int]], List[Tuple[int, int, int]]]]:
+    """
+    Records of both sides grouped by key, in key order
+    """
+    base_groups, target_groups = _groups(base), _groups(target)
+    b, t = next(base_groups, None), next(target_groups, None)
+    while b is not None or t is not None:
+        if t is None or (b is not None and b[0] < t[0]):
+            yield b[1], []
+            b = next(base_groups, None)
+        elif b is None or t[0] < b[0]:
+            yield [], t[1]
+            t = next(target_groups, None)
+        else:
+            yield b[1], t[1]
+            b, t = next(base_groups, None), next(target_groups, None)
+
+
+class QueryDiff:
+    """
+    Rows of one query added, removed and changed between two results. Rows are
+    matched by identity (fingerprint); rows with the same identity and content
+    are unchanged, and the rest of an identity's rows pair up as changed.
+    """
+
+    __slots__ = ("base_rows", "target_rows", "added", "removed", "changed_base", "changed_target", "unchanged")
+
+    def __init__(self):
+        self.base_rows = 0
+        self.target_rows = 0
+        self.added = array("q")
+        self.removed = array("q")
+        self.changed_base = array("q")
+        self.changed_target = array("q")
+        self.unchanged = 0
+
+    def delta_rows(self) -> List[int]:
+        """
+        Target rows added or changed, in their original order
+        """
+        return sorted(itertools.chain(self.added, self.changed_target))
+
+    def to_dict(self, base: Sequence[Dict[str, Any]], target: Sequence[Dict[str, Any]], limit: int) -> Dict[str, Any]:
+        changed = []
+        for before, after in itertools.islice(zip(self.changed_base, self.changed_target), limit):
+            old, new = base[before], target[after]
+            fields = sorted(f for f in set(old) | set(new) if old.get(f) != new.get(f) and f not in VOLATILE_FIELDS)
+            changed.append({"before": old, "after": new, "fields": fields})
+        return {
+            "base_rows": self.base_rows,
+            "target_rows": self.target_rows,
+            "added": len(self.added),
+            "removed": len(self.removed),
+            "changed": len(self.changed_target),
+            "unchanged": self.unchanged,
+            "samples": {
+                "added": [target[row] for row in sorted(self.added)[:limit]],
+                "removed": [base[row] for row in sorted(self.removed)[:limit]],
+                "changed": changed
+            }
+        }
+
+
+def diff_query(base: Sequence[Dict[str, Any]], target: Sequence[Dict[str, Any]], run_rows: int = 200000) -> QueryDiff:
+    """
+    Diff the rows of one query in two results
+    """
+    diff = QueryDiff()
+    with SortedRuns(run_rows) as base_runs, SortedRuns(run_rows) as target_runs:
+        for runs, rows in ((base_runs, base), (target_runs, target)):
+            for row, event in enumerate(rows):
+                runs.add(*fingerprint(event), row)
+        diff.base_rows, diff.target_rows = len(base), len(target)
+        for old, new in _merge_join(base_runs, target_runs):
+            # Both sides are sorted by content within an identity: match equal contents first
+            i = j = 0
+            left: List[int] = []
+            right: List[int] = []
+            while i < len(old) and j < len(new):
+                if old[i][1] == new[j][1]:
+                    diff.unchanged += 1
+                    i += 1
+                    j += 1
+                elif old[i][1] < new[j][1]:
+                    left.append(old[i][2])
+                    i += 1
+                else:
+                    right.append(new[j][2])
+                    j += 1
+            left.extend(record[2] for record in old[i:])
+            right.extend(record[2] for record in new[j:])
+            pairs = min(len(left), len(right))
+            diff.changed_base.extend(left[:pairs])
+            diff.changed_target.extend(right[:pairs])
+            diff.removed.extend(left[pairs:])
+            diff.added.extend(right[pairs:])
+    return diff
+
+
+def diff_entities(base: List[Sequence[Dict[str, Any]]], target: List[Sequence[Dict[str, Any]]], limit: int,
+                  run_rows: int = 200000) -> Dict[str, Dict[str, Any]]:
+    """
+    Entity values (hosts, users, command lines...) seen only in the base or only
+    in the target, over the rows of every query of each result
+    """
+    runs = {entity: (SortedRuns(run_rows), SortedRuns(run_rows)) for entity in ENTITY_FIELDS}
+    try:
+        for side, sources in enumerate((base, target)):
+            for source, rows in enumerate(sources):
+                for row, event in enumerate(rows):
+                    fields = select_fields(event, ENTITY_FIELDS)
+                    for entity in ENTITY_FIELDS:
+                        for value in fields.get(entity, ()):
+                            runs[entity][side].add(_digest(value), 0, source << _ROW_BITS | row)
+
+        report: Dict[str, Dict[str, Any]] = {}
+        for entity in ENTITY_FIELDS:
+            values: Dict[str, List[str]] = {"added": [], "removed": []}
+            counts = {"added": 0, "removed": 0}
+            for old, new in _merge_join(*runs[entity]):
+                if old and new:
+                    continue
+                side, sources = ("added", target) if new else ("removed", base)
+                counts[side] += 1
+                if len(values[side]) < limit:
+                    key, _, packed = (new or old)[0]
+                    event = sources[packed >> _ROW_BITS][packed & ((1 << _ROW_BITS) - 1)]
+                    values[side].append(next(v for v in entity_values(event, entity) if _digest(v) == key))
+            if counts["added"] or counts["removed"]:
+                report[entity] = dict(counts, added_values=sorted(values["added"]), removed_values=sorted(values["removed"]))
+        return report
+    finally:
+        for pair in runs.values():
+            for sorted_runs in pair:
+                sorted_runs.close()
+
+
+def match_queries(base: List[Dict[str, Any]], target: List[Dict[str, Any]]) -> List[Tuple[Optional[str], Optional[str]]]:
+    """
+    Pairs of (base, target) query IDs: by query ID, else by IR hash (the same logic
+    in another plan); queries only in one result pair with None
+    """
+    base_ids = [q["query_id"] for q in base]
+    by_hash = {q["ir_hash"]: q["query_id"] for q in base if q.get("ir_hash")}
+    pairs: List[Tuple[Optional[str], Optional[str]]] = []
+    matched = set()
+    for query in target:
+        query_id = query["query_id"]
+        if query_id in base_ids and query_id not in matched:
+            other: Optional[str] = query_id
+        else:
+            other = by_hash.get(query.get("ir_hash"))
+            if other in matched:
+                other = None
+        if other is not None:
+            matched.add(other)
+        pairs.append((other, query_id))
+    pairs.extend((query_id, None) for query_id in base_ids if query_id not in matched)
+    return pairs
+
+
+def compare_results(base: Dict[str, Any], target: Dict[str, Any], open_base: Any, open_target: Any,
+                    limit: int = 20, run_rows: int = 200000) -> Tuple[Dict[str, Any], Dict[str, QueryDiff]]:
+    """
+    Diff two hunt results (summaries without events), reading each query's rows
+    through open_base(query_id) and open_target(query_id), which return
+    sequences (lists or open ChunkedEvents). Returns the report and each target
+    query's QueryDiff.
+    """
+    base_queries = base["raw_results"].get("query_results") or []
+    target_queries = target["raw_results"].get("query_results") or []
+    queries: List[Dict[str, Any]] = []
+    diffs: Dict[str, QueryDiff] = {}
+    base_sources: List[Sequence[Dict[str, Any]]] = []
+    target_sources: List[Sequence[Dict[str, Any]]] = []
+    totals = {"added": 0, "removed": 0, "changed": 0, "unchanged": 0}
+    for base_id, target_id in match_queries(base_queries, target_queries):
+        old = open_base(base_id) if base_id is not None else None
+        new = open_target(target_id) if target_id is not None else None
+        old = old if old is not None else []
+        new = new if new is not None else []
+        diff = diff_query(old, new, run_rows)
+        report = diff.to_dict(old, new, limit)
+        report.update(base_query_id=base_id, query_id=target_id)
+        queries.append(report)
+        for key in totals:
+            totals[key] += report[key]
+        if target_id is not None:
+            diffs[target_id] = diff
+        base_sources.append(old)
+        target_sources.append(new)
+    entities = diff_entities(base_sources, target_sources, limit, run_rows)
+    report = {
+        "base_result_id": base["result_id"],
+        "result_id": target["result_id"],
+        "summary": totals,
+        "queries": queries,
+        "entities": entities
+    }
+    return report, diffs
+
+
+def delta_results(raw_results: Dict[str, Any], diffs: Dict[str, QueryDiff]) -> Dict[str, Any]:
+    """
+    Copy of a hunt's raw results keeping only the rows each query added or changed
+    """
+    query_results = []
+    for query_result in raw_results.get("query_results") or []:
+        diff = diffs.get(query_result["query_id"])
+        if diff is not None and query_result.get("status") == "success":
+            rows = query_result.get("results") or []
+            delta = [rows[row] for row in diff.delta_rows()]
+            query_result = dict(query_result, results=delta, result_count=len(delta))
+        query_results.append(query_result)
+    summary = dict(raw_results.get("summary") or {}, total_results=sum(r.get("result_count", 0) for r in query_results))
+    return dict(raw_results, query_results=query_results, summary=summary)
@@ -0,0 +1,343 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from config.settings import settings
+from storage.chunk_store import ChunkStore, ChunkedEvents
+from storage.event_index import EventIndex
+from storage.pagination import EventPaginator, parse_filters
+from storage.result_diff import QueryDiff, compare_results
+from storage.search_index import SearchIndex, get_search_index, remove_result
+
+# Setup logger
+logger = logging.getLogger(__name__)
+
+# Retrieval index file kept with each stored result
+EVENT_INDEX_FILE = "events.bm25"
+
+
+def strip_events(hunt_result: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Copy of a hunt result without the raw events, keeping each query's metadata and counts
+    """
+    raw_results = hunt_result.get("raw_results") or {}
+    query_results = [
+        {k: v for k, v in query_result.items() if k != "results"}
+        for query_result in raw_results.get("query_results") or []
+    ]
+    summary = dict(hunt_result)
+    summary["raw_results"] = dict(raw_results, query_results=query_results)
+    return summary
+
+
+def _time_bounds(filters: Optional[List[str]], time_field: str) -> Tuple[Any, Any]:
+    """
+    Lower and upper bounds on the time field implied by the filters, used to skip chunks
+    """
+    time_min = time_max = None
+    for field, op, operand in parse_filters(filters):
+        if field != time_field:
+            continue
+        if op in (">", ">="):
+            time_min = operand if time_min is None else max(time_min, operand)
+        elif op in ("<", "<="):
+            time_max = operand if time_max is None else min(time_max, operand)
+        elif op == ":":
+            time_min = time_max = operand
+    return time_min, time_max
+
+
+class ResultStore:
+    """
+    Persists hunt results to the chunk store and reads their events back page by
+    page, so past hunts can be reopened without holding their events in memory.
+    Only result summaries (analysis and per-query counts) and the retrieval
+    indexes of the most recently questioned results are cached in memory.
+    """
+
+    def __init__(self, chunk_store: ChunkStore, max_results: int = 50, summary_cache_size: int = 32,
+                 retrieval_max_events: int = 100000, index_cache_size: int = 4,
+                 search_index: Optional[SearchIndex] = None):
+        self.chunk_store = chunk_store
+        self.max_results = max_results
+        self.summary_cache_size = summary_cache_size
+        self.retrieval_max_events = retrieval_max_events
+        self.index_cache_size = index_cache_size
+        # Pruned results are removed from it
+        self.search_index = search_index
+        self._summaries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._indexes: "OrderedDict[str, EventIndex]" = OrderedDict()
+        # Per-result locks held while an index is built, so concurrent questions build it once
+        self._building: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self.paginator = EventPaginator()
+
+    def save(self, hunt_result: Dict[str, Any]) -> None:
+        """
+        Write a hunt result to disk (blocking: call from a worker thread)
+        """
+        summary = strip_events(hunt_result)
+        self.chunk_store.write_result(hunt_result, summary)
+        self._cache_summary(hunt_result["result_id"], summary)
+        # The retrieval index is built from the chunks by the first question about the result
+        self._prune()
+
+    def update(self, result_id: str, summary: Dict[str, Any], appended: Optional[Dict[str, List[Dict[str, Any]]]] = None,
+               replaced: Optional[Dict[str, List[Dict[str, Any]]]] = None) -> None:
+        """
+        Add a scheduled run to a stored result (blocking: call from a worker thread):
+        append new events to some queries, replace the events of others, and rewrite
+        the summary, which also makes the result the most recent one for pruning.
+        The result's retrieval index is updated with the same events.
+        """
+        for query_id, events in (appended or {}).items():
+            if events:
+                self.chunk_store.append_events(result_id, query_id, events)
+        for query_id, events in (replaced or {}).items():
+            self.chunk_store.replace_events(result_id, query_id, events)
+        self.chunk_store.write_meta(result_id, summary)
+        self._cache_summary(result_id, summary)
+        if appended or replaced:
+            # Their cache keys carry the old version of the events, which no request asks for again
+            self.paginator.discard((result_id,))
+            # Without a stored index there is nothing to update, the next retrieval builds it
+            index = self._load_index(result_id)
+            if index is not None:
+                for query_id, events in (appended or {}).items():
+                    index.add(query_id, events)
+                for query_id, events in (replaced or {}).items():
+                    index.replace(query_id, events)
+                self._save_index(result_id, index)
+
+    def get(self, result_id: str) -> Optional[Dict[str, Any]]:
+        """
+        The stored hunt result without its events
+        """
+        summary = self._summaries.get(result_id)
+        if summary is None:
+            summary = self.chunk_store.read_meta(result_id)
+            if summary is not None:
+                self._cache_summary(result_id, summary)
+        return summary
+
+    def list_results(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """
+        Most recent stored results, for hunt history
+        """
+        results = []
+        for result_id in self.chunk_store.result_ids()[:limit]:
+            summary = self.get(result_id)
+            if summary is None:
+                continue
+            analysis = summary.get("analysis") or {}
+            query_results = summary["raw_results"].get("query_results") or []
+            results.append({
+                "result_id": result_id,
+                "plan_id": summary.get("plan_id"),
+                "created_at": summary.get("created_at"),
+                "total_queries": len(query_results),
+                "total_events": sum(q.get("result_count", 0) for q in query_results),
+                "findings": len(analysis.get("findings") or [])
+            })
+        return results
+
+    def previous_result(self, plan_id: str, before: Optional[str] = None) -> Optional[str]:
+        """
+        ID of the most recent stored result of a plan, or of the most recent one older than result before
+        """
+        result_ids = self.chunk_store.result_ids()
+        if before is not None:
+            result_ids = result_ids[result_ids.index(before) + 1:] if before in result_ids else []
+        for result_id in result_ids:
+            summary = self.get(result_id)
+            if summary is not None and summary.get("plan_id") == plan_id:
+                return result_id
+        return None
+
+    def diff(self, base_id: str, target: Union[str, Dict[str, Any]], limit: int = 20,
+             run_rows: int = 200000) -> Optional[Tuple[Dict[str, Any], Dict[str, QueryDiff]]]:
+        """
+        Diff a stored result against a later one (blocking: call from a worker
+        thread). target is a stored result's ID, or a hunt result with its
+        events that is not stored yet. None when a result is missing.
+        """
+        base = self.get(base_id)
+        if isinstance(target, str):
+            target_summary = self.get(target)
+            target_events = None
+        else:
+            target_summary = target
+            target_events = {q["query_id"]: q.get("results") or [] for q in target["raw_results"].get("query_results") or []}
+        if base is None or target_summary is None:
+            return None
+
+        opened: List[ChunkedEvents] = []
+
+        def open_stored(result_id: str, query_id: str) -> Optional[ChunkedEvents]:
+            events = self.open_events(result_id, query_id)
+            if events is not None:
+                opened.append(events)
+            return events
+
+        try:
+            return compare_results(
+                base, target_summary,
+                lambda query_id: open_stored(base_id, query_id),
+                lambda query_id: open_stored(target, query_id) if target_events is None else target_events.get(query_id),
+                limit=limit, run_rows=run_rows
+            )
+        finally:
+            for events in opened:
+                events.close()
+
+    def open_events(self, result_id: str, query_id: str) -> Optional[ChunkedEvents]:
+        return self.chunk_store.open_events(result_id, query_id)
+
+    def retrieve(self, result_id: str, question: str, limit: int = 20, host: Optional[str] = None,
+                 user: Optional[str] = None, start: Optional[float] = None,
+                 end: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """
+        The stored events that best answer a question, ranked by BM25 (blocking:
+        call from a worker thread); see EventIndex.search for the filters. None
+        when the result is not stored.
+        """
+        started = time.perf_counter()
+        index = self.event_index(result_id)
+        if index is None:
+            return None
+        hits, total = index.search(question, limit, host=host, user=user, start=start, end=end)
+        return {
+            "result_id": result_id,
+            "total": total,
+            "indexed_events": len(index),
+            "events": hits,
+            "took_ms": round((time.perf_counter() - started) * 1000, 3)
+        }
+
+    def event_index(self, result_id: str) -> Optional[EventIndex]:
+        """
+        A stored result's retrieval index, built from its stored events and saved
+        the first time it is needed, so results nobody asks about are never indexed
+        """
+        index = self._load_index(result_id)
+        if index is not None:
+            return index
+        with self._lock:
+            building = self._building.setdefault(result_id, threading.Lock())
+        with building:
+            try:
+                # Built by the question this one waited for
+                index = self._load_index(result_id)
+                return index if index is not None else self._build_index(result_id)
+            finally:
+                with self._lock:
+                    self._building.pop(result_id, None)
+
+    def _build_index(self, result_id: str) -> Optional[EventIndex]:
+        summary = self.get(result_id)
+        if summary is None:
+            return None
+        start = time.perf_counter()
+        index = EventIndex(self.retrieval_max_events)
+        for query_result in summary["raw_results"].get("query_results") or []:
+            query_id = query_result.get("query_id", "")
+            stored = self.open_events(result_id, query_id)
+            if stored is None:
+                continue
+            with stored:
+                batch: List[Dict[str, Any]] = []
+                for event in stored:
+                    batch.append(event)
+                    if len(batch) == self.chunk_store.chunk_rows:
+                        index.add(query_id, batch)
+                        batch = []
+                index.add(query_id, batch)
+        self._save_index(result_id, index)
+        logger.info(f"Built the retrieval index of hunt result {result_id} ({len(index)} events) in {time.perf_counter() - start:.2f}s")
+        return index
+
+    def page(self, result_id: str, query_id: str, **options: Any) -> Optional[Dict[str, Any]]:
+        """
+        One page of a query's events; see EventPaginator.page for the options
+        """
+        events = self.open_events(result_id, query_id)
+        if events is None:
+            return None
+        with events:
+            time_min, time_max = _time_bounds(options.get("filters"), self.chunk_store.time_field)
+            page = self.paginator.page(
+                (result_id, query_id, events.version),
+                lambda: events,
+                scan=lambda start: events.scan(start, time_min, time_max),
+                **options
+            )
+            page.update(result_id=result_id, query_id=query_id, total_events=len(events))
+        return page
+
+    def _cache_summary(self, result_id: str, summary: Dict[str, Any]) -> None:
+        with self._lock:
+            self._summaries[result_id] = summary
+            self._summaries.move_to_end(result_id)
+            while len(self._summaries) > self.summary_cache_size:
+                self._summaries.popitem(last=False)
+
+    def _load_index(self, result_id: str) -> Optional[EventIndex]:
+        with self._lock:
+            index = self._indexes.get(result_id)
+            if index is not None:
+                self._indexes.move_to_end(result_id)
+                return index
+        data = self.chunk_store.read_file(result_id, EVENT_INDEX_FILE)
+        if data is None:
+            return None
+        try:
+            index = EventIndex.from_bytes(data)
+        except ValueError as e:
+            logger.warning(f"Ignoring unreadable retrieval index of hunt result {result_id}: {str(e)}")
+            return None
+        self._cache_index(result_id, index)
+        return index
+
+    def _save_index(self, result_id: str, index: EventIndex) -> None:
+        if self.chunk_store.write_file(result_id, EVENT_INDEX_FILE, index.to_bytes()):
+            self._cache_index(result_id, index)
+
+    def _cache_index(self, result_id: str, index: EventIndex) -> None:
+        with self._lock:
+            self._indexes[result_id] = index
+            self._indexes.move_to_end(result_id)
+            while len(self._indexes) > self.index_cache_size:
+                self._indexes.popitem(last=False)
+
+    def _prune(self) -> None:
+        for result_id in self.chunk_store.result_ids()[self.max_results:]:
+            self.chunk_store.delete(result_id)
+            with self._lock:
+                self._summaries.pop(result_id, None)
+                self._indexes.pop(result_id, None)
+            self.paginator.discard((result_id,))
+            if self.search_index is not None:
+                remove_result(self.search_index, result_id)
+            logger.info(f"Removed hunt result {result_id} from the result store")
+
+
+_result_store: Optional[ResultStore] = None
+
+
+def get_result_store() -> ResultStore:
+    """
+    Return the shared result store
+    """
+    global _result_store
+    if _result_store is None:
+        chunk_store = ChunkStore(settings.RESULT_STORE_PATH, chunk_rows=settings.RESULT_CHUNK_ROWS)
+        _result_store = ResultStore(
+            chunk_store,
+            max_results=settings.RESULT_STORE_MAX_RESULTS,
+            retrieval_max_events=settings.RETRIEVAL_MAX_EVENTS,
+            index_cache_size=settings.RETRIEVAL_INDEX_CACHE_SIZE,
+            search_index=get_search_index()
+        )
+    return _result_store
@@ -0,0 +1,488 @@
+import json
+import logging
+import math
+import os
+import re
+import tempfile
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import Counter, defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from config.settings import settings
+from utils.event_fields import HOST_FIELDS, USER_FIELDS, field_values, select_fields
+
+# Setup logger
+logger = logging.getLogger(__name__)
+
+# Words, and dotted/dashed identifiers such as T1003.006, wmiprvse.exe or 10.0.0.5
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[._-][a-z0-9]+)*")
+
+# Per-field term frequency multipliers
+FIELD_BOOSTS = {
+    "title": 3.0,
+    "hypothesis": 3.0,
+    "techniques": 2.5,
+    "hosts": 2.0,
+    "users": 2.0,
+    "description": 1.0,
+    "query_string": 1.0
+}
+
+FACETS = ("type", "technique", "host", "user", "data_source", "severity")
+
+# BM25 parameters
+_K1 = 1.2
+_B = 0.75
+
+# Replayed log entries per live document above which the log is compacted at startup
+_COMPACT_RATIO = 2
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercase tokens; compound tokens (T1003.006, wmiprvse.exe) also yield their parts
+    """
+    tokens = []
+    for token in _TOKEN_PATTERN.findall(text.lower()):
+        tokens.append(token)
+        if any(sep in token for sep in "._-"):
+            tokens.extend(part for part in re.split(r"[._-]", token) if part)
+    return tokens
+
+
+class SearchIndex:
+    """
+    Embedded inverted index over hunt plans, findings and results.
+
+    Documents are added (or replaced) incrementally. Queries are ranked with BM25
+    using per-field boosts; the last query term, and any term ending in '*', match
+    as prefixes through a sorted term dictionary. Facet counts are computed over
+    all matching documents. Every update and removal is appended to a log on
+    disk that is replayed at startup, and tailed before each search so that
+    updates made by other API workers sharing the log become visible. When most
+    replayed entries were superseded or removed, the log is rewritten with the
+    live documents only; workers tailing it notice the new file and replay it.
+    """
+
+    def __init__(self, log_path: Optional[str] = None):
+        self.log_path = log_path
+        self._postings: Dict[str, Dict[str, float]] = defaultdict(dict)
+        self._terms: List[str] = []
+        self._doc_terms: Dict[str, Set[str]] = {}
+        self._doc_lengths: Dict[str, float] = {}
+        self._docs: Dict[str, Dict[str, Any]] = {}
+        self._total_length = 0.0
+        # Insertion order, used to rank equally scored documents newest first
+        self._seq = 0
+        self._lock = threading.Lock()
+        # Bytes of the log already indexed, and the inode of the log file they were read from
+        self._log_offset = 0
+        self._log_inode: Optional[int] = None
+
+        if log_path and os.path.isfile(log_path):
+            start = time.perf_counter()
+            entries = self.refresh()
+            logger.info(f"Search index loaded {len(self._docs)} documents in {time.perf_counter() - start:.2f}s")
+            if entries > _COMPACT_RATIO * len(self._docs):
+                self.compact()
+
+    def add(self, doc_id: str, doc_type: str, fields: Dict[str, Any],
+            facets: Optional[Dict[str, Iterable[str]]] = None,
+            display: Optional[Dict[str, Any]] = None) -> None:
+        """
+        Index a document, replacing any previous version with the same ID
+
+        fields maps field names (see FIELD_BOOSTS) to text or lists of values, facets
+        maps facet names to values, and display is returned with search hits.
+        """
+        doc = {
+            "id": doc_id,
+            "type": doc_type,
+            "fields": {name: value for name, value in fields.items() if value},
+            "facets": {name: sorted({str(v) for v in values if v}) for name, values in (facets or {}).items()},
+            "display": display or {}
+        }
+        with self._lock:
+            self._index(doc)
+            self._log([doc])
+
+    def remove(self, doc_ids: Iterable[str]) -> None:
+        """
+        Remove documents, here and (through the log) in the other workers
+        """
+        doc_ids = list(doc_ids)
+        with self._lock:
+            for doc_id in doc_ids:
+                self._remove(doc_id)
+            self._log([{"id": doc_id, "removed": True} for doc_id in doc_ids])
+
+    def doc_ids(self, prefix: str = "") -> List[str]:
+        with self._lock:
+            return [doc_id for doc_id in self._docs if doc_id.startswith(prefix)]
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def search(self, query: str, filters: Optional[Dict[str, str]] = None, limit: int = 20,
+               match_all: bool = True) -> Dict[str, Any]:
+        """
+        Ranked documents matching every query term (or any, with match_all=False),
+        with facet counts
+        """
+        start = time.perf_counter()
+        self.refresh()
+        filters = {k: v for k, v in (filters or {}).items() if v}
+        # Whole tokens only (T1003.006 must not match T1003.001 through "t1003")
+        query_terms = []
+        for raw_term in query.lower().split():
+            tokens = _TOKEN_PATTERN.findall(raw_term)
+            query_terms.extend((token, raw_term.endswith("*")) for token in tokens)
+        if query_terms:
+            query_terms[-1] = (query_terms[-1][0], True)
+
+        with self._lock:
+            expanded = [self._expand(token, prefix) for token, prefix in query_terms]
+            if match_all:
+                # Most selective terms first, so later terms only score surviving documents
+                expanded.sort(key=lambda terms: sum(len(self._postings.get(t, ())) for t in terms))
+
+            candidates: Optional[Set[str]] = None
+            scores: Dict[str, float] = defaultdict(float)
+            for terms in expanded:
+                restrict = candidates if match_all else None
+                term_scores: Dict[str, float] = {}
+                for term in terms:
+                    for doc_id, score in self._score_term(term, restrict).items():
+                        if score > term_scores.get(doc_id, 0.0):
+                            term_scores[doc_id] = score
+                matched = set(term_scores)
+                if candidates is None:
+                    candidates = matched
+                else:
+                    candidates = candidates & matched if match_all else candidates | matched
+                for doc_id, score in term_scores.items():
+                    scores[doc_id] += score
+
+            if candidates is None:
+                # No query text: browse by facets, newest first
+                candidates = set(self._docs)
+            candidates = {doc_id for doc_id in candidates if self._passes(doc_id, filters)}
+
+            facets = {name: Counter() for name in FACETS}
+            for doc_id in candidates:
+                doc = self._docs[doc_id]
+                facets["type"][doc["type"]] += 1
+                for name, values in doc["facets"].items():
+                    if name in facets:
+                        facets[name].update(values)
+
+            ranked = sorted(candidates, key=lambda d: (-scores.get(d, 0.0), -self._docs[d]["seq"]))[:limit]
+            hits = [
+                {
+                    "id": doc_id,
+                    "type": self._docs[doc_id]["type"],
+                    "score": round(scores.get(doc_id, 0.0), 4),
+                    **self._docs[doc_id]["display"]
+                }
+                for doc_id in ranked
+            ]
+
+        return {
+            "query": query,
+            "total": len(candidates),
+            "results": hits,
+            "facets": {name: dict(counts.most_common(20)) for name, counts in facets.items() if counts},
+            "took_ms": round((time.perf_counter() - start) * 1000, 3)
+        }
+
+    def _index(self, doc: Dict[str, Any]) -> None:
+        doc_id = doc["id"]
+        if doc_id in self._docs:
+            self._remove(doc_id)
+
+        term_weights: Dict[str, float] = defaultdict(float)
+        for name, value in doc["fields"].items():
+            text = " ".join(map(str, value)) if isinstance(value, (list, tuple, set)) else str(value)
+            boost = FIELD_BOOSTS.get(name, 1.0)
+            for token in tokenize(text):
+                term_weights[token] += boost
+
+        for term, weight in term_weights.items():
+            postings = self._postings[term]
+            if not postings:
+                insort(self._terms, term)
+            postings[doc_id] = weight
+        length = sum(term_weights.values())
+        self._doc_terms[doc_id] = set(term_weights)
+        self._doc_lengths[doc_id] = length
+        self._total_length += length
+        self._seq += 1
+        doc["seq"] = self._seq
+        self._docs[doc_id] = doc
+
+    def _remove(self, doc_id: str) -> None:
+        for term in self._doc_terms.pop(doc_id, set()):
+            postings = self._postings.get(term)
+            if postings is None:
+                continue
+            postings.pop(doc_id, None)
+            if not postings:
+                del self._postings[term]
+                i = bisect_left(self._terms, term)
+                if i < len(self._terms) and self._terms[i] == term:
+                    self._terms.pop(i)
+        self._total_length -= self._doc_lengths.pop(doc_id, 0.0)
+        self._docs.pop(doc_id, None)
+
+    def _reset(self) -> None:
+        self._postings.clear()
+        self._terms.clear()
+        self._doc_terms.clear()
+        self._doc_lengths.clear()
+        self._docs.clear()
+        self._total_length = 0.0
+        self._log_offset = 0
+
+    def _expand(self, token: str, prefix: bool) -> List[str]:
+        if not prefix:
+            return [token] if token in self._postings else []
+        terms = []
+        i = bisect_left(self._terms, token)
+        while i < len(self._terms) and self._terms[i].startswith(token):
+            terms.append(self._terms[i])
+            i += 1
+        return terms
+
+    def _score_term(self, term: str, restrict: Optional[Set[str]] = None) -> Dict[str, float]:
+        postings = self._postings.get(term, {})
+        doc_count = len(self._docs)
+        idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+        avg_length = self._total_length / doc_count if doc_count else 1.0
+        if restrict is not None:
+            # Walk whichever side is smaller
+            if len(restrict) < len(postings):
+                items = [(doc_id, postings[doc_id]) for doc_id in restrict if doc_id in postings]
+            else:
+                items = [(doc_id, tf) for doc_id, tf in postings.items() if doc_id in restrict]
+        else:
+            items = postings.items()
+        lengths = self._doc_lengths
+        return {
+            doc_id: idf * tf * (_K1 + 1) / (tf + _K1 * (1 - _B + _B * lengths[doc_id] / avg_length))
+            for doc_id, tf in items
+        }
+
+    def _passes(self, doc_id: str, filters: Dict[str, str]) -> bool:
+        doc = self._docs[doc_id]
+        for name, value in filters.items():
+            if name == "type":
+                if doc["type"] != value:
+                    return False
+            elif value.lower() not in (v.lower() for v in doc["facets"].get(name, [])):
+                return False
+        return True
+
+    def _log(self, entries: List[Dict[str, Any]]) -> None:
+        """
+        Append entries already indexed here to the log. Callers hold the lock.
+        """
+        if not self.log_path or not entries:
+            return
+        lines = "".join(json.dumps({k: v for k, v in entry.items() if k != "seq"}, default=str) + "\n" for entry in entries)
+        data = lines.encode("utf-8")
+        try:
+            directory = os.path.dirname(self.log_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.log_path, "ab") as f:
+                f.write(data)
+                end = f.tell()
+                inode = os.fstat(f.fileno()).st_ino
+        except OSError as e:
+            logger.warning(f"Could not append to search index log {self.log_path}: {str(e)}")
+            return
+        # Unless other workers' entries came first, the next refresh starts after these
+        if end - len(data) == self._log_offset and self._log_inode in (None, inode):
+            self._log_offset = end
+            self._log_inode = inode
+
+    def compact(self) -> None:
+        """
+        Rewrite the log with the live documents only, oldest first
+        """
+        if not self.log_path:
+            return
+        with self._lock:
+            docs = sorted(self._docs.values(), key=lambda doc: doc["seq"])
+            directory = os.path.dirname(self.log_path) or "."
+            try:
+                fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".search-index-")
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    for doc in docs:
+                        f.write(json.dumps({k: v for k, v in doc.items() if k != "seq"}, default=str) + "\n")
+                # Entries another worker appended meanwhile would be lost: leave the log to a later startup
+                stat = os.stat(self.log_path)
+                if stat.st_size != self._log_offset or stat.st_ino != self._log_inode:
+                    os.remove(tmp_path)
+                    return
+                os.replace(tmp_path, self.log_path)
+                stat = os.stat(self.log_path)
+            except OSError as e:
+                logger.warning(f"Could not compact search index log {self.log_path}: {str(e)}")
+                return
+            self._log_offset = stat.st_size
+            self._log_inode = stat.st_ino
+        logger.info(f"Compacted search index log {self.log_path} to {len(docs)} documents")
+
+    def refresh(self) -> int:
+        """
+        Index the log entries appended since the last read (by this or another
+        worker) and return how many there were
+        """
+        if not self.log_path:
+            return 0
+        try:
+            stat = os.stat(self.log_path)
+        except OSError:
+            return 0
+        if stat.st_ino == self._log_inode and stat.st_size <= self._log_offset:
+            return 0
+
+        count = 0
+        with self._lock:
+            with open(self.log_path, "rb") as f:
+                stat = os.fstat(f.fileno())
+                if stat.st_ino != self._log_inode:
+                    # A new (compacted) log: replay it from the start
+                    self._reset()
+                    self._log_inode = stat.st_ino
+                f.seek(self._log_offset)
+                data = f.read(stat.st_size - self._log_offset)
+            # A line without its newline is still being written
+            end = data.rfind(b"\n") + 1
+            for line in data[:end].splitlines():
+                try:
+                    entry = json.loads(line)
+                    if entry.get("removed"):
+                        self._remove(entry["id"])
+                    else:
+                        self._index(entry)
+                    count += 1
+                except (json.JSONDecodeError, KeyError, AttributeError):
+                    logger.warning(f"Skipping malformed search index log entry in {self.log_path}")
+            self._log_offset += end
+        return count
+
+
+def index_plan(index: SearchIndex, plan: Dict[str, Any]) -> None:
+    """
+    Index a hunt plan's hypothesis, queries and techniques
+    """
+    queries = plan.get("queries") or []
+    techniques = sorted({t for q in queries for t in q.get("technique_ids") or []})
+    index.add(
+        f"plan:{plan['plan_id']}",
+        "plan",
+        fields={
+            "hypothesis": plan.get("hypothesis", ""),
+            "query_string": [q.get("query_string", "") for q in queries],
+            "description": [q.get("explanation", "") for q in queries],
+            "techniques": techniques
+        },
+        facets={
+            "technique": techniques,
+            "data_source": [q.get("data_source", "") for q in queries]
+        },
+        display={
+            "plan_id": plan["plan_id"],
+            "title": plan.get("hypothesis", ""),
+            "created_at": str(plan.get("created_at", "")),
+            "analyst_id": plan.get("analyst_id")
+        }
+    )
+
+
+def index_result(index: SearchIndex, hunt_result: Dict[str, Any], max_entities: int = 500) -> None:
+    """
+    Index a hunt result (hosts and users seen in its events) and each of its findings
+    """
+    result_id = hunt_result["result_id"]
+    plan_id = hunt_result.get("plan_id")
+    analysis = hunt_result.get("analysis") or {}
+
+    hosts: Set[str] = set()
+    users: Set[str] = set()
+    for query_result in (hunt_result.get("raw_results") or {}).get("query_results") or []:
+        for event in query_result.get("results") or []:
+            if len(hosts) >= max_entities and len(users) >= max_entities:
+                break
+            fields = select_fields(event, HOST_FIELDS + USER_FIELDS)
+            if len(hosts) < max_entities:
+                hosts.update(field_values(fields, HOST_FIELDS))
+            if len(users) < max_entities:
+                users.update(field_values(fields, USER_FIELDS))
+
+    findings = analysis.get("findings") or []
+    techniques = sorted({t for finding in findings for t in finding.get("techniques") or []})
+    index.add(
+        f"result:{result_id}",
+        "result",
+        fields={"hosts": sorted(hosts), "users": sorted(users), "techniques": techniques},
+        facets={"host": hosts, "user": users, "technique": techniques},
+        display={"result_id": result_id, "plan_id": plan_id, "title": f"Hunt result {result_id}",
+                 "created_at": str(hunt_result.get("created_at", ""))}
+    )
+
+    for finding in findings:
+        details = finding.get("details") or {}
+        fields = select_fields(details, HOST_FIELDS + USER_FIELDS) if isinstance(details, dict) else {}
+        finding_hosts = list(finding.get("affected_hosts") or []) + field_values(fields, HOST_FIELDS)
+        finding_users = field_values(fields, USER_FIELDS)
+        index.add(
+            f"finding:{result_id}:{finding.get('id')}",
+            "finding",
+            fields={
+                "title": finding.get("title", ""),
+                "description": finding.get("description", ""),
+                "techniques": finding.get("techniques") or [],
+                "hosts": finding_hosts,
+                "users": finding_users
+            },
+            facets={
+                "technique": finding.get("techniques") or [],
+                "host": finding_hosts,
+                "user": finding_users,
+                "severity": [finding.get("severity", "")]
+            },
+            display={
+                "result_id": result_id,
+                "plan_id": plan_id,
+                "finding_id": finding.get("id"),
+                "title": finding.get("title", ""),
+                "severity": finding.get("severity"),
+                "confidence": finding.get("confidence")
+            }
+        )
+
+
+def remove_result(index: SearchIndex, result_id: str) -> None:
+    """
+    Remove a hunt result and its findings, e.g. once it is pruned from the result store
+    """
+    index.refresh()
+    index.remove([f"result:{result_id}"] + index.doc_ids(f"finding:{result_id}:"))
+
+
+_search_index: Optional[SearchIndex] = None
+
+
+def get_search_index() -> SearchIndex:
+    """
+    Return the shared search index, replaying its log on first use
+    """
+    global _search_index
+    if _search_index is None:
+        _search_index = SearchIndex(settings.SEARCH_INDEX_PATH or None)
+    return _search_index
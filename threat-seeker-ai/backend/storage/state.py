@@ -0,0 +1,327 @@
+import logging
+import os
+from abc import ABC, abstractmethod
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from config.settings import settings
+from utils.serialization import dumps, loads
+
+# Setup logger
+logger = logging.getLogger(__name__)
+
+# Namespaces used by the API
+PLANS = "plans"
+JOBS = "jobs"
+CACHE = "cache"
+RATE_LIMITS = "rate_limits"
+SCHEDULES = "schedules"
+DETECTION_RULES = "detection_rules"
+PROGRESS = "progress"
+
+PLAN_TTL_SECONDS = 7 * 24 * 3600
+JOB_TTL_SECONDS = 24 * 3600
+
+
+class StateBackend(ABC):
+    """
+    Key-value store for state that every API worker must see the same way: hunt
+    plans, hunt job status, shared caches and rate-limit buckets.
+
+    Keys live in namespaces and may expire. Values are JSON-encoded, so a value
+    reads back the same from every backend. All methods block; call them from a
+    worker thread (run_in_thread) on the request path.
+    """
+
+    @abstractmethod
+    def get(self, namespace: str, key: str) -> Optional[Any]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def set(self, namespace: str, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def set_if_absent(self, namespace: str, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        """
+        Set the key only if it is missing or expired; True when it was set. Used as
+        a lease so that only one worker runs a job such as a cache refresh.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete(self, namespace: str, key: str) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def items(self, namespace: str) -> List[Tuple[str, Any]]:
+        raise NotImplementedError
+
+    def update(self, namespace: str, key: str, fields: Dict[str, Any], ttl: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Merge fields into a dictionary value and return the result
+        """
+        value = dict(self.get(namespace, key) or {})
+        value.update(fields)
+        self.set(namespace, key, value, ttl)
+        return value
+
+    @abstractmethod
+    def take_token(self, bucket: str, rate: float, capacity: float, cost: float = 1.0) -> Tuple[bool, float]:
+        """
+        Take cost tokens from a token bucket refilled at rate tokens per second.
+        Returns whether the tokens were taken and, if not, the seconds until they are.
+        """
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+    @staticmethod
+    def _refill(state: Optional[Dict[str, float]], now: float, rate: float, capacity: float,
+                cost: float) -> Tuple[Dict[str, float], bool, float]:
+        tokens = capacity
+        if state is not None:
+            tokens = min(capacity, state["tokens"] + (now - state["updated"]) * rate)
+        if tokens >= cost:
+            return {"tokens": tokens - cost, "updated": now}, True, 0.0
+        retry_after = (cost - tokens) / rate if rate > 0 else float("inf")
+        return {"tokens": tokens, "updated": now}, False, retry_after
+
+
+class MemoryStateBackend(StateBackend):
+    """
+    State held in this process; correct only when the API runs a single worker
+    """
+
+    def __init__(self):
+        self._data: Dict[Tuple[str, str], Tuple[bytes, Optional[float]]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, namespace: str, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._live((namespace, key), time.time())
+        return loads(entry[0]) if entry is not None else None
+
+    def set(self, namespace: str, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        data = dumps(value)
+        with self._lock:
+            self._data[(namespace, key)] = (data, _expiry(ttl))
+
+    def set_if_absent(self, namespace: str, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        data = dumps(value)
+        with self._lock:
+            if self._live((namespace, key), time.time()) is not None:
+                return False
+            self._data[(namespace, key)] = (data, _expiry(ttl))
+            return True
+
+    def delete(self, namespace: str, key: str) -> None:
+        with self._lock:
+            self._data.pop((namespace, key), None)
+
+    def items(self, namespace: str) -> List[Tuple[str, Any]]:
+        now = time.time()
+        with self._lock:
+            entries = [
+                (key, data) for (ns, key), (data, expires_at) in self._data.items()
+                if ns == namespace and (expires_at is None or expires_at > now)
+            ]
+        return [(key, loads(data)) for key, data in entries]
+
+    def update(self, namespace: str, key: str, fields: Dict[str, Any], ttl: Optional[float] = None) -> Dict[str, Any]:
+        with self._lock:
+            entry = self._live((namespace, key), time.time())
+            value = dict(loads(entry[0]) if entry is not None else {})
+            value.update(fields)
+            self._data[(namespace, key)] = (dumps(value), _expiry(ttl))
+        return value
+
+    def take_token(self, bucket: str, rate: float, capacity: float, cost: float = 1.0) -> Tuple[bool, float]:
+        now = time.time()
+        with self._lock:
+            entry = self._live((RATE_LIMITS, bucket), now)
+            state, allowed, retry_after = self._refill(
+                loads(entry[0]) if entry is not None else None, now, rate, capacity, cost
+            )
+            self._data[(RATE_LIMITS, bucket)] = (dumps(state), _bucket_expiry(now, rate, capacity))
+        return allowed, retry_after
+
+    def _live(self, key: Tuple[str, str], now: float) -> Optional[Tuple[bytes, Optional[float]]]:
+        entry = self._data.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= now:
+            del self._data[key]
+            return None
+        return entry
+
+
+class SQLiteStateBackend(StateBackend):
+    """
+    State shared by every worker on a host through a SQLite database in WAL mode.
+    WAL coordinates processes through shared memory next to the database, so the
+    database must be on a local disk, and workers on other hosts cannot share it.
+
+    WAL lets readers proceed while a writer commits, and each read-modify-write
+    (leases, merged updates, token buckets) runs in a BEGIN IMMEDIATE transaction,
+    so concurrent workers serialize on the write lock instead of losing updates.
+    Each thread keeps its own connection.
+    """
+
+    # Expired rows are purged once every this many writes
+    PURGE_EVERY = 500
+
+    def __init__(self, path: str, busy_timeout: float = 5.0):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        self._writes = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS state ("
+            "namespace TEXT NOT NULL, key TEXT NOT NULL, value BLOB NOT NULL, expires_at REAL, "
+            "PRIMARY KEY (namespace, key)) WITHOUT ROWID"
+        )
+
+    def get(self, namespace: str, key: str) -> Optional[Any]:
+        row = self._conn().execute(
+            "SELECT value FROM state WHERE namespace = ? AND key = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (namespace, key, time.time())
+        ).fetchone()
+        return loads(row[0]) if row is not None else None
+
+    def set(self, namespace: str, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        self._conn().execute(
+            "INSERT OR REPLACE INTO state (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+            (namespace, key, dumps(value), _expiry(ttl))
+        )
+        self._after_write()
+
+    def set_if_absent(self, namespace: str, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        with self._transaction() as conn:
+            conn.execute(
+                "DELETE FROM state WHERE namespace = ? AND key = ? AND expires_at IS NOT NULL AND expires_at <= ?",
+                (namespace, key, time.time())
+            )
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO state (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                (namespace, key, dumps(value), _expiry(ttl))
+            )
+            return cursor.rowcount == 1
+
+    def delete(self, namespace: str, key: str) -> None:
+        self._conn().execute("DELETE FROM state WHERE namespace = ? AND key = ?", (namespace, key))
+
+    def items(self, namespace: str) -> List[Tuple[str, Any]]:
+        rows = self._conn().execute(
+            "SELECT key, value FROM state WHERE namespace = ? AND (expires_at IS NULL OR expires_at > ?) ORDER BY key",
+            (namespace, time.time())
+        ).fetchall()
+        return [(key, loads(value)) for key, value in rows]
+
+    def update(self, namespace: str, key: str, fields: Dict[str, Any], ttl: Optional[float] = None) -> Dict[str, Any]:
+        with self._transaction() as conn:
+            value = dict(self._read(conn, namespace, key, time.time()) or {})
+            value.update(fields)
+            conn.execute(
+                "INSERT OR REPLACE INTO state (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                (namespace, key, dumps(value), _expiry(ttl))
+            )
+        self._after_write()
+        return value
+
+    def take_token(self, bucket: str, rate: float, capacity: float, cost: float = 1.0) -> Tuple[bool, float]:
+        now = time.time()
+        with self._transaction() as conn:
+            state, allowed, retry_after = self._refill(
+                self._read(conn, RATE_LIMITS, bucket, now), now, rate, capacity, cost
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO state (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                (RATE_LIMITS, bucket, dumps(state), _bucket_expiry(now, rate, capacity))
+            )
+        self._after_write()
+        return allowed, retry_after
+
+    def close(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Autocommit mode: transactions are opened explicitly where needed
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # Durable at checkpoints, which is enough for state that can be rebuilt
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _transaction(self) -> "_ImmediateTransaction":
+        return _ImmediateTransaction(self._conn())
+
+    @staticmethod
+    def _read(conn: sqlite3.Connection, namespace: str, key: str, now: float) -> Optional[Any]:
+        row = conn.execute(
+            "SELECT value FROM state WHERE namespace = ? AND key = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (namespace, key, now)
+        ).fetchone()
+        return loads(row[0]) if row is not None else None
+
+    def _after_write(self) -> None:
+        self._writes += 1
+        if self._writes % self.PURGE_EVERY == 0:
+            self._conn().execute(
+                "DELETE FROM state WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),)
+            )
+
+
+class _ImmediateTransaction:
+    """
+    BEGIN IMMEDIATE ... COMMIT, rolled back on error
+    """
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    def __enter__(self) -> sqlite3.Connection:
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type: Any, *exc: Any) -> None:
+        self.conn.execute("ROLLBACK" if exc_type is not None else "COMMIT")
+
+
+def _expiry(ttl: Optional[float]) -> Optional[float]:
+    return time.time() + ttl if ttl is not None else None
+
+
+def _bucket_expiry(now: float, rate: float, capacity: float) -> Optional[float]:
+    # A bucket that has refilled completely is the same as no bucket
+    return now + capacity / rate if rate > 0 else None
+
+
+_state_backend: Optional[StateBackend] = None
+
+
+def get_state_backend() -> StateBackend:
+    """
+    Return the shared state backend selected by STATE_BACKEND
+    """
+    global _state_backend
+    if _state_backend is None:
+        if settings.STATE_BACKEND == "sqlite":
+            _state_backend = SQLiteStateBackend(settings.STATE_SQLITE_PATH)
+            logger.info(f"Using SQLite state backend at {settings.STATE_SQLITE_PATH}")
+        else:
+            if settings.STATE_BACKEND != "memory":
+                logger.warning(f"Unknown STATE_BACKEND {settings.STATE_BACKEND}, using in-process state")
+            _state_backend = MemoryStateBackend()
+    return _state_backend
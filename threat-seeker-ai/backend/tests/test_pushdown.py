@@ -0,0 +1,102 @@
+import pytest
+
+from query_engine import parse_query, plan_from_ir, run_query, to_ir
+from query_engine.pushdown import RULES, optimize_ir
+
+POWERSHELL = "C:\\Windows\\System32\\WindowsPowerShell\\v1.0\\powershell.exe"
+CMD = "C:\\Windows\\System32\\cmd.exe"
+
+# Events of several shapes: with and without name fields, metadata fields and nested objects
+EVENTS = [
+    {"EventCode": 4688, "host": "ws-01", "user": "alice", "process_path": POWERSHELL, "process_name": "powershell.exe",
+     "command_line": "powershell -enc SQBFAFgA", "sourcetype": "WinEventLog:Security"},
+    {"EventCode": 4688, "host": "ws-01", "user": "bob", "process_path": POWERSHELL,
+     "command_line": "powershell -nop -w hidden", "source": "WinEventLog:Security", "sourcetype": "WinEventLog"},
+    {"EventCode": 4688, "host": "ws-02", "user": "alice", "process_path": CMD, "process": "cmd.exe",
+     "command_line": "cmd /c whoami"},
+    {"EventCode": 4624, "host": "ws-02", "user": "carol", "logon_type": 10, "src_ip": "10.0.0.5"},
+    {"EventCode": 4625, "host": "dc-01", "user": "carol", "logon_type": 3, "src_ip": "10.0.0.9"},
+    {"EventCode": 1, "host": "ws-03", "user": "dave", "process_path": POWERSHELL, "process": "powershell.exe",
+     "parent_process_path": CMD, "parent_process_name": "cmd.exe", "command_line": "PowerShell -EncodedCommand ZQBjAGgAbwA=",
+     "sourcetype": "XmlWinEventLog:Microsoft-Windows-Sysmon/Operational"},
+    {"EventCode": 3, "host": "ws-03", "user": "dave", "dest_ip": "203.0.113.7", "dest_port": 443},
+    {"EventCode": 4688, "host": {"name": "ws-04"}, "user": "erin", "process_path": "/usr/bin/powershell.exe"},
+]
+
+QUERIES = [
+    'EventCode=4688 process_path="*\\\\powershell.exe"',
+    'EventCode=4688 | where user="alice"',
+    'EventCode=4688 | sort host | where host="ws-01" | table host, user',
+    'EventCode IN (4624, 4625) | stats count by host, user | where host="ws-02"',
+    'EventCode=4688 | sort user | stats count by user | sort -count',
+    'EventCode=4688 | table host, user, command_line | stats count by host',
+    'EventCode=4688 | dedup host | where host="ws-01"',
+    'command_line="*-enc*"',
+    'command_line="*hidden*" OR command_line="*whoami*"',
+    'sourcetype="*Security*"',
+    'EventCode=1 parent_process_path="*\\\\cmd.exe" | stats count by host',
+    'EventCode=4625 | rename user AS account | where account="carol"',
+]
+
+# Rules only equivalent on data named the way they assume (see the pushdown module)
+CONVENTION_RULES = ("sourcetype_narrowing", "path_names")
+# Name fields the path_names rule expects next to each path field
+NAME_FIELDS = {"process_path": ("process_name", "process"), "parent_process_path": ("parent_process_name", "parent_process")}
+
+
+def _follows_conventions(event):
+    """
+    Whether an event has a sourcetype and the name of each path it has
+    """
+    return "sourcetype" in event and all(
+        any(name in event for name in NAME_FIELDS[path]) for path in NAME_FIELDS if path in event
+    )
+
+
+def _run(ir, events):
+    return run_query(plan_from_ir(ir), events)
+
+
+@pytest.mark.parametrize("target", ["local", "spl", "dsl"])
+@pytest.mark.parametrize("rule", [name for name, _ in RULES])
+@pytest.mark.parametrize("query", QUERIES)
+def test_rule_keeps_results(query, rule, target):
+    ir = to_ir(parse_query(query))
+    disabled = [name for name, _ in RULES if name != rule]
+    rewritten, _ = optimize_ir(ir, target, 1000, disabled)
+    events = EVENTS
+    if rule in CONVENTION_RULES:
+        # Only events carrying the names these rules assume
+        events = [event for event in EVENTS if _follows_conventions(event)]
+    assert _run(rewritten, events) == _run(ir, events)
+
+
+@pytest.mark.parametrize("target", ["local", "spl", "dsl"])
+@pytest.mark.parametrize("query", QUERIES)
+def test_default_rules_keep_results(query, target):
+    ir = to_ir(parse_query(query))
+    rewritten, _ = optimize_ir(ir, target, 1000, CONVENTION_RULES)
+    assert _run(rewritten, EVENTS) == _run(ir, EVENTS)
+
+
+def test_path_names_miss_events_without_name_fields():
+    ir = to_ir(parse_query('process_path="*\\\\powershell.exe"'))
+    rewritten, rewrites = optimize_ir(ir, "spl", 1000, ["sourcetype_narrowing"])
+    assert [rewrite.rule for rewrite in rewrites] == ["path_names"]
+    # The second event has the path but no name field
+    assert len(_run(ir, EVENTS)) == 3
+    assert len(_run(rewritten, EVENTS)) == 2
+
+
+def test_leading_wildcard_adds_keyword_only_locally():
+    ir = to_ir(parse_query('command_line="*-enc*"'))
+    _, local = optimize_ir(ir, "local", 1000)
+    _, spl = optimize_ir(ir, "spl", 1000)
+    assert "leading_wildcard" in [rewrite.rule for rewrite in local]
+    assert "leading_wildcard" not in [rewrite.rule for rewrite in spl]
+
+
+def test_leading_wildcard_skips_metadata_fields():
+    ir = to_ir(parse_query('sourcetype="*Security*"'))
+    _, rewrites = optimize_ir(ir, "local", 1000)
+    assert rewrites == []
@@ -0,0 +1,110 @@
+import json
+
+import pytest
+
+from query_engine import detect_language, parse_query, plan_from_ir, run_query, to_ir
+from query_engine.compiler import compile_dsl, compile_spl
+
+
+def _ir(query):
+    return to_ir(parse_query(query))
+
+
+def _search(query):
+    return _ir(query)["search"]
+
+
+def _cmp(field, value):
+    return {"cmp": [field, "=", value]}
+
+
+SPL_QUERIES = [
+    'a=1 OR b=2 c=3',
+    'NOT a=1 b=2',
+    'NOT (a=1 OR b=2)',
+    'a=1 AND (b=2 OR c=3)',
+    'a=1 OR NOT b=2 AND c=3',
+    '(a=1 b=2) OR c=3',
+    'a=1 | where b=2 OR c=3 AND d=4',
+    'index=main EventCode=4688 | stats count by host | sort -count | head 5',
+    'EventCode IN (4624, 4625) user!="svc_*" | where count > 3',
+    'powershell -enc | table host, user',
+    'a>5 b<=3 | rename user AS account | dedup host',
+    'EventCode=4625 | stats count, dc(user) AS users by src_ip | where count > 1 | sort -count',
+]
+
+# Queries with an Elasticsearch equivalent
+DSL_QUERIES = [query for query in SPL_QUERIES if "rename" not in query]
+
+# Parsed DSL names fields as CIM does again, so the same events answer both languages
+EVENTS = [
+    {"EventCode": 4624, "host": "ws-01", "user": "alice", "a": 1, "b": 2, "c": 3, "count": 5},
+    {"EventCode": 4625, "host": "ws-02", "user": "svc_backup", "a": 2, "b": 2, "c": 4, "count": 2},
+    {"EventCode": 4688, "host": "ws-01", "user": "bob", "a": 1, "b": 3, "c": 3, "d": 4, "_raw": "powershell -enc SQBFAFgA"},
+    {"EventCode": 4625, "host": "dc-01", "user": "carol", "src_ip": "10.0.0.9", "count": 12},
+    {"EventCode": 4625, "host": "dc-01", "user": "dave", "src_ip": "10.0.0.9", "count": 12},
+]
+
+
+def _rows(ir):
+    # Elasticsearch names the count of a bucket doc_count
+    return [
+        {("count" if name == "doc_count" else name): value for name, value in row.items()}
+        for row in run_query(plan_from_ir(ir), EVENTS)
+    ]
+
+
+@pytest.mark.parametrize("query", SPL_QUERIES)
+def test_spl_round_trip(query):
+    ir = _ir(query)
+    spl = compile_spl(ir)
+    assert detect_language(spl) == "spl"
+    assert _ir(spl) == ir
+
+
+@pytest.mark.parametrize("query", DSL_QUERIES)
+def test_dsl_round_trip(query):
+    ir = _ir(query)
+    dsl = compile_dsl(ir)
+    assert detect_language(dsl) == "dsl"
+    parsed = _ir(dsl)
+    assert _rows(parsed) == _rows(ir)
+    # Compiling the parsed query gives the same DSL, up to nested bools being flattened
+    again = compile_dsl(parsed)
+    assert _rows(_ir(again)) == _rows(ir)
+    assert json.loads(compile_dsl(_ir(again))) == json.loads(again)
+
+
+def test_or_binds_tighter_than_and_in_searches():
+    assert _search("a=1 b=2 OR c=3") == {"and": [_cmp("a", "1"), {"or": [_cmp("b", "2"), _cmp("c", "3")]}]}
+    assert _search("a=1 AND b=2 OR c=3") == _search("a=1 b=2 OR c=3")
+    assert _search("a=1 OR b=2 OR c=3 d=4") == {
+        "and": [{"or": [_cmp("a", "1"), _cmp("b", "2"), _cmp("c", "3")]}, _cmp("d", "4")]
+    }
+
+
+def test_and_binds_tighter_than_or_in_where():
+    assert _search("a=1 | where b=2 OR c=3 AND d=4") == {
+        "and": [_cmp("a", "1"), {"or": [_cmp("b", "2"), {"and": [_cmp("c", "3"), _cmp("d", "4")]}]}]
+    }
+
+
+def test_not_binds_tightest():
+    assert _search("NOT a=1 OR b=2") == {"or": [{"not": _cmp("a", "1")}, _cmp("b", "2")]}
+    assert _search("NOT a=1 b=2") == {"and": [{"not": _cmp("a", "1")}, _cmp("b", "2")]}
+
+
+def test_parentheses_override_precedence():
+    assert _search("(a=1 b=2) OR c=3") == {"or": [{"and": [_cmp("a", "1"), _cmp("b", "2")]}, _cmp("c", "3")]}
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("a=1 b=2 OR c=3", [0, 2]),
+    ("(a=1 b=2) OR c=3", [0, 2]),
+    ("a=1 OR b=2 c=4", [1]),
+    ("NOT a=1 OR c=3", [0, 1, 2]),
+])
+def test_precedence_decides_matching_events(query, expected):
+    events = [{"a": 1, "b": 2, "c": 3}, {"a": 2, "b": 2, "c": 4}, {"a": 1, "b": 3, "c": 3}]
+    rows = run_query(plan_from_ir(_ir(query)), events)
+    assert rows == [events[i] for i in expected]
@@ -0,0 +1,62 @@
+import pytest
+
+from storage.result_diff import diff_query
+
+
+def _classified(base, target, run_rows=200000):
+    diff = diff_query(base, target, run_rows)
+    return {
+        "added": sorted(diff.added),
+        "removed": sorted(diff.removed),
+        "changed": sorted(zip(diff.changed_base, diff.changed_target)),
+        "unchanged": diff.unchanged,
+    }
+
+
+def test_identical_rows_are_unchanged():
+    rows = [{"_id": "1", "host": "ws-01"}, {"_id": "2", "host": "ws-02"}]
+    assert _classified(rows, list(reversed(rows))) == {"added": [], "removed": [], "changed": [], "unchanged": 2}
+
+
+def test_new_and_missing_rows_are_added_and_removed():
+    base = [{"_id": "1", "host": "ws-01"}, {"_id": "2", "host": "ws-02"}]
+    target = [{"_id": "2", "host": "ws-02"}, {"_id": "3", "host": "ws-03"}]
+    assert _classified(base, target) == {"added": [1], "removed": [0], "changed": [], "unchanged": 1}
+
+
+def test_event_with_same_id_and_new_content_is_changed():
+    base = [{"_id": "1", "host": "ws-01", "status": "open"}]
+    target = [{"_id": "1", "host": "ws-01", "status": "closed"}]
+    diff = diff_query(base, target)
+    assert _classified(base, target) == {"added": [], "removed": [], "changed": [(0, 0)], "unchanged": 0}
+    assert diff.to_dict(base, target, 10)["samples"]["changed"][0]["fields"] == ["status"]
+
+
+def test_aggregate_row_whose_counts_moved_is_changed():
+    base = [{"host": "ws-01", "count": 3}, {"host": "ws-02", "count": 1}]
+    target = [{"host": "ws-01", "count": 5}, {"host": "ws-02", "count": 1}]
+    assert _classified(base, target) == {"added": [], "removed": [], "changed": [(0, 0)], "unchanged": 1}
+
+
+def test_volatile_fields_are_ignored():
+    base = [{"_cd": "1:2", "host": "ws-01", "_indextime": 100, "_serial": 0}]
+    target = [{"_cd": "1:2", "host": "ws-01", "_indextime": 200, "_serial": 7}]
+    assert _classified(base, target) == {"added": [], "removed": [], "changed": [], "unchanged": 1}
+
+
+def test_enrichment_changes_content_but_not_identity():
+    base = [{"host": "ws-01", "process": "cmd.exe"}]
+    target = [{"host": "ws-01", "process": "cmd.exe", "ioc_matches": [{"value": "cmd.exe"}]}]
+    assert _classified(base, target) == {"added": [], "removed": [], "changed": [(0, 0)], "unchanged": 0}
+
+
+def test_duplicate_rows_are_matched_one_to_one():
+    row = {"host": "ws-01", "user": "alice"}
+    assert _classified([row, row, row], [row]) == {"added": [], "removed": [1, 2], "changed": [], "unchanged": 1}
+
+
+@pytest.mark.parametrize("run_rows", [1, 3, 7])
+def test_spilled_runs_classify_like_one_run(run_rows):
+    base = [{"_id": str(i), "value": i % 4} for i in range(40)]
+    target = [{"_id": str(i), "value": i % 5} for i in range(10, 50)]
+    assert _classified(base, target, run_rows) == _classified(base, target)
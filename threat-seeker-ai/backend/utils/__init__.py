@@ -1,2 +1,8 @@
 # Utils package
-from .retry_handler import async_retry_with_exponential_backoff, retry_with_exponential_backoff
\ No newline at end of file
+from .retry_handler import async_retry_with_exponential_backoff, retry_with_exponential_backoff
+from .micro_batcher import MicroBatcher
+from .hypothesis_pool import HypothesisPool
+from .prompt_budget import PromptBuilder, count_tokens, prompt_usage, stream_with_budget
+from .json_stream import JsonArrayStreamParser
+from .metrics import instrument_agent, instrument_connector, metrics
+from .tracing import tracer
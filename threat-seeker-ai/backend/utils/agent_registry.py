@@ -0,0 +1,145 @@
+import asyncio
+import contextvars
+import importlib
+import logging
+import time
+import traceback
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+# Setup logger
+logger = logging.getLogger(__name__)
+
+
+class AgentRegistry:
+    """
+    Builds agents lazily, on first use or from a background warm-up task.
+
+    Agent modules (and the LLM client libraries they pull in) are imported only when
+    the agent is first needed, in a worker thread so the event loop keeps serving
+    requests. Every import and build is timed for the startup report, and a failing
+    agent never prevents the others from being built.
+    """
+
+    def __init__(self):
+        self._specs: Dict[str, Tuple[str, str]] = {}
+        self._agents: Dict[str, Any] = {}
+        self._errors: Dict[str, str] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self.timings: List[Dict[str, Any]] = []
+        self.created_at = time.perf_counter()
+
+    def register(self, name: str, module_path: str, class_name: str) -> None:
+        """
+        Register an agent class by module path so that it is not imported until needed
+        """
+        self._specs[name] = (module_path, class_name)
+
+    async def get(self, name: str) -> Optional[Any]:
+        """
+        Return the agent, building it first if necessary; None if it failed to build
+        """
+        if name in self._agents:
+            return self._agents[name]
+        if name in self._errors:
+            return None
+
+        lock = self._locks.setdefault(name, asyncio.Lock())
+        async with lock:
+            if name not in self._agents and name not in self._errors:
+                loop = asyncio.get_running_loop()
+                await loop.run_in_executor(None, self._build, name)
+        return self._agents.get(name)
+
+    def peek(self, name: str) -> Optional[Any]:
+        """
+        Return the agent only if it has already been built
+        """
+        return self._agents.get(name)
+
+    async def warm_up(self, names: Optional[List[str]] = None) -> None:
+        """
+        Build agents ahead of their first request
+        """
+        for name in names or list(self._specs):
+            await self.get(name)
+        logger.info(
+            f"Agent warm-up complete: {len(self._agents)} ready, {len(self._errors)} failed "
+            f"({time.perf_counter() - self.created_at:.2f}s since registry creation)"
+        )
+
+    @contextmanager
+    def timed(self, name: str, phase: str) -> Iterator[None]:
+        """
+        Record how long a startup phase took
+        """
+        start = time.perf_counter()
+        status = "error"
+        try:
+            yield
+            status = "success"
+        finally:
+            self.timings.append({
+                "name": name,
+                "phase": phase,
+                "seconds": round(time.perf_counter() - start, 4),
+                "status": status,
+                "finished_at": datetime.now().isoformat()
+            })
+
+    def readiness(self, required: Optional[List[str]] = None, lazy: bool = False) -> Dict[str, Any]:
+        """
+        Report whether the required agents (by default every registered one) are
+        available: built, or with lazy=True, still to be built on first use. A
+        required agent that failed to build keeps the service unready.
+        """
+        states = {}
+        for name in self._specs:
+            if name in self._agents:
+                states[name] = "ready"
+            elif name in self._errors:
+                states[name] = "failed"
+            elif name in self._locks and self._locks[name].locked():
+                states[name] = "loading"
+            else:
+                states[name] = "not_loaded"
+        available = ("ready", "loading", "not_loaded") if lazy else ("ready",)
+        required = list(self._specs) if required is None else required
+        return {
+            "ready": all(states.get(name) in available for name in required),
+            "required": required,
+            "agents": states,
+            "errors": dict(self._errors)
+        }
+
+    def startup_report(self) -> Dict[str, Any]:
+        """
+        Report the duration of each import and agent build
+        """
+        return {
+            "timings": list(self.timings),
+            "total_seconds": round(sum(t["seconds"] for t in self.timings), 4)
+        }
+
+    def _build(self, name: str) -> None:
+        module_path, class_name = self._specs[name]
+        try:
+            with self.timed(module_path, "import"):
+                module = importlib.import_module(module_path)
+            with self.timed(name, "build"):
+                self._agents[name] = getattr(module, class_name)()
+            logger.info(f"Agent {name} ready")
+        except Exception as e:
+            self._errors[name] = str(e)
+            logger.error(f"Failed to initialize agent {name}: {e}")
+            logger.debug(traceback.format_exc())
+
+
+async def run_in_thread(func: Callable[..., Any], *args: Any) -> Any:
+    """
+    Run blocking work (imports, file loading) without stalling the event loop. The
+    thread sees the caller's context variables, so its spans join the active trace.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, contextvars.copy_context().run, func, *args)
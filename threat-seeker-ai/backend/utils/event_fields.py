@@ -0,0 +1,148 @@
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+# Event fields holding the event time, as named by Splunk, Elasticsearch and the replayed files
+TIME_FIELDS = ("timestamp", "@timestamp", "_time")
+# Entities compared, filtered and faceted across results, and the event fields holding them (CIM and ECS names)
+ENTITY_FIELDS = {
+    "host": ("host", "hostname", "computer", "Computer", "host.name"),
+    "user": ("user", "username", "user_name", "account", "User", "user.name"),
+    "process": ("process", "process.name"),
+    "command_line": ("command_line", "CommandLine", "process.command_line"),
+    "src_ip": ("src_ip", "source.ip"),
+    "dest_ip": ("dest_ip", "destination.ip"),
+}
+# Normalized fields naming a host an event involves (the other end of a logon or connection included)
+HOST_FIELDS = ("host", "src_host", "dst_host", "source_host", "source.domain", "destination.domain")
+# Normalized fields naming a user an event involves
+USER_FIELDS = ("user",)
+# Fields that are bookkeeping rather than event content
+SKIP_FIELDS = {"_bkt", "_cd", "_si", "_serial", "_indextime", "_index", "_id", "_score", "_type", "_sourcetype"}
+
+# Canonical field of each CIM/ECS alias
+_CANONICAL = {alias: name for name, aliases in ENTITY_FIELDS.items() for alias in aliases}
+# Event paths wanted by select_fields for each set of names, and the objects on the way to them
+_SELECTORS: Dict[Tuple[str, ...], Tuple[Dict[str, str], Set[str]]] = {}
+
+
+def to_epoch(value: Any) -> Optional[float]:
+    """
+    Epoch seconds of an ISO 8601 string, a datetime or epoch seconds/milliseconds
+    (also as a string); None when it is none of these
+    """
+    if value is None or isinstance(value, bool) or value == "":
+        return None
+    if isinstance(value, (int, float)):
+        return value / 1000 if value > 1e11 else float(value)
+    if isinstance(value, datetime):
+        parsed = value
+    else:
+        try:
+            return to_epoch(float(value))
+        except (TypeError, ValueError):
+            pass
+        try:
+            parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def event_time(event: Dict[str, Any], fields: Iterable[str] = TIME_FIELDS) -> Optional[float]:
+    """
+    Epoch seconds of an event's time: the first of fields it has, at the top level
+    or in the _source of an Elasticsearch hit
+    """
+    source = event.get("_source")
+    for field in fields:
+        if field in event:
+            return to_epoch(event[field])
+        if isinstance(source, dict) and field in source:
+            return to_epoch(source[field])
+    return None
+
+
+def normalize_event(event: Dict[str, Any]) -> Dict[str, List[str]]:
+    """
+    The text values of an event by field: nested objects and Elasticsearch _source
+    are flattened to dotted names, CIM/ECS aliases are renamed to one canonical
+    field (host.name and Computer become host), and bookkeeping and time fields
+    are dropped
+    """
+    fields: Dict[str, List[str]] = {}
+
+    def visit(name: str, value: Any) -> None:
+        if value is None or value == "" or isinstance(value, bool):
+            return
+        if isinstance(value, dict):
+            for key, item in value.items():
+                if not name and (key in SKIP_FIELDS or key in TIME_FIELDS):
+                    # Bookkeeping and time fields of an Elasticsearch _source
+                    continue
+                visit(f"{name}.{key}" if name else str(key), item)
+        elif isinstance(value, (list, tuple)):
+            for item in value:
+                visit(name, item)
+        else:
+            fields.setdefault(_CANONICAL.get(name, name), []).append(str(value))
+
+    for key, value in event.items():
+        if key in SKIP_FIELDS or key in TIME_FIELDS:
+            continue
+        if type(value) is str:
+            # Flat string fields, most of them, without the recursion
+            if value:
+                fields.setdefault(_CANONICAL.get(key, key), []).append(value)
+            continue
+        visit("" if key == "_source" else key, value)
+    return fields
+
+
+def select_fields(event: Dict[str, Any], names: Iterable[str]) -> Dict[str, List[str]]:
+    """
+    The named fields of normalize_event (canonical names such as host, or dotted
+    ones such as source.domain), without flattening the rest of the event
+    """
+    names = tuple(names)
+    selector = _SELECTORS.get(names)
+    if selector is None:
+        wanted = {path: name for name in names for path in ENTITY_FIELDS.get(name, (name,))}
+        # Objects on the way to a wanted path
+        parents = {path[:i] for path in wanted for i, char in enumerate(path) if char == "."}
+        selector = _SELECTORS[names] = (wanted, parents)
+    wanted, parents = selector
+    fields: Dict[str, List[str]] = {}
+
+    def visit(name: str, value: Any) -> None:
+        if value is None or value == "" or isinstance(value, bool):
+            return
+        if isinstance(value, dict):
+            for key, item in value.items():
+                path = f"{name}.{key}" if name else str(key)
+                if path in wanted or path in parents:
+                    visit(path, item)
+        elif isinstance(value, (list, tuple)):
+            for item in value:
+                visit(name, item)
+        elif name in wanted:
+            fields.setdefault(wanted[name], []).append(str(value))
+
+    for key, value in event.items():
+        if key in wanted:
+            if type(value) is str:
+                if value:
+                    fields.setdefault(wanted[key], []).append(value)
+                continue
+        elif key != "_source" and key not in parents:
+            continue
+        visit("" if key == "_source" else key, value)
+    return fields
+
+
+def field_values(fields: Dict[str, List[str]], names: Iterable[str]) -> List[str]:
+    """
+    Values of a normalized event (see normalize_event) in any of the named fields
+    """
+    return [value for name in names for value in fields.get(name, ())]
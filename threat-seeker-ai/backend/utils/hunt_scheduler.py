@@ -0,0 +1,432 @@
+import asyncio
+import copy
+import hashlib
+import json
+import logging
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from config.settings import settings
+from query_engine import QuerySyntaxError, detect_language, get_query_compiler
+from query_engine.incremental import IncrementalQuery, split_incremental
+from query_engine.ir import ECS_FIELDS, rename_fields
+from storage.result_store import get_result_store, strip_events
+from storage.search_index import get_search_index, index_result
+from storage.state import CACHE, PLANS, PLAN_TTL_SECONDS, SCHEDULES, StateBackend
+from utils.agent_registry import run_in_thread
+from utils.event_fields import event_time
+
+# Setup logger
+logger = logging.getLogger(__name__)
+
+# Data sources whose queries can be narrowed to the events since the last run
+_INCREMENTAL_SOURCES = ("splunk", "elastic", "file", "auto")
+# Runs kept in a schedule's history
+_HISTORY_SIZE = 20
+
+
+def _fingerprint(row: Dict[str, Any]) -> str:
+    return hashlib.sha256(json.dumps(row, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:16]
+
+
+def _merge_by_id(previous: List[Dict[str, Any]], new: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    previous with the items of new replacing those with the same id, and the others appended
+    """
+    updated = {item.get("id"): item for item in new}
+    merged = [updated.pop(item.get("id"), item) for item in previous]
+    return merged + [item for item in new if item.get("id") in updated]
+
+
+def merge_analysis(previous: Optional[Dict[str, Any]], delta: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Analysis of a continuous hunt after a run: the findings and patterns of the
+    analysis of the new events update or extend the previous ones
+    """
+    if not previous:
+        return delta
+    merged = dict(delta)
+    merged["findings"] = _merge_by_id(previous.get("findings") or [], delta.get("findings") or [])
+    merged["patterns"] = _merge_by_id(previous.get("patterns") or [], delta.get("patterns") or [])
+    techniques = {}
+    for technique in (previous.get("attack_techniques") or []) + (delta.get("attack_techniques") or []):
+        techniques.setdefault(json.dumps(technique, sort_keys=True, default=str), technique)
+    merged["attack_techniques"] = list(techniques.values())
+    recommendations = (previous.get("recommendations") or []) + (delta.get("recommendations") or [])
+    merged["recommendations"] = list(dict.fromkeys(recommendations))
+    return merged
+
+
+class HuntScheduler:
+    """
+    Continuous hunts: approved queries of a plan re-run on a fixed interval.
+
+    Each query keeps a watermark, the newest event time it has returned. A run
+    searches only from the watermark (less SCHEDULE_LATENESS_SECONDS, for events
+    that arrive late) to now, and drops events of the overlap it has already seen.
+    New events are appended to the hunt's stored result; queries with stats keep
+    partial aggregates per group (query_engine.incremental) that the new events
+    are merged into, and their groups are rewritten. Queries that cannot be
+    narrowed (sort, head or dedup ahead of stats, or no IR) re-run in full and
+    replace their rows. Only the new or changed rows are analyzed, and the
+    findings are merged into the stored analysis.
+
+    Schedules live in the state backend, so every worker sees them; a run holds
+    a lease so only one worker executes each due schedule.
+    """
+
+    LEASE_PREFIX = "schedule:"
+
+    def __init__(
+        self,
+        execute: Callable[[str, List[str], Dict[str, Dict[str, Any]]], Awaitable[Dict[str, Any]]],
+        analyze: Callable[[str, Dict[str, Any]], Awaitable[Dict[str, Any]]],
+        state: StateBackend,
+        poll_interval: int = 15,
+        lateness_seconds: int = 300,
+        min_interval: int = 60
+    ):
+        self.execute = execute
+        self.analyze = analyze
+        self.state = state
+        self.poll_interval = poll_interval
+        self.lateness_seconds = lateness_seconds
+        self.min_interval = min_interval
+        self._owner = str(uuid.uuid4())
+        self._loop_task: Optional[asyncio.Task] = None
+        self._runs: Dict[str, asyncio.Task] = {}
+
+    async def create(self, plan: Dict[str, Any], query_ids: List[str], interval_seconds: int,
+                     modifications: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        """
+        Register a continuous hunt; its first run is due immediately
+        """
+        if interval_seconds < self.min_interval:
+            raise ValueError(f"Schedules run at most every {self.min_interval} seconds")
+        planned = {query["query_id"] for query in plan.get("queries") or []}
+        unknown = [query_id for query_id in query_ids if query_id not in planned]
+        if not query_ids or unknown:
+            raise ValueError(f"Unknown query IDs for plan {plan['plan_id']}: {', '.join(unknown) or 'none given'}")
+        schedule = {
+            "schedule_id": str(uuid.uuid4()),
+            "plan_id": plan["plan_id"],
+            # Plans expire from the state backend; the schedule keeps its own copy
+            "plan": plan,
+            "query_ids": query_ids,
+            "modifications": modifications or {},
+            "interval_seconds": interval_seconds,
+            "created_at": datetime.now().isoformat(),
+            "next_run_at": time.time(),
+            "last_run_at": None,
+            "runs": 0,
+            "result_id": None,
+            "last_error": None,
+            "queries": {},
+            "history": []
+        }
+        await run_in_thread(self.state.set, SCHEDULES, schedule["schedule_id"], schedule)
+        return self.describe(schedule)
+
+    async def get(self, schedule_id: str) -> Optional[Dict[str, Any]]:
+        schedule = await run_in_thread(self.state.get, SCHEDULES, schedule_id)
+        return self.describe(schedule) if schedule is not None else None
+
+    async def list_schedules(self) -> List[Dict[str, Any]]:
+        items = await run_in_thread(self.state.items, SCHEDULES)
+        schedules = [self.describe(schedule) for _, schedule in items]
+        return sorted(schedules, key=lambda schedule: schedule["created_at"])
+
+    async def delete(self, schedule_id: str) -> bool:
+        """
+        Remove a schedule; its stored result is kept
+        """
+        if await run_in_thread(self.state.get, SCHEDULES, schedule_id) is None:
+            return False
+        await run_in_thread(self.state.delete, SCHEDULES, schedule_id)
+        return True
+
+    @staticmethod
+    def describe(schedule: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        A schedule without its plan copy and per-query run state
+        """
+        described = {k: v for k, v in schedule.items() if k not in ("plan", "queries")}
+        described["next_run_at"] = datetime.fromtimestamp(schedule["next_run_at"]).isoformat()
+        described["queries"] = {
+            query_id: {k: v for k, v in query.items() if k not in ("recent", "rows", "partials")}
+            for query_id, query in schedule["queries"].items()
+        }
+        for query in described["queries"].values():
+            if query.get("watermark") is not None:
+                query["watermark"] = datetime.fromtimestamp(query["watermark"], timezone.utc).isoformat()
+        return described
+
+    async def run(self, schedule_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Run a schedule now; None when it does not exist or another run holds its lease
+        """
+        schedule = await run_in_thread(self.state.get, SCHEDULES, schedule_id)
+        if schedule is None:
+            return None
+        lease = self.LEASE_PREFIX + schedule_id
+        acquired = await run_in_thread(self.state.set_if_absent, CACHE, lease, self._owner, schedule["interval_seconds"])
+        if not acquired:
+            logger.info(f"Schedule {schedule_id} is being run by another worker")
+            return None
+        try:
+            started = time.time()
+            try:
+                # Run state is only kept when the run succeeds
+                attempt = copy.deepcopy(schedule)
+                run = await self._run_once(attempt)
+                schedule = attempt
+                schedule["last_error"] = None
+            except Exception as e:
+                logger.error(f"Error running schedule {schedule_id}: {str(e)}")
+                run = {"error": str(e)}
+                schedule["last_error"] = str(e)
+            run.update(started_at=datetime.fromtimestamp(started).isoformat(), duration=round(time.time() - started, 3))
+            schedule["runs"] += 1
+            schedule["last_run_at"] = run["started_at"]
+            schedule["history"] = (schedule["history"] + [run])[-_HISTORY_SIZE:]
+            next_run = schedule["next_run_at"] + schedule["interval_seconds"]
+            schedule["next_run_at"] = next_run if next_run > time.time() else time.time() + schedule["interval_seconds"]
+            # The schedule may have been deleted while it ran
+            if await run_in_thread(self.state.get, SCHEDULES, schedule_id) is None:
+                return None
+            await run_in_thread(self.state.set, SCHEDULES, schedule_id, schedule)
+            return self.describe(schedule)
+        finally:
+            await run_in_thread(self._release, lease)
+
+    def _release(self, lease: str) -> None:
+        # A run outlasting the interval has lost its lease, which another worker may hold now
+        if self.state.get(CACHE, lease) == self._owner:
+            self.state.delete(CACHE, lease)
+
+    async def start(self) -> None:
+        """
+        Start running due schedules in the background
+        """
+        if self._loop_task is None:
+            self._loop_task = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> None:
+        """
+        Stop the background loop and any run in progress
+        """
+        for task in [self._loop_task] + list(self._runs.values()):
+            if task is not None and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except (asyncio.CancelledError, Exception):
+                    pass
+        self._loop_task = None
+        self._runs.clear()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                items = await run_in_thread(self.state.items, SCHEDULES)
+            except Exception as e:
+                logger.error(f"Error reading hunt schedules: {str(e)}")
+                items = []
+            now = time.time()
+            for schedule_id, schedule in items:
+                running = self._runs.get(schedule_id)
+                if schedule["next_run_at"] > now or (running is not None and not running.done()):
+                    continue
+                self._runs[schedule_id] = asyncio.ensure_future(self.run(schedule_id))
+            for schedule_id in [s for s, task in self._runs.items() if task.done()]:
+                del self._runs[schedule_id]
+            await asyncio.sleep(self.poll_interval)
+
+    def _split(self, query: Dict[str, Any], query_string: str, modified: bool) -> Tuple[Optional[Dict[str, Any]], str]:
+        """
+        IR of a query that can run incrementally, and the language its search is sent in
+        """
+        language = "dsl" if detect_language(query_string) in ("dsl", "lucene") else "spl"
+        if query.get("data_source", "").lower() not in _INCREMENTAL_SOURCES:
+            return None, language
+        try:
+            ir = query.get("ir") if not modified else None
+            if ir is None:
+                ir, _ = get_query_compiler().ir(query_string)
+        except QuerySyntaxError:
+            return None, language
+        return (ir if split_incremental(ir) is not None else None), language
+
+    async def _run_once(self, schedule: Dict[str, Any]) -> Dict[str, Any]:
+        plan = schedule["plan"]
+        plan_id = plan["plan_id"]
+        store = get_result_store()
+        # The executor and analyzer read the plan from the state backend
+        await run_in_thread(self.state.set, PLANS, plan_id, plan, PLAN_TTL_SECONDS)
+        stored = None
+        if schedule["result_id"] is not None:
+            stored = await run_in_thread(store.get, schedule["result_id"])
+        if stored is None:
+            # First run, or the result was pruned from the store: start over
+            schedule["result_id"] = None
+            schedule["queries"] = {}
+
+        compiler = get_query_compiler()
+        splits: Dict[str, Tuple[Optional[Dict[str, Any]], str]] = {}
+        overrides: Dict[str, Dict[str, Any]] = {}
+        for query in plan["queries"]:
+            query_id = query["query_id"]
+            if query_id not in schedule["query_ids"]:
+                continue
+            modified = query_id in schedule["modifications"]
+            query_string = schedule["modifications"][query_id] if modified else query["query_string"]
+            ir, language = self._split(query, query_string, modified)
+            splits[query_id] = (ir, language)
+            split = split_incremental(ir) if ir is not None else None
+            state = schedule["queries"].setdefault(
+                query_id, {"mode": "full" if split is None else "aggregate" if split.stats else "append", "watermark": None}
+            )
+            override: Dict[str, Any] = {"query_string": query_string}
+            if modified:
+                override["ir"] = None
+            if split is not None:
+                # Only the search runs on the backend; its commands run here over the new events
+                override.update(query_string=compiler.compile(split.search_ir(), language), ir=None)
+                if state["watermark"] is not None:
+                    start = datetime.fromtimestamp(state["watermark"] - self.lateness_seconds, timezone.utc)
+                    override["time_range"] = {"start": start.isoformat(), "end": "now"}
+            overrides[query_id] = override
+
+        raw_results = await self.execute(plan_id, schedule["query_ids"], overrides)
+        appended: Dict[str, List[Dict[str, Any]]] = {}
+        replaced: Dict[str, List[Dict[str, Any]]] = {}
+        delta_results = []
+        for query_result in raw_results["query_results"]:
+            query_id = query_result["query_id"]
+            if query_result["status"] != "success":
+                delta_results.append(query_result)
+                continue
+            ir, language = splits[query_id]
+            state = schedule["queries"][query_id]
+            events = query_result.get("results") or []
+            split = None
+            if ir is not None:
+                # Events of Elasticsearch queries carry ECS field names
+                ecs = query_result["data_source"] == "elastic" or (query_result["data_source"] == "file" and language == "dsl")
+                split = split_incremental(rename_fields(ir, ECS_FIELDS) if ecs else ir)
+            new_rows, total = self._merge(state, split, events, query_id, appended, replaced)
+            delta_results.append(dict(query_result, results=new_rows, result_count=len(new_rows)))
+            query_result["results"] = appended.get(query_id, replaced.get(query_id, []))
+            query_result["result_count"] = total
+
+        delta = dict(raw_results, query_results=delta_results)
+        delta["summary"] = dict(raw_results["summary"], total_results=sum(r.get("result_count", 0) for r in delta_results))
+        new_rows = delta["summary"]["total_results"]
+        run = {"new_rows": new_rows, "failed_queries": raw_results["summary"]["failed_queries"]}
+        if stored is not None and not new_rows:
+            # Nothing new to analyze
+            stored["updated_at"] = datetime.now().isoformat()
+            self._update_counts(stored, raw_results)
+            await run_in_thread(store.update, schedule["result_id"], stored)
+            run["findings"] = 0
+            return run
+
+        delta["result_id"] = schedule["result_id"] or raw_results["result_id"]
+        analysis = await self.analyze(plan_id, delta)
+        run["findings"] = len(analysis.get("findings") or [])
+        if stored is None:
+            hunt_result = {
+                "result_id": raw_results["result_id"],
+                "plan_id": plan_id,
+                "schedule_id": schedule["schedule_id"],
+                "raw_results": raw_results,
+                "analysis": analysis,
+                "created_at": datetime.now().isoformat()
+            }
+            await run_in_thread(store.save, hunt_result)
+            await run_in_thread(index_result, get_search_index(), hunt_result)
+            schedule["result_id"] = hunt_result["result_id"]
+        else:
+            stored["analysis"] = merge_analysis(stored.get("analysis"), analysis)
+            stored["updated_at"] = datetime.now().isoformat()
+            self._update_counts(stored, raw_results)
+            await run_in_thread(store.update, schedule["result_id"], stored, appended, replaced)
+        logger.info(
+            f"Schedule {schedule['schedule_id']} run added {new_rows} rows and {run['findings']} findings to result {schedule['result_id']}"
+        )
+        return run
+
+    def _merge(self, state: Dict[str, Any], split: Optional[IncrementalQuery], events: List[Dict[str, Any]], query_id: str,
+               appended: Dict[str, List[Dict[str, Any]]], replaced: Dict[str, List[Dict[str, Any]]]) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        Fold a query's events into its run state; returns the rows that are new or
+        changed since the last run, and the query's total row count
+        """
+        if split is None:
+            # Re-run in full: the rows not in the previous run are new
+            seen = set(state.get("rows") or [])
+            fingerprints = [_fingerprint(row) for row in events]
+            state["rows"] = fingerprints
+            replaced[query_id] = events
+            return [row for row, fingerprint in zip(events, fingerprints) if fingerprint not in seen], len(events)
+
+        # Events of the lateness overlap were returned by the previous run
+        recent = set(state.get("recent") or [])
+        returned = len(events)
+        times = [event_time(event) for event in events]
+        if state["watermark"] is not None:
+            # Older events were folded in by earlier runs (or are too late to count), whatever the backend returned
+            oldest = state["watermark"] - self.lateness_seconds
+            kept = [(event, t) for event, t in zip(events, times) if t is None or t >= oldest]
+            events, times = [event for event, _ in kept], [t for _, t in kept]
+        fingerprints = [_fingerprint(event) for event in events]
+        fresh = [event for event, fingerprint in zip(events, fingerprints) if fingerprint not in recent]
+        watermark = max([t for t in times if t is not None] + ([state["watermark"]] if state["watermark"] is not None else []), default=None)
+        if watermark is not None:
+            cutoff = watermark - self.lateness_seconds
+            state["recent"] = [f for f, t in zip(fingerprints, times) if t is None or t >= cutoff]
+        else:
+            state["recent"] = fingerprints
+        state["watermark"] = watermark
+        state["truncated"] = returned >= settings.MAX_RESULTS_PER_QUERY
+        if state["truncated"]:
+            logger.warning(f"Query {query_id} returned {returned} events, the per-query limit; some new events may be missed")
+
+        if split.stats is None:
+            rows = split.apply(fresh)
+            appended[query_id] = rows
+            state["total"] = state.get("total", 0) + len(rows)
+            return rows, state["total"]
+
+        partials = state.setdefault("partials", {})
+        split.merge(partials, split.partials(fresh))
+        rows = split.rows(partials)
+        seen = set(state.get("rows") or [])
+        fingerprints = [_fingerprint(row) for row in rows]
+        state["rows"] = fingerprints
+        replaced[query_id] = rows
+        return [row for row, fingerprint in zip(rows, fingerprints) if fingerprint not in seen], len(rows)
+
+    @staticmethod
+    def _update_counts(stored: Dict[str, Any], raw_results: Dict[str, Any]) -> None:
+        """
+        Per-query counts and status of a stored result after a run; failed queries keep their rows
+        """
+        current = {r["query_id"]: r for r in strip_events({"raw_results": raw_results})["raw_results"]["query_results"]}
+        query_results = []
+        for previous in stored["raw_results"].get("query_results") or []:
+            latest = current.pop(previous["query_id"], None)
+            if latest is None:
+                query_results.append(previous)
+            elif latest["status"] != "success":
+                query_results.append(dict(previous, status=latest["status"], error_message=latest.get("error_message"),
+                                          executed_at=latest["executed_at"]))
+            else:
+                query_results.append(latest)
+        query_results.extend(current.values())
+        stored["raw_results"]["query_results"] = query_results
+        stored["raw_results"]["summary"] = dict(
+            raw_results["summary"], total_results=sum(r.get("result_count", 0) for r in query_results)
+        )
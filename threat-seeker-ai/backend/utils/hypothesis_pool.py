@@ -0,0 +1,228 @@
+import asyncio
+import hashlib
+import logging
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from storage.state import CACHE, StateBackend
+from utils.agent_registry import run_in_thread
+
+# Setup logger
+logger = logging.getLogger(__name__)
+
+
+class HypothesisPool:
+    """
+    Pool of pre-generated threat hunting hypotheses that is refreshed in the background.
+
+    The pool is regenerated on a fixed schedule and whenever the threat intelligence
+    fingerprint changes. Reads never wait on the LLM: they are served from the current
+    pool (stale-while-revalidate), and a stale read schedules a background refresh.
+
+    With a state backend the pool is shared between API workers: a refresh holds a
+    lease so only one worker calls the LLM, and the others adopt the pool it publishes.
+    """
+
+    SNAPSHOT_KEY = "hypothesis_pool"
+    LEASE_KEY = "hypothesis_pool:refresh"
+    # How often reads check the state backend for a pool published by another worker
+    SYNC_INTERVAL = 5.0
+
+    def __init__(
+        self,
+        generate: Callable[[int, Optional[str]], Awaitable[List[Dict[str, Any]]]],
+        fetch_intel: Callable[[], Awaitable[str]],
+        fallback: Callable[[], List[Dict[str, Any]]],
+        pool_size: int = 5,
+        refresh_interval: int = 900,
+        intel_poll_interval: int = 300,
+        state: Optional[StateBackend] = None
+    ):
+        self.generate = generate
+        self.fetch_intel = fetch_intel
+        self.fallback = fallback
+        self.pool_size = pool_size
+        self.refresh_interval = refresh_interval
+        self.intel_poll_interval = intel_poll_interval
+        self.state = state
+        self._owner = str(uuid.uuid4())
+        self._synced_at = 0.0
+
+        # Start from the fallback data so the endpoint can serve immediately
+        self._hypotheses: List[Dict[str, Any]] = fallback()
+        self._source = "mock"
+        self._generated_at = datetime.now()
+        # Wall-clock time, comparable between workers
+        self._generated_ts = time.time()
+        self._intel_fingerprint: Optional[str] = None
+        self._last_error: Optional[str] = None
+
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._loop_task: Optional[asyncio.Task] = None
+
+    async def get(self, count: int) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """
+        Return up to count hypotheses from the pool together with its freshness metadata
+        """
+        if self.state is not None and time.time() - self._synced_at >= self.SYNC_INTERVAL:
+            # Reading the state backend blocks, so reads only leave the event loop every SYNC_INTERVAL
+            await run_in_thread(self._sync)
+        freshness = self.freshness()
+        if freshness["stale"]:
+            self.request_refresh("stale read")
+        return self._hypotheses[:count], freshness
+
+    def freshness(self) -> Dict[str, Any]:
+        """
+        Describe how fresh the current pool is
+        """
+        age = time.time() - self._generated_ts
+        return {
+            "generated_at": self._generated_at.isoformat(),
+            "age_seconds": round(age, 1),
+            "stale": self._source != "llm" or age > self.refresh_interval,
+            "source": self._source,
+            "refreshing": self._refresh_task is not None and not self._refresh_task.done(),
+            "pool_size": len(self._hypotheses),
+            "last_error": self._last_error
+        }
+
+    def request_refresh(self, reason: str) -> None:
+        """
+        Schedule a background refresh unless one is already running
+        """
+        if self._loop_task is None:
+            # Background refreshing has not been started (e.g. generation disabled)
+            return
+        if self._refresh_task is not None and not self._refresh_task.done():
+            return
+        logger.info(f"Refreshing hypothesis pool ({reason})")
+        self._refresh_task = asyncio.ensure_future(self.refresh())
+
+    async def refresh(self, threat_intel: Optional[str] = None) -> None:
+        """
+        Regenerate the pool, keeping the previous pool if generation fails
+        """
+        if self.state is not None:
+            acquired = await run_in_thread(
+                self.state.set_if_absent, CACHE, self.LEASE_KEY, self._owner, self.refresh_interval
+            )
+            if not acquired:
+                logger.info("Hypothesis pool is being refreshed by another worker")
+                return
+        try:
+            if threat_intel is None:
+                threat_intel = await self.fetch_intel()
+            fingerprint = self._fingerprint(threat_intel)
+
+            # Another worker may have refreshed for this threat intelligence already
+            await run_in_thread(self._sync, True)
+            if (self._source == "llm" and fingerprint == self._intel_fingerprint
+                    and time.time() - self._generated_ts < self.refresh_interval):
+                return
+
+            hypotheses = await self.generate(self.pool_size, threat_intel)
+            if not hypotheses:
+                raise ValueError("Hypothesis generation returned an empty pool")
+
+            self._hypotheses = hypotheses
+            self._source = "llm"
+            self._generated_at = datetime.now()
+            self._generated_ts = time.time()
+            self._intel_fingerprint = fingerprint
+            self._last_error = None
+            logger.info(f"Hypothesis pool refreshed with {len(hypotheses)} hypotheses")
+            if self.state is not None:
+                await run_in_thread(self.state.set, CACHE, self.SNAPSHOT_KEY, self._snapshot())
+        except Exception as e:
+            self._last_error = str(e)
+            logger.error(f"Error refreshing hypothesis pool, keeping previous pool: {str(e)}")
+        finally:
+            if self.state is not None:
+                await run_in_thread(self._release)
+
+    async def start(self) -> None:
+        """
+        Start the background refresher
+        """
+        if self._loop_task is None:
+            self._loop_task = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> None:
+        """
+        Stop the background refresher and any refresh in progress
+        """
+        for task in (self._loop_task, self._refresh_task):
+            if task is not None and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except (asyncio.CancelledError, Exception):
+                    pass
+        self._loop_task = None
+        self._refresh_task = None
+
+    async def _run(self) -> None:
+        """
+        Refresh on schedule, and early whenever the threat intelligence changes
+        """
+        self.request_refresh("startup")
+        while True:
+            await asyncio.sleep(min(self.refresh_interval, self.intel_poll_interval))
+
+            await run_in_thread(self._sync, True)
+            age = time.time() - self._generated_ts
+            if age >= self.refresh_interval:
+                self.request_refresh("scheduled")
+                continue
+
+            try:
+                threat_intel = await self.fetch_intel()
+            except Exception as e:
+                logger.error(f"Error polling threat intelligence: {str(e)}")
+                continue
+
+            if self._fingerprint(threat_intel) != self._intel_fingerprint:
+                if self._refresh_task is None or self._refresh_task.done():
+                    logger.info("Threat intelligence changed, refreshing hypothesis pool")
+                    self._refresh_task = asyncio.ensure_future(self.refresh(threat_intel))
+
+    def _release(self) -> None:
+        # A refresh outlasting refresh_interval has lost the lease, which another worker may hold now
+        if self.state.get(CACHE, self.LEASE_KEY) == self._owner:
+            self.state.delete(CACHE, self.LEASE_KEY)
+
+    def _snapshot(self) -> Dict[str, Any]:
+        return {
+            "hypotheses": self._hypotheses,
+            "source": self._source,
+            "generated_at": self._generated_at.isoformat(),
+            "generated_ts": self._generated_ts,
+            "intel_fingerprint": self._intel_fingerprint
+        }
+
+    def _sync(self, force: bool = False) -> None:
+        """
+        Adopt a newer pool published by another worker
+        """
+        if self.state is None or (not force and time.time() - self._synced_at < self.SYNC_INTERVAL):
+            return
+        self._synced_at = time.time()
+        try:
+            snapshot = self.state.get(CACHE, self.SNAPSHOT_KEY)
+        except Exception as e:
+            logger.error(f"Error reading shared hypothesis pool: {str(e)}")
+            return
+        if snapshot is None or (self._source == "llm" and snapshot["generated_ts"] <= self._generated_ts):
+            return
+        self._hypotheses = snapshot["hypotheses"]
+        self._source = snapshot["source"]
+        self._generated_at = datetime.fromisoformat(snapshot["generated_at"])
+        self._generated_ts = snapshot["generated_ts"]
+        self._intel_fingerprint = snapshot["intel_fingerprint"]
+
+    @staticmethod
+    def _fingerprint(threat_intel: str) -> str:
+        return hashlib.sha256(threat_intel.encode("utf-8")).hexdigest()
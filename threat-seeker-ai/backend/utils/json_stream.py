@@ -0,0 +1,206 @@
+import json
+import logging
+from typing import Any, List, Optional, Sequence, Tuple
+
+# Setup logger
+logger = logging.getLogger(__name__)
+
+_CLOSERS = {"{": "}", "[": "]"}
+
+
+class JsonArrayStreamParser:
+    """
+    Incremental parser for streamed JSON LLM output.
+
+    Chunks are fed as they arrive and every complete element of the target array is
+    returned as soon as its closing character has been seen, e.g. each hypothesis of a
+    top-level array (path ()) or each entry of "query_critiques" (path ("query_critiques",)).
+
+    The scanner only tracks structure (containers, strings, keys), so text before the
+    JSON document (such as a ```json fence) and after it is ignored. A malformed element
+    is skipped without affecting the others, and finish() recovers the longest valid
+    prefix of a truncated document by closing whatever containers are still open.
+    """
+
+    def __init__(self, path: Sequence[str] = ()):
+        self.path = list(path)
+        self.elements: List[Any] = []
+        self.skipped = 0
+
+        self._text = ""
+        self._pos = 0
+
+        self._stack: List[str] = []
+        self._key_stack: List[Optional[str]] = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._expect_key = False
+        self._pending_key: Optional[str] = None
+
+        self._root_start: Optional[int] = None
+        self._root_end: Optional[int] = None
+        self._target_depth: Optional[int] = None
+        self._target_done = False
+        self._element_start: Optional[int] = None
+
+        # Latest position where cutting the text and closing the open containers is valid JSON
+        self._safe_point: Tuple[int, str] = (0, "")
+
+    def feed(self, chunk: str) -> List[Any]:
+        """
+        Consume a chunk and return the target array elements completed by it
+        """
+        self._text += chunk
+        completed: List[Any] = []
+        text = self._text
+
+        while self._pos < len(text) and self._root_end is None:
+            i = self._pos
+            char = text[i]
+            self._pos += 1
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    self._end_string(i, completed)
+                continue
+
+            if self._root_start is None:
+                # Skip anything before the document, e.g. a markdown code fence
+                if char not in _CLOSERS:
+                    continue
+                self._root_start = i
+
+            if self._at_target_level() and self._element_start is None and char not in ",] \t\r\n":
+                self._element_start = i
+
+            if char == '"':
+                self._in_string = True
+                self._string_start = i
+            elif char in _CLOSERS:
+                self._open(char, i)
+            elif char in "}]":
+                self._close(i, completed)
+            elif char == ":":
+                self._expect_key = False
+            elif char == ",":
+                self._mark_safe(i)
+                if self._at_target_level() and self._element_start is not None:
+                    # A scalar element ends at the comma
+                    self._complete_element(self._element_start, i, completed)
+                if self._stack and self._stack[-1] == "{":
+                    self._expect_key = True
+                    self._pending_key = None
+
+        return completed
+
+    def finish(self) -> Tuple[Optional[Any], List[Any]]:
+        """
+        Return the parsed document (or its longest valid prefix) and all elements seen
+        """
+        if self._root_start is None:
+            return None, self.elements
+
+        if self._root_end is not None:
+            try:
+                return json.loads(self._text[self._root_start:self._root_end]), self.elements
+            except json.JSONDecodeError as e:
+                logger.warning(f"Streamed JSON document is malformed, recovering valid prefix: {str(e)}")
+
+        cut, closers = self._safe_point
+        try:
+            return json.loads(self._text[self._root_start:cut] + closers), self.elements
+        except json.JSONDecodeError as e:
+            logger.warning(f"Could not recover streamed JSON prefix: {str(e)}")
+            return None, self.elements
+
+    @property
+    def text(self) -> str:
+        return self._text
+
+    def _at_target_level(self) -> bool:
+        return (
+            self._target_depth is not None
+            and len(self._stack) == self._target_depth
+            and self._stack[-1] == "["
+        )
+
+    def _open(self, char: str, i: int) -> None:
+        key = self._pending_key if self._stack and self._stack[-1] == "{" else None
+        self._stack.append(char)
+        self._key_stack.append(key)
+        self._pending_key = None
+        self._expect_key = char == "{"
+
+        if (
+            char == "["
+            and self._target_depth is None
+            and not self._target_done
+            and [k for k in self._key_stack[1:]] == self.path
+            and (self.path or len(self._stack) == 1)
+        ):
+            self._target_depth = len(self._stack)
+            self._element_start = None
+        self._mark_safe(i + 1)
+
+    def _close(self, i: int, completed: List[Any]) -> None:
+        if not self._stack:
+            return
+        at_target = self._at_target_level()
+        if at_target and self._element_start is not None:
+            # A scalar element ends at the closing bracket
+            self._complete_element(self._element_start, i, completed)
+
+        self._stack.pop()
+        self._key_stack.pop()
+        self._pending_key = None
+        self._expect_key = False
+
+        if at_target:
+            self._target_depth = None
+            self._target_done = True
+        elif self._at_target_level() and self._element_start is not None:
+            self._complete_element(self._element_start, i + 1, completed)
+
+        if not self._stack:
+            self._root_end = i + 1
+        self._mark_safe(i + 1)
+
+    def _end_string(self, i: int, completed: List[Any]) -> None:
+        if self._stack and self._stack[-1] == "{" and self._expect_key:
+            try:
+                self._pending_key = json.loads(self._text[self._string_start:i + 1])
+            except json.JSONDecodeError:
+                self._pending_key = None
+            return
+        if self._at_target_level() and self._element_start == self._string_start:
+            self._complete_element(self._string_start, i + 1, completed)
+        self._mark_safe(i + 1)
+
+    def _complete_element(self, start: int, end: int, completed: List[Any]) -> None:
+        self._element_start = None
+        raw = self._text[start:end].strip()
+        if not raw:
+            return
+        try:
+            element = json.loads(raw)
+        except json.JSONDecodeError as e:
+            self.skipped += 1
+            logger.warning(f"Skipping malformed streamed JSON element: {str(e)}")
+            return
+        self.elements.append(element)
+        completed.append(element)
+
+    def _mark_safe(self, position: int) -> None:
+        if self._root_start is None:
+            return
+        if self._target_depth is not None and len(self._stack) > self._target_depth:
+            # Never cut inside a target element: recovered elements are always whole
+            return
+        closers = "".join(_CLOSERS[c] for c in reversed(self._stack))
+        self._safe_point = (position, closers)
@@ -0,0 +1,227 @@
+import functools
+import threading
+import time
+from bisect import bisect_left
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from utils.tracing import tracer
+
+# Latency buckets in seconds, from fast in-memory calls to slow LLM and SIEM round-trips
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+
+class _Metric:
+    """
+    Base class for metrics whose values are sharded per thread.
+
+    Each thread only ever writes to its own shard, so recording never takes a lock
+    and never contends with other threads; a scrape sums the shards.
+    """
+
+    metric_type = ""
+
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self._shards: Dict[int, Dict[Tuple[str, ...], Any]] = {}
+
+    def _shard(self) -> Dict[Tuple[str, ...], Any]:
+        ident = threading.get_ident()
+        shard = self._shards.get(ident)
+        if shard is None:
+            shard = self._shards.setdefault(ident, {})
+        return shard
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def _format_labels(self, key: Tuple[str, ...], extra: Optional[Tuple[str, str]] = None) -> str:
+        pairs = list(zip(self.label_names, key))
+        if extra:
+            pairs.append(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Monotonically increasing count, e.g. errors."""
+
+    metric_type = "counter"
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        shard = self._shard()
+        key = self._key(labels)
+        shard[key] = shard.get(key, 0.0) + amount
+
+    def values(self) -> Dict[Tuple[str, ...], float]:
+        merged: Dict[Tuple[str, ...], float] = {}
+        for shard in list(self._shards.values()):
+            for key, value in list(shard.items()):
+                merged[key] = merged.get(key, 0.0) + value
+        return merged
+
+    def render(self) -> List[str]:
+        return [f"{self.name}{self._format_labels(key)} {_number(value)}" for key, value in sorted(self.values().items())]
+
+
+class Gauge(Counter):
+    """Value that goes up and down, e.g. requests in flight."""
+
+    metric_type = "gauge"
+
+    def dec(self, amount: float = 1.0, **labels: Any) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    """Distribution of observed values (latencies) over fixed buckets."""
+
+    metric_type = "histogram"
+
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, label_names)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels: Any) -> None:
+        shard = self._shard()
+        key = self._key(labels)
+        series = shard.get(key)
+        if series is None:
+            # Per-bucket counts (non-cumulative, last slot is +Inf), then sum
+            series = shard[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self) -> List[str]:
+        merged: Dict[Tuple[str, ...], List[float]] = {}
+        for shard in list(self._shards.values()):
+            for key, series in list(shard.items()):
+                total = merged.setdefault(key, [0] * len(series))
+                for i, value in enumerate(series):
+                    total[i] += value
+
+        lines = []
+        for key, series in sorted(merged.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series[:-1]):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _number(bound)
+                lines.append(f"{self.name}_bucket{self._format_labels(key, ('le', le))} {cumulative}")
+            lines.append(f"{self.name}_sum{self._format_labels(key)} {_number(series[-1])}")
+            lines.append(f"{self.name}_count{self._format_labels(key)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Holds every metric and renders them in the Prometheus text exposition format
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def counter(self, name: str, help_text: str, label_names: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help_text, label_names))
+
+    def gauge(self, name: str, help_text: str, label_names: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, help_text, label_names))
+
+    def histogram(self, name: str, help_text: str, label_names: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help_text, label_names, buckets))
+
+    def _register(self, metric: _Metric) -> Any:
+        return self._metrics.setdefault(metric.name, metric)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.metric_type}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+# Shared registry scraped by /metrics
+metrics = MetricsRegistry()
+
+http_request_duration = metrics.histogram(
+    "threat_seeker_http_request_duration_seconds", "Latency of API requests by route",
+    ("method", "route", "status")
+)
+http_requests_in_flight = metrics.gauge(
+    "threat_seeker_http_requests_in_flight", "API requests currently being served", ("method", "route")
+)
+http_request_errors = metrics.counter(
+    "threat_seeker_http_request_errors_total", "API requests that returned a 5xx or 4xx status",
+    ("method", "route", "status")
+)
+
+agent_call_duration = metrics.histogram(
+    "threat_seeker_agent_call_duration_seconds", "Latency of agent method calls", ("agent", "method")
+)
+agent_calls_in_flight = metrics.gauge(
+    "threat_seeker_agent_calls_in_flight", "Agent method calls currently running", ("agent", "method")
+)
+agent_call_errors = metrics.counter(
+    "threat_seeker_agent_call_errors_total", "Agent method calls that raised", ("agent", "method")
+)
+
+connector_query_duration = metrics.histogram(
+    "threat_seeker_connector_query_duration_seconds", "Latency of connector queries", ("data_source",)
+)
+connector_queries_in_flight = metrics.gauge(
+    "threat_seeker_connector_queries_in_flight", "Connector queries currently running", ("data_source",)
+)
+connector_query_errors = metrics.counter(
+    "threat_seeker_connector_query_errors_total", "Connector queries that raised", ("data_source",)
+)
+
+
+def _instrument(span_name: str, span_kind: str, duration: Histogram, in_flight: Gauge, errors: Counter,
+                **labels: Any) -> Callable:
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        async def wrapper(*args: Any, **kwargs: Any) -> Any:
+            in_flight.inc(**labels)
+            start = time.perf_counter()
+            try:
+                with tracer.span(span_name, span_kind, **labels):
+                    return await func(*args, **kwargs)
+            except Exception:
+                errors.inc(**labels)
+                raise
+            finally:
+                duration.observe(time.perf_counter() - start, **labels)
+                in_flight.dec(**labels)
+        return wrapper
+    return decorator
+
+
+def instrument_agent(agent: str, method: str) -> Callable:
+    """
+    Record latency, in-flight calls and errors of an async agent method, and trace it
+    """
+    return _instrument(f"agent.{agent}.{method}", "internal", agent_call_duration, agent_calls_in_flight, agent_call_errors, agent=agent, method=method)
+
+
+def instrument_connector(data_source: str) -> Callable:
+    """
+    Record latency, in-flight queries and errors of a connector's execute_query, and trace it
+    """
+    return _instrument(f"connector.{data_source}.query", "client", connector_query_duration, connector_queries_in_flight, connector_query_errors,
+                       data_source=data_source)
@@ -0,0 +1,349 @@
+import asyncio
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Deque, Dict, Iterator, List, Optional, Set, Tuple
+
+from config.settings import settings
+from storage.state import JOB_TTL_SECONDS, PROGRESS, StateBackend, get_state_backend
+from utils.agent_registry import run_in_thread
+from utils.metrics import metrics
+from utils.serialization import dumps
+
+# Setup logger
+logger = logging.getLogger(__name__)
+
+# Each execution of a hunt has its own channel, started by its first event and closed after a terminal one
+START_EVENT = "hunt.started"
+TERMINAL_EVENTS = ("hunt.completed", "hunt.failed")
+
+progress_subscribers = metrics.gauge(
+    "threat_seeker_hunt_progress_subscribers", "Clients subscribed to hunt progress"
+)
+progress_events_dropped = metrics.counter(
+    "threat_seeker_hunt_progress_events_dropped_total", "Hunt progress events dropped for slow clients"
+)
+
+def is_terminal(message: str) -> bool:
+    """
+    Whether an encoded event ends its hunt (the type is always the first key)
+    """
+    return any(message.startswith(f'{{"type":"{event}"') for event in TERMINAL_EVENTS)
+
+
+# (plan_id, execution_id) of the hunt execution emitting in this context
+_current_hunt: ContextVar[Optional[Tuple[str, str]]] = ContextVar("current_hunt", default=None)
+
+
+class Subscription:
+    """
+    One client's bounded buffer of encoded events.
+
+    Publishing never waits: when the buffer is full the oldest event is dropped,
+    and the client is told how many it missed, so a slow browser cannot hold up
+    the executor.
+    """
+
+    def __init__(self, max_events: int, execution_id: Optional[str] = None):
+        self.max_events = max_events
+        # The execution followed; None until the plan's next execution publishes
+        self.execution_id = execution_id
+        self.dropped = 0
+        self._events: Deque[str] = deque()
+        self._ready = asyncio.Event()
+
+    def push(self, message: str) -> None:
+        if len(self._events) >= self.max_events:
+            self._events.popleft()
+            self.dropped += 1
+            progress_events_dropped.inc()
+        self._events.append(message)
+        self._ready.set()
+
+    async def get(self) -> List[str]:
+        """
+        Wait for events and return every buffered one
+        """
+        while not self._events:
+            self._ready.clear()
+            await self._ready.wait()
+        batch = list(self._events)
+        self._events.clear()
+        if self.dropped:
+            batch.insert(0, dumps({"type": "events_dropped", "count": self.dropped}).decode("utf-8"))
+            self.dropped = 0
+        return batch
+
+
+class _HuntChannel:
+    __slots__ = ("history", "seq", "finished")
+
+    def __init__(self, history_size: int):
+        self.history: Deque[Tuple[int, str]] = deque(maxlen=history_size)
+        self.seq = 0
+        self.finished = False
+
+
+class HuntProgress:
+    """
+    Per-execution fan-out of hunt lifecycle events (queries queued, started and
+    completed, retries, analysis, findings) to WebSocket subscribers.
+
+    Every run of /api/execute is its own execution with its own sequence of
+    events, so two runs of a plan never interleave on one client. Each event is
+    encoded once and the same string is pushed to every subscriber's bounded
+    buffer. The last events of each execution are kept so a client that
+    subscribes late still sees what already happened.
+
+    The executing worker also writes each execution's recent events to the shared
+    state backend every sync_interval seconds, and workers with subscribers poll
+    it, so a client can watch a hunt running on another worker (a sync_interval
+    behind) when STATE_BACKEND is shared.
+    """
+
+    def __init__(
+        self,
+        client_buffer: int = 256,
+        history_size: int = 200,
+        max_hunts: int = 100,
+        sync_interval: float = 0.5,
+        state: Optional[StateBackend] = None
+    ):
+        self.client_buffer = client_buffer
+        self.history_size = history_size
+        self.max_hunts = max_hunts
+        self.sync_interval = sync_interval
+        self._state = state
+        self._channels: "OrderedDict[Tuple[str, str], _HuntChannel]" = OrderedDict()
+        self._subscribers: Dict[str, Set[Subscription]] = {}
+        # Newest execution of each plan known here, as (started_at, execution_id)
+        self._latest: Dict[str, Tuple[float, str]] = {}
+        # Executions with events not yet written to the state backend, and new executions to announce
+        self._dirty: Set[Tuple[str, str]] = set()
+        self._started: Dict[str, Tuple[float, str]] = {}
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._sync_task: Optional[asyncio.Task] = None
+
+    @property
+    def state(self) -> StateBackend:
+        if self._state is None:
+            self._state = get_state_backend()
+        return self._state
+
+    @contextmanager
+    def bind(self, plan_id: str) -> Iterator[str]:
+        """
+        Start a new execution of a hunt and attribute emit() calls in this context
+        (and tasks started from it) to it; yields the execution ID
+        """
+        execution_id = uuid.uuid4().hex
+        token = _current_hunt.set((plan_id, execution_id))
+        try:
+            yield execution_id
+        finally:
+            _current_hunt.reset(token)
+
+    def emit(self, event_type: str, **data: Any) -> None:
+        """
+        Publish an event for the hunt execution bound to the current context, if any
+        """
+        hunt = _current_hunt.get()
+        if hunt is not None:
+            self.publish(hunt[0], hunt[1], event_type, **data)
+
+    def publish(self, plan_id: str, execution_id: str, event_type: str, **data: Any) -> None:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        if loop is None and self._loop is not None and not self._loop.is_closed():
+            # Subscribers are woken and events synced on the event loop; hand over from worker threads
+            self._loop.call_soon_threadsafe(lambda: self.publish(plan_id, execution_id, event_type, **data))
+            return
+
+        with self._lock:
+            key = (plan_id, execution_id)
+            channel = self._channel(key)
+            now = time.time()
+            if event_type == START_EVENT:
+                self._latest[plan_id] = self._started[plan_id] = (now, execution_id)
+            event = {
+                "type": event_type, "plan_id": plan_id, "execution_id": execution_id,
+                "seq": channel.seq + 1, "timestamp": now
+            }
+            event.update(data)
+            message = dumps(event).decode("utf-8")
+            subscribers = self._append(key, channel, channel.seq + 1, message)
+            self._dirty.add(key)
+        for subscription in subscribers:
+            subscription.push(message)
+        if loop is not None:
+            self._loop = loop
+            self._start_sync()
+
+    async def subscribe(
+        self, plan_id: str, execution_id: Optional[str] = None
+    ) -> Tuple[Subscription, List[str]]:
+        """
+        Subscribe to an execution of a hunt, by default its latest one (or the next
+        one when it has not run yet); returns the subscription and the events
+        published so far
+        """
+        self._loop = asyncio.get_running_loop()
+        if execution_id is None:
+            await self._refresh_latest(plan_id)
+            with self._lock:
+                latest = self._latest.get(plan_id)
+            execution_id = latest[1] if latest is not None else None
+        if execution_id is not None:
+            await self._pull(plan_id, execution_id)
+
+        subscription = Subscription(self.client_buffer, execution_id)
+        with self._lock:
+            self._subscribers.setdefault(plan_id, set()).add(subscription)
+            channel = self._channels.get((plan_id, execution_id)) if execution_id is not None else None
+            history = [message for _, message in channel.history] if channel is not None else []
+        progress_subscribers.inc()
+        self._start_sync()
+        return subscription, history
+
+    def unsubscribe(self, plan_id: str, subscription: Subscription) -> None:
+        with self._lock:
+            subscribers = self._subscribers.get(plan_id)
+            if subscribers is not None and subscription in subscribers:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[plan_id]
+                progress_subscribers.dec()
+
+    def _append(self, key: Tuple[str, str], channel: _HuntChannel, seq: int, message: str) -> List[Subscription]:
+        """
+        Record an event of an execution and return the subscribers to push it to.
+        Callers hold the lock.
+        """
+        channel.seq = seq
+        channel.history.append((seq, message))
+        if is_terminal(message):
+            channel.finished = True
+        subscribers = []
+        for subscription in self._subscribers.get(key[0], ()):
+            if subscription.execution_id is None:
+                # Waiting for the plan's next execution: this is it
+                subscription.execution_id = key[1]
+            if subscription.execution_id == key[1]:
+                subscribers.append(subscription)
+        return subscribers
+
+    def _channel(self, key: Tuple[str, str]) -> _HuntChannel:
+        channel = self._channels.get(key)
+        if channel is None:
+            channel = self._channels[key] = _HuntChannel(self.history_size)
+            # Forget the oldest executions nobody is watching
+            watched = {
+                (plan_id, subscription.execution_id)
+                for plan_id, subscribers in self._subscribers.items() for subscription in subscribers
+            }
+            for old_key in list(self._channels)[:-self.max_hunts]:
+                if old_key not in watched and old_key not in self._dirty:
+                    del self._channels[old_key]
+        else:
+            self._channels.move_to_end(key)
+        return channel
+
+    def _start_sync(self) -> None:
+        if self._sync_task is None or self._sync_task.done():
+            self._sync_task = asyncio.ensure_future(self._sync())
+
+    async def _sync(self) -> None:
+        """
+        Write local executions' new events to the state backend and read those of
+        executions watched here, while either has anything to do
+        """
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            with self._lock:
+                plan_ids = list(self._subscribers)
+                if not self._dirty and not plan_ids:
+                    return
+            try:
+                await self._flush()
+                for plan_id in plan_ids:
+                    await self._poll(plan_id)
+            except Exception as e:
+                logger.warning(f"Could not sync hunt progress with the state backend: {e}")
+
+    async def _flush(self) -> None:
+        with self._lock:
+            updates = [
+                (f"{plan_id}:{execution_id}", [list(entry) for entry in self._channels[(plan_id, execution_id)].history])
+                for plan_id, execution_id in self._dirty if (plan_id, execution_id) in self._channels
+            ]
+            updates.extend(
+                (plan_id, {"started_at": started_at, "execution_id": execution_id})
+                for plan_id, (started_at, execution_id) in self._started.items()
+            )
+            self._dirty.clear()
+            self._started.clear()
+        if updates:
+            await run_in_thread(self._write, updates)
+
+    def _write(self, updates: List[Tuple[str, Any]]) -> None:
+        for key, value in updates:
+            self.state.set(PROGRESS, key, value, JOB_TTL_SECONDS)
+
+    async def _poll(self, plan_id: str) -> None:
+        await self._refresh_latest(plan_id)
+        with self._lock:
+            latest = self._latest.get(plan_id)
+            executions = {
+                subscription.execution_id if subscription.execution_id is not None else (latest and latest[1])
+                for subscription in self._subscribers.get(plan_id, ())
+            }
+        for execution_id in executions:
+            if execution_id:
+                await self._pull(plan_id, execution_id)
+
+    async def _refresh_latest(self, plan_id: str) -> None:
+        """
+        Learn of a newer execution of a plan started by another worker
+        """
+        stored = await run_in_thread(self.state.get, PROGRESS, plan_id)
+        if not stored:
+            return
+        with self._lock:
+            latest = self._latest.get(plan_id)
+            if latest is None or stored["started_at"] > latest[0]:
+                self._latest[plan_id] = (stored["started_at"], stored["execution_id"])
+
+    async def _pull(self, plan_id: str, execution_id: str) -> None:
+        """
+        Copy the events of an execution published by another worker that are not here yet
+        """
+        key = (plan_id, execution_id)
+        with self._lock:
+            channel = self._channels.get(key)
+            if channel is not None and channel.finished:
+                return
+        stored = await run_in_thread(self.state.get, PROGRESS, f"{plan_id}:{execution_id}")
+        if not stored:
+            return
+        pushes = []
+        with self._lock:
+            channel = self._channel(key)
+            for seq, message in stored:
+                if seq > channel.seq:
+                    pushes.extend((subscription, message) for subscription in self._append(key, channel, seq, message))
+        for subscription, message in pushes:
+            subscription.push(message)
+
+
+hunt_progress = HuntProgress(
+    client_buffer=settings.PROGRESS_CLIENT_BUFFER,
+    history_size=settings.PROGRESS_HISTORY_SIZE,
+    sync_interval=settings.PROGRESS_SYNC_SECONDS
+)
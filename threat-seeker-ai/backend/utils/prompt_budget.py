@@ -0,0 +1,283 @@
+import logging
+import math
+import re
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, AsyncIterator, Callable, Deque, Dict, List, Optional, Tuple
+
+from utils.retry_handler import async_retry_with_exponential_backoff
+from utils.tracing import tracer
+
+# Setup logger
+logger = logging.getLogger(__name__)
+
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+TRUNCATION_MARKER = "...[truncated]"
+
+
+def count_tokens(text: str) -> int:
+    """
+    Estimate the number of LLM tokens in a piece of text.
+
+    Words are counted as one token per four characters (rounded up) and every
+    punctuation character as one token, which tracks SentencePiece-style tokenizers
+    closely enough for budgeting without a network round-trip to the model.
+    """
+    return sum(math.ceil(len(piece) / 4) for piece in _TOKEN_PATTERN.findall(text))
+
+
+class PromptSection:
+    """
+    A named part of a prompt. Sections with a higher priority number are trimmed first;
+    item sections are trimmed by dropping trailing items, text sections by truncation.
+    """
+
+    def __init__(self, name: str, priority: int, required: bool, text: str = "",
+                 items: Optional[List[str]] = None, header: str = ""):
+        self.name = name
+        self.priority = priority
+        self.required = required
+        self.text = text
+        self.items = items
+        self.header = header
+        self.dropped_items = 0
+        self.truncated = False
+
+        # Count while assembling so trimming never has to re-tokenize the whole prompt
+        if items is not None:
+            self.item_tokens = [count_tokens(item) for item in items]
+            self.tokens = count_tokens(header) + sum(self.item_tokens)
+        else:
+            self.tokens = count_tokens(text)
+
+    def render(self) -> str:
+        if self.items is None:
+            return self.text
+        if not self.items:
+            return ""
+        return self.header + "".join(self.items)
+
+    def trim(self, excess: int) -> int:
+        """
+        Remove at least excess tokens if possible, returning how many were removed
+        """
+        removed = 0
+        if self.items is not None:
+            # Leave room for the note that tells the model how many items were omitted
+            while self.items and removed - self._note_tokens(self.dropped_items) < excess:
+                self.items.pop()
+                removed += self.item_tokens.pop()
+                self.dropped_items += 1
+            if not self.items and self.header:
+                removed += count_tokens(self.header)
+            if self.dropped_items and self.items:
+                note = self._note(self.dropped_items)
+                self.items.append(note)
+                self.item_tokens.append(count_tokens(note))
+                removed -= self.item_tokens[-1]
+        else:
+            keep_tokens = max(0, self.tokens - excess)
+            # Approximate the cut point in characters, then re-count the kept text
+            keep_chars = int(len(self.text) * keep_tokens / max(self.tokens, 1))
+            self.text = self.text[:keep_chars] + TRUNCATION_MARKER if keep_chars else ""
+            self.truncated = True
+            new_tokens = count_tokens(self.text)
+            removed = self.tokens - new_tokens
+        self.tokens -= removed
+        return removed
+
+    @staticmethod
+    def _note(dropped_items: int) -> str:
+        return f"(and {dropped_items} more omitted to fit the prompt budget)\n"
+
+    def _note_tokens(self, dropped_items: int) -> int:
+        return count_tokens(self._note(dropped_items)) if dropped_items else 0
+
+
+class PromptBuilder:
+    """
+    Assembles prompt inputs section by section while counting tokens, and enforces a
+    token budget by trimming the lowest-priority sections first.
+    """
+
+    def __init__(self, agent: str, budget: int, template: str = ""):
+        self.agent = agent
+        self.budget = budget
+        self.template_tokens = count_tokens(template)
+        self.sections: List[PromptSection] = []
+
+    def add(self, name: str, text: str, priority: int = 0, required: bool = False) -> "PromptBuilder":
+        """
+        Add a free-text section
+        """
+        self.sections.append(PromptSection(name, priority, required, text=text))
+        return self
+
+    def add_items(self, name: str, items: List[str], priority: int = 1,
+                  required: bool = False, header: str = "") -> "PromptBuilder":
+        """
+        Add a section made of independent items (e.g. one per query) trimmed from the end
+        """
+        self.sections.append(PromptSection(name, priority, required, items=list(items), header=header))
+        return self
+
+    @property
+    def tokens(self) -> int:
+        return self.template_tokens + sum(section.tokens for section in self.sections)
+
+    def build(self) -> Dict[str, str]:
+        """
+        Trim to the budget and render the sections, joining sections that share a name
+        """
+        excess = self.tokens - self.budget
+        if excess > 0:
+            trimmable = [s for s in self.sections if not s.required]
+            for section in sorted(trimmable, key=lambda s: s.priority, reverse=True):
+                if excess <= 0:
+                    break
+                excess -= section.trim(excess)
+            if excess > 0:
+                logger.warning(
+                    f"{self.agent} prompt exceeds its budget of {self.budget} tokens "
+                    f"by {excess} tokens after trimming"
+                )
+
+        rendered: Dict[str, str] = {}
+        for section in self.sections:
+            rendered[section.name] = rendered.get(section.name, "") + section.render()
+        return rendered
+
+    def report(self) -> Dict[str, Any]:
+        """
+        Describe the assembled prompt size and what was trimmed
+        """
+        return {
+            "prompt_tokens": self.tokens,
+            "budget": self.budget,
+            "trimmed_sections": [
+                {"section": s.name, "dropped_items": s.dropped_items, "truncated": s.truncated}
+                for s in self.sections if s.dropped_items or s.truncated
+            ]
+        }
+
+
+class PromptUsageRecorder:
+    """
+    Records prompt size, completion size and latency for every LLM call, per agent
+    """
+
+    def __init__(self, history_size: int = 200):
+        self.totals: Dict[str, Dict[str, Any]] = {}
+        self.history: Deque[Dict[str, Any]] = deque(maxlen=history_size)
+
+    def record(self, agent: str, prompt_tokens: int, completion_tokens: int,
+               latency: float, budget: int, trimmed: bool, status: str = "success") -> None:
+        totals = self.totals.setdefault(agent, {
+            "calls": 0,
+            "errors": 0,
+            "trimmed_calls": 0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "max_prompt_tokens": 0,
+            "total_latency": 0.0,
+            "budget": budget
+        })
+        totals["calls"] += 1
+        totals["errors"] += status != "success"
+        totals["trimmed_calls"] += trimmed
+        totals["prompt_tokens"] += prompt_tokens
+        totals["completion_tokens"] += completion_tokens
+        totals["max_prompt_tokens"] = max(totals["max_prompt_tokens"], prompt_tokens)
+        totals["total_latency"] += latency
+        totals["budget"] = budget
+
+        self.history.append({
+            "agent": agent,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "latency": round(latency, 3),
+            "trimmed": trimmed,
+            "status": status,
+            "recorded_at": datetime.now().isoformat()
+        })
+
+    def summary(self) -> Dict[str, Any]:
+        agents = {}
+        for agent, totals in self.totals.items():
+            calls = totals["calls"] or 1
+            agents[agent] = dict(
+                totals,
+                total_latency=round(totals["total_latency"], 3),
+                avg_prompt_tokens=round(totals["prompt_tokens"] / calls, 1),
+                avg_completion_tokens=round(totals["completion_tokens"] / calls, 1),
+                avg_latency=round(totals["total_latency"] / calls, 3)
+            )
+        return {"agents": agents, "recent_calls": list(self.history)}
+
+
+# Shared recorder for all agents
+prompt_usage = PromptUsageRecorder()
+
+
+class StreamInterruptedError(RuntimeError):
+    """Raised when an LLM stream fails after some output has already been delivered."""
+
+
+async def stream_with_budget(builder: PromptBuilder, astream: Callable[..., Any], **retry_kwargs: Any) -> AsyncIterator[str]:
+    """
+    Build the prompt inputs and yield completion chunks as the LLM produces them
+
+    Opening the stream (up to its first chunk) is retried on rate limits; a
+    failure after output has been yielded is raised as StreamInterruptedError so
+    callers can keep what they already received.
+    """
+    inputs = builder.build()
+    report = builder.report()
+    trimmed = bool(report["trimmed_sections"])
+    start = time.perf_counter()
+    completion_tokens = 0
+    status = "error"
+    # Not made the active span: the context cannot be held across the yields below
+    span = tracer.start_span(f"llm.{builder.agent}.stream", "client", agent=builder.agent,
+                             prompt_tokens=report["prompt_tokens"])
+
+    async def open_stream() -> Tuple[Any, str]:
+        iterator = astream(inputs).__aiter__()
+        try:
+            first_chunk = await iterator.__anext__()
+        except StopAsyncIteration:
+            first_chunk = ""
+        return iterator, first_chunk
+
+    try:
+        # Retry attempts are children of the LLM span; no yield happens while it is active
+        with tracer.use_span(span):
+            iterator, first_chunk = await async_retry_with_exponential_backoff(open_stream, **retry_kwargs)
+        completion_tokens += count_tokens(first_chunk)
+        yield first_chunk
+
+        chunk_count = 1
+        try:
+            async for chunk in iterator:
+                chunk_count += 1
+                completion_tokens += count_tokens(chunk)
+                yield chunk
+        except Exception as e:
+            raise StreamInterruptedError(f"LLM stream interrupted after {chunk_count} chunks") from e
+        status = "success"
+    except GeneratorExit:
+        # The caller stopped reading early, e.g. once it had enough elements
+        status = "success"
+        raise
+    except BaseException as e:
+        if span is not None:
+            span.record_error(e)
+        raise
+    finally:
+        prompt_usage.record(builder.agent, report["prompt_tokens"], completion_tokens,
+                            time.perf_counter() - start, builder.budget, trimmed, status=status)
+        if span is not None:
+            span.set_attribute("completion_tokens", completion_tokens)
+            tracer.end_span(span)
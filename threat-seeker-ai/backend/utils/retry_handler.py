@@ -4,6 +4,9 @@ import asyncio
 import random
 from typing import Callable, Any, TypeVar, Optional, Dict
 
+from utils.progress import hunt_progress
+from utils.tracing import tracer
+
 # Create a type variable for the return type of the function
 T = TypeVar('T')
 
@@ -88,7 +91,8 @@ async def async_retry_with_exponential_backoff(
     # Try up to max_retries times
     for attempt in range(max_retries + 1):
         try:
-            return await func(*args, **kwargs)
+            with tracer.span("retry.attempt", attempt=attempt + 1, function=getattr(func, "__name__", "call")):
+                return await func(*args, **kwargs)
         except Exception as e:
             last_exception = e
             
@@ -114,6 +118,10 @@ async def async_retry_with_exponential_backoff(
                 f"Attempt {attempt + 1}/{max_retries}. Error: {str(e)}"
             )
             
+            hunt_progress.emit(
+                "retry", function=getattr(func, "__name__", "call"), attempt=attempt + 1, delay=round(delay, 1)
+            )
+            
             # Wait before retrying
             await asyncio.sleep(delay)
     
@@ -159,7 +167,8 @@ def retry_with_exponential_backoff(
     # Try up to max_retries times
     for attempt in range(max_retries + 1):
         try:
-            return func(*args, **kwargs)
+            with tracer.span("retry.attempt", attempt=attempt + 1, function=getattr(func, "__name__", "call")):
+                return func(*args, **kwargs)
         except Exception as e:
             last_exception = e
             
@@ -185,6 +194,10 @@ def retry_with_exponential_backoff(
                 f"Attempt {attempt + 1}/{max_retries}. Error: {str(e)}"
             )
             
+            hunt_progress.emit(
+                "retry", function=getattr(func, "__name__", "call"), attempt=attempt + 1, delay=round(delay, 1)
+            )
+            
             # Wait before retrying
             time.sleep(delay)
     
@@ -0,0 +1,240 @@
+import gzip
+import json
+import struct
+import sys
+from array import array
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import orjson
+except ImportError:  # Optional accelerator, the stdlib encoder is used without it
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:  # Optional, responses fall back to gzip without it
+    zstandard = None
+
+JSON_MEDIA_TYPE = "application/json"
+COLUMNAR_MEDIA_TYPE = "application/vnd.threat-seeker.columnar"
+
+COLUMNAR_MAGIC = b"TSCOL001"
+
+# Largest integer a float64 (and a JavaScript number) represents exactly
+_MAX_SAFE_INTEGER = 2 ** 53 - 1
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if hasattr(value, "model_dump"):
+        return value.model_dump()
+    if isinstance(value, (set, frozenset, tuple)):
+        return list(value)
+    return str(value)
+
+
+def dumps(obj: Any) -> bytes:
+    """
+    Encode a result payload as compact UTF-8 JSON, using orjson when it is installed.
+
+    Unlike FastAPI's default response path, the payload is not validated against a
+    response model nor walked by jsonable_encoder first, which dominates the cost of
+    encoding large raw result sets.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def loads(data: Any) -> Any:
+    """
+    Decode JSON produced by dumps
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(bytes(data) if isinstance(data, memoryview) else data)
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """
+    Pick the best content coding the client accepts: zstd (when available), then gzip
+    """
+    if not accept_encoding:
+        return None
+    accepted: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[coding.strip().lower()] = quality
+
+    wildcard = accepted.get("*", 0.0)
+    for coding in ("zstd", "gzip"):
+        if coding == "zstd" and zstandard is None:
+            continue
+        if accepted.get(coding, wildcard) > 0:
+            return coding
+    return None
+
+
+def compress(body: bytes, encoding: Optional[str]) -> bytes:
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=3).compress(body)
+    if encoding == "gzip":
+        # Level 5 keeps most of the ratio of level 9 at a fraction of the CPU time
+        return gzip.compress(body, compresslevel=5)
+    return body
+
+
+def wants_columnar(accept: Optional[str]) -> bool:
+    return bool(accept) and COLUMNAR_MEDIA_TYPE in accept
+
+
+def encode_payload(payload: Dict[str, Any], columnar: bool, encoding: Optional[str],
+                   min_compress_bytes: int = 1024) -> Tuple[bytes, Optional[str]]:
+    """
+    Serialize a hunt result and compress it when it is large enough to benefit.
+    Returns the body and the content coding actually applied.
+    """
+    body = encode_columnar(payload) if columnar else dumps(payload)
+    if encoding is None or len(body) < min_compress_bytes:
+        return body, None
+    return compress(body, encoding), encoding
+
+
+def _column_type(values: List[Any]) -> str:
+    numeric = True
+    for value in values:
+        if value is None or isinstance(value, bool) or not isinstance(value, (int, float)):
+            numeric = False
+            break
+        if isinstance(value, int) and abs(value) > _MAX_SAFE_INTEGER:
+            numeric = False
+            break
+    return "f64" if numeric and values else "dict"
+
+
+def _little_endian(values: array) -> bytes:
+    if sys.byteorder != "little":
+        values.byteswap()
+    return values.tobytes()
+
+
+def encode_columnar(payload: Dict[str, Any]) -> bytes:
+    """
+    Encode a hunt result in the columnar binary format used by the hunt-results page.
+
+    Layout: the 8-byte magic, a little-endian u32 header length, the JSON header,
+    then one 8-byte aligned buffer per column. Every query's events become a table
+    whose columns are either "f64" (all values numeric, stored as float64) or
+    "dict" (the distinct values, listed in the JSON header, plus u16 or u32
+    indices into them). Repeated values such as host names, users and event codes
+    are stored once, so the body is much smaller than JSON before compression and
+    decodes into typed arrays without parsing every event.
+    """
+    raw_results = payload.get("raw_results") or {}
+    query_results = raw_results.get("query_results") or []
+
+    buffers: List[bytes] = []
+    offset = 0
+    tables = []
+    for query_result in query_results:
+        events = query_result.get("results") or []
+        names: Dict[str, None] = {}
+        for event in events:
+            for name in event:
+                names.setdefault(name, None)
+
+        columns = []
+        for name in names:
+            values = [event.get(name) for event in events]
+            column_type = _column_type(values)
+            if column_type == "f64":
+                data = _little_endian(array("d", values))
+                column = {"name": name, "type": "f64"}
+            else:
+                # Strings (the common case) are their own key; other values are keyed by
+                # their JSON so that 1, 1.0 and True stay distinct
+                lookup: Dict[Any, int] = {}
+                distinct: List[Any] = []
+                indices = []
+                for value in values:
+                    key = value if isinstance(value, str) else (dumps(value),)
+                    index = lookup.get(key)
+                    if index is None:
+                        index = lookup[key] = len(distinct)
+                        distinct.append(value)
+                    indices.append(index)
+                width = "H" if len(distinct) <= 0xFFFF else "I"
+                data = _little_endian(array(width, indices))
+                column = {
+                    "name": name,
+                    "type": "dict",
+                    "index_bytes": array(width).itemsize,
+                    "dictionary": distinct
+                }
+            padding = -len(data) % 8
+            column.update(offset=offset, length=len(data))
+            buffers.append(data + b"\0" * padding)
+            offset += len(data) + padding
+            columns.append(column)
+
+        table = {k: v for k, v in query_result.items() if k != "results"}
+        table.update(rows=len(events), columns=columns)
+        tables.append(table)
+
+    meta = {k: v for k, v in payload.items() if k != "raw_results"}
+    meta["raw_results"] = {k: v for k, v in raw_results.items() if k != "query_results"}
+    header = dumps({"version": 1, "meta": meta, "tables": tables})
+    # Pad the header so column buffers start 8-byte aligned for Float64Array views
+    header += b" " * (-(len(COLUMNAR_MAGIC) + 4 + len(header)) % 8)
+    return COLUMNAR_MAGIC + struct.pack("<I", len(header)) + header + b"".join(buffers)
+
+
+def decode_columnar(data: bytes) -> Dict[str, Any]:
+    """
+    Rebuild the hunt result dictionary from the columnar format
+    """
+    if data[:len(COLUMNAR_MAGIC)] != COLUMNAR_MAGIC:
+        raise ValueError("Not a columnar hunt result")
+    (header_length,) = struct.unpack_from("<I", data, len(COLUMNAR_MAGIC))
+    body_start = len(COLUMNAR_MAGIC) + 4 + header_length
+    header = json.loads(data[len(COLUMNAR_MAGIC) + 4:body_start])
+    body = memoryview(data)[body_start:]
+
+    query_results = []
+    for table in header["tables"]:
+        rows = table.pop("rows")
+        columns = table.pop("columns")
+        decoded = []
+        for column in columns:
+            chunk = body[column["offset"]:column["offset"] + column["length"]]
+            if column["type"] == "f64":
+                values = array("d")
+                values.frombytes(chunk)
+                if sys.byteorder != "little":
+                    values.byteswap()
+                decoded.append((column["name"], [int(v) if v.is_integer() else v for v in values]))
+            else:
+                indices = array("H" if column["index_bytes"] == 2 else "I")
+                indices.frombytes(chunk)
+                if sys.byteorder != "little":
+                    indices.byteswap()
+                dictionary = column["dictionary"]
+                decoded.append((column["name"], [dictionary[i] for i in indices]))
+        table["results"] = [
+            {name: values[row] for name, values in decoded if values[row] is not None}
+            for row in range(rows)
+        ]
+        query_results.append(table)
+
+    result = header["meta"]
+    result["raw_results"]["query_results"] = query_results
+    return result
@@ -0,0 +1,341 @@
+import json
+import logging
+import os
+import queue
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional
+
+# Setup logger
+logger = logging.getLogger(__name__)
+
+SERVICE_NAME = "threat-seeker-api"
+
+
+class Span:
+    """
+    A timed operation within a trace, e.g. an API request, an agent call,
+    a connector query, a retry attempt or an LLM invocation
+    """
+
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "kind", "attributes",
+                 "start_ns", "end_ns", "status", "error")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], kind: str,
+                 attributes: Dict[str, Any]):
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.attributes = attributes
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.status = "ok"
+        self.error: Optional[str] = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def record_error(self, error: BaseException) -> None:
+        self.status = "error"
+        self.error = f"{type(error).__name__}: {error}"
+
+    @property
+    def duration_ms(self) -> float:
+        end_ns = self.end_ns if self.end_ns is not None else time.time_ns()
+        return (end_ns - self.start_ns) / 1e6
+
+    def to_otlp(self) -> Dict[str, Any]:
+        """
+        Encode the span the way the OTLP/JSON exporter does
+        """
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id or "",
+            "name": self.name,
+            "kind": _OTLP_KINDS.get(self.kind, 1),
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or self.start_ns),
+            "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in self.attributes.items()],
+            "status": {"code": 2, "message": self.error} if self.status == "error" else {"code": 1}
+        }
+
+
+# OTLP SpanKind values: internal, server, client
+_OTLP_KINDS = {"internal": 1, "server": 2, "client": 3}
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class FileSpanExporter:
+    """
+    Appends finished traces to a file in the OTLP/JSON file format, one
+    ExportTraceServiceRequest per line, which an OpenTelemetry collector's
+    file receiver (or any OTLP tooling) can ingest.
+
+    Traces are encoded and written by a background thread, so exporting never
+    blocks the event loop; when the thread falls queue_size traces behind,
+    further traces are dropped and counted. Once the file reaches max_bytes it
+    is rotated to path.1 (path.1 to path.2, and so on), keeping backups files.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 50 * 2 ** 20, backups: int = 3, queue_size: int = 1000):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.dropped = 0
+        self._queue: "queue.Queue[Optional[List[Span]]]" = queue.Queue(queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def export(self, spans: List[Span]) -> None:
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+                    self._thread.start()
+        try:
+            self._queue.put_nowait(list(spans))
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self, timeout: float = 5.0) -> None:
+        """
+        Write the queued traces and stop the background thread
+        """
+        if self._thread is None:
+            return
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self) -> None:
+        while True:
+            spans = self._queue.get()
+            if spans is None:
+                return
+            request = {
+                "resourceSpans": [{
+                    "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+                    "scopeSpans": [{"scope": {"name": __name__}, "spans": [span.to_otlp() for span in spans]}]
+                }]
+            }
+            line = (json.dumps(request, separators=(",", ":")) + "\n").encode("utf-8")
+            try:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                self._rotate(len(line))
+                with open(self.path, "ab") as f:
+                    f.write(line)
+            except OSError as e:
+                logger.warning(f"Could not export trace to {self.path}: {str(e)}")
+
+    def _rotate(self, incoming: int) -> None:
+        try:
+            size = os.path.getsize(self.path)
+        except FileNotFoundError:
+            return
+        if size == 0 or size + incoming <= self.max_bytes:
+            return
+        if self.backups <= 0:
+            os.remove(self.path)
+            return
+        for number in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{number}"):
+                os.replace(f"{self.path}.{number}", f"{self.path}.{number + 1}")
+        os.replace(self.path, f"{self.path}.1")
+
+
+class Tracer:
+    """
+    Creates spans, keeps recent traces in memory for the waterfall view and
+    hands every finished trace to the exporter.
+
+    The active span is held in a context variable, so spans opened in a coroutine
+    become children of the span that was active when it was awaited or its task
+    was created. Spans are also opened and ended in worker threads, so the recent
+    traces are only read and changed under the tracer's lock.
+    """
+
+    def __init__(self, history_size: int = 200, exporter: Optional[FileSpanExporter] = None,
+                 enabled: bool = True):
+        self.history_size = history_size
+        self.exporter = exporter
+        self.enabled = enabled
+        self._traces: "OrderedDict[str, List[Span]]" = OrderedDict()
+        self._open_spans: Dict[str, int] = {}
+        self._hunts: Dict[str, List[str]] = {}
+        self._lock = threading.Lock()
+
+    def configure(self, enabled: bool, export_path: Optional[str], history_size: int,
+                  export_max_bytes: int = 50 * 2 ** 20, export_backups: int = 3) -> None:
+        self.enabled = enabled
+        self.history_size = history_size
+        self.exporter = FileSpanExporter(export_path, export_max_bytes, export_backups) if export_path else None
+
+    def close(self) -> None:
+        """
+        Write the traces still queued for export
+        """
+        if self.exporter is not None:
+            self.exporter.close()
+
+    def start_span(self, name: str, kind: str = "internal", **attributes: Any) -> Optional[Span]:
+        """
+        Create a span under the active one without making it active; the caller
+        must pass it to end_span. Used where a context manager cannot span the work,
+        e.g. across the yields of an async generator.
+        """
+        if not self.enabled:
+            return None
+        parent = _current_span.get()
+        trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        span = Span(name, trace_id, parent.span_id if parent else None, kind, attributes)
+
+        with self._lock:
+            trace = self._traces.get(trace_id)
+            if trace is None:
+                trace = self._traces[trace_id] = []
+                self._evict()
+            trace.append(span)
+            self._open_spans[trace_id] = self._open_spans.get(trace_id, 0) + 1
+        return span
+
+    def end_span(self, span: Optional[Span]) -> None:
+        if span is None or span.end_ns is not None:
+            return
+        span.end_ns = time.time_ns()
+        with self._lock:
+            remaining = self._open_spans.get(span.trace_id, 1) - 1
+            if remaining > 0:
+                self._open_spans[span.trace_id] = remaining
+                return
+            # Every span of the trace has finished: export it as one batch
+            self._open_spans.pop(span.trace_id, None)
+            spans = list(self._traces.get(span.trace_id, []))
+        if self.exporter is not None:
+            self.exporter.export(spans)
+
+    @contextmanager
+    def span(self, name: str, kind: str = "internal", **attributes: Any) -> Iterator[Optional[Span]]:
+        """
+        Open a span, make it the active one for the enclosed block and close it afterwards
+        """
+        span = self.start_span(name, kind, **attributes)
+        if span is None:
+            yield None
+            return
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.record_error(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            self.end_span(span)
+
+    @contextmanager
+    def use_span(self, span: Optional[Span]) -> Iterator[None]:
+        """
+        Make an existing span the active one for the enclosed block without ending it
+        """
+        if span is None:
+            yield
+            return
+        token = _current_span.set(span)
+        try:
+            yield
+        finally:
+            _current_span.reset(token)
+
+    def current_span(self) -> Optional[Span]:
+        return _current_span.get()
+
+    def tag_hunt(self, plan_id: str) -> None:
+        """
+        Associate the active trace with a hunt so it appears in the hunt's waterfall
+        """
+        span = _current_span.get()
+        if span is None or not plan_id:
+            return
+        with self._lock:
+            trace_ids = self._hunts.setdefault(plan_id, [])
+            if span.trace_id not in trace_ids:
+                trace_ids.append(span.trace_id)
+            root = self._traces.get(span.trace_id, [span])[0]
+        root.set_attribute("hunt.plan_id", plan_id)
+
+    def waterfall(self, plan_id: str) -> Optional[Dict[str, Any]]:
+        """
+        All spans recorded for a hunt (planning, execution, analysis, clarification),
+        ordered by start time with offsets relative to the first one
+        """
+        with self._lock:
+            trace_ids = [t for t in self._hunts.get(plan_id, []) if t in self._traces]
+            spans = [span for trace_id in trace_ids for span in self._traces[trace_id]]
+        if not trace_ids:
+            return None
+        spans.sort(key=lambda s: s.start_ns)
+        origin = spans[0].start_ns
+        end = max(s.end_ns or time.time_ns() for s in spans)
+
+        depths: Dict[str, int] = {}
+        rows = []
+        for span in spans:
+            depth = depths[span.parent_id] + 1 if span.parent_id in depths else 0
+            depths[span.span_id] = depth
+            rows.append({
+                "trace_id": span.trace_id,
+                "span_id": span.span_id,
+                "parent_id": span.parent_id,
+                "name": span.name,
+                "depth": depth,
+                "offset_ms": round((span.start_ns - origin) / 1e6, 3),
+                "duration_ms": round(span.duration_ms, 3),
+                "status": span.status,
+                "error": span.error,
+                "in_progress": span.end_ns is None,
+                "attributes": span.attributes
+            })
+        return {
+            "plan_id": plan_id,
+            "trace_ids": trace_ids,
+            "total_ms": round((end - origin) / 1e6, 3),
+            "spans": rows
+        }
+
+    def _evict(self) -> None:
+        # Callers hold the lock
+        while len(self._traces) > self.history_size:
+            trace_id, _ = self._traces.popitem(last=False)
+            self._open_spans.pop(trace_id, None)
+            for plan_id in [p for p, ids in self._hunts.items() if trace_id in ids]:
+                self._hunts[plan_id].remove(trace_id)
+                if not self._hunts[plan_id]:
+                    del self._hunts[plan_id]
+
+
+# Shared tracer, configured from settings at startup
+tracer = Tracer()
+
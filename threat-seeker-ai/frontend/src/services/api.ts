@@ -1,4 +1,5 @@
 import axios from 'axios';
+import { COLUMNAR_MEDIA_TYPE, columnarToHuntResult } from './columnar';
 
 // Create axios instance with base configuration
 const api = axios.create({
@@ -23,6 +24,7 @@ export interface HuntPlan {
   analyst_id: string;
   mitre_techniques: MitreTechnique[];
   estimated_execution_time: string;
+  similar_hunts?: HuntSearchHit[];
 }
 
 export interface Query {
@@ -68,6 +70,71 @@ export interface ClarificationResponse {
   confidence: number;
 }
 
+export interface HuntStatus {
+  plan_id: string;
+  status: 'running' | 'completed' | 'failed';
+  stage: string;
+  query_ids: string[];
+  started_at: string;
+  updated_at: string;
+  result_id: string | null;
+  error: string | null;
+}
+
+export interface HuntProgressEvent {
+  type: string;
+  plan_id?: string;
+  seq?: number;
+  timestamp?: number;
+  query_id?: string;
+  data_source?: string;
+  row_count?: number;
+  count?: number;
+  [key: string]: any;
+}
+
+export interface HuntSearchHit {
+  id: string;
+  type: string;
+  score: number;
+  [key: string]: any;
+}
+
+export interface HuntSearchResponse {
+  query: string;
+  total: number;
+  results: HuntSearchHit[];
+  facets: Record<string, Record<string, number>>;
+  took_ms: number;
+}
+
+export interface ResultEventsPage {
+  result_id: string;
+  query_id: string;
+  events: Record<string, any>[];
+  next_cursor: string | null;
+  total_matching: number | null;
+  total_events: number;
+}
+
+export interface StoredHuntResult {
+  result_id: string;
+  plan_id: string;
+  created_at: string;
+  total_queries: number;
+  total_events: number;
+  findings: number;
+}
+
+export interface ResultEventsQuery {
+  cursor?: string;
+  limit?: number;
+  sort?: string;
+  order?: 'asc' | 'desc';
+  filter?: string[];
+  fields?: string[];
+}
+
 // API Service functions
 export interface Hypothesis {
   id: string;
@@ -82,6 +149,16 @@ export interface Hypothesis {
   generated_at: string;
 }
 
+export interface HypothesisPoolFreshness {
+  generated_at: string;
+  age_seconds: number;
+  stale: boolean;
+  source: 'llm' | 'mock';
+  refreshing: boolean;
+  pool_size: number;
+  last_error: string | null;
+}
+
 export const apiService = {
   // Create a hunt plan from a natural language hypothesis
   async createHuntPlan(request: HypothesisRequest): Promise<HuntPlan> {
@@ -95,6 +172,60 @@ export const apiService = {
     return response.data;
   },
 
+  // Execute approved queries and receive the results in the compact columnar format
+  async executeHuntPlanColumnar(request: QueryApprovalRequest): Promise<HuntResult> {
+    const response = await api.post<ArrayBuffer>('/execute', request, {
+      headers: { Accept: COLUMNAR_MEDIA_TYPE },
+      responseType: 'arraybuffer',
+    });
+    return columnarToHuntResult(response.data) as HuntResult;
+  },
+
+  // List recently stored hunt results for hunt history
+  async listHuntResults(limit: number = 20): Promise<StoredHuntResult[]> {
+    const response = await api.get<{ results: StoredHuntResult[] }>(`/results?limit=${limit}`);
+    return response.data.results;
+  },
+
+  // Read a stored hunt result (analysis and per-query counts, without raw events)
+  async getHuntResult(resultId: string): Promise<HuntResult> {
+    const response = await api.get<HuntResult>(`/results/${resultId}`);
+    return response.data;
+  },
+
+  // Read one page of a stored query's raw events
+  async getResultEvents(resultId: string, queryId: string, query: ResultEventsQuery = {}): Promise<ResultEventsPage> {
+    const params = new URLSearchParams();
+    if (query.cursor) params.set('cursor', query.cursor);
+    if (query.limit) params.set('limit', String(query.limit));
+    if (query.sort) params.set('sort', query.sort);
+    if (query.order) params.set('order', query.order);
+    if (query.fields?.length) params.set('fields', query.fields.join(','));
+    query.filter?.forEach((expression) => params.append('filter', expression));
+    const response = await api.get<ResultEventsPage>(`/results/${resultId}/queries/${queryId}/events`, { params });
+    return response.data;
+  },
+
+  // Execution status of a hunt
+  async getHuntStatus(planId: string): Promise<HuntStatus> {
+    const response = await api.get<HuntStatus>(`/hunts/${planId}/status`);
+    return response.data;
+  },
+
+  // Subscribe to a hunt's live progress events; returns a function that closes the channel
+  subscribeHuntProgress(planId: string, onEvent: (event: HuntProgressEvent) => void): () => void {
+    const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
+    const socket = new WebSocket(`${protocol}//${window.location.host}/api/hunts/${planId}/progress`);
+    socket.onmessage = (message) => onEvent(JSON.parse(message.data));
+    return () => socket.close();
+  },
+
+  // Full-text search over past hunts and findings, with optional facet filters
+  async searchHunts(q: string, filters: Record<string, string> = {}, limit: number = 20): Promise<HuntSearchResponse> {
+    const response = await api.get<HuntSearchResponse>('/search', { params: { q, limit, ...filters } });
+    return response.data;
+  },
+
   // Request clarification about hunt results
   async requestClarification(request: ClarificationRequest): Promise<ClarificationResponse> {
     const response = await api.post<ClarificationResponse>('/clarify', request);
@@ -102,8 +233,8 @@ export const apiService = {
   },
   
   // Get suggested hypotheses
-  async getSuggestedHypotheses(count: number = 3): Promise<{ hypotheses: Hypothesis[] }> {
-    const response = await api.get<{ hypotheses: Hypothesis[] }>(`/suggested-hypotheses?count=${count}`);
+  async getSuggestedHypotheses(count: number = 3): Promise<{ hypotheses: Hypothesis[]; freshness?: HypothesisPoolFreshness }> {
+    const response = await api.get<{ hypotheses: Hypothesis[]; freshness?: HypothesisPoolFreshness }>(`/suggested-hypotheses?count=${count}`);
     return response.data;
   },
 
@@ -0,0 +1,84 @@
+// Decoder for the columnar hunt result format served by /api/execute when the
+// request sends "Accept: application/vnd.threat-seeker.columnar".
+//
+// Layout: 8-byte magic, little-endian u32 header length, JSON header, then one
+// 8-byte aligned buffer per column ("f64" values or u16/u32 dictionary indices).
+
+export const COLUMNAR_MEDIA_TYPE = 'application/vnd.threat-seeker.columnar';
+
+const MAGIC = 'TSCOL001';
+
+interface ColumnHeader {
+  name: string;
+  type: 'f64' | 'dict';
+  offset: number;
+  length: number;
+  index_bytes?: number;
+  dictionary?: unknown[];
+}
+
+interface TableHeader {
+  rows: number;
+  columns: ColumnHeader[];
+  [key: string]: unknown;
+}
+
+export interface ColumnarTable {
+  rows: number;
+  // Column values by name; dictionary columns resolve to their original values
+  columns: Record<string, ArrayLike<unknown>>;
+  meta: Record<string, unknown>;
+}
+
+export function decodeColumnarTables(buffer: ArrayBuffer): { meta: Record<string, any>; tables: ColumnarTable[] } {
+  const bytes = new Uint8Array(buffer);
+  const magic = new TextDecoder().decode(bytes.subarray(0, MAGIC.length));
+  if (magic !== MAGIC) {
+    throw new Error('Not a columnar hunt result');
+  }
+
+  const view = new DataView(buffer);
+  const headerLength = view.getUint32(MAGIC.length, true);
+  const bodyStart = MAGIC.length + 4 + headerLength;
+  const header = JSON.parse(new TextDecoder().decode(bytes.subarray(MAGIC.length + 4, bodyStart)));
+
+  const tables = (header.tables as TableHeader[]).map(({ rows, columns, ...meta }) => {
+    const decoded: Record<string, ArrayLike<unknown>> = {};
+    for (const column of columns) {
+      const start = bodyStart + column.offset;
+      if (column.type === 'f64') {
+        // Buffers are 8-byte aligned, so the values are viewed without copying
+        decoded[column.name] = new Float64Array(buffer, start, column.length / 8);
+      } else {
+        const indices = column.index_bytes === 2
+          ? new Uint16Array(buffer, start, column.length / 2)
+          : new Uint32Array(buffer, start, column.length / 4);
+        const dictionary = column.dictionary ?? [];
+        decoded[column.name] = Array.from(indices, (index) => dictionary[index]);
+      }
+    }
+    return { rows, columns: decoded, meta };
+  });
+
+  return { meta: header.meta, tables };
+}
+
+// Rebuild the row-oriented HuntResult shape from the columnar tables
+export function columnarToHuntResult(buffer: ArrayBuffer): Record<string, any> {
+  const { meta, tables } = decodeColumnarTables(buffer);
+  const queryResults = tables.map((table) => {
+    const names = Object.keys(table.columns);
+    const results = Array.from({ length: table.rows }, (_, row) => {
+      const event: Record<string, unknown> = {};
+      for (const name of names) {
+        const value = table.columns[name][row];
+        if (value !== null && value !== undefined) {
+          event[name] = value;
+        }
+      }
+      return event;
+    });
+    return { ...table.meta, results };
+  });
+  return { ...meta, raw_results: { ...meta.raw_results, query_results: queryResults } };
+}